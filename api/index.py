@@ -1,16 +1,31 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from pymongo import MongoClient, ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.errors import DuplicateKeyError
 import os
 import hashlib
 import hmac
 import secrets
+import sys
+from pathlib import Path
 from urllib.parse import quote_plus
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone
 
+# game_history rows use backend/game_codec.py's compact (v2) layout, shared
+# with backend/server.py; vercel.json ships backend/ with this function
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from game_codec import GAME_TYPE_CODES, decode_game, encode_game, public_game, select_fields, stored_fields  # noqa: E402
+from idempotency import game_id_for  # noqa: E402
+from ledger import CURRENCY_DECIMALS, DEFAULT_CURRENCY, DEFAULT_DECIMALS, from_minor  # noqa: E402
+from metrics import CONTENT_TYPE, GAMES_RECORDED, REGISTRY, VERIFICATIONS, MetricsMiddleware  # noqa: E402
+from seed_sessions import build_session, session_id  # noqa: E402
+from storage_mongo import CommandTimingListener  # noqa: E402
+
 def _fix_mongo_url(url):
     if not url or '://' not in url:
         return url
@@ -30,26 +45,52 @@ def _fix_mongo_url(url):
 # MongoDB connection - use environment variable
 MONGO_URL = _fix_mongo_url(os.environ.get('MONGO_URL', ''))
 DB_NAME = os.environ.get('DB_NAME', 'razerbet')
+SLOW_QUERY_MS = float(os.environ.get('MONGO_SLOW_QUERY_MS', '100'))
 BOT_API_KEY = os.environ.get('BOT_API_KEY', 'rzrbt_a81bc6b34dc15aae0a8ca9e2a9d517064deecaca727675c1')
+# Public reads may lag the primary by this much (90 is the driver's minimum)
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '90'))
+
+def either(field: str, legacy: str, default=None) -> dict:
+    """Expression for a v2 field, or its name on v1 rows"""
+    return {"$ifNull": [f"${field}", {"$ifNull": [f"${legacy}", default]}]}
+
+def minor_amount(minor: str, amount: str, legacy_minor: str, legacy_amount: str) -> dict:
+    """Expression for a game's minor unit amount, converting the float of games from before them"""
+    currency = either("cu", "currency", DEFAULT_CURRENCY)
+    scale = {"$switch": {
+        "branches": [{"case": {"$eq": [currency, code]}, "then": 10 ** places} for code, places in CURRENCY_DECIMALS.items()],
+        "default": 10 ** DEFAULT_DECIMALS
+    }}
+    converted = {"$toLong": {"$round": [{"$multiply": [either(amount, legacy_amount), scale]}, 0]}}
+    return either(minor, legacy_minor, converted)
 
 # Initialize MongoDB client (synchronous for serverless)
 client = None
 db = None
+read_db = None
 
 def get_db():
-    global client, db
+    """Database pinned to the primary: bot writes, nonces and seeds"""
+    global client, db, read_db
     if client is None and MONGO_URL:
         try:
-            client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=5000, connectTimeoutMS=5000)
-            db = client[DB_NAME]
+            client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=5000, connectTimeoutMS=5000, event_listeners=[CommandTimingListener(SLOW_QUERY_MS)])
+            db = client.get_database(DB_NAME, read_preference=ReadPreference.PRIMARY)
+            read_db = client.get_database(DB_NAME, read_preference=SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS))
             # Force a connection check
             client.admin.command('ping')
         except Exception as e:
             print(f"MongoDB connection error: {e}")
             client = None
             db = None
+            read_db = None
     return db
 
+def get_read_db():
+    """Database for public reads, served by a secondary when one is fresh enough"""
+    get_db()
+    return read_db
+
 # Create FastAPI app
 app = FastAPI(title="RazerBet Provably Fair API")
 api_router = APIRouter(prefix="/api")
@@ -87,7 +128,12 @@ class GameRecordCreate(BaseModel):
     multiplier: float
     won: bool
     payout: float
-    currency: str = "ETH"
+    currency: str = DEFAULT_CURRENCY
+
+class GameBatchItem(GameRecordCreate):
+    idempotency_key: Optional[str] = None
+
+MAX_BATCH_GAMES = 500
 
 class ApiStats(BaseModel):
     total_games: int
@@ -181,6 +227,7 @@ def verify_game_result(request: VerificationRequest):
         raise HTTPException(status_code=400, detail=f"Invalid game type. Must be one of: {GAME_TYPES}")
     if request.nonce < 0:
         raise HTTPException(status_code=400, detail="Nonce must be non-negative")
+    VERIFICATIONS.inc("verify")
     return verify_game(request.server_seed, request.client_seed, request.nonce, request.game_type)
 
 @api_router.post("/seeds/generate")
@@ -193,6 +240,7 @@ def generate_seed_pair(client_seed: Optional[str] = None):
 @api_router.post("/verify-hash")
 def verify_hash(server_seed: str = Query(...), expected_hash: str = Query(...)):
     actual_hash = hash_server_seed(server_seed)
+    VERIFICATIONS.inc("verify_hash")
     return {"matches": actual_hash == expected_hash, "server_seed": server_seed, "expected_hash": expected_hash, "actual_hash": actual_hash}
 
 # Bot API helper
@@ -201,18 +249,38 @@ def verify_bot_api_key(x_api_key: str):
         raise HTTPException(status_code=401, detail="Invalid API key")
 
 @api_router.post("/bot/game")
-def record_game(game: GameRecordCreate, x_api_key: str = Header(None)):
+def record_game(
+    game: GameRecordCreate,
+    x_api_key: str = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     verify_bot_api_key(x_api_key)
+    return _record_game(game, idempotency_key)
+
+@api_router.post("/bot/games/batch")
+def record_games(games: List[GameBatchItem], x_api_key: str = Header(None)):
+    verify_bot_api_key(x_api_key)
+    if not 1 <= len(games) <= MAX_BATCH_GAMES:
+        raise HTTPException(status_code=400, detail=f"A batch holds 1 to {MAX_BATCH_GAMES} games")
+    results = []
+    for game in games:
+        try:
+            results.append(_record_game(game, game.idempotency_key))
+        except HTTPException as e:
+            results.append({"success": False, "status_code": e.status_code, "detail": e.detail})
+    return {"results": results}
+
+def _record_game(game: GameRecordCreate, idempotency_key: Optional[str]) -> dict:
     if game.game_type not in GAME_TYPES:
         raise HTTPException(status_code=400, detail="Invalid game type")
     
     database = get_db()
     verification = verify_game(game.server_seed, game.client_seed, game.nonce, game.game_type)
+    game_id = game_id_for(session_id(verification.server_seed_hash, game.client_seed), game.nonce, idempotency_key)
     
     record = {
-        "id": str(uuid.uuid4()),
+        "id": game_id,
         "game_type": game.game_type,
-        "server_seed": game.server_seed,
         "server_seed_hash": verification.server_seed_hash,
         "client_seed": game.client_seed,
         "nonce": game.nonce,
@@ -225,88 +293,194 @@ def record_game(game: GameRecordCreate, x_api_key: str = Header(None)):
         "won": game.won,
         "payout": game.payout,
         "currency": game.currency,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "verified": True
+        "timestamp": datetime.now(timezone.utc)
     }
     
     if database:
-        database.game_history.insert_one(record)
-    return {"success": True, "game_id": record["id"], "server_seed_hash": verification.server_seed_hash}
+        # Same writes as backend/server.py: the seed session, the users directory entry, then the game
+        session = build_session(game.server_seed, verification.server_seed_hash, game.client_seed)
+        database.seed_sessions.update_one(
+            {"_id": session["_id"]},
+            {"$setOnInsert": {"h": session["h"], "c": session["c"], "t": session["t"]}, "$set": {"ss": session["ss"]}},
+            upsert=True
+        )
+        _upsert_user(database, game.user_id, game.username)
+        try:
+            database.game_history.insert_one(encode_game(record))
+        except DuplicateKeyError:
+            return {"success": True, "game_id": game_id, "server_seed_hash": verification.server_seed_hash, "duplicate": True}
+    VERIFICATIONS.inc("record")
+    GAMES_RECORDED.inc(game.game_type, game.currency)
+    return {"success": True, "game_id": game_id, "server_seed_hash": verification.server_seed_hash, "duplicate": False}
+
+def _upsert_user(database, user_id: str, username: str):
+    """Point the users directory at user_id for username (see backend/users.py)"""
+    name = username.lower()
+    for attempt in range(3):
+        # A name belongs to the user who recorded with it last
+        database.users.update_many({"username_lower": name, "_id": {"$ne": user_id}}, {"$unset": {"username_lower": ""}})
+        try:
+            database.users.update_one({"_id": user_id}, {"$set": {"username": username, "username_lower": name}}, upsert=True)
+            return
+        except DuplicateKeyError:
+            if attempt == 2:
+                raise
+
+def _find_user(database, identifier: str) -> Optional[str]:
+    """user_id for a user id or (case-insensitive) username; None if unknown"""
+    docs = database.users.find({"$or": [{"_id": identifier}, {"username_lower": identifier.lower()}]}, {"_id": 1}).limit(2)
+    ids = [doc["_id"] for doc in docs]
+    if identifier in ids:
+        return identifier
+    return ids[0] if ids else None
+
+# v1 rows (public field names, ISO string timestamps) written before the
+# compact layout; read alongside v2 rows until `migrate.py history-v2` has run
+LEGACY_GAMES = {"timestamp": {"$type": "string"}}
+
+def _game_time(doc: dict) -> datetime:
+    if "t" in doc:
+        return doc["t"].replace(tzinfo=timezone.utc)
+    timestamp = datetime.fromisoformat(doc["timestamp"])
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def _find_games(database, query: dict, legacy: dict, fields: Optional[List[str]], limit: int) -> List[dict]:
+    """Newest v2 and v1 games matching `query` / `legacy`, decoded to the public shape"""
+    stored = stored_fields(fields) if fields else None
+    projection = dict({name: 1 for name in stored}, t=1) if stored else None
+    legacy_projection = dict({name: 1 for name in stored}, timestamp=1) if stored else {
+        "server_seed": 0, "bet_amount_minor": 0, "payout_minor": 0
+    }
+    docs = list(database.game_history.find(query, projection).sort("t", -1).limit(limit))
+    docs += database.game_history.find({**LEGACY_GAMES, **legacy}, legacy_projection).sort("timestamp", -1).limit(limit)
+    # An unfiltered v2 query also returns legacy rows, after every dated one
+    docs = sorted({doc["_id"]: doc for doc in docs}.values(), key=_game_time, reverse=True)[:limit]
+    session_ids = list({doc["s"] for doc in docs if "s" in doc})
+    sessions = {session["_id"]: session for session in database.seed_sessions.find({"_id": {"$in": session_ids}})} if session_ids else {}
+    return [decode_game(doc, sessions) for doc in docs]
+
+# Fields `fields=` may name; responses are compressed by Vercel's edge
+GAME_FIELDS = (
+    "id", "game_type", "server_seed_hash", "client_seed", "nonce", "result", "raw_result", "user_id",
+    "username", "bet_amount", "multiplier", "won", "payout", "currency", "timestamp", "verified"
+)
 
 @api_router.get("/history")
-def get_game_history(limit: int = Query(50, le=100), game_type: Optional[str] = None, user_id: Optional[str] = None):
-    database = get_db()
-    if not database:
-        return {"games": [], "count": 0}
-    
-    query = {}
-    if game_type:
-        query["game_type"] = game_type
-    if user_id:
-        query["user_id"] = user_id
+def get_game_history(
+    limit: int = Query(50, le=100),
+    game_type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    fields: Optional[str] = None,
+    layout: str = "objects"
+):
+    if layout not in ("objects", "columns"):
+        raise HTTPException(status_code=400, detail="Invalid layout. Must be one of: ['objects', 'columns']")
+    selected = None
+    if fields:
+        selected = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in selected if name not in GAME_FIELDS]
+        if unknown or not selected:
+            raise HTTPException(status_code=400, detail=f"Invalid fields {unknown}. Must be among: {list(GAME_FIELDS)}")
     
-    games = list(database.game_history.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit))
-    
-    for game in games:
-        if 'username' in game:
-            name = game['username']
-            if len(name) > 4:
-                game['username'] = name[:2] + '*' * (len(name) - 4) + name[-2:]
+    database = get_read_db()
+    games = []
+    if database:
+        query = {}
+        legacy = {}
+        if game_type:
+            query["g"] = GAME_TYPE_CODES.get(game_type, -1)
+            legacy["game_type"] = game_type
+        if user_id:
+            query["u"] = user_id
+            legacy["user_id"] = user_id
+        games = [public_game(game) for game in _find_games(database, query, legacy, selected, limit)]
+        if selected:
+            games = [select_fields(game, selected) for game in games]
     
+    if layout == "columns":
+        return {"games": {name: [game.get(name) for game in games] for name in selected or GAME_FIELDS}, "count": len(games)}
     return {"games": games, "count": len(games)}
 
 @api_router.get("/stats")
 def get_stats():
-    database = get_db()
+    database = get_read_db()
     if not database:
         return ApiStats(total_games=0, total_verified=0, games_by_type={}, recent_games_count=0)
     
-    total_games = database.game_history.count_documents({})
-    pipeline = [{"$group": {"_id": "$game_type", "count": {"$sum": 1}}}]
+    # v2 rows carry a game type code, v1 rows its name
+    pipeline = [{"$group": {"_id": {"g": "$g", "game_type": "$game_type"}, "count": {"$sum": 1}}}]
     games_by_type = {}
     for doc in database.game_history.aggregate(pipeline):
-        games_by_type[doc["_id"]] = doc["count"]
+        group = doc["_id"]
+        name = GAME_TYPES[group["g"]] if group.get("g") is not None else group.get("game_type")
+        games_by_type[name] = games_by_type.get(name, 0) + doc["count"]
+    total_games = sum(games_by_type.values())
     return ApiStats(total_games=total_games, total_verified=total_games, games_by_type=games_by_type, recent_games_count=min(total_games, 100))
 
 @api_router.get("/user/{identifier}/stats")
 def get_user_stats(identifier: str):
-    database = get_db()
+    database = get_read_db()
     if not database:
         raise HTTPException(status_code=404, detail="Database not configured")
     
-    query = {"$or": [{"user_id": identifier}, {"username": {"$regex": f"^{identifier}$", "$options": "i"}}]}
+    user_id = _find_user(database, identifier)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found or has no games")
+    query = {"u": user_id}
+    legacy = {"user_id": user_id}
+    
+    # Exact integer sums per currency; amounts of different currencies are never added together
+    pipeline = [{"$match": {"$or": [query, {**LEGACY_GAMES, **legacy}]}}, {"$group": {
+        "_id": {"g": "$g", "game_type": "$game_type", "currency": either("cu", "currency", DEFAULT_CURRENCY)},
+        "games": {"$sum": 1},
+        "wins": {"$sum": {"$cond": [either("w", "won", False), 1, 0]}},
+        "wagered": {"$sum": minor_amount("ba", "b", "bet_amount_minor", "bet_amount")},
+        "payout": {"$sum": minor_amount("pa", "p", "payout_minor", "payout")}
+    }}]
+    games_by_type = {}
+    totals = {}
+    for group in database.game_history.aggregate(pipeline):
+        key = group["_id"]
+        game_type = GAME_TYPES[key["g"]] if key.get("g") is not None else key.get("game_type")
+        currency = key["currency"]
+        games_by_type[game_type] = games_by_type.get(game_type, 0) + group["games"]
+        counts = totals.setdefault(currency, {"games": 0, "wins": 0, "wagered": 0, "payout": 0})
+        for field in counts:
+            counts[field] += group[field]
     
-    total_games = database.game_history.count_documents(query)
+    total_games = sum(counts["games"] for counts in totals.values())
     if total_games == 0:
         raise HTTPException(status_code=404, detail="User not found or has no games")
-    
-    wins = database.game_history.count_documents({**query, "won": True})
+    wins = sum(counts["wins"] for counts in totals.values())
     losses = total_games - wins
     
-    pipeline = [{"$match": query}, {"$group": {"_id": None, "total_wagered": {"$sum": "$bet_amount"}, "total_payout": {"$sum": "$payout"}, "games_by_type": {"$push": "$game_type"}}}]
-    agg_result = list(database.game_history.aggregate(pipeline))
-    
-    total_wagered = agg_result[0].get("total_wagered", 0) if agg_result else 0
-    total_payout = agg_result[0].get("total_payout", 0) if agg_result else 0
-    games_by_type = {}
-    if agg_result:
-        for gt in agg_result[0].get("games_by_type", []):
-            games_by_type[gt] = games_by_type.get(gt, 0) + 1
-    
-    profit = total_payout - total_wagered
+    currencies = {
+        currency: {
+            "games": counts["games"],
+            "wins": counts["wins"],
+            "total_wagered": from_minor(counts["wagered"], currency),
+            "total_payout": from_minor(counts["payout"], currency),
+            "profit": from_minor(counts["payout"] - counts["wagered"], currency)
+        }
+        for currency, counts in sorted(totals.items())
+    }
+    default = currencies.get(DEFAULT_CURRENCY, {"total_wagered": 0, "total_payout": 0, "profit": 0})
     win_rate = round((wins / total_games) * 100, 2) if total_games > 0 else 0
     
-    recent_games = list(database.game_history.find(query, {"_id": 0, "server_seed": 0}).sort("timestamp", -1).limit(10))
+    recent_games = _find_games(database, query, legacy, None, 10)
+    for game in recent_games:
+        game.pop("masked_username", None)
     
     return {
-        "user_id": identifier,
+        "user_id": user_id,
         "total_games": total_games,
         "wins": wins,
         "losses": losses,
         "win_rate": win_rate,
-        "total_wagered": round(total_wagered, 6),
-        "total_payout": round(total_payout, 6),
-        "profit": round(profit, 6),
+        "total_wagered": default["total_wagered"],
+        "total_payout": default["total_payout"],
+        "profit": default["profit"],
+        "currencies": currencies,
         "games_by_type": games_by_type,
         "recent_games": recent_games
     }
@@ -378,6 +552,10 @@ def increment_nonce(user_id: str, x_api_key: str = Header(None)):
         raise HTTPException(status_code=404, detail="No active seeds for user")
     return {"nonce": result["nonce"]}
 
+@api_router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 # Include router and add CORS
 app.include_router(api_router)
 
@@ -389,3 +567,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Same series as backend/metrics.py. Sync routes record from the threadpool;
+# a function instance serves one request at a time, so nothing contends.
+app.add_middleware(MetricsMiddleware)
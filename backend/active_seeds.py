@@ -0,0 +1,139 @@
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import REGISTRY
+
+# =============================================================================
+# ACTIVE SEED CACHE
+# =============================================================================
+# Every bet reads the player's active user_seeds document (hash, client seed,
+# nonce). This keeps those documents in an in-process LRU so reads never touch
+# the database, and writes through on every change:
+#
+# - increment: under the entry's lock, the next nonce is persisted with a
+#   compare-and-set on (seed id, active, current nonce) and only then applied
+#   in memory. If the write matches nothing, another process moved the nonce
+#   or rotated the seed: the entry is dropped and the increment falls back to
+#   the atomic one in storage. The lease is checked again once the lock is
+#   held, since queued increments can outlive it.
+# - create / reveal: the entry is invalidated once the new seed is written.
+#   Loads that overlap an invalidation are not cached, so a read that started
+#   before the write can never put the old seed back.
+#
+# With several workers, `leases` decides which worker may cache a user: only
+# the holder of the user's lease keeps the seed (and so the nonce) in memory.
+# The others read and increment through storage, and every change is
+# published on the cache bus so the holder drops its copy.
+
+LOOKUPS = REGISTRY.counter("active_seed_cache_lookups_total", "Active seed cache lookups by result", ("result",))
+CONFLICTS = REGISTRY.counter("active_seed_cache_conflicts_total", "Nonce writes that found the seed changed by another process")
+ENTRIES = REGISTRY.gauge("active_seed_cache_entries", "Active seeds held in the cache")
+
+SEED_EVENT = "seed"
+
+class _Entry:
+    __slots__ = ("seed", "lock")
+
+    def __init__(self, seed: dict):
+        self.seed = seed
+        self.lock = asyncio.Lock()
+
+class ActiveSeedCache:
+    """In-process LRU of active user seeds, written through to storage"""
+
+    def __init__(self, maxsize: int = 10000, bus=None, leases=None):
+        self.maxsize = maxsize
+        self.bus = bus
+        self.leases = leases
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._epoch = 0
+        if bus is not None:
+            bus.subscribe(SEED_EVENT, self._drop)
+        ENTRIES.set_callback(lambda: {(): len(self._entries)})
+
+    def _put(self, user_id: str, seed: dict) -> _Entry:
+        entry = self._entries[user_id] = _Entry(seed)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            if self.leases is not None:
+                self.leases.release(evicted)
+        return entry
+
+    def _drop(self, user_id: str):
+        self._epoch += 1
+        self._entries.pop(user_id, None)
+
+    def _publish(self, user_id: str):
+        if self.bus is not None:
+            self.bus.publish(SEED_EVENT, user_id)
+
+    def invalidate(self, user_id: str):
+        """Forget a user's seed, here and in the other workers; call after writing a new active seed"""
+        self._drop(user_id)
+        self._publish(user_id)
+
+    async def _entry(self, storage, user_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            if self.leases is None or self.leases.holds(user_id):
+                self._entries.move_to_end(user_id)
+                LOOKUPS.inc("hit")
+                return entry
+            # The lease lapsed; another worker may have taken the user over
+            self._drop(user_id)
+        LOOKUPS.inc("miss")
+        epoch = self._epoch
+        owned = self.leases is None or await self.leases.acquire(storage, user_id)
+        seed = await storage.get_active_seed(user_id)
+        if seed is None:
+            return None
+        if not owned or epoch != self._epoch:
+            # A seed was written while loading; this one may already be stale
+            return _Entry(seed)
+        return self._entries.get(user_id) or self._put(user_id, seed)
+
+    async def get(self, storage, user_id: str) -> Optional[dict]:
+        """The user's active seed, or None"""
+        entry = await self._entry(storage, user_id)
+        return dict(entry.seed) if entry is not None else None
+
+    async def increment(self, storage, user_id: str) -> Optional[dict]:
+        """Advance the active seed's nonce; returns the updated seed, or None without one"""
+        entry = await self._entry(storage, user_id)
+        if entry is None:
+            return None
+        async with entry.lock:
+            if self.leases is not None and not self.leases.holds(user_id):
+                # The lease lapsed while this waited on the lock; another
+                # worker may hold the user now, so go through storage
+                if self._entries.get(user_id) is entry:
+                    self._drop(user_id)
+            elif self._entries.get(user_id) is entry:
+                seed = entry.seed
+                nonce = seed["nonce"] + 1
+                if await storage.advance_nonce(user_id, seed["id"], seed["nonce"], nonce):
+                    seed["nonce"] = nonce
+                    if self.leases is not None and not self.leases.holds(user_id):
+                        # The lease ran out during the write
+                        self._drop(user_id)
+                        self._publish(user_id)
+                    return dict(seed)
+                CONFLICTS.inc()
+                if self._entries.get(user_id) is entry:
+                    self._drop(user_id)
+
+        epoch = self._epoch
+        seed = await storage.increment_nonce(user_id)
+        if seed is None:
+            return None
+        # Loads and increments that overlapped this one may hold an older nonce
+        fresh = epoch == self._epoch
+        self._drop(user_id)
+        if self.leases is not None and not self.leases.holds(user_id):
+            # The holder's copy of the nonce is stale now
+            self._publish(user_id)
+        elif fresh:
+            self._put(user_id, seed)
+        return seed
@@ -0,0 +1,612 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from ledger import DEFAULT_CURRENCY, to_minor
+from storage import Storage, add_to_summary, empty_summary
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# GAME HISTORY ARCHIVE
+# =============================================================================
+# Games older than a cutoff move out of the hot game_history collection into
+# immutable segment files on local disk, so the collection and its indexes
+# only hold recent games and stay in RAM.
+#
+# A segment holds up to a few hundred thousand games sorted by (user_id,
+# timestamp), cut into blocks of BLOCK_ROWS rows. Every column of a block is
+# compressed on its own, so a query only inflates the columns it reads. The
+# footer carries:
+#
+# - the first (user_id, timestamp) of every block   -> sparse index, bisected
+# - seed session id -> blocks containing it          -> verification / audits
+# - per user totals by game type and currency       -> user stats without
+#                                                       touching any block
+#
+# Files are opened with mmap; a bounded LRU keeps recently inflated columns.
+#
+# The archive owns every game with a timestamp before `archived_before`
+# (saved in service_state together with the segment list). Hot reads ignore
+# rows before that mark, so a move interrupted between writing a segment and
+# deleting its rows from the hot collection is never counted twice.
+#
+# With several workers, only the holder of the archive lease moves games. It
+# publishes every commit on the cache bus, and the others open the new
+# segments and move their mark before the hot rows are deleted; they also
+# reload the saved state on every round, in case an event was lost.
+#
+#   file = MAGIC | column blocks... | footer (zlib JSON) | footer length (u64) | MAGIC
+
+MAGIC = b"RBSEG1"
+SEGMENT_SUFFIX = ".seg"
+BLOCK_ROWS = 4096
+STATE_KEY = "archive"
+ARCHIVE_EVENT = "archive"
+LEASE_KEY = "service:archive"
+
+# Column name -> array typecode, or None for JSON encoded columns
+COLUMNS = {
+    "_id": None, "s": None, "u": None, "un": None, "mu": None, "cu": None, "o": None,
+    "g": "B", "w": "B", "n": "q", "t": "q", "r": "d", "b": "d", "m": "d", "p": "d",
+    "ba": "q", "pa": "q"
+}
+# Columns missing from segments written before they were added
+LEDGER_COLUMNS = {"ba": "b", "pa": "p"}
+
+def _to_micros(timestamp: datetime) -> int:
+    return int(timestamp.timestamp() * 1_000_000)
+
+def _from_micros(micros: int) -> datetime:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc)
+
+def _minor_amount(doc: dict, column: str) -> int:
+    # Games recorded before minor unit amounts (Mongo, until migrated) only have the float
+    value = doc.get(column)
+    return value if value is not None else to_minor(doc[LEDGER_COLUMNS[column]], doc.get("cu"))
+
+def _as_utc(timestamp: datetime) -> datetime:
+    # BSON datetimes come back naive but are always UTC
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def _encode_column(name: str, values: list) -> bytes:
+    typecode = COLUMNS[name]
+    if typecode is None:
+        raw = json.dumps(values, separators=(",", ":")).encode()
+    else:
+        raw = array(typecode, values).tobytes()
+    return zlib.compress(raw, 6)
+
+def _decode_column(name: str, data: bytes) -> list:
+    raw = zlib.decompress(data)
+    typecode = COLUMNS[name]
+    if typecode is None:
+        return json.loads(raw)
+    values = array(typecode)
+    values.frombytes(raw)
+    return values.tolist()
+
+# =============================================================================
+# WRITING
+# =============================================================================
+
+def write_segment(directory: Path, docs: List[dict]) -> Path:
+    """Write v2 game documents to a new segment file; returns its path"""
+    rows = sorted(docs, key=lambda doc: (doc["u"], _as_utc(doc["t"])))
+    micros = [_to_micros(_as_utc(doc["t"])) for doc in rows]
+
+    blocks = []
+    sessions: Dict[str, List[int]] = {}
+    totals: Dict[str, Dict[tuple, list]] = {}
+    by_type: Dict[int, int] = {}
+
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{min(micros)}-{max(micros)}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+    tmp_path = directory / (name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for number, first in enumerate(range(0, len(rows), BLOCK_ROWS)):
+            chunk = rows[first:first + BLOCK_ROWS]
+            columns = {}
+            for column in COLUMNS:
+                if column == "t":
+                    values = micros[first:first + BLOCK_ROWS]
+                elif column == "w":
+                    values = [int(doc["w"]) for doc in chunk]
+                elif column in LEDGER_COLUMNS:
+                    values = [_minor_amount(doc, column) for doc in chunk]
+                else:
+                    values = [doc.get(column) for doc in chunk]
+                data = _encode_column(column, values)
+                columns[column] = [f.tell(), len(data)]
+                f.write(data)
+            blocks.append({
+                "rows": len(chunk),
+                "first": [chunk[0]["u"], micros[first]],
+                "last_u": chunk[-1]["u"],
+                "columns": columns
+            })
+
+            for doc in chunk:
+                block_list = sessions.setdefault(doc["s"], [])
+                if not block_list or block_list[-1] != number:
+                    block_list.append(number)
+
+                group = (doc["g"], doc.get("cu", DEFAULT_CURRENCY))
+                counts = totals.setdefault(doc["u"], {}).setdefault(group, [0, 0, 0, 0])
+                counts[0] += 1
+                counts[1] += int(doc["w"])
+                counts[2] += _minor_amount(doc, "ba")
+                counts[3] += _minor_amount(doc, "pa")
+                by_type[doc["g"]] = by_type.get(doc["g"], 0) + 1
+
+        footer = zlib.compress(json.dumps({
+            "rows": len(rows),
+            "t_min": min(micros),
+            "t_max": max(micros),
+            "blocks": blocks,
+            "sessions": sorted(sessions.items()),
+            "totals": {
+                user_id: [list(group) + counts for group, counts in groups.items()]
+                for user_id, groups in totals.items()
+            },
+            "by_type": by_type
+        }, separators=(",", ":")).encode(), 6)
+        f.write(footer)
+        f.write(struct.pack("<Q", len(footer)))
+        f.write(MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+
+    path = directory / name
+    os.replace(tmp_path, path)
+    return path
+
+# =============================================================================
+# READING
+# =============================================================================
+
+class Segment:
+    """One memory mapped segment file"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC or self._map[-len(MAGIC):] != MAGIC:
+            raise ValueError(f"Not an archive segment: {path}")
+        footer_end = len(self._map) - len(MAGIC) - 8
+        (footer_length,) = struct.unpack("<Q", self._map[footer_end:footer_end + 8])
+        footer = json.loads(zlib.decompress(self._map[footer_end - footer_length:footer_end]))
+
+        self.rows = footer["rows"]
+        self.t_min = _from_micros(footer["t_min"])
+        self.t_max = _from_micros(footer["t_max"])
+        self.blocks = footer["blocks"]
+        self.first_keys = [tuple(block["first"]) for block in self.blocks]
+        self.sessions = dict(footer["sessions"])
+        # user_id -> [[game type, currency, games, wins, wagered, payout], ...];
+        # None in segments written before minor unit amounts
+        self.totals = footer.get("totals")
+        self.by_type = {int(g): count for g, count in footer["by_type"].items()}
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def read_column(self, block: int, column: str) -> list:
+        offset, length = self.blocks[block]["columns"][column]
+        return _decode_column(column, self._map[offset:offset + length])
+
+    def user_blocks(self, user_id: str) -> range:
+        """Blocks that can hold rows of `user_id`, from the sparse index"""
+        start = max(bisect_left(self.first_keys, (user_id, -1)) - 1, 0)
+        end = bisect_left(self.first_keys, (user_id, float("inf")))
+        while start < end and self.blocks[start]["last_u"] < user_id:
+            start += 1
+        return range(start, end)
+
+class Archive:
+    """Every segment of the archive plus a cache of inflated columns"""
+
+    def __init__(self, directory: str, cache_columns: int = 512):
+        self.directory = Path(directory)
+        self.cache_columns = cache_columns
+        self.segments: List[Segment] = []   # oldest first
+        self._cache: "OrderedDict[tuple, list]" = OrderedDict()
+
+    def open(self, names: Iterable[str]):
+        self.segments = sorted((Segment(self.directory / name) for name in names), key=lambda seg: seg.t_min)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self._cache.clear()
+
+    def add(self, path: Path):
+        # A new list, so reads running in the executor keep a consistent one
+        self.segments = sorted(self.segments + [Segment(path)], key=lambda seg: seg.t_min)
+
+    def _column(self, segment: Segment, block: int, column: str) -> list:
+        key = (segment.path.name, block, column)
+        values = self._cache.get(key)
+        if values is None:
+            values = self._cache[key] = segment.read_column(block, column)
+            if len(self._cache) > self.cache_columns:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return values
+
+    def _docs(
+        self,
+        segment: Segment,
+        block: int,
+        indexes: Optional[List[int]] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        """Documents of a block, inflating only the columns in `fields` (all by default)"""
+        present = segment.blocks[block]["columns"]
+        wanted = COLUMNS if fields is None else [column for column in COLUMNS if column in fields]
+        columns = {column: self._column(segment, block, column) for column in wanted if column in present}
+        if indexes is None:
+            indexes = range(segment.blocks[block]["rows"])
+        docs = []
+        for i in indexes:
+            doc = {"v": 2}
+            for column, values in columns.items():
+                if values[i] is not None:
+                    doc[column] = values[i]
+            if "w" in doc:
+                doc["w"] = bool(doc["w"])
+            if "t" in doc:
+                doc["t"] = _from_micros(doc["t"])
+            for column in LEDGER_COLUMNS:
+                if column in wanted and column not in doc:
+                    doc[column] = _minor_amount(doc, column)
+            docs.append(doc)
+        return docs
+
+    # -- queries (blocking; run them off the event loop) ----------------------
+
+    def user_games(
+        self,
+        user_id: str,
+        limit: int,
+        game_type: Optional[int] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        """Newest games of a user"""
+        if fields is not None:
+            # t is needed to merge the blocks in time order
+            fields = list(fields) + ["t"]
+        found = []
+        for segment in reversed(self.segments):
+            matches = []
+            for block in segment.user_blocks(user_id):
+                users = self._column(segment, block, "u")
+                types = self._column(segment, block, "g")
+                indexes = [
+                    i for i, u in enumerate(users)
+                    if u == user_id and (game_type is None or types[i] == game_type)
+                ]
+                if indexes:
+                    matches.extend(self._docs(segment, block, indexes, fields))
+            matches.sort(key=lambda doc: doc["t"], reverse=True)
+            found.extend(matches)
+            # Older segments only hold older games
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def recent_games(
+        self,
+        limit: int,
+        game_type: Optional[int] = None,
+        user_id: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        if user_id:
+            return self.user_games(user_id, limit, game_type, fields)
+        found = []
+        for segment in reversed(self.segments):
+            candidates = []
+            for block in range(len(segment.blocks)):
+                times = self._column(segment, block, "t")
+                types = self._column(segment, block, "g")
+                candidates.extend(
+                    (t, block, i) for i, t in enumerate(times)
+                    if game_type is None or types[i] == game_type
+                )
+            candidates.sort(reverse=True)
+            for _, block, i in candidates[:limit - len(found)]:
+                found.extend(self._docs(segment, block, [i], fields))
+            if len(found) >= limit:
+                break
+        return found
+
+    def _count_user_groups(self, segment: Segment, user_id: str) -> List[list]:
+        # Segments without footer totals in minor units: add up the user's rows
+        groups: Dict[tuple, list] = {}
+        for block in segment.user_blocks(user_id):
+            users = self._column(segment, block, "u")
+            indexes = [i for i, u in enumerate(users) if u == user_id]
+            for doc in self._docs(segment, block, indexes) if indexes else ():
+                counts = groups.setdefault((doc["g"], doc.get("cu", DEFAULT_CURRENCY)), [0, 0, 0, 0])
+                counts[0] += 1
+                counts[1] += int(doc["w"])
+                counts[2] += doc["ba"]
+                counts[3] += doc["pa"]
+        return [list(group) + counts for group, counts in groups.items()]
+
+    def user_groups(self, user_id: str) -> List[list]:
+        """[game type, currency, games, wins, wagered, payout] of every archived group of a user"""
+        groups = []
+        for segment in self.segments:
+            if segment.totals is not None:
+                groups.extend(segment.totals.get(user_id, ()))
+            else:
+                groups.extend(self._count_user_groups(segment, user_id))
+        return groups
+
+    def user_summary(self, user_id: str) -> dict:
+        summary = empty_summary()
+        for group in self.user_groups(user_id):
+            add_to_summary(summary, *group)
+        return summary
+
+    def count_games_by_type(self) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        for segment in self.segments:
+            for game_type, count in segment.by_type.items():
+                counts[game_type] = counts.get(game_type, 0) + count
+        return counts
+
+    def games_for_sessions(self, session_ids: List[str]) -> List[dict]:
+        wanted = set(session_ids)
+        docs = []
+        for segment in self.segments:
+            blocks = sorted({block for s in wanted for block in segment.sessions.get(s, ())})
+            for block in blocks:
+                sessions = self._column(segment, block, "s")
+                indexes = [i for i, s in enumerate(sessions) if s in wanted]
+                docs.extend(self._docs(segment, block, indexes))
+        return docs
+
+    def scan(self, start: Optional[datetime], end: Optional[datetime]):
+        """Blocks of games with timestamps in [start, end)"""
+        for segment in self.segments:
+            if (start is not None and segment.t_max < start) or (end is not None and segment.t_min >= end):
+                continue
+            for block in range(len(segment.blocks)):
+                docs = [
+                    doc for doc in self._docs(segment, block)
+                    if (start is None or doc["t"] >= start) and (end is None or doc["t"] < end)
+                ]
+                if docs:
+                    yield docs
+
+# =============================================================================
+# TIERED STORAGE
+# =============================================================================
+
+class TieredStorage:
+    """Hot storage backend plus the archive, behind the Storage interface
+
+    Game history reads combine both tiers; every other method goes straight to
+    the hot backend. Moving games into the archive runs periodically.
+    """
+
+    def __init__(self, hot: Storage, directory: str, archive_after_days: float = 30,
+                 segment_rows: int = 200_000, interval: float = 3600,
+                 bus=None, owner: Optional[str] = None, lease_ttl: float = 60):
+        self.hot = hot
+        self.archive = Archive(directory)
+        self.archive_after = timedelta(days=archive_after_days)
+        self.segment_rows = segment_rows
+        self.interval = interval
+        # Shared by several workers: moves need the archive lease
+        self.bus = bus if bus is not None and bus.shared else None
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        self._task: Optional[asyncio.Task] = None
+        self._moving: Optional[asyncio.Lock] = None
+        if self.bus is not None:
+            self.bus.subscribe(ARCHIVE_EVENT, self._follow)
+
+    def __getattr__(self, name):
+        return getattr(self.hot, name)
+
+    @property
+    def name(self) -> str:
+        return f"{self.hot.name}+archive"
+
+    async def _offload(self, fn, *args):
+        # Inflating blocks is CPU and page-in work; keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    # -- lifecycle ------------------------------------------------------------
+
+    async def init(self):
+        await self.hot.init()
+        self._apply(await self._load_state())
+        # Created here: on Python 3.9 a Lock binds to the loop current at creation
+        self._moving = asyncio.Lock()
+        self._task = asyncio.create_task(self._archive_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.archive.close()
+        await self.hot.close()
+
+    # -- archiving ------------------------------------------------------------
+
+    async def _load_state(self) -> dict:
+        return await self.hot.load_state(STATE_KEY) or {"segments": [], "archived_before": None}
+
+    def _apply(self, state: dict):
+        """Open the segments of a saved state that are not open yet and adopt its mark"""
+        known = {segment.path.name for segment in self.archive.segments}
+        for name in state["segments"]:
+            if name not in known:
+                self.archive.add(self.archive.directory / name)
+        if state["archived_before"]:
+            mark = datetime.fromisoformat(state["archived_before"])
+            if self.hot.archived_before is None or mark > self.hot.archived_before:
+                self.hot.archived_before = mark
+
+    def _follow(self, state: dict):
+        # Another worker committed a move
+        self._apply(state)
+
+    async def _holds_lease(self) -> bool:
+        return self.bus is None or await self.hot.acquire_lease(LEASE_KEY, self.owner, self.lease_ttl)
+
+    def _remove_uncommitted(self, state: dict):
+        # Files not in the saved list come from a move that never committed;
+        # only the worker holding the lease may decide that
+        listed = set(state["segments"])
+        if self.archive.directory.is_dir():
+            for path in self.archive.directory.iterdir():
+                if path.name not in listed and (path.suffix == SEGMENT_SUFFIX or path.name.endswith(".tmp")):
+                    logger.warning("Removing uncommitted archive file %s", path.name)
+                    path.unlink()
+
+    async def archive_once(self) -> int:
+        """Move every game older than the cutoff into new segments; returns the number moved
+
+        Without the archive lease this only catches up with the moves of the
+        worker that holds it.
+        """
+        async with self._moving:
+            state = await self._load_state()
+            self._apply(state)
+            if not await self._holds_lease():
+                return 0
+            self._remove_uncommitted(state)
+            return await self._move_before(datetime.now(timezone.utc) - self.archive_after)
+
+    async def _move_before(self, cutoff: datetime) -> int:
+        if self.hot.archived_before is not None:
+            # Rows a crashed move left behind; hidden from reads, deleted here
+            await self.hot.delete_games_before(self.hot.archived_before)
+        moved = 0
+        while True:
+            docs = await self.hot.games_before(cutoff, self.segment_rows)
+            if not docs:
+                break
+            boundary = cutoff
+            if len(docs) == self.segment_rows:
+                # Never split games sharing a timestamp across the mark
+                boundary = _as_utc(docs[-1]["t"])
+                docs = [doc for doc in docs if _as_utc(doc["t"]) < boundary]
+                if not docs:
+                    logger.error("More than %d games share timestamp %s; not archiving", self.segment_rows, boundary)
+                    break
+
+            path = await self._offload(write_segment, self.archive.directory, docs)
+            if not await self._holds_lease():
+                # Another worker took over while this one was writing
+                logger.warning("Lost the archive lease; discarding %s", path.name)
+                path.unlink()
+                break
+            state = {
+                "segments": [segment.path.name for segment in self.archive.segments] + [path.name],
+                "archived_before": boundary.isoformat()
+            }
+            await self.hot.save_state(STATE_KEY, state)
+            # Commit point: from here on the archive serves these games, the hot
+            # backend hides them, and deleting them is only cleanup
+            self.archive.add(path)
+            self.hot.archived_before = boundary
+            if self.bus is not None:
+                # The other workers must stop reading these rows from the hot tier
+                self.bus.publish(ARCHIVE_EVENT, state)
+            await self.hot.delete_games_before(boundary)
+            moved += len(docs)
+            logger.info("Archived %d games before %s into %s", len(docs), boundary.isoformat(), path.name)
+        return moved
+
+    async def _archive_loop(self):
+        while True:
+            try:
+                await self.archive_once()
+            except Exception:
+                logger.exception("Archiving game history failed")
+            await asyncio.sleep(self.interval)
+
+    # -- game_history ---------------------------------------------------------
+
+    async def insert_game(self, doc: dict) -> bool:
+        return await self.hot.insert_game(doc)
+
+    async def recent_games(
+        self,
+        limit: int,
+        game_type: Optional[int] = None,
+        user_id: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        docs = await self.hot.recent_games(limit, game_type=game_type, user_id=user_id, fields=fields)
+        if len(docs) < limit and self.archive.segments:
+            docs += await self._offload(self.archive.recent_games, limit - len(docs), game_type, user_id, fields)
+        return docs
+
+    async def count_games_by_type(self) -> Dict[int, int]:
+        counts = await self.hot.count_games_by_type()
+        for game_type, count in self.archive.count_games_by_type().items():
+            counts[game_type] = counts.get(game_type, 0) + count
+        return counts
+
+    async def user_summary(self, user_id: str) -> dict:
+        summary = await self.hot.user_summary(user_id)
+        if all(segment.totals is not None for segment in self.archive.segments):
+            groups = self.archive.user_groups(user_id)
+        else:
+            # Older segments are read block by block
+            groups = await self._offload(self.archive.user_groups, user_id)
+        for group in groups:
+            add_to_summary(summary, *group)
+        return summary
+
+    async def recent_user_games(self, user_id: str, limit: int, fields: Optional[List[str]] = None) -> List[dict]:
+        docs = await self.hot.recent_user_games(user_id, limit, fields)
+        if len(docs) < limit and self.archive.segments:
+            docs += await self._offload(self.archive.user_games, user_id, limit - len(docs), None, fields)
+        return docs
+
+    async def games_for_sessions(self, session_ids: List[str]) -> List[dict]:
+        docs = await self.hot.games_for_sessions(session_ids)
+        if self.archive.segments:
+            docs += await self._offload(self.archive.games_for_sessions, session_ids)
+            docs.sort(key=lambda doc: doc["n"])
+        return docs
+
+    async def scan_games(self, batch_size: int = 1000, start: Optional[datetime] = None, end: Optional[datetime] = None) -> AsyncIterator[List[dict]]:
+        blocks = self.archive.scan(start, end)
+        while True:
+            docs = await self._offload(next, blocks, None)
+            if docs is None:
+                break
+            yield docs
+        async for docs in self.hot.scan_games(batch_size, start=start, end=end):
+            yield docs
+
+    async def oldest_game_time(self) -> Optional[datetime]:
+        if self.archive.segments:
+            return self.archive.segments[0].t_min
+        return await self.hot.oldest_game_time()
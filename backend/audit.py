@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from provably_fair import hash_server_seed, hex_to_float, calculate_game_result
+from game_codec import decode_game
+
+logger = logging.getLogger(__name__)
+
+# Leaves are persisted in chunks so a long seed session never hits the 16MB document limit
+LEAVES_PER_CHUNK = 8192
+# How many mismatching game ids are kept on the summary for inspection
+MAX_REPORTED_MISMATCHES = 20
+# Built trees kept in memory for proof requests
+TREE_CACHE_SIZE = 32
+# Audits left "pending" by a restart that are picked up again at startup
+PENDING_AUDIT_BATCH = 100
+# With several workers only the one holding this lease resumes audits
+LEASE_KEY = "service:audit"
+
+# =============================================================================
+# MERKLE TREE
+# =============================================================================
+# Leaves and inner nodes are domain separated (0x00 / 0x01 prefixes) and an odd
+# node at the end of a level is promoted unchanged instead of being duplicated,
+# so two different leaf sets can never produce the same root.
+
+def merkle_leaf(nonce: int, game_type: str, result: dict) -> bytes:
+    """Hash a (nonce, outcome) pair into a Merkle leaf"""
+    payload = json.dumps(
+        {"nonce": nonce, "game_type": game_type, "result": result},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(b"\x00" + payload.encode()).digest()
+
+def _merkle_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def build_merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Build every level of the tree, from the leaves up to the root"""
+    if not leaves:
+        return [[hashlib.sha256(b"").digest()]]
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parent = [_merkle_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parent.append(level[-1])
+        levels.append(parent)
+    return levels
+
+def merkle_proof(levels: List[List[bytes]], index: int) -> List[dict]:
+    """Sibling path for one leaf, ordered from the leaf up"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({
+                "position": "left" if sibling < index else "right",
+                "hash": level[sibling].hex()
+            })
+        index //= 2
+    return proof
+
+def verify_merkle_proof(leaf_hash: str, proof: List[dict], root: str) -> bool:
+    """Recompute the root from a leaf and its sibling path"""
+    node = bytes.fromhex(leaf_hash)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = _merkle_node(sibling, node) if step["position"] == "left" else _merkle_node(node, sibling)
+    return node.hex() == root
+
+# =============================================================================
+# BATCH VERIFICATION
+# =============================================================================
+
+def audit_games(server_seed: str, server_seed_hash: str, games: List[dict]) -> tuple:
+    """Re-derive every game of a seed session and commit to the outcomes
+
+    `games` must be sorted by nonce. Returns the summary dict, the game ids in
+    leaf order and the levels of the tree built from them.
+    """
+    hash_matches = hash_server_seed(server_seed) == server_seed_hash
+    # The keyed HMAC state only depends on the server seed, so it is set up once
+    base_mac = hmac.new(server_seed.encode(), digestmod=hashlib.sha256)
+
+    leaves = []
+    game_ids = []
+    mismatched = []
+    mismatch_count = 0
+    seen_nonces = set()
+    duplicate_nonces = 0
+
+    for game in games:
+        nonce = game["nonce"]
+        mac = base_mac.copy()
+        mac.update(f"{game['client_seed']}:{nonce}".encode())
+        raw_result = hex_to_float(mac.hexdigest())
+        result = calculate_game_result(game["game_type"], raw_result)
+
+        if raw_result != game.get("raw_result") or result != game.get("result"):
+            mismatch_count += 1
+            if len(mismatched) < MAX_REPORTED_MISMATCHES:
+                mismatched.append(game["id"])
+
+        if nonce in seen_nonces:
+            duplicate_nonces += 1
+        seen_nonces.add(nonce)
+
+        leaves.append(merkle_leaf(nonce, game["game_type"], result))
+        game_ids.append(game["id"])
+
+    max_nonce = max(seen_nonces) if seen_nonces else -1
+    levels = build_merkle_levels(leaves)
+
+    summary = {
+        "status": "complete",
+        "merkle_root": levels[-1][0].hex(),
+        "leaf_count": len(leaves),
+        "games_checked": len(games),
+        "verified": len(games) - mismatch_count if hash_matches else 0,
+        "mismatched": mismatch_count,
+        "mismatched_game_ids": mismatched,
+        "server_seed_hash_matches": hash_matches,
+        "duplicate_nonces": duplicate_nonces,
+        "missing_nonces": max_nonce + 1 - len(seen_nonces),
+        "audited_at": datetime.now(timezone.utc).isoformat()
+    }
+    return summary, game_ids, levels
+
+def _audit_session(seeds: dict, docs: List[dict], sessions: dict) -> tuple:
+    """Decode, verify and chunk a whole seed session; runs off the event loop"""
+    games = [decode_game(doc, sessions) for doc in docs]
+    summary, game_ids, levels = audit_games(seeds["server_seed"], seeds["server_seed_hash"], games)
+    leaves = levels[0] if game_ids else []
+    chunks = [
+        {
+            "server_seed_hash": seeds["server_seed_hash"],
+            "chunk": i // LEAVES_PER_CHUNK,
+            "game_ids": game_ids[i:i + LEAVES_PER_CHUNK],
+            "leaves": b"".join(leaves[i:i + LEAVES_PER_CHUNK])
+        }
+        for i in range(0, len(game_ids), LEAVES_PER_CHUNK)
+    ]
+    tree = ({game_id: i for i, game_id in enumerate(game_ids)}, levels) if game_ids else None
+    return summary, chunks, tree
+
+# =============================================================================
+# BACKGROUND JOB
+# =============================================================================
+
+async def run_seed_audit(storage, seed_sessions, seeds: dict):
+    """Audit every game played under a revealed seed and store the commitment"""
+    server_seed_hash = seeds["server_seed_hash"]
+    started = time.perf_counter()
+    try:
+        # One session per client seed the server seed was used with
+        sessions = {s["_id"]: s for s in await seed_sessions.find_by_hash(storage, server_seed_hash)}
+        docs = await storage.games_for_sessions(list(sessions))
+
+        # Re-deriving every game is CPU bound; keep it off the event loop
+        loop = asyncio.get_running_loop()
+        summary, chunks, tree = await loop.run_in_executor(None, _audit_session, seeds, docs, sessions)
+        summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        await storage.save_audit_chunks(server_seed_hash, chunks)
+        await storage.set_seed_audit(seeds["id"], server_seed_hash, summary)
+        # The levels were just built; proof requests start from them
+        _cache_tree(server_seed_hash, tree)
+        logger.info(
+            "Audited seed %s...: %d games, %d mismatched, root %s",
+            server_seed_hash[:16], summary["games_checked"], summary["mismatched"], summary["merkle_root"][:16]
+        )
+    except Exception as e:
+        logger.exception("Seed audit failed for %s", server_seed_hash)
+        await storage.set_seed_audit(seeds["id"], server_seed_hash, {"status": "failed", "error": str(e)})
+
+async def resume_pending_audits(storage, seed_sessions, owner: Optional[str] = None, lease_ttl: float = 60) -> int:
+    """Run the audits a restart interrupted; returns how many were run
+
+    A reveal marks the seed "pending" before its audit runs as a background
+    task, so a crash in between would leave it pending forever. Audits are
+    safe to repeat: the chunks are replaced and the summary overwritten.
+    With an `owner`, workers other than the lease holder leave them alone.
+    """
+    if owner is not None and not await storage.acquire_lease(LEASE_KEY, owner, lease_ttl):
+        return 0
+    done = set()
+    while True:
+        # Every audit leaves "pending" (complete or failed), so each batch is new
+        seeds = [s for s in await storage.pending_audits(PENDING_AUDIT_BATCH) if s["server_seed_hash"] not in done]
+        for seed in seeds:
+            await run_seed_audit(storage, seed_sessions, seed)
+            done.add(seed["server_seed_hash"])
+        if not seeds:
+            break
+    resumed = len(done)
+    if resumed:
+        logger.info("Resumed %d pending seed audits", resumed)
+    return resumed
+
+# =============================================================================
+# INCLUSION PROOFS
+# =============================================================================
+
+_tree_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _cache_tree(server_seed_hash: str, tree: Optional[tuple]):
+    if tree is None:
+        _tree_cache.pop(server_seed_hash, None)
+        return
+    _tree_cache[server_seed_hash] = tree
+    _tree_cache.move_to_end(server_seed_hash)
+    if len(_tree_cache) > TREE_CACHE_SIZE:
+        _tree_cache.popitem(last=False)
+
+def _build_tree(chunks: List[dict]) -> Optional[tuple]:
+    game_ids = []
+    leaves = []
+    for chunk in chunks:
+        blob = bytes(chunk["leaves"])
+        game_ids.extend(chunk["game_ids"])
+        leaves.extend(blob[i:i + 32] for i in range(0, len(blob), 32))
+    if not leaves:
+        return None
+    return {game_id: i for i, game_id in enumerate(game_ids)}, build_merkle_levels(leaves)
+
+async def load_audit_tree(storage, server_seed_hash: str) -> Optional[tuple]:
+    """Load the persisted leaves of an audit and rebuild (game_ids, levels)"""
+    cached = _tree_cache.get(server_seed_hash)
+    if cached is not None:
+        _tree_cache.move_to_end(server_seed_hash)
+        return cached
+
+    chunks = await storage.load_audit_chunks(server_seed_hash)
+    # Hashing a large session's tree is CPU bound; keep it off the event loop
+    tree = await asyncio.get_running_loop().run_in_executor(None, _build_tree, chunks)
+    if tree is not None:
+        _cache_tree(server_seed_hash, tree)
+    return tree
+
+async def get_inclusion_proof(storage, server_seed_hash: str, game_id: str) -> Optional[dict]:
+    """O(log n) proof that a single game is part of an audited seed session"""
+    tree = await load_audit_tree(storage, server_seed_hash)
+    if tree is None:
+        return None
+    index_by_id, levels = tree
+    index = index_by_id.get(game_id)
+    if index is None:
+        return None
+    return {
+        "game_id": game_id,
+        "leaf_index": index,
+        "leaf_hash": levels[0][index].hex(),
+        "proof": merkle_proof(levels, index),
+        "merkle_root": levels[-1][0].hex()
+    }
@@ -0,0 +1,361 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# MULTI-WORKER COORDINATION
+# =============================================================================
+# With several uvicorn / gunicorn workers (or nodes), each process still keeps
+# its own caches and in-memory aggregates. Two pieces keep them coherent:
+#
+# - cache bus: every worker broadcasts what it changed (a user's seeds, a
+#   user's name, a recorded game) and the others drop or update their copies.
+#   The channel is pluggable: datagrams between the workers of one host over
+#   Unix sockets in a shared directory, or a capped Mongo collection read
+#   through a change stream (a tailable cursor on a standalone server).
+#   Delivery is best effort (a worker too far behind loses events); correctness
+#   never depends on it, only freshness.
+# - leases: a worker only caches a user's active seed (and its nonce) while
+#   it holds that user's lease in storage. Other workers read and increment
+#   that user's nonce straight through storage, so its nonce state lives on
+#   one worker at a time. Leases are renewed in bulk in the background, and
+#   the nonce compare-and-set stays as the last line of defence.
+#
+# Without WORKER_COORDINATION the bus publishes into nothing and no leases
+# are taken: the single-process behaviour is unchanged.
+
+EVENTS = REGISTRY.counter("cache_bus_events_total", "Cache events by direction", ("direction",))
+LEASES_HELD = REGISTRY.gauge("leases_held", "Leases this worker holds")
+
+def worker_id() -> str:
+    """Unique name of this worker process"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _json_object(obj: dict):
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+class CacheBus:
+    """Cache events for the other workers; this base class is the single-process no-op"""
+
+    shared = False
+
+    def __init__(self, worker: str):
+        self.worker = worker
+        self._handlers: Dict[str, List[Callable]] = {}
+
+    def subscribe(self, kind: str, handler: Callable):
+        """Call `handler(payload)` for `kind` events published by other workers"""
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def publish(self, kind: str, payload):
+        """Tell the other workers; never blocks, never raises"""
+        if not self.shared:
+            return
+        try:
+            self._send(json.dumps({"w": self.worker, "k": kind, "p": payload}, default=_json_default))
+            EVENTS.inc("published")
+        except Exception:
+            EVENTS.inc("dropped")
+            logger.exception("Publishing a %s cache event failed", kind)
+
+    def _send(self, data: str):
+        pass
+
+    def _deliver(self, data: str):
+        event = json.loads(data, object_hook=_json_object)
+        if event["w"] == self.worker:
+            return
+        EVENTS.inc("received")
+        for handler in self._handlers.get(event["k"], ()):
+            try:
+                handler(event["p"])
+            except Exception:
+                logger.exception("Handling a %s cache event failed", event["k"])
+
+    async def start(self, storage):
+        pass
+
+    async def stop(self, storage):
+        pass
+
+class UnixSocketBus(CacheBus):
+    """Datagrams between the workers of one host, one socket per worker in `directory`
+
+    A busy worker's receive queue is short (net.unix.max_dgram_qlen, 10 by
+    default). Datagrams it has no room for are kept, in order, and resent
+    shortly after; only past `backlog` per peer are the oldest dropped.
+    """
+
+    shared = True
+    RETRY_SECONDS = 0.002
+
+    def __init__(self, worker: str, directory: str, peer_refresh: float = 1.0, backlog: int = 1000):
+        super().__init__(worker)
+        self.directory = Path(directory)
+        self.peer_refresh = peer_refresh
+        self.backlog = backlog
+        self.path = self.directory / f"{worker}.sock"
+        self._sock: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+        self._pending: Dict[str, deque] = {}
+        self._retry: Optional[asyncio.TimerHandle] = None
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.peer_refresh:
+            self._peers = [str(path) for path in self.directory.glob("*.sock") if path != self.path]
+            self._peers_at = now
+        return self._peers
+
+    def _send_to(self, path: str, payload: bytes) -> bool:
+        """Send one datagram; False when the peer has no room for it yet"""
+        try:
+            self._sock.sendto(payload, path)
+        except ConnectionRefusedError:
+            # Left behind by a worker that died without cleaning up
+            Path(path).unlink(missing_ok=True)
+            self._peers_at = 0.0
+        except FileNotFoundError:
+            self._peers_at = 0.0
+        except BlockingIOError:
+            return False
+        return True
+
+    def _send(self, data: str):
+        payload = data.encode()
+        for path in self._peer_paths():
+            # Behind earlier datagrams still waiting for the peer, to keep the order
+            if path in self._pending or not self._send_to(path, payload):
+                self._hold(path, payload)
+
+    def _hold(self, path: str, payload: bytes):
+        pending = self._pending.setdefault(path, deque())
+        if len(pending) >= self.backlog:
+            pending.popleft()
+            EVENTS.inc("dropped")
+        pending.append(payload)
+        if self._retry is None:
+            self._retry = asyncio.get_running_loop().call_later(self.RETRY_SECONDS, self._resend)
+
+    def _resend(self):
+        self._retry = None
+        for path, pending in list(self._pending.items()):
+            while pending and self._send_to(path, pending[0]):
+                pending.popleft()
+            if not pending:
+                del self._pending[path]
+        if self._pending:
+            self._retry = asyncio.get_running_loop().call_later(self.RETRY_SECONDS, self._resend)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except BlockingIOError:
+                return
+            try:
+                self._deliver(data.decode())
+            except Exception:
+                logger.exception("Dropping a malformed cache event")
+
+    async def start(self, storage):
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(str(self.path))
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+        logger.info("Cache bus listening on %s", self.path)
+
+    async def stop(self, storage):
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        self._pending.clear()
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            self.path.unlink(missing_ok=True)
+
+class MongoBus(CacheBus):
+    """Events in a capped collection, followed by a change stream or a tailable cursor"""
+
+    shared = True
+    COLLECTION = "cache_events"
+
+    def __init__(self, worker: str, size_bytes: int = 16 * 1024 * 1024):
+        super().__init__(worker)
+        self.size_bytes = size_bytes
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        self._inserts = set()
+
+    def _send(self, data: str):
+        task = asyncio.ensure_future(self._collection.insert_one({"w": self.worker, "e": data}))
+        self._inserts.add(task)
+        task.add_done_callback(self._inserted)
+
+    def _inserted(self, task: asyncio.Task):
+        self._inserts.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            EVENTS.inc("dropped")
+            logger.warning("Publishing a cache event failed: %s", task.exception())
+
+    async def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.w": {"$ne": self.worker}}}]
+        async with self._collection.watch(pipeline) as stream:
+            async for change in stream:
+                self._deliver(change["fullDocument"]["e"])
+
+    async def _follow_tailable_cursor(self):
+        from pymongo import CursorType
+        newest = await self._collection.find_one({}, sort=[("$natural", -1)])
+        last = newest["_id"] if newest else None
+        while True:
+            query = {"_id": {"$gt": last}} if last is not None else {}
+            cursor = self._collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                async for doc in cursor:
+                    last = doc["_id"]
+                    if doc["w"] != self.worker:
+                        self._deliver(doc["e"])
+            await asyncio.sleep(0.1)
+
+    async def _listen(self, change_streams: bool):
+        while True:
+            try:
+                if change_streams:
+                    await self._follow_change_stream()
+                else:
+                    await self._follow_tailable_cursor()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Following cache events failed; retrying")
+                await asyncio.sleep(1)
+
+    async def start(self, storage):
+        from pymongo.errors import CollectionInvalid
+        db = storage.db
+        try:
+            await db.create_collection(self.COLLECTION, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._collection = db[self.COLLECTION]
+        # Change streams need a replica set, the same condition as transactions
+        self._task = asyncio.create_task(self._listen(storage.transactions))
+
+    async def stop(self, storage):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._inserts:
+            await asyncio.gather(*self._inserts, return_exceptions=True)
+
+def create_bus(kind: str, worker: str, socket_dir: str = "/tmp/razerbet-workers") -> CacheBus:
+    """Bus for WORKER_COORDINATION: `unix`, `mongo`, or empty for a single process"""
+    if not kind:
+        return CacheBus(worker)
+    if kind == "unix":
+        return UnixSocketBus(worker, socket_dir)
+    if kind == "mongo":
+        return MongoBus(worker)
+    raise ValueError(f"Unknown WORKER_COORDINATION: {kind}")
+
+class Leases:
+    """Keys this worker owns through storage leases, renewed in the background"""
+
+    def __init__(self, owner: str, ttl: float = 30, maxsize: int = 10000):
+        self.owner = owner
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # key -> monotonic time until which the lease is certainly still ours
+        self._held: Dict[str, float] = {}
+        # key -> monotonic time until which another worker is assumed to hold it
+        self._foreign: "OrderedDict[str, float]" = OrderedDict()
+        self._released = set()
+        self._task: Optional[asyncio.Task] = None
+        LEASES_HELD.set_callback(lambda: {(): len(self._held)})
+
+    def _deadline(self, since: float) -> float:
+        # Trust a lease for less than its ttl: renewals may be late, clocks differ
+        return since + self.ttl * 0.8
+
+    def holds(self, key: str) -> bool:
+        deadline = self._held.get(key)
+        return deadline is not None and deadline > time.monotonic()
+
+    async def acquire(self, storage, key: str) -> bool:
+        """Whether this worker owns `key`, taking the lease if it is free"""
+        if self.holds(key):
+            return True
+        now = time.monotonic()
+        if self._foreign.get(key, 0.0) > now:
+            return False
+        self._released.discard(key)
+        if await storage.acquire_lease(key, self.owner, self.ttl):
+            self._held[key] = self._deadline(now)
+            self._foreign.pop(key, None)
+            return True
+        self._foreign[key] = now + self.ttl
+        self._foreign.move_to_end(key)
+        if len(self._foreign) > self.maxsize:
+            self._foreign.popitem(last=False)
+        return False
+
+    def release(self, key: str):
+        """Give `key` up; the lease is deleted with the next renewal"""
+        if self._held.pop(key, None) is not None:
+            self._released.add(key)
+
+    async def _renew_loop(self, storage):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if self._released:
+                    keys, self._released = list(self._released), set()
+                    await storage.release_leases(self.owner, keys)
+                started = time.monotonic()
+                renewed = set(await storage.renew_leases(self.owner, self.ttl))
+                deadline = self._deadline(started)
+                for key in list(self._held):
+                    if key in renewed:
+                        self._held[key] = max(self._held[key], deadline)
+                    elif self._held[key] <= deadline:
+                        # A late renewal let it expire and another worker took it over
+                        del self._held[key]
+            except Exception:
+                logger.exception("Renewing leases failed")
+
+    async def start(self, storage):
+        self._task = asyncio.create_task(self._renew_loop(storage))
+
+    async def stop(self, storage):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._held.clear()
+        try:
+            await storage.release_leases(self.owner)
+        except Exception:
+            logger.exception("Releasing leases failed; they expire on their own")
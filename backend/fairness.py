@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# ONLINE FAIRNESS MONITOR
+# =============================================================================
+# Every recorded game feeds its raw_result (uniform on [0, 1) if the seeds are
+# fair) into per game type accumulators. Updates are O(1) and allocation free;
+# the test statistics are only computed when the endpoint is read.
+#
+# - Histogram bins        -> chi-square goodness of fit against uniform
+# - Welford mean/variance -> z-test of the mean against 0.5 (variance 1/12)
+# - Runs above/below 0.5  -> Wald-Wolfowitz runs test for serial dependence
+# - Longest streak        -> chance of a streak that long in n fair draws
+
+HISTOGRAM_BINS = 20
+STATE_KEY = "fairness_monitor"
+
+class FairnessAccumulator:
+    """Streaming statistics of one game type's raw results"""
+
+    __slots__ = ("count", "bins", "mean", "m2", "above", "runs", "streak", "longest_streak", "last_side")
+
+    def __init__(self):
+        self.count = 0
+        self.bins = [0] * HISTOGRAM_BINS
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.above = 0
+        self.runs = 0
+        self.streak = 0
+        self.longest_streak = 0
+        self.last_side = None
+
+    def add(self, raw_result: float):
+        self.count += 1
+        self.bins[min(int(raw_result * HISTOGRAM_BINS), HISTOGRAM_BINS - 1)] += 1
+
+        delta = raw_result - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (raw_result - self.mean)
+
+        side = raw_result >= 0.5
+        self.above += side
+        if side == self.last_side:
+            self.streak += 1
+        else:
+            self.runs += 1
+            self.streak = 1
+            self.last_side = side
+        if self.streak > self.longest_streak:
+            self.longest_streak = self.streak
+
+    def to_state(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "FairnessAccumulator":
+        acc = cls()
+        for slot in cls.__slots__:
+            if slot in state:
+                setattr(acc, slot, state[slot])
+        if len(acc.bins) != HISTOGRAM_BINS:
+            # Bin count changed since the state was saved; start the histogram over
+            acc.bins = [0] * HISTOGRAM_BINS
+        return acc
+
+    def report(self, alert_p_value: float, min_samples: int) -> dict:
+        """Current test statistics and whether any of them crosses the alert threshold"""
+        n = self.count
+        if n < 2:
+            return {"count": n, "status": "insufficient_data"}
+
+        expected = n / HISTOGRAM_BINS
+        chi_square = sum((observed - expected) ** 2 / expected for observed in self.bins)
+        chi_square_p = _chi_square_sf(chi_square, HISTOGRAM_BINS - 1)
+
+        variance = self.m2 / (n - 1)
+        mean_z = (self.mean - 0.5) / math.sqrt(1 / 12 / n)
+        mean_p = math.erfc(abs(mean_z) / math.sqrt(2))
+
+        above, below = self.above, n - self.above
+        if above and below:
+            expected_runs = 2 * above * below / n + 1
+            runs_variance = (expected_runs - 1) * (expected_runs - 2) / (n - 1)
+            runs_z = (self.runs - expected_runs) / math.sqrt(runs_variance) if runs_variance > 0 else 0.0
+            runs_p = math.erfc(abs(runs_z) / math.sqrt(2))
+        else:
+            # Every result on one side of 0.5: no z-score, and as unlikely as it gets
+            expected_runs, runs_z, runs_p = 1.0, None, 0.0
+
+        # P(some streak >= L in n fair draws) ~= 1 - exp(-n / 2^L)
+        streak_p = -math.expm1(-n / 2 ** self.longest_streak)
+
+        p_values = {"chi_square": chi_square_p, "mean": mean_p, "runs": runs_p, "longest_streak": streak_p}
+        failing = sorted(test for test, p in p_values.items() if p < alert_p_value)
+        if n < min_samples:
+            status = "insufficient_data"
+        else:
+            status = "alert" if failing else "ok"
+
+        return {
+            "count": n,
+            "status": status,
+            "failing_tests": failing if n >= min_samples else [],
+            "chi_square": {"statistic": round(chi_square, 4), "df": HISTOGRAM_BINS - 1, "p_value": chi_square_p, "bins": list(self.bins)},
+            "mean": {"value": self.mean, "expected": 0.5, "z": round(mean_z, 4), "p_value": mean_p},
+            "variance": {"value": variance, "expected": 1 / 12},
+            "runs": {"observed": self.runs, "expected": round(expected_runs, 2), "z": round(runs_z, 4) if runs_z is not None else None, "p_value": runs_p},
+            "longest_streak": {"length": self.longest_streak, "current": self.streak, "p_value": streak_p}
+        }
+
+def _chi_square_sf(statistic: float, df: int) -> float:
+    """Upper tail of the chi-square distribution (Wilson-Hilferty approximation)"""
+    if statistic <= 0:
+        return 1.0
+    z = ((statistic / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+class FairnessMonitor:
+    """Per game type accumulators with periodic persistence"""
+
+    def __init__(self, alert_p_value: float = 0.001, min_samples: int = 1000, persist_interval: float = 60):
+        self.alert_p_value = alert_p_value
+        self.min_samples = min_samples
+        self.persist_interval = persist_interval
+        self.accumulators: Dict[str, FairnessAccumulator] = {}
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self, game_type: str, raw_result: float):
+        """Feed one recorded game; called on the ingest path"""
+        acc = self.accumulators.get(game_type)
+        if acc is None:
+            acc = self.accumulators[game_type] = FairnessAccumulator()
+        acc.add(raw_result)
+        self._dirty = True
+
+    def report(self) -> dict:
+        games = {
+            game_type: acc.report(self.alert_p_value, self.min_samples)
+            for game_type, acc in sorted(self.accumulators.items())
+        }
+        alerts = sorted(game_type for game_type, report in games.items() if report["status"] == "alert")
+        return {
+            "status": "alert" if alerts else "ok",
+            "alerts": alerts,
+            "thresholds": {"alert_p_value": self.alert_p_value, "min_samples": self.min_samples},
+            "games": games,
+            "generated_at": datetime.now(timezone.utc).isoformat()
+        }
+
+    # -- persistence ----------------------------------------------------------
+
+    async def load(self, storage):
+        state = await storage.load_state(STATE_KEY)
+        if state:
+            self.accumulators = {
+                game_type: FairnessAccumulator.from_state(acc_state)
+                for game_type, acc_state in state.get("games", {}).items()
+            }
+
+    async def persist(self, storage):
+        if not self._dirty:
+            return
+        self._dirty = False
+        state = {"games": {game_type: acc.to_state() for game_type, acc in self.accumulators.items()}}
+        await storage.save_state(STATE_KEY, state)
+
+    async def _persist_loop(self, storage):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.persist(storage)
+            except Exception:
+                logger.exception("Persisting fairness monitor state failed")
+                self._dirty = True
+
+    async def start(self, storage):
+        await self.load(storage)
+        self._task = asyncio.create_task(self._persist_loop(storage))
+
+    async def stop(self, storage):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.persist(storage)
@@ -0,0 +1,248 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from ledger import DEFAULT_CURRENCY, to_minor
+from provably_fair import GAME_TYPES
+from seed_sessions import session_id, session_fields
+
+# =============================================================================
+# GAME HISTORY SCHEMA (v2)
+# =============================================================================
+# Stored documents use short field names, a BSON datetime, the game id as _id,
+# a reference to the seed session (see seed_sessions) and the outcome packed
+# into one integer. Every result field can be rebuilt from the packed outcome
+# plus raw_result, so the full result dict is never stored. `decode_game`
+# expands v2 and legacy (v1) documents back to the public response shape.
+#
+#   _id  game id            n   nonce              b   bet_amount
+#   v    schema version     o   packed outcome     m   multiplier
+#   g    game type code     r   raw_result         w   won
+#   s    seed session id    u   user_id            p   payout
+#   t    timestamp          un  username           cu  currency (omitted for ETH)
+#                           mu  masked username    ba  bet_amount in minor units
+#                                                  pa  payout in minor units
+#
+# `ba` / `pa` are the exact integers every aggregate sums (see ledger); the
+# floats stay for the public shape. `migrate.py ledger-amounts` adds them to
+# rows written before they existed.
+#
+# Early v2 rows carry the seed hash (`h`, raw bytes) and client seed (`c`)
+# inline instead of `s`; `migrate.py seed-sessions` moves them to sessions.
+
+SCHEMA_VERSION = 2
+
+GAME_TYPE_CODES = {game_type: code for code, game_type in enumerate(GAME_TYPES)}
+
+def mask_username(name: str) -> str:
+    """Hide the middle of a username for public listings"""
+    if len(name) > 4:
+        return name[:2] + '*' * (len(name) - 4) + name[-2:]
+    return name
+
+# =============================================================================
+# OUTCOME PACKING
+# =============================================================================
+
+def pack_outcome(game_type: str, result: dict) -> int:
+    """Pack the discrete part of a game result into one integer"""
+    if game_type == "coinflip":
+        return 0 if result["outcome"] == "heads" else 1
+    elif game_type == "dices_war":
+        return result["player_roll"] * 8 + result["house_roll"]
+    elif game_type == "mines":
+        mask = 0
+        for pos in result["mine_positions"]:
+            mask |= 1 << pos
+        return mask
+    elif game_type == "tower":
+        packed = 0
+        for pos in reversed(result["correct_path"]):
+            packed = packed * 3 + pos
+        return packed
+    elif game_type == "blackjack":
+        return result["deck_seed"]
+    elif game_type == "match":
+        return result["match_value"]
+    elif game_type == "crash":
+        return round(result["crash_point"] * 100)
+    return 0
+
+def unpack_outcome(game_type: str, packed: int, raw_result: float) -> dict:
+    """Rebuild the full result dict of `calculate_game_result`"""
+    if game_type == "coinflip":
+        return {
+            "outcome": "heads" if packed == 0 else "tails",
+            "roll": round(raw_result * 100, 2)
+        }
+    elif game_type == "dices_war":
+        player_roll, house_roll = packed >> 3, packed & 7
+        return {
+            "player_roll": player_roll,
+            "house_roll": house_roll,
+            "winner": "player" if player_roll > house_roll else ("tie" if player_roll == house_roll else "house")
+        }
+    elif game_type == "mines":
+        positions = [i for i in range(25) if packed >> i & 1]
+        return {
+            "mine_positions": positions,
+            "safe_tiles": [i for i in range(25) if not packed >> i & 1]
+        }
+    elif game_type == "tower":
+        correct_positions = []
+        for level in range(8):
+            packed, pos = divmod(packed, 3)
+            correct_positions.append(pos)
+        return {
+            "correct_path": correct_positions,
+            "levels": 8,
+            "positions_per_level": 3
+        }
+    elif game_type == "blackjack":
+        return {
+            "deck_seed": packed,
+            "shuffle_index": raw_result,
+            "note": "Full deck shuffle determined by this seed"
+        }
+    elif game_type == "match":
+        return {
+            "match_value": packed,
+            "is_match": packed < 20,
+            "roll": round(raw_result * 100, 2)
+        }
+    elif game_type == "crash":
+        return {
+            "crash_point": packed / 100,
+            "raw_value": round(raw_result * 100, 4)
+        }
+    return {"raw": raw_result}
+
+# =============================================================================
+# ENCODE / DECODE
+# =============================================================================
+
+def encode_game(record: dict) -> dict:
+    """Convert a full game record into a v2 storage document"""
+    game_type = record["game_type"]
+    currency = record.get("currency", DEFAULT_CURRENCY)
+    timestamp = record["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    doc = {
+        "_id": record["id"],
+        "v": SCHEMA_VERSION,
+        "g": GAME_TYPE_CODES[game_type],
+        "s": session_id(record["server_seed_hash"], record["client_seed"]),
+        "n": record["nonce"],
+        "o": pack_outcome(game_type, record["result"]),
+        "r": record["raw_result"],
+        "u": record["user_id"],
+        "un": record["username"],
+        "mu": mask_username(record["username"]),
+        "b": record["bet_amount"],
+        "m": record["multiplier"],
+        "w": record["won"],
+        "p": record["payout"],
+        "ba": to_minor(record["bet_amount"], currency),
+        "pa": to_minor(record["payout"], currency),
+        "t": timestamp
+    }
+    if currency != DEFAULT_CURRENCY:
+        doc["cu"] = currency
+    return doc
+
+def _as_utc(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if isinstance(timestamp, datetime) and timestamp.tzinfo is None:
+        # BSON datetimes come back naive but are always UTC
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+def decode_game(doc: dict, sessions: Optional[Dict[str, dict]] = None) -> dict:
+    """Expand a stored game document (v2 or legacy) to the public shape
+
+    `sessions` maps seed session ids to their documents for rows that
+    reference one; the seed fields are left out when it is missing.
+    """
+    if doc.get("v") != SCHEMA_VERSION:
+        # The plaintext server seed is never part of the public shape
+        game = {k: v for k, v in doc.items() if k not in ("_id", "server_seed")}
+        if "timestamp" in game:
+            game["timestamp"] = _as_utc(game["timestamp"])
+        if "username" in game:
+            game["masked_username"] = mask_username(game["username"])
+        return game
+
+    game_type = GAME_TYPES[doc["g"]]
+    if "s" in doc:
+        session = (sessions or {}).get(doc["s"])
+        seeds = session_fields(session) if session else {}
+    else:
+        seeds = {"server_seed_hash": doc["h"].hex() if "h" in doc else None, "client_seed": doc.get("c")}
+    game = {
+        "id": doc["_id"],
+        "game_type": game_type,
+        "server_seed_hash": seeds.get("server_seed_hash"),
+        "client_seed": seeds.get("client_seed"),
+        "nonce": doc.get("n"),
+        "result": unpack_outcome(game_type, doc["o"], doc["r"]) if "o" in doc else None,
+        "raw_result": doc.get("r"),
+        "user_id": doc.get("u"),
+        "username": doc.get("un"),
+        "masked_username": doc.get("mu"),
+        "bet_amount": doc.get("b"),
+        "multiplier": doc.get("m"),
+        "won": doc.get("w"),
+        "payout": doc.get("p"),
+        "currency": doc.get("cu", DEFAULT_CURRENCY),
+        "timestamp": _as_utc(doc["t"]) if "t" in doc else None,
+        "verified": True
+    }
+    # Drop whatever a projection left out
+    return {k: v for k, v in game.items() if v is not None}
+
+def public_game(game: dict) -> dict:
+    """Decoded game as public listings show it"""
+    # Usernames are masked once at write time
+    game["username"] = game.pop("masked_username", game.get("username"))
+    return game
+
+# -- projections --------------------------------------------------------------
+# Public game field -> stored v2 fields it is decoded from. Legacy rows use the
+# public names themselves, so those are projected as well.
+
+FIELD_SOURCES = {
+    "id": ("_id",),
+    "game_type": (),
+    "server_seed_hash": ("s", "h"),
+    "client_seed": ("s", "c"),
+    "nonce": ("n",),
+    "result": ("o", "r"),
+    "raw_result": ("r",),
+    "user_id": ("u",),
+    "username": ("un", "mu"),
+    "bet_amount": ("b",),
+    "multiplier": ("m",),
+    "won": ("w",),
+    "payout": ("p",),
+    "currency": ("cu",),
+    "timestamp": ("t",),
+    "verified": ()
+}
+PUBLIC_FIELDS = tuple(FIELD_SOURCES)
+
+def stored_fields(fields) -> List[str]:
+    """Stored fields a query must return to decode the public `fields`"""
+    # v tells v2 rows from legacy ones; g is needed to decode any v2 row
+    stored = {"_id", "v", "g"}
+    for field in fields:
+        stored.add(field)
+        stored.update(FIELD_SOURCES[field])
+    return sorted(stored)
+
+def select_fields(game: dict, fields) -> dict:
+    return {field: game[field] for field in fields if field in game}
+
+def game_columns(games: List[dict], fields) -> Dict[str, list]:
+    """Games as one list per field, for table views; null where a game lacks the field"""
+    return {field: [game.get(field) for game in games] for field in fields}
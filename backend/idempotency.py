@@ -0,0 +1,44 @@
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import REGISTRY
+
+# =============================================================================
+# IDEMPOTENT GAME RECORDING
+# =============================================================================
+# A game's id is derived from its idempotency key instead of drawn at random:
+# the Idempotency-Key header when the bot sends one, otherwise the seed
+# session and nonce the game was played with (one game per nonce). Every
+# retry of a submission therefore carries the same id, and the primary key of
+# game_history turns the second insert into a no-op that returns the original
+# game_id. Recently recorded ids are also kept in memory, so a hot retry is
+# answered before any verification or storage work.
+
+GAME_ID_NAMESPACE = uuid.UUID("6f0c6a4e-1d5b-4b8e-9a51-3c2f7d9e8b10")
+
+DUPLICATES = REGISTRY.counter("games_duplicate_total", "Repeated game submissions answered with the original game", ("source",))
+
+def game_id_for(session_id: str, nonce: int, key: Optional[str] = None) -> str:
+    """Deterministic game id of a submission"""
+    name = f"key:{key}" if key else f"session:{session_id}:{nonce}"
+    return str(uuid.uuid5(GAME_ID_NAMESPACE, name))
+
+class RecentGames:
+    """LRU of recently recorded game ids"""
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def seen(self, game_id: str) -> bool:
+        if game_id in self._ids:
+            self._ids.move_to_end(game_id)
+            return True
+        return False
+
+    def add(self, game_id: str):
+        self._ids[game_id] = None
+        self._ids.move_to_end(game_id)
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
@@ -0,0 +1,436 @@
+import asyncio
+import heapq
+import logging
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from game_codec import decode_game, public_game
+from ledger import from_minor, to_minor
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# LEADERBOARDS
+# =============================================================================
+# Maintained incrementally by record_game, never computed with $group/$sort.
+# Every window (daily, weekly, all-time) keeps, per game type (plus `all`):
+#
+# - wagered / profit -> running totals per user and currency in minor units,
+#                       with a top-K of them kept sorted by bisect
+# - multiplier       -> the top-K single winning games
+#
+# Recording a game is a handful of O(K) list inserts; reading a board slices
+# an already sorted list, refilled from the totals first if a fall in profit
+# left it stale. Totals are what makes profit exact (it can fall), so they are
+# kept for every user active in the window. They are persisted one row per
+# (window, period, game type, currency, user), and only the rows that changed
+# since the last save are written; the multiplier boards, which are bounded,
+# go into one service_state document. A rebuild replays game_history once,
+# e.g. after first deploy.
+
+METRICS = ("wagered", "profit", "multiplier")
+WINDOWS = ("daily", "weekly", "all_time")
+ALL_GAMES = "all"
+STATE_KEY = "leaderboards"
+# Saved boards of an older version are dropped and rebuilt from history
+# (2: totals in minor units, 3: totals as rows of their own)
+STATE_VERSION = 3
+
+# Games recorded this long before a rebuild started may still be in flight
+REBUILD_OVERLAP = timedelta(minutes=5)
+
+def period_of(window: str, timestamp: datetime) -> str:
+    """Id of the window period `timestamp` falls in (UTC days, ISO weeks)"""
+    if window == "daily":
+        return timestamp.strftime("%Y-%m-%d")
+    if window == "weekly":
+        year, week, _ = timestamp.isocalendar()
+        return f"{year}-W{week:02d}"
+    return "all"
+
+class TopK:
+    """Highest scores by key, kept sorted with bisect
+
+    Tracks twice the served size so that scores which fall (profit) rarely
+    push an untracked key into the served ranks. `ceiling` bounds every
+    untracked score; when the served ranks can no longer be trusted the owner
+    refills from its totals.
+    """
+
+    __slots__ = ("size", "capacity", "entries", "scores", "ceiling")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.capacity = size * 2
+        self.entries: List[Tuple[float, str]] = []   # (-score, key), best first
+        self.scores: Dict[str, float] = {}
+        self.ceiling = float("-inf")
+
+    def offer(self, key: str, score: float) -> Optional[str]:
+        """Set the score of `key`; returns the key pushed out, if any"""
+        entries = self.entries
+        old = self.scores.pop(key, None)
+        if old is not None:
+            del entries[bisect_left(entries, (-old, key))]
+        elif len(entries) >= self.capacity and score <= -entries[-1][0]:
+            # Common case: an untracked key that still does not make the board
+            if score > self.ceiling:
+                self.ceiling = score
+            return None
+
+        insort(entries, (-score, key))
+        self.scores[key] = score
+        if len(entries) > self.capacity:
+            evicted_score, evicted = entries.pop()
+            del self.scores[evicted]
+            self.ceiling = max(self.ceiling, -evicted_score)
+            return evicted
+        return None
+
+    @property
+    def stale(self) -> bool:
+        """An untracked key may outrank one of the served entries"""
+        if self.ceiling == float("-inf"):
+            return False
+        return len(self.entries) < self.size or -self.entries[self.size - 1][0] < self.ceiling
+
+    def refill(self, scores):
+        """Rebuild from (key, score) pairs covering every key; O(n log K)"""
+        best = heapq.nlargest(self.capacity + 1, scores, key=lambda item: item[1])
+        self.entries = sorted((-score, key) for key, score in best[:self.capacity])
+        self.scores = dict(best[:self.capacity])
+        self.ceiling = best[self.capacity][1] if len(best) > self.capacity else float("-inf")
+
+    def top(self, limit: int) -> List[Tuple[str, float]]:
+        return [(key, -score) for score, key in self.entries[:min(limit, self.size)]]
+
+class UserBoard:
+    """Per user totals of one game type and currency, ranked by wagered and profit"""
+
+    __slots__ = ("currency", "totals", "wagered", "profit", "changed")
+
+    def __init__(self, currency: str, size: int):
+        self.currency = currency
+        self.totals: Dict[str, list] = {}   # user_id -> [wagered, profit, games, username]
+        self.wagered = TopK(size)
+        self.profit = TopK(size)
+        self.changed = set()                # user_ids whose totals are not saved yet
+
+    def add(self, user_id: str, username: str, wagered: int, profit: int):
+        totals = self.totals.get(user_id)
+        if totals is None:
+            totals = self.totals[user_id] = [0, 0, 0, username]
+        totals[0] += wagered
+        totals[1] += profit
+        totals[2] += 1
+        totals[3] = username
+        self.changed.add(user_id)
+
+        self.wagered.offer(user_id, totals[0])
+        # A ranked user can lose enough that someone untracked is ahead; the
+        # profit ranking is then refilled when it is next read, not here
+        self.profit.offer(user_id, totals[1])
+
+    def reindex(self):
+        self.wagered.refill((uid, t[0]) for uid, t in self.totals.items())
+        self.profit.refill((uid, t[1]) for uid, t in self.totals.items())
+
+    def entries(self, metric: str, limit: int) -> List[dict]:
+        ranking = self.wagered if metric == "wagered" else self.profit
+        if ranking.stale:
+            index = 0 if metric == "wagered" else 1
+            ranking.refill((uid, t[index]) for uid, t in self.totals.items())
+        entries = []
+        for rank, (user_id, value) in enumerate(ranking.top(limit), 1):
+            _, _, games, username = self.totals[user_id]
+            entries.append({"rank": rank, "user_id": user_id, "username": username, "value": from_minor(value, self.currency), "games": games})
+        return entries
+
+class MultiplierBoard:
+    """Biggest single winning multipliers of one game type"""
+
+    __slots__ = ("ranking", "games")
+
+    def __init__(self, size: int):
+        self.ranking = TopK(size)
+        self.games: Dict[str, dict] = {}
+
+    def add(self, game: dict):
+        if not game["won"] or not game["multiplier"]:
+            return
+        if len(self.ranking.entries) >= self.ranking.capacity and game["multiplier"] <= -self.ranking.entries[-1][0]:
+            return
+        self.games[game["id"]] = {
+            "game_id": game["id"],
+            "game_type": game["game_type"],
+            "user_id": game["user_id"],
+            "username": game["username"],
+            "multiplier": game["multiplier"],
+            "bet_amount": game["bet_amount"],
+            "payout": game["payout"],
+            "currency": game["currency"],
+            "timestamp": game["timestamp"].isoformat()
+        }
+        evicted = self.ranking.offer(game["id"], game["multiplier"])
+        if evicted is not None:
+            del self.games[evicted]
+
+    def entries(self, limit: int) -> List[dict]:
+        return [
+            dict(self.games[game_id], rank=rank, value=value)
+            for rank, (game_id, value) in enumerate(self.ranking.top(limit), 1)
+        ]
+
+class WindowBoards:
+    """Every board of one window period"""
+
+    __slots__ = ("period", "size", "users", "multipliers")
+
+    def __init__(self, period: str, size: int):
+        self.period = period
+        self.size = size
+        self.users: Dict[Tuple[str, str], UserBoard] = {}
+        self.multipliers: Dict[str, MultiplierBoard] = {}
+
+    def add(self, game: dict):
+        currency = game["currency"]
+        wagered = to_minor(game["bet_amount"], currency)
+        profit = to_minor(game["payout"], currency) - wagered
+        for game_type in (game["game_type"], ALL_GAMES):
+            key = (game_type, currency)
+            board = self.users.get(key)
+            if board is None:
+                board = self.users[key] = UserBoard(currency, self.size)
+            board.add(game["user_id"], game["username"], wagered, profit)
+
+            multipliers = self.multipliers.get(game_type)
+            if multipliers is None:
+                multipliers = self.multipliers[game_type] = MultiplierBoard(self.size)
+            multipliers.add(game)
+
+    def to_state(self) -> dict:
+        # The user totals are saved as rows, see take_changed
+        return {
+            "period": self.period,
+            "multipliers": {game_type: list(board.games.values()) for game_type, board in self.multipliers.items()}
+        }
+
+    def take_changed(self, window: str) -> Tuple[List[dict], list]:
+        """Total rows changed since the last call, and the token to hand back if saving them fails"""
+        rows, taken = [], []
+        for (game_type, currency), board in self.users.items():
+            if not board.changed:
+                continue
+            changed, board.changed = board.changed, set()
+            taken.append((board, changed))
+            for user_id in changed:
+                wagered, profit, games, username = board.totals[user_id]
+                rows.append({
+                    "window": window, "period": self.period, "game_type": game_type, "currency": currency,
+                    "user_id": user_id, "wagered": wagered, "profit": profit, "games": games, "username": username
+                })
+        return rows, taken
+
+    @staticmethod
+    def restore_changed(taken: list):
+        for board, changed in taken:
+            board.changed |= changed
+
+    @classmethod
+    def from_state(cls, state: dict, size: int, rows: List[dict]) -> "WindowBoards":
+        boards = cls(state["period"], size)
+        for row in rows:
+            key = (row["game_type"], row["currency"])
+            board = boards.users.get(key)
+            if board is None:
+                board = boards.users[key] = UserBoard(row["currency"], size)
+            board.totals[row["user_id"]] = [row["wagered"], row["profit"], row["games"], row["username"]]
+        for board in boards.users.values():
+            board.reindex()
+        for game_type, games in state["multipliers"].items():
+            board = boards.multipliers[game_type] = MultiplierBoard(size)
+            for game in games:
+                board.games[game["game_id"]] = game
+                board.ranking.offer(game["game_id"], game["multiplier"])
+        return boards
+
+class BoardSet:
+    """The current period of every window"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.windows: Dict[str, WindowBoards] = {}
+
+    def add(self, game: dict):
+        timestamp = game["timestamp"]
+        for window in WINDOWS:
+            period = period_of(window, timestamp)
+            boards = self.windows.get(window)
+            if boards is None or boards.period < period:
+                boards = self.windows[window] = WindowBoards(period, self.size)
+            elif boards.period > period:
+                # Late game of a finished period
+                continue
+            boards.add(game)
+
+    def current(self, window: str, now: datetime) -> Optional[WindowBoards]:
+        boards = self.windows.get(window)
+        return boards if boards is not None and boards.period == period_of(window, now) else None
+
+class Leaderboards:
+    """Incrementally maintained leaderboards with periodic persistence"""
+
+    def __init__(self, size: int = 100, persist_interval: float = 60):
+        self.size = size
+        self.persist_interval = persist_interval
+        self.boards = BoardSet(size)
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        # Games recorded while a rebuild scans history, by id
+        self._recorded_during_rebuild: Optional[Dict[str, dict]] = None
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._recorded_during_rebuild is not None
+
+    def observe(self, game: dict):
+        """Feed one recorded game in its public shape; called on the ingest path"""
+        self.boards.add(game)
+        self._dirty = True
+        if self._recorded_during_rebuild is not None:
+            self._recorded_during_rebuild[game["id"]] = game
+
+    def top(self, metric: str, window: str, game_type: str = ALL_GAMES, currency: str = "ETH", limit: int = 10) -> dict:
+        now = datetime.now(timezone.utc)
+        boards = self.boards.current(window, now)
+        entries = []
+        if boards is not None:
+            if metric == "multiplier":
+                board = boards.multipliers.get(game_type)
+                entries = board.entries(limit) if board else []
+            else:
+                board = boards.users.get((game_type, currency))
+                entries = board.entries(metric, limit) if board else []
+        return {
+            "metric": metric,
+            "window": window,
+            "period": period_of(window, now),
+            "game_type": game_type,
+            "currency": None if metric == "multiplier" else currency,
+            "entries": entries,
+            "generated_at": now.isoformat()
+        }
+
+    # -- rebuild --------------------------------------------------------------
+
+    async def rebuild(self, storage, batch_size: int = 1000) -> int:
+        """Recompute every board from game_history; recording continues meanwhile"""
+        if self.rebuilding:
+            raise RuntimeError("Leaderboard rebuild already running")
+        started = datetime.now(timezone.utc)
+        self._recorded_during_rebuild = {}
+        try:
+            boards = BoardSet(self.size)
+            scanned = 0
+            # Recent games can be both scanned and observed; count each once
+            recent_scanned = set()
+            async for docs in storage.scan_games(batch_size):
+                for doc in docs:
+                    game = public_game(decode_game(doc))
+                    if "bet_amount" not in game or "timestamp" not in game:
+                        continue
+                    if game["timestamp"] >= started - REBUILD_OVERLAP:
+                        if game["id"] in self._recorded_during_rebuild:
+                            continue
+                        recent_scanned.add(game["id"])
+                    boards.add(game)
+                    scanned += 1
+
+            for game_id, game in self._recorded_during_rebuild.items():
+                if game_id not in recent_scanned:
+                    boards.add(game)
+            self.boards = boards
+            self._dirty = True
+        finally:
+            self._recorded_during_rebuild = None
+        logger.info("Rebuilt leaderboards from %d games", scanned)
+        return scanned
+
+    # -- persistence ----------------------------------------------------------
+
+    async def load(self, storage) -> bool:
+        """Restore saved boards of the current periods; False when nothing usable was saved"""
+        state = await storage.load_state(STATE_KEY)
+        if not state or state.get("version") != STATE_VERSION:
+            return False
+        now = datetime.now(timezone.utc)
+        boards = BoardSet(self.size)
+        for window, window_state in state.get("windows", {}).items():
+            period = window_state["period"]
+            if window in WINDOWS and period == period_of(window, now):
+                rows = await storage.load_leaderboard_totals(window, period)
+                boards.windows[window] = WindowBoards.from_state(window_state, self.size, rows)
+        self.boards = boards
+        return True
+
+    async def persist(self, storage):
+        # Saving half-rebuilt boards would make the next start skip the rebuild
+        if not self._dirty or self.rebuilding:
+            return
+        self._dirty = False
+        windows = dict(self.boards.windows)
+        rows, taken = [], []
+        for window, boards in windows.items():
+            window_rows, window_taken = boards.take_changed(window)
+            rows += window_rows
+            taken += window_taken
+        try:
+            # Totals first: the state document is what makes a start trust them
+            await storage.save_leaderboard_totals(rows)
+            for window, boards in windows.items():
+                await storage.delete_leaderboard_totals(window, keep_period=boards.period)
+            state = {
+                "version": STATE_VERSION,
+                "windows": {window: boards.to_state() for window, boards in windows.items()}
+            }
+            await storage.save_state(STATE_KEY, state)
+        except BaseException:
+            WindowBoards.restore_changed(taken)
+            raise
+
+    async def _persist_loop(self, storage):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.persist(storage)
+            except Exception:
+                logger.exception("Persisting leaderboards failed")
+                self._dirty = True
+
+    async def _rebuild_in_background(self, storage):
+        try:
+            await self.rebuild(storage)
+        except Exception:
+            logger.exception("Rebuilding leaderboards failed")
+
+    def start_rebuild(self, storage) -> bool:
+        """Rebuild in a task of its own; False when a rebuild is already running"""
+        if self.rebuilding or (self._rebuild_task is not None and not self._rebuild_task.done()):
+            return False
+        self._rebuild_task = asyncio.create_task(self._rebuild_in_background(storage))
+        return True
+
+    async def start(self, storage):
+        if not await self.load(storage):
+            # First start with leaderboards (or of this version): derive them from existing history
+            self.start_rebuild(storage)
+        self._task = asyncio.create_task(self._persist_loop(storage))
+
+    async def stop(self, storage):
+        for task in (self._task, self._rebuild_task):
+            if task is not None:
+                task.cancel()
+        self._task = self._rebuild_task = None
+        await self.persist(storage)
@@ -0,0 +1,52 @@
+import math
+from typing import Optional
+
+# =============================================================================
+# LEDGER AMOUNTS
+# =============================================================================
+# Bet amounts and payouts arrive as floats in a currency's major unit (1.5
+# ETH). Every stored total (user stats, rollups, leaderboards) is kept as an
+# integer count of the currency's minor unit instead, so sums are exact, do
+# not drift as they grow, and need no rounding when read.
+#
+# Minor units are chosen so int64 totals have room to spare: ETH counts gwei
+# (1e-9; wei would overflow int64 after ~9 ETH), BTC and LTC satoshis, the
+# dollar stablecoins micro-units. Currencies not listed use 8 decimals.
+# Amounts finer than the minor unit are rounded to the nearest one; amounts
+# whose minor unit count would not fit in an int64 are refused at the API.
+
+CURRENCY_DECIMALS = {
+    "ETH": 9,
+    "BTC": 8,
+    "LTC": 8,
+    "SOL": 9,
+    "BNB": 9,
+    "TRX": 6,
+    "USDT": 6,
+    "USDC": 6,
+}
+DEFAULT_DECIMALS = 8
+DEFAULT_CURRENCY = "ETH"
+# Minor unit counts must fit the int64 columns and BSON longs they are stored in
+MINOR_UNITS_LIMIT = 2 ** 63
+
+def decimals(currency: Optional[str]) -> int:
+    """Decimal places of `currency`'s minor unit"""
+    return CURRENCY_DECIMALS.get(currency or DEFAULT_CURRENCY, DEFAULT_DECIMALS)
+
+def to_minor(amount: float, currency: Optional[str]) -> int:
+    """`amount` in major units as an integer count of minor units"""
+    # Exact for every amount with at most `decimals` places below 2**53 minor units
+    return round(amount * 10 ** decimals(currency))
+
+def check_amount(amount: float, currency: Optional[str]) -> float:
+    """`amount` if it is finite and fits in int64 minor units; ValueError otherwise"""
+    if not math.isfinite(amount):
+        raise ValueError("amount must be a finite number")
+    if abs(amount) * 10 ** decimals(currency) >= MINOR_UNITS_LIMIT:
+        raise ValueError(f"amount is too large for {currency or DEFAULT_CURRENCY}")
+    return amount
+
+def from_minor(units: int, currency: Optional[str]) -> float:
+    """A minor unit count back in major units"""
+    return units / 10 ** decimals(currency)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from metrics import REGISTRY
+
+# =============================================================================
+# LIVE FEED
+# =============================================================================
+# In-process broadcast hub behind GET /api/history/stream (Server-Sent Events).
+# record_game publishes each game once: it is serialized to an SSE frame a
+# single time, kept in a bounded replay ring and pushed onto the send queue of
+# every matching subscriber. A viewer costs a queue slot, not a database query.
+#
+# Event ids are `<boot>-<seq>`. A reconnecting EventSource sends its last id
+# back as Last-Event-ID and is replayed everything after it that is still in
+# the ring; when the gap is no longer covered it gets a `reset` event and
+# should reload /api/history. Subscribers whose queue fills up are dropped;
+# the browser reconnects and resumes from the ring.
+
+SUBSCRIBERS = REGISTRY.gauge("live_feed_subscribers", "Connected live feed clients")
+DROPPED = REGISTRY.counter("live_feed_dropped_total", "Live feed clients dropped for falling behind")
+PUBLISHED = REGISTRY.counter("live_feed_published_total", "Games published to the live feed")
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class Subscriber:
+    """One connected client and its bounded send queue"""
+
+    __slots__ = ("game_type", "user_id", "queue", "dropped")
+
+    def __init__(self, game_type: Optional[str], user_id: Optional[str], queue_size: int):
+        self.game_type = game_type
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    def matches(self, game_type: str, user_id: str) -> bool:
+        return (self.game_type is None or self.game_type == game_type) and (self.user_id is None or self.user_id == user_id)
+
+class LiveFeedHub:
+    """Fans recorded games out to SSE subscribers"""
+
+    def __init__(self, replay_size: int = 1000, queue_size: int = 256, max_subscribers: int = 10000, heartbeat: float = 15):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+        self._boot = format(int(time.time()), "x")
+        self._seq = 0
+        self._ring: deque = deque(maxlen=replay_size)
+        self._subscribers = set()
+        SUBSCRIBERS.set_callback(lambda: {(): len(self._subscribers)})
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_subscribers
+
+    def publish(self, game: dict):
+        """Broadcast a game in its public /api/history shape; O(matching subscribers)"""
+        self._seq += 1
+        data = json.dumps(game, default=_json_default, separators=(",", ":"))
+        frame = f"id: {self._boot}-{self._seq}\nevent: game\ndata: {data}\n\n".encode()
+        game_type, user_id = game["game_type"], game["user_id"]
+        self._ring.append((self._seq, game_type, user_id, frame))
+        PUBLISHED.inc()
+
+        for subscriber in tuple(self._subscribers):
+            if not subscriber.matches(game_type, user_id):
+                continue
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        subscriber.dropped = True
+        self._subscribers.discard(subscriber)
+        DROPPED.inc()
+
+    def _replay(self, subscriber: Subscriber, last_event_id: Optional[str]) -> list:
+        """Frames a resuming client missed, or None when the ring no longer covers the gap"""
+        if not last_event_id:
+            return []
+        boot, _, seq = last_event_id.partition("-")
+        if boot != self._boot or not seq.isdigit():
+            # Issued before a restart; nothing can be resumed
+            return None
+        last_seq = int(seq)
+        if self._ring and last_seq < self._ring[0][0] - 1:
+            return None
+        return [
+            frame for seq, game_type, user_id, frame in self._ring
+            if seq > last_seq and subscriber.matches(game_type, user_id)
+        ]
+
+    async def stream(self, game_type: Optional[str], user_id: Optional[str], last_event_id: Optional[str]) -> AsyncIterator[bytes]:
+        """SSE byte stream for one client; ends when it disconnects or is dropped"""
+        subscriber = Subscriber(game_type, user_id, self.queue_size)
+        # Replay and subscribe without awaiting in between, so no game falls in the gap
+        replay = self._replay(subscriber, last_event_id)
+        self._subscribers.add(subscriber)
+        try:
+            yield b"retry: 3000\n\n"
+            if replay is None:
+                yield f"id: {self._boot}-{self._seq}\nevent: reset\ndata: {{}}\n\n".encode()
+            else:
+                for frame in replay:
+                    yield frame
+
+            while not subscriber.dropped:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if subscriber.dropped:
+                    break
+                yield frame
+        finally:
+            self._subscribers.discard(subscriber)
@@ -0,0 +1,263 @@
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+# =============================================================================
+# METRICS
+# =============================================================================
+# Minimal Prometheus text-format metrics. Series live in plain dicts keyed by
+# label tuples and are only touched from the event loop thread, so recording
+# is a dict lookup and an integer add - no locks. Values that other threads
+# own (connection pools, queues) are read at scrape time via callbacks.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Metric:
+    """Base class of a metric family"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set_callback(self, callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        """Read the series at scrape time; the callback returns {labels: value}"""
+        self._callback = callback
+
+    def _series(self) -> dict:
+        return self._callback() if self._callback else self._values
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._series().items())
+        ]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        values = self._values
+        values[labels] = values.get(labels, 0) - amount
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        # One non-cumulative slot per bucket plus +Inf, then the running sum
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        bounds = self.buckets + (float("inf"),)
+        for labels, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Registry:
+    """Metric families exposed on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Run `collector` on the event loop before every scrape"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+GAMES_RECORDED = REGISTRY.counter("games_recorded_total", "Games recorded by the bot", ("game_type", "currency"))
+VERIFICATIONS = REGISTRY.counter("verifications_total", "Provably fair verifications by source", ("source",))
+DB_COMMAND_DURATION = REGISTRY.histogram("db_command_duration_seconds", "Database command latency by originating route", ("route", "command"))
+DB_COMMAND_DOCUMENTS = REGISTRY.counter("db_command_documents_total", "Documents returned or written by database commands", ("route", "command"))
+HTTP_DB_TIME = REGISTRY.histogram("http_request_db_seconds", "Database time spent per HTTP request", ("route",))
+
+# =============================================================================
+# DATABASE TIME ATTRIBUTION
+# =============================================================================
+# The middleware puts a RequestTiming in a contextvar; storage backends report
+# every database call with record_db_command. Motor and the threadpool copy the
+# context into their worker threads, so calls made on behalf of a request land
+# in its RequestTiming (list.append is atomic) and are turned into metrics on
+# the event loop once the request finishes. Calls outside any request
+# (startup, periodic jobs) are queued and folded in at scrape time.
+
+class RequestTiming:
+    """Database calls made while serving one request"""
+
+    __slots__ = ("scope", "commands")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.commands: List[Tuple[str, float, int]] = []
+
+    @property
+    def route(self) -> str:
+        return _route_label(self.scope)
+
+    def db_seconds(self) -> float:
+        return sum(seconds for _, seconds, _ in self.commands)
+
+_current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+_background_commands: deque = deque(maxlen=100000)
+
+def _route_label(scope: dict) -> str:
+    return getattr(scope.get("route"), "path_format", None) or "unmatched"
+
+def current_route() -> str:
+    """Route template of the request being served, or `background`"""
+    timing = _current_timing.get()
+    return timing.route if timing is not None else "background"
+
+def record_db_command(command: str, seconds: float, documents: int = 0):
+    """Attribute one database call to the current request; safe from any thread"""
+    timing = _current_timing.get()
+    target = timing.commands if timing is not None else _background_commands
+    target.append((command, seconds, documents))
+
+def _observe_commands(route: str, commands):
+    for command, seconds, documents in commands:
+        DB_COMMAND_DURATION.observe(seconds, route, command)
+        if documents:
+            DB_COMMAND_DOCUMENTS.inc(route, command, amount=documents)
+
+def _collect_background_commands():
+    commands = []
+    while _background_commands:
+        commands.append(_background_commands.popleft())
+    _observe_commands("background", commands)
+
+REGISTRY.add_collector(_collect_background_commands)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and database time of every HTTP request
+
+    Requests are labelled with the matched route template (`/api/user/{identifier}/stats`),
+    never the raw path, so series stay bounded. Responses carry a Server-Timing
+    header splitting the time so far into database and application time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        timing = RequestTiming(scope)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = perf_counter() - start
+                db = timing.db_seconds()
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'db;dur={db * 1000:.2f};desc="{len(timing.commands)} calls", app;dur={max(total - db, 0) * 1000:.2f}'
+                )
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        token = _current_timing.set(timing)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            _current_timing.reset(token)
+            HTTP_IN_FLIGHT.dec()
+            path = timing.route
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, path, str(status))
+            HTTP_LATENCY.observe(elapsed, method, path)
+            # Includes calls made by background tasks after the response was sent
+            HTTP_DB_TIME.observe(timing.db_seconds(), path)
+            _observe_commands(path, timing.commands)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+RazerBet database migrations
+Converts existing documents in bounded batches; every command can be re-run safely.
+backend/server.py and the Vercel function (api/index.py) both write v2 rows
+and read v1 rows alongside them until history-v2 has converted every one.
+
+Usage:
+    python migrate.py history-v2 [--batch-size 1000] [--dry-run]
+    python migrate.py seed-sessions [--batch-size 1000] [--dry-run]
+    python migrate.py ledger-amounts [--batch-size 1000] [--dry-run]
+    python migrate.py report [--sample 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import bson
+from dotenv import load_dotenv
+from pymongo import MongoClient, InsertOne, DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from game_codec import SCHEMA_VERSION, encode_game, decode_game
+from ledger import DEFAULT_CURRENCY, to_minor
+from seed_sessions import build_session, session_id
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+def get_database():
+    from storage_mongo import _fix_mongo_url
+    mongo_url = _fix_mongo_url(os.environ.get('MONGO_URL'))
+    if not mongo_url:
+        sys.exit("MONGO_URL is not set")
+    return MongoClient(mongo_url)[os.environ.get('DB_NAME', 'razerbet')]
+
+# =============================================================================
+# GAME HISTORY v1 -> v2
+# =============================================================================
+
+def migrate_history_v2(db, batch_size: int, dry_run: bool):
+    """Rewrite legacy game_history documents into the compact v2 schema"""
+    legacy = {"v": {"$ne": SCHEMA_VERSION}}
+    remaining = db.game_history.count_documents(legacy)
+    print(f"{remaining} legacy game_history documents to convert")
+
+    converted = 0
+    bytes_before = 0
+    bytes_after = 0
+    last_id = None
+    while True:
+        query = dict(legacy)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.game_history.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        sessions = {}
+        for doc in batch:
+            session = build_session(doc.get("server_seed"), doc["server_seed_hash"], doc["client_seed"])
+            sessions[session["_id"]] = session
+            new_doc = encode_game(doc)
+            bytes_before += len(bson.encode(doc))
+            bytes_after += len(bson.encode(new_doc))
+            # The game id becomes the _id, so the document is replaced rather than updated
+            ops.append(InsertOne(new_doc))
+            ops.append(DeleteOne({"_id": doc["_id"]}))
+
+        if not dry_run:
+            _upsert_sessions(db, sessions.values())
+            try:
+                db.game_history.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # A previous interrupted run already inserted some of these
+                if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                    raise
+
+        converted += len(batch)
+        print(f"  {converted}/{remaining} converted")
+
+    if converted:
+        print(f"Average document size: {bytes_before / converted:.0f} -> {bytes_after / converted:.0f} bytes")
+    if dry_run:
+        print("Dry run - nothing was written")
+
+# =============================================================================
+# SEED SESSIONS
+# =============================================================================
+
+def migrate_seed_sessions(db, batch_size: int, dry_run: bool):
+    """Move inline seed fields of v2 game rows into referenced seed sessions"""
+    inline = {"v": SCHEMA_VERSION, "h": {"$exists": True}}
+    remaining = db.game_history.count_documents(inline)
+    print(f"{remaining} game_history documents with inline seeds")
+
+    converted = 0
+    last_id = None
+    while True:
+        query = dict(inline)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.game_history.find(query, {"h": 1, "c": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        sessions, updates = inline_seed_sessions(batch)
+        ops = [UpdateOne({"_id": game_id}, update) for game_id, update in updates]
+
+        # v2 rows no longer carry the plaintext seed; recover it from user_seeds
+        hashes = [session["h"].hex() for session in sessions.values()]
+        seeds = {
+            seed["server_seed_hash"]: seed["server_seed"]
+            for seed in db.user_seeds.find({"server_seed_hash": {"$in": hashes}}, {"server_seed": 1, "server_seed_hash": 1})
+        }
+        for session in sessions.values():
+            server_seed = seeds.get(session["h"].hex())
+            if server_seed:
+                session["ss"] = server_seed
+
+        if not dry_run:
+            _upsert_sessions(db, sessions.values())
+            db.game_history.bulk_write(ops, ordered=False)
+
+        converted += len(batch)
+        print(f"  {converted}/{remaining} converted, {len(sessions)} sessions in batch")
+
+    if dry_run:
+        print("Dry run - nothing was written")
+
+def inline_seed_sessions(batch: list) -> tuple:
+    """Sessions of rows with inline h/c, and the (game id, update) moving each row onto its session"""
+    sessions = {}
+    updates = []
+    for doc in batch:
+        server_seed_hash = doc["h"].hex()
+        sid = session_id(server_seed_hash, doc["c"])
+        if sid not in sessions:
+            sessions[sid] = build_session(None, server_seed_hash, doc["c"])
+        updates.append((doc["_id"], {"$set": {"s": sid}, "$unset": {"h": "", "c": ""}}))
+    return sessions, updates
+
+def _upsert_sessions(db, sessions):
+    ops = []
+    for session in sessions:
+        update = {"$setOnInsert": {k: v for k, v in session.items() if k not in ("_id", "ss")}}
+        if "ss" in session:
+            update["$set"] = {"ss": session["ss"]}
+        ops.append(UpdateOne({"_id": session["_id"]}, update, upsert=True))
+    if ops:
+        db.seed_sessions.bulk_write(ops, ordered=False)
+
+# =============================================================================
+# LEDGER AMOUNTS
+# =============================================================================
+
+def migrate_ledger_amounts(db, batch_size: int, dry_run: bool):
+    """Add minor unit amounts to v2 game rows and convert float rollup amounts"""
+    missing = {"v": SCHEMA_VERSION, "ba": {"$exists": False}}
+    remaining = db.game_history.count_documents(missing)
+    print(f"{remaining} game_history documents without minor unit amounts")
+
+    converted = 0
+    last_id = None
+    while True:
+        query = dict(missing)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.game_history.find(query, {"b": 1, "p": 1, "cu": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        for doc in batch:
+            currency = doc.get("cu", DEFAULT_CURRENCY)
+            amounts = {"ba": to_minor(doc["b"], currency), "pa": to_minor(doc["p"], currency)}
+            ops.append(UpdateOne({"_id": doc["_id"], "ba": {"$exists": False}}, {"$set": amounts}))
+        if not dry_run:
+            db.game_history.bulk_write(ops, ordered=False)
+
+        converted += len(batch)
+        print(f"  {converted}/{remaining} converted")
+
+    # Live workers keep $inc-ing the same buckets: each float is folded into the
+    # integer field only if it is still the value read, and removed in the same update
+    legacy_fields = {"wagered": "wagered_minor", "payout": "payout_minor"}
+    legacy = {"$or": [
+        {field: {"$exists": True}} for prefix in ("", "bf.") for field in (prefix + name for name in legacy_fields)
+    ]}
+    buckets = 0
+    for doc in db.rollups.find(legacy):
+        match = {"_id": doc["_id"]}
+        update = {"$inc": {}, "$unset": {}}
+        for prefix, part in (("", doc), ("bf.", doc.get("bf", {}))):
+            for name, minor in legacy_fields.items():
+                if name in part:
+                    match[prefix + name] = part[name]
+                    update["$inc"][prefix + minor] = to_minor(part[name], doc["currency"])
+                    update["$unset"][prefix + name] = ""
+        if not dry_run:
+            db.rollups.update_one(match, update)
+        buckets += 1
+    print(f"{buckets} rollup buckets converted")
+
+    if dry_run:
+        print("Dry run - nothing was written")
+
+# =============================================================================
+# REPORTING
+# =============================================================================
+
+def report_history(db, sample: int):
+    """Compare stored size and read-side decode cost of v1 and v2 documents"""
+    docs = list(db.game_history.find({}).limit(sample))
+    if not docs:
+        print("game_history is empty")
+        return
+    legacy = [doc for doc in docs if doc.get("v") != SCHEMA_VERSION]
+    session_ids = [doc["s"] for doc in docs if "s" in doc]
+    sessions = {s["_id"]: s for s in db.seed_sessions.find({"_id": {"$in": session_ids}})}
+    v1_docs = legacy or [_as_legacy(decode_game(doc, sessions)) for doc in docs]
+    v2_docs = [encode_game(doc) for doc in v1_docs]
+
+    v1_size = sum(len(bson.encode(doc)) for doc in v1_docs) / len(v1_docs)
+    v2_size = sum(len(bson.encode(doc)) for doc in v2_docs) / len(v2_docs)
+    v1_time = _time_decode(v1_docs)
+    v2_time = _time_decode(v2_docs)
+
+    print(f"Sampled {len(docs)} documents ({len(legacy)} legacy)")
+    print(f"  v1: {v1_size:7.0f} bytes/doc  {v1_time:6.2f} us/doc to read")
+    print(f"  v2: {v2_size:7.0f} bytes/doc  {v2_time:6.2f} us/doc to read")
+    print(f"  size -{(1 - v2_size / v1_size) * 100:.0f}%")
+
+def _as_legacy(game: dict) -> dict:
+    from provably_fair import calculate_game_result
+    legacy = dict(game)
+    legacy.pop("masked_username", None)
+    legacy["timestamp"] = game["timestamp"].isoformat()
+    legacy["result"] = calculate_game_result(game["game_type"], game["raw_result"])
+    legacy["server_seed"] = "0" * 64
+    return legacy
+
+def _time_decode(docs: list) -> float:
+    # BSON decoding is included since that is what the driver does per row
+    raw_docs = [bson.encode(doc) for doc in docs]
+    rounds = max(1, 20000 // len(docs))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for raw in raw_docs:
+            decode_game(bson.decode(raw))
+    return (time.perf_counter() - started) / (rounds * len(docs)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="RazerBet database migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    history = commands.add_parser("history-v2", help="convert game_history to the compact v2 schema")
+    history.add_argument("--batch-size", type=int, default=1000)
+    history.add_argument("--dry-run", action="store_true")
+
+    sessions = commands.add_parser("seed-sessions", help="move inline seed fields of game rows into seed_sessions")
+    sessions.add_argument("--batch-size", type=int, default=1000)
+    sessions.add_argument("--dry-run", action="store_true")
+
+    ledger = commands.add_parser("ledger-amounts", help="add minor unit amounts to game rows and rollups")
+    ledger.add_argument("--batch-size", type=int, default=1000)
+    ledger.add_argument("--dry-run", action="store_true")
+
+    report = commands.add_parser("report", help="compare v1 and v2 game_history size and decode cost")
+    report.add_argument("--sample", type=int, default=1000)
+
+    args = parser.parse_args()
+    db = get_database()
+
+    if args.command == "history-v2":
+        migrate_history_v2(db, args.batch_size, args.dry_run)
+    elif args.command == "seed-sessions":
+        migrate_seed_sessions(db, args.batch_size, args.dry_run)
+    elif args.command == "ledger-amounts":
+        migrate_ledger_amounts(db, args.batch_size, args.dry_run)
+    elif args.command == "report":
+        report_history(db, args.sample)
+
+if __name__ == "__main__":
+    main()
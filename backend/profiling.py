@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# REQUEST PROFILER
+# =============================================================================
+# Opt-in wall-clock sampler for single requests. While a profiled request is in
+# flight, a helper thread samples its asyncio task every few milliseconds:
+#
+# - task running    -> the event loop thread's Python stack (CPU work such as
+#                      request parsing, verify_game, calculate_game_result)
+# - task suspended  -> the coroutine chain it is awaiting on, ending in
+#                      `[await]` (storage round trips, Mongo or SQLite)
+#
+# Samples are written as collapsed stacks (`frame;frame;frame count`), which
+# flamegraph.pl and speedscope read directly. Nothing is installed unless
+# PROFILING_ENABLED is set, so a disabled profiler costs nothing.
+
+PROFILE_HEADER = "x-profile-token"
+PROFILE_SUFFIX = ".collapsed"
+_NAME_PATTERN = re.compile(r"^[\w.-]+\.collapsed$")
+
+def sign_profile_token(secret: str, ttl: int) -> str:
+    """Token for the X-Profile-Token header, valid for `ttl` seconds"""
+    expires = int(time.time()) + ttl
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def verify_profile_token(secret: str, token: str) -> bool:
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+# The sampler only runs when the loop thread yields the GIL, every 5 ms by
+# default; while any request is profiled the switch interval is shortened
+_switch_lock = threading.Lock()
+_active_samplers = 0
+_default_switch_interval = sys.getswitchinterval()
+
+def _acquire_switch_interval(interval: float):
+    global _active_samplers
+    with _switch_lock:
+        _active_samplers += 1
+        sys.setswitchinterval(min(interval / 2, _default_switch_interval))
+
+def _release_switch_interval():
+    global _active_samplers
+    with _switch_lock:
+        _active_samplers -= 1
+        if not _active_samplers:
+            sys.setswitchinterval(_default_switch_interval)
+
+class _TaskSampler:
+    """Samples one task from a helper thread until stopped"""
+
+    def __init__(self, task: asyncio.Task, loop: asyncio.AbstractEventLoop, interval: float):
+        self.task = task
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        _acquire_switch_interval(self.interval)
+        self._thread.start()
+
+    def stop(self):
+        """Tell the thread to stop; join() waits until it has"""
+        self._stop.set()
+        _release_switch_interval()
+
+    def join(self):
+        self._thread.join()
+
+    def _sample(self) -> Optional[tuple]:
+        if asyncio.current_task(self.loop) is self.task:
+            frames = []
+            frame = sys._current_frames().get(self.loop_thread_id)
+            while frame is not None and frame.f_code is not _MIDDLEWARE_CODE:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            suffix = ()
+        else:
+            # Task.get_stack() stops at the outermost coroutine; follow cr_await
+            # down to the innermost one instead
+            frames = []
+            coro = self.task.get_coro()
+            while coro is not None:
+                frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+                if frame is None:
+                    break
+                frames.append(frame)
+                coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+            # Only what runs below the profiling middleware belongs to the request
+            for index, frame in enumerate(frames):
+                if frame.f_code is _MIDDLEWARE_CODE:
+                    frames = frames[index + 1:]
+                    break
+            suffix = ("[await]",)
+        return tuple(_frame_label(frame) for frame in frames) + suffix if frames else None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                stack = self._sample()
+            except Exception:
+                # The task can change state while its frames are walked
+                continue
+            if stack:
+                self.stacks[stack] += 1
+
+class RequestProfiler:
+    """Decides which requests to profile and stores their profiles"""
+
+    def __init__(self, directory: str, secret: str, sample_rate: float = 0.0, keep: int = 50, interval_ms: float = 1.0):
+        self.directory = Path(directory)
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.interval = interval_ms / 1000
+
+    def wants(self, scope: dict) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode():
+                return verify_profile_token(self.secret, value.decode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def list_profiles(self) -> List[dict]:
+        """Stored profiles, newest first"""
+        if not self.directory.is_dir():
+            return []
+        profiles = []
+        for path in self.directory.glob(f"*{PROFILE_SUFFIX}"):
+            stat = path.stat()
+            profiles.append({
+                "name": path.name,
+                "size": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+            })
+        profiles.sort(key=lambda profile: profile["name"], reverse=True)
+        return profiles
+
+    def profile_path(self, name: str) -> Optional[Path]:
+        """Path of a stored profile; None for unknown or malformed names"""
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+    def save(self, scope: dict, status: int, elapsed: float, stacks: Counter) -> str:
+        """Write a profile and drop the oldest beyond `keep`; runs off the event loop"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        route = getattr(scope.get("route"), "path_format", None) or scope["path"]
+        slug = re.sub(r"[^\w]+", "_", route).strip("_") or "root"
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        name = f"{stamp}_{scope['method']}_{slug}_{elapsed * 1000:.0f}ms_{uuid.uuid4().hex[:6]}{PROFILE_SUFFIX}"
+
+        root = f"{scope['method']} {route} [{status}]"
+        lines = [f"{root};{';'.join(stack)} {count}" for stack, count in stacks.most_common()]
+        (self.directory / name).write_text("\n".join(lines) + "\n")
+
+        for old in self.list_profiles()[self.keep:]:
+            try:
+                (self.directory / old["name"]).unlink()
+            except FileNotFoundError:
+                pass
+        return name
+
+class ProfilingMiddleware:
+    """ASGI middleware sampling the requests the profiler selects"""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wants(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        loop = asyncio.get_running_loop()
+        sampler = _TaskSampler(asyncio.current_task(), loop, self.profiler.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - start
+            try:
+                name = await loop.run_in_executor(None, self._save, sampler, scope, status, elapsed)
+                logger.info("Saved request profile %s (%d samples)", name, sum(sampler.stacks.values()))
+            except OSError:
+                logger.exception("Saving request profile failed")
+
+    def _save(self, sampler: _TaskSampler, scope, status: int, elapsed: float) -> str:
+        # The sampler can be mid-sample; wait for it here rather than on the event loop
+        sampler.join()
+        return self.profiler.save(scope, status, elapsed, sampler.stacks)
+
+_MIDDLEWARE_CODE = ProfilingMiddleware.__call__.__code__
+
+def create_profiler(default_secret: str) -> Optional[RequestProfiler]:
+    """Profiler configured from the environment, or None when PROFILING_ENABLED is off"""
+    if os.environ.get('PROFILING_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    return RequestProfiler(
+        os.environ.get('PROFILE_DIR', 'profiles'),
+        secret=os.environ.get('PROFILE_SECRET') or default_secret,
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+        keep=int(os.environ.get('PROFILE_KEEP', '50')),
+        interval_ms=float(os.environ.get('PROFILE_INTERVAL_MS', '1'))
+    )
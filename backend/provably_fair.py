@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+import secrets
+
+# =============================================================================
+# PROVABLY FAIR LOGIC
+# =============================================================================
+# Shared by the API routes, the reveal-time audit and the tooling scripts.
+
+# Game Types (append only - the position is the stored game type code)
+GAME_TYPES = ["blackjack", "tower", "dices_war", "mines", "coinflip", "match", "crash"]
+
+def generate_server_seed():
+    """Generate a cryptographically secure server seed"""
+    return secrets.token_hex(32)
+
+def hash_server_seed(server_seed: str) -> str:
+    """Create SHA256 hash of server seed"""
+    return hashlib.sha256(server_seed.encode()).hexdigest()
+
+def generate_hmac_result(server_seed: str, client_seed: str, nonce: int) -> str:
+    """Generate HMAC-SHA256 result from seeds and nonce"""
+    message = f"{client_seed}:{nonce}"
+    return hmac.new(
+        server_seed.encode(),
+        message.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+def hex_to_float(hex_string: str) -> float:
+    """Convert first 8 characters of hex to float between 0 and 1"""
+    # Take first 8 chars (32 bits) and convert to integer
+    int_value = int(hex_string[:8], 16)
+    # Normalize to 0-1 range
+    return int_value / (16 ** 8)
+
+def calculate_game_result(game_type: str, raw_result: float) -> dict:
+    """Calculate game-specific result from raw float"""
+    
+    if game_type == "coinflip":
+        return {
+            "outcome": "heads" if raw_result < 0.5 else "tails",
+            "roll": round(raw_result * 100, 2)
+        }
+    
+    elif game_type == "dices_war":
+        player_roll = int(raw_result * 6) + 1
+        house_roll = int((raw_result * 100 % 1) * 6) + 1
+        return {
+            "player_roll": player_roll,
+            "house_roll": house_roll,
+            "winner": "player" if player_roll > house_roll else ("tie" if player_roll == house_roll else "house")
+        }
+    
+    elif game_type == "mines":
+        # Generate mine positions (5 mines out of 25 tiles)
+        positions = []
+        temp_result = raw_result
+        for i in range(5):
+            pos = int(temp_result * 25) % 25
+            while pos in positions:
+                pos = (pos + 1) % 25
+            positions.append(pos)
+            temp_result = (temp_result * 1000) % 1
+        return {
+            "mine_positions": sorted(positions),
+            "safe_tiles": [i for i in range(25) if i not in positions]
+        }
+    
+    elif game_type == "tower":
+        # Tower game - 8 levels, each level has correct position
+        correct_positions = []
+        temp_result = raw_result
+        for level in range(8):
+            pos = int(temp_result * 3) % 3  # 3 positions per level
+            correct_positions.append(pos)
+            temp_result = (temp_result * 1000) % 1
+        return {
+            "correct_path": correct_positions,
+            "levels": 8,
+            "positions_per_level": 3
+        }
+    
+    elif game_type == "blackjack":
+        # Generate shuffled deck seed
+        deck_seed = int(raw_result * 52)
+        return {
+            "deck_seed": deck_seed,
+            "shuffle_index": raw_result,
+            "note": "Full deck shuffle determined by this seed"
+        }
+    
+    elif game_type == "match":
+        # Match game - matching items
+        match_value = int(raw_result * 100)
+        return {
+            "match_value": match_value,
+            "is_match": match_value < 20,  # 20% match chance
+            "roll": round(raw_result * 100, 2)
+        }
+    
+    elif game_type == "crash":
+        # Crash multiplier calculation
+        # Using house edge of 1%
+        e = 2.718281828
+        house_edge = 0.01
+        crash_point = max(1.0, (1 - house_edge) / (1 - raw_result))
+        if raw_result > 0.99:
+            crash_point = 100.0  # Cap at 100x
+        return {
+            "crash_point": round(crash_point, 2),
+            "raw_value": round(raw_result * 100, 4)
+        }
+    
+    return {"raw": raw_result}
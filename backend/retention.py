@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SEED RETENTION
+# =============================================================================
+# Every reveal and every create leaves an inactive user_seeds document behind.
+# Once it is older than the retention period, the compactor moves it to
+# revealed_seeds: one document per server seed, keyed by its hash, which is
+# all verification and audits look seeds up by. user_seeds then holds about
+# one document per active user plus the last few days of rotations.
+#
+#   _id  server seed hash   ss  server seed    c   client seed
+#   u    user id            i   seed id        n   final nonce
+#   ct   created at         ra  revealed at    a   audit
+#
+# (revealed at and audit are absent for seeds replaced without a reveal)
+#
+# The compactor copies a batch, deletes it from user_seeds, and yields to the
+# event loop between batches. A batch interrupted in between is copied again
+# on the next run, which overwrites the same documents.
+
+COMPACTED = REGISTRY.counter("seeds_compacted_total", "Inactive user seeds moved to revealed_seeds")
+
+def encode_revealed_seed(seed: dict) -> dict:
+    """revealed_seeds document of an inactive user_seeds document"""
+    doc = {
+        "_id": seed["server_seed_hash"],
+        "ss": seed["server_seed"],
+        "c": seed["client_seed"],
+        "u": seed["user_id"],
+        "i": seed["id"],
+        "n": seed["nonce"],
+        "ct": seed["created_at"]
+    }
+    if seed.get("revealed_at"):
+        doc["ra"] = seed["revealed_at"]
+    if seed.get("audit"):
+        doc["a"] = seed["audit"]
+    return doc
+
+def decode_revealed_seed(doc: dict) -> dict:
+    """Back to the user_seeds layout the API reads"""
+    seed = {
+        "id": doc["i"],
+        "user_id": doc["u"],
+        "server_seed": doc["ss"],
+        "server_seed_hash": doc["_id"],
+        "client_seed": doc["c"],
+        "nonce": doc["n"],
+        "active": False,
+        "created_at": doc["ct"]
+    }
+    if "ra" in doc:
+        seed["revealed_at"] = doc["ra"]
+    if "a" in doc:
+        seed["audit"] = doc["a"]
+    return seed
+
+class SeedCompactor:
+    """Moves inactive user seeds past the retention period into revealed_seeds"""
+
+    def __init__(self, retention_days: float = 7, batch_size: int = 500, interval: float = 600, pause: float = 0.05):
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    async def compact_once(self, storage) -> int:
+        """Move every seed past the cutoff in bounded batches; returns the number moved"""
+        cutoff = datetime.now(timezone.utc) - self.retention
+        moved = 0
+        while True:
+            seeds = await storage.inactive_seeds_before(cutoff, self.batch_size)
+            if not seeds:
+                break
+            await storage.retire_seeds(seeds)
+            moved += len(seeds)
+            COMPACTED.inc(amount=len(seeds))
+            if len(seeds) < self.batch_size:
+                break
+            # Leave room for requests between batches
+            await asyncio.sleep(self.pause)
+        if moved:
+            logger.info("Moved %d inactive seeds to revealed_seeds", moved)
+        return moved
+
+    async def _compact_loop(self, storage):
+        while True:
+            try:
+                await self.compact_once(storage)
+            except Exception:
+                logger.exception("Compacting user seeds failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self, storage):
+        self._task = asyncio.create_task(self._compact_loop(storage))
+
+    async def stop(self, storage):
+        if self._task is not None:
+            # Safe to interrupt: an unfinished batch is copied again next time
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from game_codec import decode_game
+from ledger import from_minor, to_minor
+from storage import ROLLUP_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# ANALYTICS ROLLUPS
+# =============================================================================
+# Hourly and daily buckets per game type and currency holding games, wins,
+# and wagered and payout in the currency's minor units (ledger.py), so
+# dashboards read one document per bucket instead of aggregating game_history.
+#
+# - Live counts: record_game adds to an in-memory buffer that is flushed as
+#   one batch of $inc upserts every few seconds. Increments commute, so any
+#   number of workers can flush into the same buckets.
+# - Backfill: games recorded before live counting started (`live_since`) are
+#   aggregated one UTC day at a time into a separate `bf` part of each bucket
+#   with $set. A day can be re-aggregated any number of times without double
+#   counting, so the high-water mark saved after each day makes it resumable.
+#
+# Reads sum both parts. A crash loses at most the unflushed live buffer.
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+STATE_KEY = "rollups"
+MAX_BUCKETS = 2000
+
+def bucket_start(granularity: str, timestamp: datetime) -> datetime:
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _add_game(counts: Dict[tuple, list], game: dict):
+    timestamp = game["timestamp"]
+    won = 1 if game["won"] else 0
+    wagered = to_minor(game["bet_amount"], game["currency"])
+    payout = to_minor(game["payout"], game["currency"])
+    for granularity in GRANULARITIES:
+        key = (granularity, bucket_start(granularity, timestamp), game["game_type"], game["currency"])
+        bucket = counts.get(key)
+        if bucket is None:
+            bucket = counts[key] = [0, 0, 0, 0]
+        bucket[0] += 1
+        bucket[1] += won
+        bucket[2] += wagered
+        bucket[3] += payout
+
+def _rows(counts: Dict[tuple, list]) -> List[dict]:
+    return [
+        dict(zip(("granularity", "start", "game_type", "currency") + ROLLUP_FIELDS, key + tuple(values)))
+        for key, values in counts.items()
+    ]
+
+class Rollups:
+    """Buffered live rollup counts plus the resumable backfill of older history"""
+
+    def __init__(self, flush_interval: float = 10, batch_size: int = 1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.live_since: Optional[datetime] = None
+        self.backfilled_to: Optional[datetime] = None
+        self.backfill_complete = False
+        self._pending: Dict[tuple, list] = {}
+        self._in_flight: List[Dict[tuple, list]] = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._backfill_task: Optional[asyncio.Task] = None
+
+    def observe(self, game: dict):
+        """Count one recorded game; called on the ingest path"""
+        _add_game(self._pending, game)
+
+    async def flush(self, storage):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._in_flight.append(batch)
+        try:
+            await storage.increment_rollups(_rows(batch))
+        except Exception:
+            # Keep the counts for the next flush
+            for key, values in batch.items():
+                bucket = self._pending.setdefault(key, [0, 0, 0, 0])
+                for i, value in enumerate(values):
+                    bucket[i] += value
+            raise
+        finally:
+            self._in_flight = [b for b in self._in_flight if b is not batch]
+
+    async def series(
+        self,
+        storage,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        game_type: Optional[str] = None,
+        currency: Optional[str] = None
+    ) -> List[dict]:
+        """Buckets starting in [start, end), including counts not flushed yet"""
+        buckets = await storage.rollup_buckets(granularity, start, end, game_type, currency)
+        by_key = {(b["start"], b["game_type"], b["currency"]): b for b in buckets}
+
+        for counts in self._in_flight + [self._pending]:
+            for (bucket_granularity, bucket_time, bucket_game_type, bucket_currency), values in counts.items():
+                if (bucket_granularity != granularity or not start <= bucket_time < end
+                        or (game_type and bucket_game_type != game_type)
+                        or (currency and bucket_currency != currency)):
+                    continue
+                key = (bucket_time, bucket_game_type, bucket_currency)
+                bucket = by_key.get(key)
+                if bucket is None:
+                    bucket = by_key[key] = dict(
+                        granularity=granularity, start=bucket_time, game_type=bucket_game_type,
+                        currency=bucket_currency, **dict.fromkeys(ROLLUP_FIELDS, 0)
+                    )
+                for field, value in zip(ROLLUP_FIELDS, values):
+                    bucket[field] += value
+
+        series = []
+        for key in sorted(by_key):
+            bucket = by_key[key]
+            wagered, payout = bucket["wagered_minor"], bucket["payout_minor"]
+            series.append({
+                "start": bucket["start"].isoformat(),
+                "game_type": bucket["game_type"],
+                "currency": bucket["currency"],
+                "games": bucket["games"],
+                "wins": bucket["wins"],
+                "wagered": from_minor(wagered, bucket["currency"]),
+                "payout": from_minor(payout, bucket["currency"]),
+                "house_profit": from_minor(wagered - payout, bucket["currency"])
+            })
+        return series
+
+    # -- backfill -------------------------------------------------------------
+
+    async def backfill(self, storage):
+        """Aggregate the games recorded before `live_since`, resuming from the saved mark"""
+        day = self.backfilled_to
+        if day is None:
+            oldest = await storage.oldest_game_time()
+            day = bucket_start("day", oldest) if oldest is not None else self.live_since
+
+        while day < self.live_since:
+            end = min(day + GRANULARITIES["day"], self.live_since)
+            counts = {}
+            async for docs in storage.scan_games(self.batch_size, start=day, end=end):
+                for doc in docs:
+                    game = decode_game(doc)
+                    if "bet_amount" in game and "timestamp" in game:
+                        _add_game(counts, game)
+            await storage.set_rollup_backfill(_rows(counts))
+            logger.info("Backfilled rollups for %s (%d buckets)", day.date(), len(counts))
+
+            day += GRANULARITIES["day"]
+            self.backfilled_to = day
+            await self._save_state(storage)
+
+        self.backfill_complete = True
+        await self._save_state(storage)
+
+    # -- state ----------------------------------------------------------------
+
+    async def _save_state(self, storage):
+        await storage.save_state(STATE_KEY, {
+            "live_since": self.live_since.isoformat(),
+            "backfilled_to": self.backfilled_to.isoformat() if self.backfilled_to else None,
+            "backfill_complete": self.backfill_complete
+        })
+
+    async def _flush_loop(self, storage):
+        # Stopped through an event rather than cancelled: a cancelled $inc batch
+        # may or may not have been applied, so it could neither be kept nor dropped
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush(storage)
+            except Exception:
+                logger.exception("Flushing rollups failed")
+
+    async def _backfill_in_background(self, storage):
+        try:
+            await self.backfill(storage)
+        except Exception:
+            logger.exception("Backfilling rollups failed; it resumes on the next start")
+
+    async def start(self, storage):
+        state = await storage.load_state(STATE_KEY)
+        if not state:
+            # Everything recorded from now on is counted live. Of workers
+            # starting together, the first to save its live_since wins
+            state = await storage.create_state(STATE_KEY, {
+                "live_since": datetime.now(timezone.utc).isoformat(), "backfilled_to": None, "backfill_complete": False
+            })
+        self.live_since = datetime.fromisoformat(state["live_since"])
+        self.backfilled_to = datetime.fromisoformat(state["backfilled_to"]) if state["backfilled_to"] else None
+        self.backfill_complete = state["backfill_complete"]
+
+        # Created here: on Python 3.9 an Event binds to the loop current at creation
+        self._stopping = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop(storage))
+        if not self.backfill_complete:
+            self._backfill_task = asyncio.create_task(self._backfill_in_background(storage))
+
+    async def stop(self, storage):
+        if self._backfill_task is not None:
+            # Safe to interrupt: a day is only marked done after its buckets are written
+            self._backfill_task.cancel()
+            self._backfill_task = None
+        if self._flush_task is not None:
+            # The loop flushes once more on its way out
+            self._stopping.set()
+            await self._flush_task
+            self._flush_task = None
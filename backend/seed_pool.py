@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from collections import deque
+from typing import List, Optional, Tuple
+
+from metrics import REGISTRY
+from provably_fair import generate_server_seed, hash_server_seed
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SERVER SEED POOL
+# =============================================================================
+# Creating and revealing seeds take a ready (server_seed, server_seed_hash)
+# pair from this pool instead of generating one inline. A background task tops
+# the pool up in batches on a worker thread whenever it drops to half, so a
+# burst of rotations (a whole server revealing after an event) only drains
+# memory. Each pair is handed out exactly once and never stored before use;
+# pairs still pooled at shutdown are simply discarded.
+
+AVAILABLE = REGISTRY.gauge("seed_pool_available", "Pre-generated server seeds ready to hand out")
+EXHAUSTED = REGISTRY.counter("seed_pool_exhausted_total", "Server seeds generated inline because the pool was empty")
+
+def generate_pairs(count: int) -> List[Tuple[str, str]]:
+    pairs = []
+    for _ in range(count):
+        server_seed = generate_server_seed()
+        pairs.append((server_seed, hash_server_seed(server_seed)))
+    return pairs
+
+class SeedPool:
+    """Pre-generated server seeds with their hashes, refilled in the background"""
+
+    def __init__(self, size: int = 1000, batch_size: int = 100):
+        self.size = size
+        self.batch_size = batch_size
+        self._pairs: deque = deque()
+        self._low: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        AVAILABLE.set_callback(lambda: {(): len(self._pairs)})
+
+    def take(self) -> Tuple[str, str]:
+        """A fresh (server_seed, server_seed_hash) pair"""
+        if self._low is not None and len(self._pairs) <= self.size // 2:
+            self._low.set()
+        if self._pairs:
+            return self._pairs.popleft()
+        EXHAUSTED.inc()
+        return generate_pairs(1)[0]
+
+    async def _refill_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._low.wait()
+            self._low.clear()
+            try:
+                while len(self._pairs) < self.size:
+                    count = min(self.batch_size, self.size - len(self._pairs))
+                    self._pairs.extend(await loop.run_in_executor(None, generate_pairs, count))
+            except Exception:
+                logger.exception("Refilling the seed pool failed")
+
+    async def start(self):
+        # Created here: on Python 3.9 an Event binds to the loop current at creation
+        self._low = asyncio.Event()
+        self._low.set()
+        self._task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._pairs.clear()
@@ -0,0 +1,85 @@
+import base64
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+# =============================================================================
+# SEED SESSIONS
+# =============================================================================
+# A seed session is one (server seed, client seed) pair. It is stored once in
+# the seed_sessions collection and game_history rows reference it by a short
+# id next to their nonce, instead of repeating ~150 bytes of hex per game.
+#
+#   _id  session id      h   server seed hash (raw bytes)
+#   ss   server seed     c   client seed
+#   t    created at
+#
+# The id is derived from the hash and client seed, so recording a game never
+# needs a lookup to find out which session it belongs to.
+
+def session_id(server_seed_hash: str, client_seed: str) -> str:
+    """12 character id of a (server seed hash, client seed) pair"""
+    digest = hashlib.sha256(f"{server_seed_hash}:{client_seed}".encode()).digest()
+    return base64.urlsafe_b64encode(digest[:9]).decode()
+
+def build_session(server_seed: Optional[str], server_seed_hash: str, client_seed: str) -> dict:
+    """Storage document for a seed session"""
+    doc = {
+        "_id": session_id(server_seed_hash, client_seed),
+        "h": bytes.fromhex(server_seed_hash),
+        "c": client_seed,
+        "t": datetime.now(timezone.utc)
+    }
+    if server_seed:
+        doc["ss"] = server_seed
+    return doc
+
+def session_fields(session: dict) -> dict:
+    """Public seed fields a game row expands to"""
+    return {"server_seed_hash": session["h"].hex(), "client_seed": session["c"]}
+
+class SeedSessionCache:
+    """In-process LRU of seed sessions, written through to storage"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _put(self, session: dict):
+        self._sessions[session["_id"]] = session
+        self._sessions.move_to_end(session["_id"])
+        if len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+
+    async def ensure(self, storage, session: dict):
+        """Make sure a session exists; only the first game of a session writes"""
+        if session["_id"] in self._sessions:
+            self._sessions.move_to_end(session["_id"])
+            return
+        await storage.upsert_seed_session(session)
+        self._put(session)
+
+    async def get_many(self, storage, ids: Iterable[str]) -> Dict[str, dict]:
+        """Resolve session ids, fetching every cache miss in one query"""
+        found = {}
+        missing = []
+        for sid in set(ids):
+            session = self._sessions.get(sid)
+            if session is None:
+                missing.append(sid)
+            else:
+                self._sessions.move_to_end(sid)
+                found[sid] = session
+        if missing:
+            for session in await storage.get_seed_sessions(missing):
+                self._put(session)
+                found[session["_id"]] = session
+        return found
+
+    async def find_by_hash(self, storage, server_seed_hash: str) -> List[dict]:
+        """All sessions (one per client seed) that used a server seed"""
+        sessions = await storage.find_seed_sessions_by_hash(server_seed_hash)
+        for session in sessions:
+            self._put(session)
+        return sessions
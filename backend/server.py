@@ -1,60 +1,150 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, Query
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import FileResponse, Response, StreamingResponse
+import asyncio
 import os
+from contextlib import asynccontextmanager
 import logging
-import hashlib
-import hmac
 import secrets
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import AfterValidator, BaseModel, Field, ConfigDict, FiniteFloat
 from typing import List, Optional
+from typing_extensions import Annotated, NotRequired, TypedDict
 import uuid
 from datetime import datetime, timezone
 
+from provably_fair import (
+    GAME_TYPES,
+    hash_server_seed,
+    generate_hmac_result,
+    hex_to_float,
+    calculate_game_result,
+)
+from active_seeds import ActiveSeedCache
+from audit import get_inclusion_proof, resume_pending_audits, run_seed_audit
+from coordination import Leases, create_bus, worker_id
+from fairness import FairnessMonitor
+from retention import SeedCompactor
+from rollups import GRANULARITIES as ROLLUP_GRANULARITIES, MAX_BUCKETS as MAX_ROLLUP_BUCKETS, Rollups, bucket_start
+from ledger import DEFAULT_CURRENCY, check_amount, from_minor
+from leaderboards import METRICS as LEADERBOARD_METRICS, WINDOWS as LEADERBOARD_WINDOWS, Leaderboards
+from live_feed import LiveFeedHub
+from metrics import REGISTRY, CONTENT_TYPE, GAMES_RECORDED, VERIFICATIONS, MetricsMiddleware
+from compression import CompressionMiddleware
+from profiling import ProfilingMiddleware, create_profiler, sign_profile_token
+from game_codec import (
+    GAME_TYPE_CODES, PUBLIC_FIELDS, encode_game, decode_game, game_columns, public_game, select_fields, stored_fields
+)
+from idempotency import DUPLICATES as DUPLICATE_GAMES, RecentGames, game_id_for
+from seed_pool import SeedPool
+from seed_sessions import SeedSessionCache, build_session, session_id
+from storage import create_storage, prefer_secondary_reads, restore_primary_reads
+from users import UserDirectory
+from wire import PlainJSONResponse, RequestBody, reply
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection (optional) - fix password encoding if URL contains special chars
-def _fix_mongo_url(url):
-    if not url or '://' not in url:
-        return url
-    from urllib.parse import quote_plus
-    scheme, rest = url.split('://', 1)
-    if '@' not in rest:
-        return url
-    last_at = rest.rfind('@')
-    credentials = rest[:last_at]
-    host_part = rest[last_at + 1:]
-    if ':' not in credentials:
-        return url
-    colon_idx = credentials.index(':')
-    user = credentials[:colon_idx]
-    password = credentials[colon_idx + 1:]
-    return f"{scheme}://{quote_plus(user)}:{quote_plus(password)}@{host_part}"
-
-mongo_url = _fix_mongo_url(os.environ.get('MONGO_URL'))
-client = AsyncIOMotorClient(mongo_url) if mongo_url else None
-db = client[os.environ.get('DB_NAME', 'razerbet')] if client else None
+# Multi-worker mode: caches stay coherent over a cache bus, and a user's nonce
+# is only cached by the worker holding the user's lease
+WORKER_ID = worker_id()
+cache_bus = create_bus(
+    os.environ.get('WORKER_COORDINATION', ''),
+    WORKER_ID,
+    socket_dir=os.environ.get('WORKER_SOCKET_DIR', '/tmp/razerbet-workers')
+)
+seed_leases = Leases(WORKER_ID, ttl=float(os.environ.get('SEED_LEASE_SECONDS', '30'))) if cache_bus.shared else None
+
+# Storage backend: MongoDB when MONGO_URL is set, embedded SQLite otherwise
+storage = create_storage(bus=cache_bus, owner=WORKER_ID)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_storage()
+    try:
+        yield
+    finally:
+        await shutdown_storage()
 
 # Create the main app
-app = FastAPI(title="RazerBet Provably Fair API")
+app = FastAPI(title="RazerBet Provably Fair API", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Seed sessions shared by game_history rows, cached in-process
+seed_sessions = SeedSessionCache(maxsize=int(os.environ.get('SEED_SESSION_CACHE_SIZE', '10000')))
+
+# Ids of recently recorded games, so retried submissions are answered from memory
+recent_games = RecentGames(maxsize=int(os.environ.get('RECENT_GAME_KEYS', '50000')))
+
+# Active user seeds (hash, client seed, nonce), cached in-process and written through
+active_seeds = ActiveSeedCache(
+    maxsize=int(os.environ.get('ACTIVE_SEED_CACHE_SIZE', '10000')),
+    bus=cache_bus,
+    leases=seed_leases
+)
+
+# Pre-generated server seeds for create / reveal, refilled in the background
+seed_pool = SeedPool(size=int(os.environ.get('SEED_POOL_SIZE', '1000')))
+
+# Moves inactive user seeds past the retention period to revealed_seeds
+seed_compactor = SeedCompactor(
+    retention_days=float(os.environ.get('SEED_RETENTION_DAYS', '7')),
+    batch_size=int(os.environ.get('SEED_COMPACT_BATCH_SIZE', '500')),
+    interval=float(os.environ.get('SEED_COMPACT_INTERVAL_SECONDS', '600'))
+)
+
+# Stats lookups by id or username resolve to a user_id through the users directory
+user_directory = UserDirectory(maxsize=int(os.environ.get('USER_CACHE_SIZE', '10000')), bus=cache_bus)
+
+# Online uniformity tests over the raw results of recorded games
+fairness_monitor = FairnessMonitor(
+    alert_p_value=float(os.environ.get('FAIRNESS_ALERT_P_VALUE', '0.001')),
+    min_samples=int(os.environ.get('FAIRNESS_MIN_SAMPLES', '1000')),
+    persist_interval=float(os.environ.get('FAIRNESS_PERSIST_SECONDS', '60'))
+)
+
+# Top wagered / profit / multiplier boards, updated by record_game
+leaderboards = Leaderboards(
+    size=int(os.environ.get('LEADERBOARD_SIZE', '100')),
+    persist_interval=float(os.environ.get('LEADERBOARD_PERSIST_SECONDS', '60'))
+)
+
+# Hourly / daily analytics buckets, flushed from an in-memory buffer
+rollups = Rollups(flush_interval=float(os.environ.get('ROLLUP_FLUSH_SECONDS', '10')))
+
 # API Key for Discord bot (generate once and store)
 BOT_API_KEY = os.environ.get('BOT_API_KEY', 'razerbet_secret_key_change_in_production')
 
-# Game Types
-GAME_TYPES = ["blackjack", "tower", "dices_war", "mines", "coinflip", "match", "crash"]
+# Live game feed for SSE viewers, fed by record_game
+live_feed = LiveFeedHub(
+    replay_size=int(os.environ.get('LIVE_FEED_REPLAY_SIZE', '1000')),
+    queue_size=int(os.environ.get('LIVE_FEED_QUEUE_SIZE', '256')),
+    max_subscribers=int(os.environ.get('LIVE_FEED_MAX_CLIENTS', '10000'))
+)
+
+# Opt-in request profiler; None (and no middleware) unless PROFILING_ENABLED is set
+profiler = create_profiler(BOT_API_KEY)
+
+# Work a request starts but does not wait for (seed audits). Unlike FastAPI's
+# BackgroundTasks these run outside the ASGI call, so the request's latency,
+# metrics and profile end with its response.
+background_jobs = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    # The event loop only keeps weak references to tasks
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
 
 # =============================================================================
 # MODELS
 # =============================================================================
 
-class VerificationRequest(BaseModel):
+class VerificationRequest(TypedDict):
     server_seed: str
     client_seed: str
     nonce: int
@@ -69,39 +159,31 @@ class VerificationResponse(BaseModel):
     game_type: str
     calculation_steps: List[str]
 
-class GameRecord(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+class GameRecordCreate(TypedDict):
     game_type: str
     server_seed: str
-    server_seed_hash: str
     client_seed: str
     nonce: int
-    result: dict
-    raw_result: float
     user_id: str
     username: str
-    bet_amount: float
-    multiplier: float
+    bet_amount: FiniteFloat
+    multiplier: FiniteFloat
     won: bool
-    payout: float
-    currency: str = "ETH"
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    verified: bool = True
-
-class GameRecordCreate(BaseModel):
-    game_type: str
-    server_seed: str
-    client_seed: str
-    nonce: int
-    user_id: str
-    username: str
-    bet_amount: float
-    multiplier: float
-    won: bool
-    payout: float
-    currency: str = "ETH"
+    payout: FiniteFloat
+    currency: NotRequired[str]
+
+class GameBatchItem(GameRecordCreate):
+    idempotency_key: NotRequired[str]
+
+def check_game_amounts(game: dict) -> dict:
+    """Refuse amounts whose minor unit count would overflow the ledger columns"""
+    currency = game.get("currency", DEFAULT_CURRENCY)
+    for field in ("bet_amount", "payout"):
+        try:
+            check_amount(game[field], currency)
+        except ValueError as e:
+            raise ValueError(f"{field}: {e}")
+    return game
 
 class SeedPair(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -117,6 +199,22 @@ class SeedPair(BaseModel):
 class SeedPairCreate(BaseModel):
     client_seed: Optional[str] = None
 
+# Bot request bodies, validated into plain dicts (JSON or MessagePack)
+verification_body = RequestBody(VerificationRequest)
+game_record_body = RequestBody(
+    Annotated[GameRecordCreate, AfterValidator(check_game_amounts)],
+    defaults={"currency": "ETH"}
+)
+
+MAX_BATCH_GAMES = 500
+game_batch_body = RequestBody(
+    Annotated[
+        List[Annotated[GameBatchItem, AfterValidator(check_game_amounts)]],
+        Field(min_length=1, max_length=MAX_BATCH_GAMES)
+    ],
+    defaults={"currency": "ETH"}
+)
+
 class ApiStats(BaseModel):
     total_games: int
     total_verified: int
@@ -127,110 +225,6 @@ class ApiStats(BaseModel):
 # PROVABLY FAIR LOGIC
 # =============================================================================
 
-def generate_server_seed():
-    """Generate a cryptographically secure server seed"""
-    return secrets.token_hex(32)
-
-def hash_server_seed(server_seed: str) -> str:
-    """Create SHA256 hash of server seed"""
-    return hashlib.sha256(server_seed.encode()).hexdigest()
-
-def generate_hmac_result(server_seed: str, client_seed: str, nonce: int) -> str:
-    """Generate HMAC-SHA256 result from seeds and nonce"""
-    message = f"{client_seed}:{nonce}"
-    return hmac.new(
-        server_seed.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
-
-def hex_to_float(hex_string: str) -> float:
-    """Convert first 8 characters of hex to float between 0 and 1"""
-    # Take first 8 chars (32 bits) and convert to integer
-    int_value = int(hex_string[:8], 16)
-    # Normalize to 0-1 range
-    return int_value / (16 ** 8)
-
-def calculate_game_result(game_type: str, raw_result: float) -> dict:
-    """Calculate game-specific result from raw float"""
-    
-    if game_type == "coinflip":
-        return {
-            "outcome": "heads" if raw_result < 0.5 else "tails",
-            "roll": round(raw_result * 100, 2)
-        }
-    
-    elif game_type == "dices_war":
-        player_roll = int(raw_result * 6) + 1
-        house_roll = int((raw_result * 100 % 1) * 6) + 1
-        return {
-            "player_roll": player_roll,
-            "house_roll": house_roll,
-            "winner": "player" if player_roll > house_roll else ("tie" if player_roll == house_roll else "house")
-        }
-    
-    elif game_type == "mines":
-        # Generate mine positions (5 mines out of 25 tiles)
-        positions = []
-        temp_result = raw_result
-        for i in range(5):
-            pos = int(temp_result * 25) % 25
-            while pos in positions:
-                pos = (pos + 1) % 25
-            positions.append(pos)
-            temp_result = (temp_result * 1000) % 1
-        return {
-            "mine_positions": sorted(positions),
-            "safe_tiles": [i for i in range(25) if i not in positions]
-        }
-    
-    elif game_type == "tower":
-        # Tower game - 8 levels, each level has correct position
-        correct_positions = []
-        temp_result = raw_result
-        for level in range(8):
-            pos = int(temp_result * 3) % 3  # 3 positions per level
-            correct_positions.append(pos)
-            temp_result = (temp_result * 1000) % 1
-        return {
-            "correct_path": correct_positions,
-            "levels": 8,
-            "positions_per_level": 3
-        }
-    
-    elif game_type == "blackjack":
-        # Generate shuffled deck seed
-        deck_seed = int(raw_result * 52)
-        return {
-            "deck_seed": deck_seed,
-            "shuffle_index": raw_result,
-            "note": "Full deck shuffle determined by this seed"
-        }
-    
-    elif game_type == "match":
-        # Match game - matching items
-        match_value = int(raw_result * 100)
-        return {
-            "match_value": match_value,
-            "is_match": match_value < 20,  # 20% match chance
-            "roll": round(raw_result * 100, 2)
-        }
-    
-    elif game_type == "crash":
-        # Crash multiplier calculation
-        # Using house edge of 1%
-        e = 2.718281828
-        house_edge = 0.01
-        crash_point = max(1.0, (1 - house_edge) / (1 - raw_result))
-        if raw_result > 0.99:
-            crash_point = 100.0  # Cap at 100x
-        return {
-            "crash_point": round(crash_point, 2),
-            "raw_value": round(raw_result * 100, 4)
-        }
-    
-    return {"raw": raw_result}
-
 def verify_game(server_seed: str, client_seed: str, nonce: int, game_type: str) -> VerificationResponse:
     """Full verification of a game result"""
     steps = []
@@ -275,28 +269,28 @@ async def get_game_types():
     return {"games": GAME_TYPES}
 
 # Verification endpoint
-@api_router.post("/verify", response_model=VerificationResponse)
-async def verify_game_result(request: VerificationRequest):
+@api_router.post("/verify", response_model=VerificationResponse, openapi_extra=verification_body.openapi)
+async def verify_game_result(request: dict = Depends(verification_body), accept: Optional[str] = Header(None)):
     """Verify a game result using provably fair algorithm"""
-    if request.game_type not in GAME_TYPES:
+    if request["game_type"] not in GAME_TYPES:
         raise HTTPException(status_code=400, detail=f"Invalid game type. Must be one of: {GAME_TYPES}")
     
-    if request.nonce < 0:
+    if request["nonce"] < 0:
         raise HTTPException(status_code=400, detail="Nonce must be non-negative")
     
-    return verify_game(
-        request.server_seed,
-        request.client_seed,
-        request.nonce,
-        request.game_type
-    )
+    VERIFICATIONS.inc("verify")
+    return reply(accept, verify_game(
+        request["server_seed"],
+        request["client_seed"],
+        request["nonce"],
+        request["game_type"]
+    ))
 
 # Generate new seed pair
 @api_router.post("/seeds/generate")
 async def generate_seed_pair(request: SeedPairCreate):
     """Generate a new server seed and return its hash (seed remains hidden until revealed)"""
-    server_seed = generate_server_seed()
-    server_seed_hash = hash_server_seed(server_seed)
+    server_seed, server_seed_hash = seed_pool.take()
     client_seed = request.client_seed or secrets.token_hex(16)
     
     seed_pair = SeedPair(
@@ -306,10 +300,9 @@ async def generate_seed_pair(request: SeedPairCreate):
         nonce=0
     )
     
-    if db is not None:
-        doc = seed_pair.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.seed_pairs.insert_one(doc)
+    doc = seed_pair.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    await storage.insert_seed_pair(doc)
     
     return {
         "id": seed_pair.id,
@@ -325,6 +318,7 @@ async def verify_hash(server_seed: str = Query(...), expected_hash: str = Query(
     """Verify that a server seed matches its previously shown hash"""
     actual_hash = hash_server_seed(server_seed)
     matches = actual_hash == expected_hash
+    VERIFICATIONS.inc("verify_hash")
     
     return {
         "matches": matches,
@@ -343,92 +337,203 @@ async def verify_bot_api_key(x_api_key: str = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return True
 
-@api_router.post("/bot/game", response_model=dict)
-async def record_game(game: GameRecordCreate, x_api_key: str = Header(None)):
-    """Record a game result from Discord bot"""
-    await verify_bot_api_key(x_api_key)
-    
-    if game.game_type not in GAME_TYPES:
+async def _record_game(game: dict, idempotency_key: Optional[str] = None) -> dict:
+    """Verify and store one game; returns the response body"""
+    if game["game_type"] not in GAME_TYPES:
         raise HTTPException(status_code=400, detail=f"Invalid game type")
     
+    # Retries of a submission map to the same game id
+    server_seed_hash = hash_server_seed(game["server_seed"])
+    game_id = game_id_for(session_id(server_seed_hash, game["client_seed"]), game["nonce"], idempotency_key)
+    duplicate = {
+        "success": True,
+        "game_id": game_id,
+        "server_seed_hash": server_seed_hash,
+        "duplicate": True
+    }
+    if recent_games.seen(game_id):
+        DUPLICATE_GAMES.inc("memory")
+        return duplicate
+    
     # Verify the game
     verification = verify_game(
-        game.server_seed,
-        game.client_seed,
-        game.nonce,
-        game.game_type
+        game["server_seed"],
+        game["client_seed"],
+        game["nonce"],
+        game["game_type"]
     )
     
-    record = GameRecord(
-        game_type=game.game_type,
-        server_seed=game.server_seed,
+    # The full game record; the body was validated already, so no model is built
+    record = dict(
+        game,
+        id=game_id,
         server_seed_hash=verification.server_seed_hash,
-        client_seed=game.client_seed,
-        nonce=game.nonce,
         result=verification.result,
         raw_result=verification.raw_result,
-        user_id=game.user_id,
-        username=game.username,
-        bet_amount=game.bet_amount,
-        multiplier=game.multiplier,
-        won=game.won,
-        payout=game.payout,
-        currency=game.currency
+        timestamp=datetime.now(timezone.utc),
+        verified=True
     )
     
-    if db is not None:
-        doc = record.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
-        await db.game_history.insert_one(doc)
+    session = build_session(
+        game["server_seed"],
+        verification.server_seed_hash,
+        game["client_seed"]
+    )
+    await seed_sessions.ensure(storage, session)
+    await user_directory.ensure(storage, game["user_id"], game["username"])
+    doc = encode_game(record)
+    inserted = await storage.insert_game(doc)
+    recent_games.add(game_id)
+    if not inserted:
+        DUPLICATE_GAMES.inc("storage")
+        return duplicate
+    fairness_monitor.observe(game["game_type"], verification.raw_result)
+    public = public_game(decode_game(doc, {session["_id"]: session}))
+    leaderboards.observe(public)
+    rollups.observe(public)
+    live_feed.publish(public)
+    cache_bus.publish(GAME_EVENT, public)
+    VERIFICATIONS.inc("record")
+    GAMES_RECORDED.inc(game["game_type"], game["currency"])
     
     return {
         "success": True,
-        "game_id": record.id,
-        "server_seed_hash": verification.server_seed_hash
+        "game_id": game_id,
+        "server_seed_hash": verification.server_seed_hash,
+        "duplicate": False
     }
 
-@api_router.get("/history")
+GAME_EVENT = "game"
+
+def observe_remote_game(public: dict):
+    """Feed a game another worker recorded to this worker's in-memory views"""
+    recent_games.add(public["id"])
+    fairness_monitor.observe(public["game_type"], public["raw_result"])
+    leaderboards.observe(public)
+    # Not rollups: every worker adds only its own games to the shared buckets
+    live_feed.publish(public)
+
+cache_bus.subscribe(GAME_EVENT, observe_remote_game)
+
+@api_router.post("/bot/game", response_model=dict, openapi_extra=game_record_body.openapi)
+async def record_game(
+    game: dict = Depends(game_record_body),
+    x_api_key: str = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    accept: Optional[str] = Header(None)
+):
+    """Record a game result from Discord bot"""
+    await verify_bot_api_key(x_api_key)
+    
+    return reply(accept, await _record_game(game, idempotency_key))
+
+async def _record_batch_item(game: dict) -> dict:
+    try:
+        return await _record_game(game, game.pop("idempotency_key", None))
+    except HTTPException as e:
+        return {"success": False, "status_code": e.status_code, "detail": e.detail}
+
+@api_router.post("/bot/games/batch", openapi_extra=game_batch_body.openapi)
+async def record_games(
+    games: list = Depends(game_batch_body),
+    x_api_key: str = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    """Record up to MAX_BATCH_GAMES game results in one request (Bot only)"""
+    await verify_bot_api_key(x_api_key)
+    
+    # Recorded concurrently, so their storage writes share group commits
+    results = await asyncio.gather(*[_record_batch_item(game) for game in games])
+    
+    return reply(accept, {"results": results})
+
+async def public_reads():
+    """Dependency of public read routes: they may be served by a secondary"""
+    # Async, so it runs in the handler's context and the flag reaches its reads
+    token = prefer_secondary_reads()
+    try:
+        yield
+    finally:
+        restore_primary_reads(token)
+
+# -- game listings ------------------------------------------------------------
+# `fields` trims every listed game to the named fields, and only those are read
+# from storage. `layout=columns` returns one list per field instead of one
+# object per game, so table views get each field name once.
+
+GAME_LAYOUTS = ("objects", "columns")
+FIELDS_QUERY = Query(None, description=f"Comma separated game fields to return, any of {', '.join(PUBLIC_FIELDS)}")
+LAYOUT_QUERY = Query("objects", description="`objects` (one per game) or `columns` (one list per field)")
+
+def parse_game_fields(fields: Optional[str], layout: str) -> Optional[List[str]]:
+    """Fields named in a `fields` parameter, None for all of them"""
+    if layout not in GAME_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"Invalid layout. Must be one of: {list(GAME_LAYOUTS)}")
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in PUBLIC_FIELDS]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Invalid fields {unknown}. Must be among: {list(PUBLIC_FIELDS)}")
+    return names
+
+def shape_games(games: List[dict], fields: Optional[List[str]], layout: str):
+    if layout == "columns":
+        return game_columns(games, fields or PUBLIC_FIELDS)
+    if fields:
+        return [select_fields(game, fields) for game in games]
+    return games
+
+@api_router.get("/history", dependencies=[Depends(public_reads)])
 async def get_game_history(
     limit: int = Query(50, le=100),
     game_type: Optional[str] = None,
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    fields: Optional[str] = FIELDS_QUERY,
+    layout: str = LAYOUT_QUERY
 ):
     """Get recent game history (public endpoint)"""
-    if db is None:
-        return {"games": [], "count": 0}
+    selected = parse_game_fields(fields, layout)
+    if game_type and game_type not in GAME_TYPE_CODES:
+        return {"games": shape_games([], selected, layout), "count": 0}
+    
+    docs = await storage.recent_games(
+        limit,
+        game_type=GAME_TYPE_CODES[game_type] if game_type else None,
+        user_id=user_id,
+        fields=stored_fields(selected) if selected else None
+    )
+    sessions = await seed_sessions.get_many(storage, (doc["s"] for doc in docs if "s" in doc))
     
-    query = {}
-    if game_type:
-        query["game_type"] = game_type
-    if user_id:
-        query["user_id"] = user_id
+    games = [public_game(decode_game(doc, sessions)) for doc in docs]
     
-    games = await db.game_history.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    return PlainJSONResponse({"games": shape_games(games, selected, layout), "count": len(games)})
+
+@api_router.get("/history/stream")
+async def stream_game_history(
+    game_type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)
+):
+    """Stream newly recorded games as Server-Sent Events (public endpoint)"""
+    if game_type and game_type not in GAME_TYPE_CODES:
+        raise HTTPException(status_code=400, detail=f"Invalid game type. Must be one of: {GAME_TYPES}")
     
-    for game in games:
-        if 'username' in game:
-            name = game['username']
-            if len(name) > 4:
-                game['username'] = name[:2] + '*' * (len(name) - 4) + name[-2:]
-        if isinstance(game.get('timestamp'), str):
-            game['timestamp'] = datetime.fromisoformat(game['timestamp'])
+    if live_feed.full:
+        raise HTTPException(status_code=503, detail="Too many live feed clients")
     
-    return {"games": games, "count": len(games)}
+    return StreamingResponse(
+        live_feed.stream(game_type, user_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@api_router.get("/stats")
+@api_router.get("/stats", dependencies=[Depends(public_reads)])
 async def get_stats():
     """Get API statistics"""
-    if db is None:
-        return ApiStats(total_games=0, total_verified=0, games_by_type={}, recent_games_count=0)
-    
-    total_games = await db.game_history.count_documents({})
-    
-    pipeline = [
-        {"$group": {"_id": "$game_type", "count": {"$sum": 1}}}
-    ]
-    games_by_type = {}
-    async for doc in db.game_history.aggregate(pipeline):
-        games_by_type[doc["_id"]] = doc["count"]
+    counts = await storage.count_games_by_type()
+    games_by_type = {GAME_TYPES[code]: count for code, count in counts.items()}
+    total_games = sum(counts.values())
     
     return ApiStats(
         total_games=total_games,
@@ -437,68 +542,115 @@ async def get_stats():
         recent_games_count=min(total_games, 100)
     )
 
-@api_router.get("/user/{identifier}/stats")
-async def get_user_stats(identifier: str):
-    """Get stats for a specific user by ID or username (public endpoint)"""
-    if db is None:
-        raise HTTPException(status_code=503, detail="Database not configured")
+@api_router.get("/fairness")
+async def get_fairness():
+    """Get live uniformity test statistics of recorded raw results (public endpoint)"""
+    return fairness_monitor.report()
+
+@api_router.get("/leaderboard")
+async def get_leaderboard(
+    metric: str = "wagered",
+    window: str = "daily",
+    game_type: str = "all",
+    currency: str = "ETH",
+    limit: int = Query(10, ge=1, le=100)
+):
+    """Get a leaderboard: top wagered, top profit or biggest multipliers (public endpoint)"""
+    if metric not in LEADERBOARD_METRICS:
+        raise HTTPException(status_code=400, detail=f"Invalid metric. Must be one of: {list(LEADERBOARD_METRICS)}")
+    if window not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Invalid window. Must be one of: {list(LEADERBOARD_WINDOWS)}")
+    if game_type != "all" and game_type not in GAME_TYPE_CODES:
+        raise HTTPException(status_code=400, detail=f"Invalid game type. Must be one of: {GAME_TYPES}")
+    
+    return leaderboards.top(metric, window, game_type, currency, min(limit, leaderboards.size))
+
+@api_router.get("/analytics/rollups")
+async def get_rollups(
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    game_type: Optional[str] = None,
+    currency: Optional[str] = None
+):
+    """Get games, wagered, payout and house profit per time bucket (public endpoint)"""
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid granularity. Must be one of: {list(ROLLUP_GRANULARITIES)}")
+    if game_type and game_type not in GAME_TYPE_CODES:
+        raise HTTPException(status_code=400, detail=f"Invalid game type. Must be one of: {GAME_TYPES}")
+    
+    step = ROLLUP_GRANULARITIES[granularity]
+    end = end.replace(tzinfo=end.tzinfo or timezone.utc) if end else datetime.now(timezone.utc)
+    start = start.replace(tzinfo=start.tzinfo or timezone.utc) if start else end - step * (24 if granularity == "hour" else 30)
+    # Include the bucket `start` falls in
+    start = bucket_start(granularity, start)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start) / step > MAX_ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range too long: at most {MAX_ROLLUP_BUCKETS} {granularity} buckets")
+    
+    buckets = await rollups.series(storage, granularity, start, end, game_type, currency)
     
-    query = {"$or": [
-        {"user_id": identifier},
-        {"username": {"$regex": f"^{identifier}$", "$options": "i"}}
-    ]}
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "backfill_complete": rollups.backfill_complete,
+        "buckets": buckets
+    }
+
+@api_router.get("/user/{identifier}/stats", dependencies=[Depends(public_reads)])
+async def get_user_stats(identifier: str, fields: Optional[str] = FIELDS_QUERY, layout: str = LAYOUT_QUERY):
+    """Get stats for a specific user by ID or username (public endpoint)"""
+    selected = parse_game_fields(fields, layout)
+    user_id = await user_directory.resolve(storage, identifier)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found or has no games")
     
-    total_games = await db.game_history.count_documents(query)
+    summary = await storage.user_summary(user_id)
+    total_games = summary["total_games"]
     
     if total_games == 0:
         raise HTTPException(status_code=404, detail="User not found or has no games")
     
-    wins = await db.game_history.count_documents({**query, "won": True})
+    wins = summary["wins"]
     losses = total_games - wins
-    
-    pipeline = [
-        {"$match": query},
-        {"$group": {
-            "_id": None,
-            "total_wagered": {"$sum": "$bet_amount"},
-            "total_payout": {"$sum": "$payout"},
-            "games_by_type": {"$push": "$game_type"}
-        }}
-    ]
-    
-    agg_result = await db.game_history.aggregate(pipeline).to_list(1)
-    
-    total_wagered = 0
-    total_payout = 0
-    games_by_type = {}
-    
-    if agg_result:
-        total_wagered = agg_result[0].get("total_wagered", 0)
-        total_payout = agg_result[0].get("total_payout", 0)
-        for gt in agg_result[0].get("games_by_type", []):
-            games_by_type[gt] = games_by_type.get(gt, 0) + 1
-    
-    profit = total_payout - total_wagered
+    games_by_type = {GAME_TYPES[code]: count for code, count in summary["games_by_type"].items()}
     win_rate = round((wins / total_games) * 100, 2) if total_games > 0 else 0
     
-    recent_games = await db.game_history.find(query, {"_id": 0, "server_seed": 0}).sort("timestamp", -1).limit(10).to_list(10)
+    # Amounts are exact minor unit sums per currency; they are never added across currencies
+    currencies = {}
+    for currency, totals in sorted(summary["currencies"].items()):
+        currencies[currency] = {
+            "games": totals["games"],
+            "wins": totals["wins"],
+            "total_wagered": from_minor(totals["wagered"], currency),
+            "total_payout": from_minor(totals["payout"], currency),
+            "profit": from_minor(totals["payout"] - totals["wagered"], currency)
+        }
+    default = currencies.get(DEFAULT_CURRENCY, {"total_wagered": 0, "total_payout": 0, "profit": 0})
     
-    for game in recent_games:
-        if isinstance(game.get('timestamp'), str):
-            game['timestamp'] = datetime.fromisoformat(game['timestamp'])
+    recent_docs = await storage.recent_user_games(user_id, 10, stored_fields(selected) if selected else None)
+    sessions = await seed_sessions.get_many(storage, (doc["s"] for doc in recent_docs if "s" in doc))
+    recent_games = []
+    for doc in recent_docs:
+        game = decode_game(doc, sessions)
+        game.pop('masked_username', None)
+        recent_games.append(game)
     
-    return {
-        "user_id": identifier,
+    return PlainJSONResponse({
+        "user_id": user_id,
         "total_games": total_games,
         "wins": wins,
         "losses": losses,
         "win_rate": win_rate,
-        "total_wagered": round(total_wagered, 6),
-        "total_payout": round(total_payout, 6),
-        "profit": round(profit, 6),
+        "total_wagered": default["total_wagered"],
+        "total_payout": default["total_payout"],
+        "profit": default["profit"],
+        "currencies": currencies,
         "games_by_type": games_by_type,
-        "recent_games": recent_games
-    }
+        "recent_games": shape_games(recent_games, selected, layout)
+    })
 
 # =============================================================================
 # SEED MANAGEMENT FOR BOT
@@ -508,13 +660,13 @@ async def get_user_stats(identifier: str):
 async def create_seeds_for_user(
     user_id: str,
     client_seed: Optional[str] = None,
-    x_api_key: str = Header(None)
+    x_api_key: str = Header(None),
+    accept: Optional[str] = Header(None)
 ):
     """Create a new seed pair for a user (Bot only)"""
     await verify_bot_api_key(x_api_key)
     
-    server_seed = generate_server_seed()
-    server_seed_hash = hash_server_seed(server_seed)
+    server_seed, server_seed_hash = seed_pool.take()
     client_seed = client_seed or secrets.token_hex(16)
     
     doc = {
@@ -528,69 +680,51 @@ async def create_seeds_for_user(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    if db is None:
-        raise HTTPException(status_code=503, detail="Database not configured")
-    
-    # Deactivate old seeds for this user
-    await db.user_seeds.update_many(
-        {"user_id": user_id, "active": True},
-        {"$set": {"active": False}}
-    )
+    # Deactivate old seeds for this user and activate the new ones in one atomic write
+    rotated = await storage.rotate_active_seed(user_id, doc)
+    active_seeds.invalidate(user_id)
     
-    await db.user_seeds.insert_one(doc)
+    if not rotated:
+        raise HTTPException(status_code=409, detail="Seeds were created concurrently for this user")
     
-    return {
+    return reply(accept, {
         "id": doc["id"],
         "server_seed_hash": server_seed_hash,
         "client_seed": client_seed,
         "nonce": 0
-    }
+    })
 
 @api_router.get("/bot/seeds/{user_id}")
-async def get_user_seeds(user_id: str, x_api_key: str = Header(None)):
+async def get_user_seeds(user_id: str, x_api_key: str = Header(None), accept: Optional[str] = Header(None)):
     """Get active seeds for a user (Bot only)"""
     await verify_bot_api_key(x_api_key)
-    if db is None:
-        raise HTTPException(status_code=503, detail="Database not configured")
     
-    seeds = await db.user_seeds.find_one(
-        {"user_id": user_id, "active": True},
-        {"_id": 0}
-    )
+    seeds = await active_seeds.get(storage, user_id)
     
     if not seeds:
         raise HTTPException(status_code=404, detail="No active seeds for user")
     
-    return {
+    return reply(accept, {
         "server_seed_hash": seeds["server_seed_hash"],
         "client_seed": seeds["client_seed"],
         "nonce": seeds["nonce"]
-    }
+    })
 
 @api_router.post("/bot/seeds/{user_id}/reveal")
-async def reveal_user_seeds(user_id: str, x_api_key: str = Header(None)):
+async def reveal_user_seeds(
+    user_id: str,
+    x_api_key: str = Header(None),
+    accept: Optional[str] = Header(None)
+):
     """Reveal server seed for a user and rotate to new seeds (Bot only)"""
     await verify_bot_api_key(x_api_key)
-    if db is None:
-        raise HTTPException(status_code=503, detail="Database not configured")
     
-    seeds = await db.user_seeds.find_one(
-        {"user_id": user_id, "active": True},
-        {"_id": 0}
-    )
+    seeds = await active_seeds.get(storage, user_id)
     
     if not seeds:
         raise HTTPException(status_code=404, detail="No active seeds for user")
     
-    # Mark as revealed
-    await db.user_seeds.update_one(
-        {"id": seeds["id"]},
-        {"$set": {"active": False, "revealed_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    
-    # Create new seeds
-    new_server_seed = generate_server_seed()
-    new_server_seed_hash = hash_server_seed(new_server_seed)
+    new_server_seed, new_server_seed_hash = seed_pool.take()
     
     new_doc = {
         "id": str(uuid.uuid4()),
@@ -602,36 +736,117 @@ async def reveal_user_seeds(user_id: str, x_api_key: str = Header(None)):
         "active": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.user_seeds.insert_one(new_doc)
     
-    return {
+    # Mark as revealed and activate the new seeds in one atomic write
+    rotated = await storage.rotate_active_seed(
+        user_id,
+        new_doc,
+        reveal_id=seeds["id"],
+        reveal_fields={"revealed_at": datetime.now(timezone.utc).isoformat(), "audit": {"status": "pending"}}
+    )
+    active_seeds.invalidate(user_id)
+    
+    if not rotated:
+        raise HTTPException(status_code=409, detail="Seeds changed while revealing; fetch them and retry")
+    
+    # Verify the revealed session's games without holding up the response;
+    # an audit cut short by a shutdown is still pending and resumed on start
+    run_in_background(run_seed_audit(storage, seed_sessions, seeds))
+    
+    return reply(accept, {
         "revealed_server_seed": seeds["server_seed"],
         "revealed_server_seed_hash": seeds["server_seed_hash"],
         "new_server_seed_hash": new_server_seed_hash,
         "client_seed": seeds["client_seed"]
+    })
+
+@api_router.get("/seeds/{server_seed_hash}/audit")
+async def get_seed_audit(server_seed_hash: str):
+    """Get the reveal-time audit summary and Merkle root of a seed session (public endpoint)"""
+    seeds = await storage.get_revealed_seed(server_seed_hash)
+    
+    if not seeds or "audit" not in seeds:
+        raise HTTPException(status_code=404, detail="No audit for this server seed hash")
+    
+    return {
+        "server_seed": seeds["server_seed"],
+        "server_seed_hash": seeds["server_seed_hash"],
+        "client_seed": seeds["client_seed"],
+        "revealed_at": seeds.get("revealed_at"),
+        "audit": seeds["audit"]
     }
 
+@api_router.get("/seeds/{server_seed_hash}/proof/{game_id}")
+async def get_game_inclusion_proof(server_seed_hash: str, game_id: str):
+    """Get a Merkle inclusion proof for one game of an audited seed session (public endpoint)"""
+    proof = await get_inclusion_proof(storage, server_seed_hash, game_id)
+    
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Game not found in an audited seed session")
+    
+    return proof
+
 @api_router.post("/bot/seeds/{user_id}/increment-nonce")
-async def increment_nonce(user_id: str, x_api_key: str = Header(None)):
+async def increment_nonce(user_id: str, x_api_key: str = Header(None), accept: Optional[str] = Header(None)):
     """Increment nonce for a user after each game (Bot only)"""
     await verify_bot_api_key(x_api_key)
-    if db is None:
-        raise HTTPException(status_code=503, detail="Database not configured")
     
-    result = await db.user_seeds.find_one_and_update(
-        {"user_id": user_id, "active": True},
-        {"$inc": {"nonce": 1}},
-        return_document=True
-    )
+    result = await active_seeds.increment(storage, user_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="No active seeds for user")
     
-    return {"nonce": result["nonce"]}
+    return reply(accept, {"nonce": result["nonce"]})
+
+@api_router.post("/bot/leaderboards/rebuild")
+async def rebuild_leaderboards(x_api_key: str = Header(None)):
+    """Recompute every leaderboard from game history in the background (Bot only)"""
+    await verify_bot_api_key(x_api_key)
+    
+    if not leaderboards.start_rebuild(storage):
+        raise HTTPException(status_code=409, detail="Leaderboard rebuild already running")
+    
+    return {"success": True, "message": "Leaderboard rebuild started"}
+
+def require_profiler():
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return profiler
+
+@api_router.post("/bot/profiles/token")
+async def create_profile_token(ttl: int = Query(300, ge=1, le=86400), x_api_key: str = Header(None)):
+    """Sign an X-Profile-Token header value that profiles requests carrying it (Bot only)"""
+    await verify_bot_api_key(x_api_key)
+    require_profiler()
+    
+    return {"header": "X-Profile-Token", "token": sign_profile_token(profiler.secret, ttl), "expires_in": ttl}
+
+@api_router.get("/bot/profiles")
+async def list_profiles(x_api_key: str = Header(None)):
+    """List recent request profiles, newest first (Bot only)"""
+    await verify_bot_api_key(x_api_key)
+    
+    return {"profiles": require_profiler().list_profiles()}
+
+@api_router.get("/bot/profiles/{name}")
+async def download_profile(name: str, x_api_key: str = Header(None)):
+    """Download a request profile in collapsed stack format (Bot only)"""
+    await verify_bot_api_key(x_api_key)
+    
+    path = require_profiler().profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return FileResponse(path, media_type="text/plain", filename=name)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -640,6 +855,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Inside the metrics and profiling middleware, so their timings include compressing
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')))
+
+if profiler is not None:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Outermost, so the timings include every other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -647,7 +871,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    if client is not None:
-        client.close()
+# Startup task running the seed audits a restart interrupted
+audit_resume_task: Optional[asyncio.Task] = None
+
+async def init_storage():
+    await storage.init()
+    logger.info("Using %s storage", storage.name)
+    await cache_bus.start(storage)
+    if seed_leases is not None:
+        await seed_leases.start(storage)
+    await seed_pool.start()
+    await fairness_monitor.start(storage)
+    await leaderboards.start(storage)
+    await rollups.start(storage)
+    await user_directory.start(storage)
+    await seed_compactor.start(storage)
+    # Audits a restart interrupted run again in the background
+    global audit_resume_task
+    lease = {"owner": WORKER_ID, "lease_ttl": seed_leases.ttl} if seed_leases is not None else {}
+    audit_resume_task = asyncio.create_task(resume_pending_audits(storage, seed_sessions, **lease))
+
+async def shutdown_storage():
+    jobs = list(background_jobs) + ([audit_resume_task] if audit_resume_task is not None else [])
+    for job in jobs:
+        job.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
+    await fairness_monitor.stop(storage)
+    await leaderboards.stop(storage)
+    await rollups.stop(storage)
+    await user_directory.stop(storage)
+    await seed_compactor.stop(storage)
+    await seed_pool.stop()
+    if seed_leases is not None:
+        await seed_leases.stop(storage)
+    await cache_bus.stop(storage)
+    await storage.close()
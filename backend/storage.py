@@ -0,0 +1,336 @@
+import os
+from contextvars import ContextVar
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from ledger import DEFAULT_CURRENCY
+
+# =============================================================================
+# STORAGE INTERFACE
+# =============================================================================
+# Every collection the API touches (game_history, seed_sessions, user_seeds,
+# revealed_seeds, seed_pairs, seed_audits, rollups, leaderboard_totals, users,
+# service_state) is reached through this interface. Game rows and seed
+# sessions are passed around in their stored form (see game_codec and
+# seed_sessions); the other documents keep the field names the API returns.
+
+# Counters of a rollup bucket; amounts in the currency's minor units (see ledger)
+ROLLUP_FIELDS = ("games", "wins", "wagered_minor", "payout_minor")
+
+# Public read routes tolerate slightly stale data, so a backend with replicas
+# may serve their game_history and users reads from a secondary. Everything
+# else (bot writes, nonces, seeds) reads the primary.
+_secondary_reads: ContextVar[bool] = ContextVar("secondary_reads", default=False)
+
+def prefer_secondary_reads():
+    """Let the following reads go to a secondary; returns the token to undo it"""
+    return _secondary_reads.set(True)
+
+def restore_primary_reads(token):
+    _secondary_reads.reset(token)
+
+def secondary_reads() -> bool:
+    return _secondary_reads.get()
+
+class Storage:
+    """Base class of the storage backends"""
+
+    name = "base"
+
+    # Games before this timestamp belong to the archive (see archive.py); the
+    # game_history reads below skip any that are still stored here
+    archived_before: Optional[datetime] = None
+
+    async def init(self):
+        """Create tables / indexes; called once at startup"""
+
+    async def close(self):
+        """Release connections; called once at shutdown"""
+
+    # -- game_history ---------------------------------------------------------
+
+    async def insert_game(self, doc: dict) -> bool:
+        """Insert a game; False (and no write) if a game with the same id exists"""
+        raise NotImplementedError
+
+    async def recent_games(
+        self,
+        limit: int,
+        game_type: Optional[int] = None,
+        user_id: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        """Newest games first, optionally filtered by game type code and user
+
+        `fields` lists the stored fields the caller needs (game_codec.stored_fields);
+        a backend may return more.
+        """
+        raise NotImplementedError
+
+    async def count_games_by_type(self) -> Dict[int, int]:
+        """Number of games per game type code"""
+        raise NotImplementedError
+
+    async def user_summary(self, user_id: str) -> dict:
+        """Totals of a user's games
+
+        Returns total_games, wins, games_by_type (keyed by game type code)
+        and currencies: per currency games, wins, and wagered / payout as
+        integer minor units. Build it with empty_summary / add_to_summary.
+        """
+        raise NotImplementedError
+
+    async def recent_user_games(self, user_id: str, limit: int, fields: Optional[List[str]] = None) -> List[dict]:
+        raise NotImplementedError
+
+    async def games_for_sessions(self, session_ids: List[str]) -> List[dict]:
+        """Every game of the given seed sessions, ordered by nonce"""
+        raise NotImplementedError
+
+    def scan_games(
+        self,
+        batch_size: int = 1000,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> AsyncIterator[List[dict]]:
+        """Stored games in batches, in no particular order; used to rebuild derived state
+
+        `start` / `end` limit the scan to timestamps in [start, end).
+        """
+        raise NotImplementedError
+
+    async def oldest_game_time(self) -> Optional[datetime]:
+        raise NotImplementedError
+
+    async def games_before(self, end: datetime, limit: int) -> List[dict]:
+        """Oldest games with timestamps before `end`, oldest first, with every field"""
+        raise NotImplementedError
+
+    async def delete_games_before(self, end: datetime):
+        raise NotImplementedError
+
+    # -- seed_sessions --------------------------------------------------------
+
+    async def upsert_seed_session(self, session: dict):
+        """Insert a session if missing; fills in its plaintext seed when given"""
+        raise NotImplementedError
+
+    async def get_seed_sessions(self, session_ids: Iterable[str]) -> List[dict]:
+        raise NotImplementedError
+
+    async def find_seed_sessions_by_hash(self, server_seed_hash: str) -> List[dict]:
+        raise NotImplementedError
+
+    # -- user_seeds -----------------------------------------------------------
+
+    async def get_active_seed(self, user_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def rotate_active_seed(
+        self,
+        user_id: str,
+        doc: dict,
+        reveal_id: Optional[str] = None,
+        reveal_fields: Optional[dict] = None
+    ) -> bool:
+        """Atomically make `doc` the user's only active seed
+
+        Without `reveal_id` every active seed of the user is deactivated. With
+        it, the rotation only happens while that seed is the active one, and
+        it is deactivated with `reveal_fields` (revealed_at, audit) set.
+        Returns False when the active seed changed underneath.
+        """
+        raise NotImplementedError
+
+    async def increment_nonce(self, user_id: str) -> Optional[dict]:
+        """Atomically bump the active seed's nonce and return the updated seed"""
+        raise NotImplementedError
+
+    async def advance_nonce(self, user_id: str, seed_id: str, expected: int, nonce: int) -> bool:
+        """Set the nonce of an active seed if it still is `expected`; False when nothing matched"""
+        raise NotImplementedError
+
+    async def get_revealed_seed(self, server_seed_hash: str) -> Optional[dict]:
+        """An inactive seed by hash, from user_seeds or else from revealed_seeds"""
+        raise NotImplementedError
+
+    async def set_seed_audit(self, seed_id: str, server_seed_hash: str, audit: dict):
+        """Set the audit of an inactive seed, wherever retention has put it"""
+        raise NotImplementedError
+
+    async def pending_audits(self, limit: int) -> List[dict]:
+        """Inactive seeds whose audit is still "pending", from user_seeds and revealed_seeds"""
+        raise NotImplementedError
+
+    # -- revealed_seeds -------------------------------------------------------
+
+    async def inactive_seeds_before(self, cutoff: datetime, limit: int) -> List[dict]:
+        """Oldest inactive user_seeds created and revealed (if ever) before `cutoff`"""
+        raise NotImplementedError
+
+    async def retire_seeds(self, seeds: List[dict]):
+        """Copy inactive seeds into revealed_seeds, then delete them from user_seeds
+
+        Safe to repeat: a seed is keyed by its hash in revealed_seeds.
+        """
+        raise NotImplementedError
+
+    # -- seed_pairs -----------------------------------------------------------
+
+    async def insert_seed_pair(self, doc: dict):
+        raise NotImplementedError
+
+    # -- seed_audits ----------------------------------------------------------
+
+    async def save_audit_chunks(self, server_seed_hash: str, chunks: List[dict]):
+        """Replace the persisted Merkle leaves of an audit"""
+        raise NotImplementedError
+
+    async def load_audit_chunks(self, server_seed_hash: str) -> List[dict]:
+        """Persisted leaf chunks of an audit, ordered by chunk number"""
+        raise NotImplementedError
+
+    # -- rollups --------------------------------------------------------------
+
+    async def increment_rollups(self, rows: List[dict]):
+        """Add live counts to rollup buckets, creating missing ones
+
+        Rows carry the bucket key (granularity, start, game_type, currency) and
+        the games, wins, wagered and payout to add.
+        """
+        raise NotImplementedError
+
+    async def set_rollup_backfill(self, rows: List[dict]):
+        """Set the backfilled part of rollup buckets; writing the same rows again changes nothing"""
+        raise NotImplementedError
+
+    async def rollup_buckets(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        game_type: Optional[str] = None,
+        currency: Optional[str] = None
+    ) -> List[dict]:
+        """Buckets starting in [start, end) with live and backfilled counts summed, oldest first"""
+        raise NotImplementedError
+
+    # -- leaderboard_totals ---------------------------------------------------
+
+    async def save_leaderboard_totals(self, rows: List[dict]):
+        """Insert or replace per user leaderboard totals
+
+        Rows carry the key (window, period, game_type, currency, user_id) and
+        the user's wagered and profit in minor units, games and username.
+        """
+        raise NotImplementedError
+
+    async def load_leaderboard_totals(self, window: str, period: str) -> List[dict]:
+        """Every total row of one window period"""
+        raise NotImplementedError
+
+    async def delete_leaderboard_totals(self, window: str, keep_period: str):
+        """Drop the rows of every period of `window` but `keep_period`"""
+        raise NotImplementedError
+
+    # -- users ----------------------------------------------------------------
+
+    async def upsert_user(self, user_id: str, username: str):
+        """Record a user's current username
+
+        Lowercased usernames are unique: a name recorded for a new user is
+        taken away from whichever user held it before.
+        """
+        raise NotImplementedError
+
+    async def add_users(self, users: List[dict]):
+        """Insert users (user_id, username) that are not known yet; never changes existing ones"""
+        raise NotImplementedError
+
+    async def find_user(self, identifier: str) -> Optional[str]:
+        """user_id of the user with this id, else of the user with this username (any case)"""
+        raise NotImplementedError
+
+    # -- leases ---------------------------------------------------------------
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or extend `key` for `ttl` seconds; False while another owner holds it"""
+        raise NotImplementedError
+
+    async def renew_leases(self, owner: str, ttl: float) -> List[str]:
+        """Extend every lease `owner` still holds by `ttl` seconds from now; returns their keys"""
+        raise NotImplementedError
+
+    async def release_leases(self, owner: str, keys: Optional[List[str]] = None):
+        """Give up `keys` (every lease when None) held by `owner`"""
+        raise NotImplementedError
+
+    # -- service_state --------------------------------------------------------
+
+    async def load_state(self, key: str) -> Optional[dict]:
+        """JSON-serialisable state a background service saved under `key`"""
+        raise NotImplementedError
+
+    async def save_state(self, key: str, value: dict):
+        raise NotImplementedError
+
+    async def create_state(self, key: str, value: dict) -> dict:
+        """Save `value` under `key` unless a state is there already; returns the state saved under `key`"""
+        raise NotImplementedError
+
+def empty_summary() -> dict:
+    return {"total_games": 0, "wins": 0, "games_by_type": {}, "currencies": {}}
+
+def add_to_summary(summary: dict, game_type: int, currency: Optional[str], games: int, wins: int, wagered: int, payout: int):
+    """Add one (game type, currency) group of a user's games to a user_summary result"""
+    summary["total_games"] += games
+    summary["wins"] += wins
+    summary["games_by_type"][game_type] = summary["games_by_type"].get(game_type, 0) + games
+    totals = summary["currencies"].setdefault(currency or DEFAULT_CURRENCY, {"games": 0, "wins": 0, "wagered": 0, "payout": 0})
+    totals["games"] += games
+    totals["wins"] += wins
+    totals["wagered"] += wagered
+    totals["payout"] += payout
+
+def create_storage(bus=None, owner: Optional[str] = None) -> Storage:
+    """Pick the backend from the environment
+
+    STORAGE_BACKEND selects `mongo` or `sqlite`. Without it, Mongo is used when
+    MONGO_URL is set and an embedded SQLite database otherwise. ARCHIVE_DIR adds
+    the on-disk archive tier for old games; with a shared cache `bus`, worker
+    `owner` only moves games while it holds the archive lease.
+    """
+    backend = os.environ.get('STORAGE_BACKEND') or ('mongo' if os.environ.get('MONGO_URL') else 'sqlite')
+
+    if backend == 'mongo':
+        from storage_mongo import MongoStorage
+        storage = MongoStorage(
+            os.environ.get('MONGO_URL'),
+            os.environ.get('DB_NAME', 'razerbet'),
+            slow_query_ms=float(os.environ.get('MONGO_SLOW_QUERY_MS', '100')),
+            max_staleness=int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '90'))
+        )
+    elif backend == 'sqlite':
+        from storage_sqlite import SQLiteStorage
+        storage = SQLiteStorage(
+            os.environ.get('SQLITE_PATH', 'razerbet.db'),
+            read_threads=int(os.environ.get('SQLITE_READ_THREADS', '4')),
+            batch_size=int(os.environ.get('SQLITE_BATCH_SIZE', '256'))
+        )
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+    if os.environ.get('ARCHIVE_DIR'):
+        # Old games move to compressed segment files; reads fall back to them
+        from archive import TieredStorage
+        storage = TieredStorage(
+            storage,
+            os.environ['ARCHIVE_DIR'],
+            archive_after_days=float(os.environ.get('ARCHIVE_AFTER_DAYS', '30')),
+            segment_rows=int(os.environ.get('ARCHIVE_SEGMENT_ROWS', '200000')),
+            interval=float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600')),
+            bus=bus,
+            owner=owner
+        )
+
+    return storage
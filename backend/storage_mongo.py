@@ -0,0 +1,788 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReadPreference, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne, monitoring
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from game_codec import GAME_TYPE_CODES
+from provably_fair import GAME_TYPES
+from seed_sessions import build_session
+from ledger import CURRENCY_DECIMALS, DEFAULT_CURRENCY, DEFAULT_DECIMALS, to_minor
+from metrics import REGISTRY, current_route, record_db_command
+from retention import decode_revealed_seed, encode_revealed_seed
+from storage import ROLLUP_FIELDS, Storage, add_to_summary, empty_summary, secondary_reads
+
+logger = logging.getLogger(__name__)
+
+# MongoDB connection - fix password encoding if URL contains special chars
+def _fix_mongo_url(url):
+    if not url or '://' not in url:
+        return url
+    from urllib.parse import quote_plus
+    scheme, rest = url.split('://', 1)
+    if '@' not in rest:
+        return url
+    last_at = rest.rfind('@')
+    credentials = rest[:last_at]
+    host_part = rest[last_at + 1:]
+    if ':' not in credentials:
+        return url
+    colon_idx = credentials.index(':')
+    user = credentials[:colon_idx]
+    password = credentials[colon_idx + 1:]
+    return f"{scheme}://{quote_plus(user)}:{quote_plus(password)}@{host_part}"
+
+POOL_CONNECTIONS = REGISTRY.gauge("mongo_pool_connections", "Open connections in the driver pool", ("address",))
+POOL_CHECKED_OUT = REGISTRY.gauge("mongo_pool_checked_out", "Pool connections currently checked out", ("address",))
+POOL_CHECKOUT_FAILURES = REGISTRY.counter("mongo_pool_checkout_failures_total", "Failed connection checkouts", ("address", "reason"))
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks driver pool usage for the mongo_pool_* metrics
+
+    Pool events fire on the driver's threads, so counts are kept here under a
+    lock and the metrics read a snapshot when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = defaultdict(int)
+        self._checked_out = defaultdict(int)
+        self._failures = defaultdict(int)
+        POOL_CONNECTIONS.set_callback(lambda: self._snapshot(self._open))
+        POOL_CHECKED_OUT.set_callback(lambda: self._snapshot(self._checked_out))
+        POOL_CHECKOUT_FAILURES.set_callback(lambda: self._snapshot(self._failures))
+
+    def _snapshot(self, counts: dict) -> dict:
+        with self._lock:
+            return {key if isinstance(key, tuple) else (key,): value for key, value in counts.items()}
+
+    def _add(self, counts: dict, key, amount: int):
+        with self._lock:
+            counts[key] += amount
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_created(self, event):
+        self._add(self._open, self._address(event), 1)
+
+    def connection_closed(self, event):
+        self._add(self._open, self._address(event), -1)
+
+    def connection_checked_out(self, event):
+        self._add(self._checked_out, self._address(event), 1)
+
+    def connection_checked_in(self, event):
+        self._add(self._checked_out, self._address(event), -1)
+
+    def connection_check_out_failed(self, event):
+        self._add(self._failures, (self._address(event), str(event.reason)), 1)
+
+    def pool_cleared(self, event):
+        # Cleared connections are closed lazily and still emit connection_closed
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+# Where each command keeps its filter, for the slow query log
+FILTER_FIELDS = ("filter", "query", "pipeline", "updates", "deletes")
+
+def query_shape(value):
+    """A filter with its literal values replaced by `?`, keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return "[?]"
+    return "?"
+
+def _reply_documents(command_name: str, reply: dict) -> int:
+    # Replies do not say how many documents the server examined (that needs
+    # explain or the profiler); count what came back or was written instead
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") is not None else 0
+    return reply.get("n", 0)
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Times every command, attributes it to the current route and logs slow ones"""
+
+    def __init__(self, slow_ms: float = 100):
+        self.slow_seconds = slow_ms / 1000
+        self._commands = {}
+
+    def started(self, event):
+        self._commands[(event.connection_id, event.request_id)] = event.command
+
+    def _finished(self, event, documents: int, failed: bool):
+        command = self._commands.pop((event.connection_id, event.request_id), None)
+        seconds = event.duration_micros / 1e6
+        name = event.command_name + ("_failed" if failed else "")
+        record_db_command(name, seconds, documents)
+
+        if seconds >= self.slow_seconds and command is not None:
+            collection = command.get(event.command_name)
+            query = {field: command[field] for field in FILTER_FIELDS if field in command}
+            logger.warning(
+                "Slow mongo %s on %s: %.1f ms, %d docs, route %s, shape %s",
+                name, collection if isinstance(collection, str) else command.get("collection"),
+                seconds * 1000, documents, current_route(), json.dumps(query_shape(query))
+            )
+
+    def succeeded(self, event):
+        self._finished(event, _reply_documents(event.command_name, event.reply), failed=False)
+
+    def failed(self, event):
+        self._finished(event, 0, failed=True)
+
+def _minor_amount(minor: str, amount: str, currency_field: str = "cu") -> dict:
+    """Expression for a game row's minor unit amount, converting the float of rows from before them"""
+    currency = {"$ifNull": [f"${currency_field}", DEFAULT_CURRENCY]}
+    scale = {"$switch": {
+        "branches": [
+            {"case": {"$eq": [currency, code]}, "then": 10 ** places}
+            for code, places in CURRENCY_DECIMALS.items()
+        ],
+        "default": 10 ** DEFAULT_DECIMALS
+    }}
+    # $round rounds half to even, like ledger.to_minor
+    converted = {"$toLong": {"$round": [{"$multiply": [f"${amount}", scale]}, 0]}}
+    return {"$ifNull": [f"${minor}", converted]}
+
+# v1 game_history rows: public field names and an ISO string timestamp. Until
+# `migrate.py history-v2` has converted them, reads merge them in; partial
+# indexes over this filter cover those queries and are empty afterwards.
+LEGACY_GAMES = {"timestamp": {"$type": "string"}}
+# Legacy fields listings never return
+LEGACY_HIDDEN = {"server_seed": 0, "bet_amount_minor": 0, "payout_minor": 0}
+
+def _game_time(doc: dict) -> datetime:
+    if "t" in doc:
+        # BSON datetimes come back naive but are always UTC
+        return doc["t"].replace(tzinfo=timezone.utc)
+    timestamp = datetime.fromisoformat(doc["timestamp"])
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def _newest(docs: List[dict], legacy: List[dict], limit: int) -> List[dict]:
+    """Merge v2 and legacy rows into the newest `limit`"""
+    if not legacy:
+        return docs
+    # An unfiltered v2 query also returns legacy rows, after every dated one
+    unique = {doc["_id"]: doc for doc in docs + legacy}
+    return sorted(unique.values(), key=_game_time, reverse=True)[:limit]
+
+# Rollup fields that held float major unit amounts before minor units
+LEGACY_ROLLUP_AMOUNTS = {"wagered_minor": "wagered", "payout_minor": "payout"}
+
+class MongoStorage(Storage):
+    """Storage backed by MongoDB through Motor"""
+
+    name = "mongo"
+
+    def __init__(self, mongo_url: str, db_name: str, slow_query_ms: float = 100, max_staleness: int = 90):
+        self.client = AsyncIOMotorClient(
+            _fix_mongo_url(mongo_url),
+            event_listeners=[PoolMetricsListener(), CommandTimingListener(slow_query_ms)]
+        )
+        # Writes, nonces and seeds always go to the primary, whatever the URL asks for
+        self.db = self.client.get_database(db_name, read_preference=ReadPreference.PRIMARY)
+        # Public reads (see storage.secondary_reads); falls back to the primary
+        # when no secondary is within `max_staleness` seconds of it
+        self.secondary_db = self.client.get_database(
+            db_name, read_preference=SecondaryPreferred(max_staleness=max_staleness)
+        )
+        self.transactions = False
+        # Set by init when game_history still holds v1 rows
+        self.legacy_games = False
+
+    async def init(self):
+        db = self.db
+        await db.game_history.create_index([("t", -1)])
+        await db.game_history.create_index([("g", 1), ("t", -1)])
+        await db.game_history.create_index([("u", 1), ("t", -1)])
+        await db.game_history.create_index("timestamp", name="legacy_timestamp", partialFilterExpression=LEGACY_GAMES)
+        await db.game_history.create_index(
+            [("user_id", 1), ("timestamp", -1)], name="legacy_user_timestamp", partialFilterExpression=LEGACY_GAMES
+        )
+        await db.game_history.create_index(
+            "server_seed_hash", name="legacy_server_seed_hash", partialFilterExpression=LEGACY_GAMES
+        )
+        self.legacy_games = await db.game_history.find_one(LEGACY_GAMES, {"_id": 1}) is not None
+        if self.legacy_games:
+            logger.warning("game_history still holds v1 rows; run `migrate.py history-v2` to convert them")
+        await db.game_history.create_index([("s", 1), ("n", 1)])
+        await db.seed_sessions.create_index("h")
+        await db.user_seeds.create_index("server_seed_hash")
+        await db.user_seeds.create_index("created_at", name="created_at_inactive", partialFilterExpression={"active": False})
+        one_active = dict(name="user_id_one_active", unique=True, partialFilterExpression={"active": True})
+        try:
+            await db.user_seeds.create_index("user_id", **one_active)
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            await self._repair_active_seeds()
+            await db.user_seeds.create_index("user_id", **one_active)
+        # Active lookups use the partial index above; the full one only grew with inactive seeds
+        if "user_id_1_active_1" in await db.user_seeds.index_information():
+            await db.user_seeds.drop_index("user_id_1_active_1")
+        # Audits interrupted by a restart are found again through these
+        await db.user_seeds.create_index("revealed_at", name="audit_pending", partialFilterExpression={"audit.status": "pending"})
+        await db.revealed_seeds.create_index("ra", name="audit_pending", partialFilterExpression={"a.status": "pending"})
+        await db.seed_audits.create_index([("server_seed_hash", 1), ("chunk", 1)], unique=True)
+        await db.rollups.create_index([("granularity", 1), ("start", 1), ("game_type", 1), ("currency", 1)], unique=True)
+        await db.leaderboard_totals.create_index(
+            [("window", 1), ("period", 1), ("game_type", 1), ("currency", 1), ("user_id", 1)], unique=True
+        )
+        await db.users.create_index(
+            "username_lower", unique=True,
+            partialFilterExpression={"username_lower": {"$type": "string"}}
+        )
+        await db.leases.create_index("o")
+
+        # Multi-document transactions need a replica set or a sharded cluster
+        hello = await self.client.admin.command("hello")
+        self.transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+
+    async def close(self):
+        self.client.close()
+
+    def _reads(self):
+        return self.secondary_db if secondary_reads() else self.db
+
+    # -- game_history ---------------------------------------------------------
+
+    def _live(self, query: dict) -> dict:
+        """Restrict a game_history query to rows the archive does not own"""
+        if self.archived_before is None:
+            return query
+        return {"$and": [query, {"t": {"$gte": self.archived_before}}]} if query else {"t": {"$gte": self.archived_before}}
+
+    async def insert_game(self, doc: dict) -> bool:
+        try:
+            await self.db.game_history.insert_one(doc)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def recent_games(
+        self,
+        limit: int,
+        game_type: Optional[int] = None,
+        user_id: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        query = {}
+        if game_type is not None:
+            query["g"] = game_type
+        if user_id:
+            query["u"] = user_id
+        # Public listings only need the masked username
+        projection = {field: 1 for field in fields if field != "un"} if fields else {"un": 0}
+        docs = await self._find_games(query, projection, limit)
+        if not self.legacy_games:
+            return docs
+        legacy = {"game_type": GAME_TYPES[game_type]} if game_type is not None else {}
+        if user_id:
+            legacy["user_id"] = user_id
+        return _newest(docs, await self._find_legacy_games(legacy, fields, limit), limit)
+
+    async def count_games_by_type(self) -> Dict[int, int]:
+        pipeline = [{"$match": self._live({})}, {"$group": {"_id": "$g", "count": {"$sum": 1}}}]
+        counts = {doc["_id"]: doc["count"] async for doc in self._reads().game_history.aggregate(pipeline)}
+        # Legacy rows have no code; they are counted by name below
+        counts.pop(None, None)
+        if self.legacy_games:
+            pipeline = [{"$match": LEGACY_GAMES}, {"$group": {"_id": "$game_type", "count": {"$sum": 1}}}]
+            async for doc in self._reads().game_history.aggregate(pipeline):
+                code = GAME_TYPE_CODES[doc["_id"]]
+                counts[code] = counts.get(code, 0) + doc["count"]
+        return counts
+
+    async def user_summary(self, user_id: str) -> dict:
+        # Counts, wins and exact integer sums come out of one pass instead of separate queries
+        pipeline = [
+            {"$match": self._live({"u": user_id})},
+            {"$group": {
+                "_id": {"g": "$g", "cu": "$cu"},
+                "count": {"$sum": 1},
+                "wins": {"$sum": {"$cond": ["$w", 1, 0]}},
+                "wagered": {"$sum": _minor_amount("ba", "b")},
+                "payout": {"$sum": _minor_amount("pa", "p")}
+            }}
+        ]
+        summary = empty_summary()
+        async for doc in self._reads().game_history.aggregate(pipeline):
+            group = doc["_id"]
+            add_to_summary(summary, group["g"], group.get("cu"), doc["count"], doc["wins"], doc["wagered"], doc["payout"])
+        if self.legacy_games:
+            pipeline = [
+                {"$match": {**LEGACY_GAMES, "user_id": user_id}},
+                {"$group": {
+                    "_id": {"game_type": "$game_type", "currency": "$currency"},
+                    "count": {"$sum": 1},
+                    "wins": {"$sum": {"$cond": ["$won", 1, 0]}},
+                    "wagered": {"$sum": _minor_amount("bet_amount_minor", "bet_amount", "currency")},
+                    "payout": {"$sum": _minor_amount("payout_minor", "payout", "currency")}
+                }}
+            ]
+            async for doc in self._reads().game_history.aggregate(pipeline):
+                group = doc["_id"]
+                add_to_summary(
+                    summary, GAME_TYPE_CODES[group["game_type"]], group.get("currency"),
+                    doc["count"], doc["wins"], doc["wagered"], doc["payout"]
+                )
+        return summary
+
+    async def recent_user_games(self, user_id: str, limit: int, fields: Optional[List[str]] = None) -> List[dict]:
+        projection = {field: 1 for field in fields if field != "mu"} if fields else {"mu": 0}
+        docs = await self._find_games({"u": user_id}, projection, limit)
+        if not self.legacy_games:
+            return docs
+        return _newest(docs, await self._find_legacy_games({"user_id": user_id}, fields, limit), limit)
+
+    async def _find_games(self, query: dict, projection: dict, limit: int) -> List[dict]:
+        if self.legacy_games:
+            # Merging with legacy rows orders by time, selected or not
+            projection = dict(projection, t=1) if 1 in projection.values() else projection
+        cursor = self._reads().game_history.find(self._live(query), projection).sort("t", -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def _find_legacy_games(self, query: dict, fields: Optional[List[str]], limit: int) -> List[dict]:
+        projection = dict({field: 1 for field in fields}, timestamp=1) if fields else LEGACY_HIDDEN
+        cursor = self._reads().game_history.find({**LEGACY_GAMES, **query}, projection).sort("timestamp", -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def games_for_sessions(self, session_ids: List[str]) -> List[dict]:
+        cursor = self.db.game_history.find(
+            self._live({"s": {"$in": session_ids}}),
+            {"v": 1, "g": 1, "s": 1, "n": 1, "o": 1, "r": 1}
+        ).sort("n", 1).batch_size(1000)
+        games = await cursor.to_list(None)
+        if not self.legacy_games or not session_ids:
+            return games
+        # Legacy rows carry the seeds inline instead of a session id
+        pairs = [
+            {"server_seed_hash": session["h"].hex(), "client_seed": session["c"]}
+            for session in await self.get_seed_sessions(session_ids)
+        ]
+        if not pairs:
+            return games
+        cursor = self.db.game_history.find(
+            {**LEGACY_GAMES, "$or": pairs},
+            {"id": 1, "game_type": 1, "client_seed": 1, "nonce": 1, "result": 1, "raw_result": 1}
+        ).batch_size(1000)
+        legacy = await cursor.to_list(None)
+        return sorted(games + legacy, key=lambda doc: doc["n"] if "n" in doc else doc["nonce"]) if legacy else games
+
+    async def scan_games(self, batch_size: int = 1000, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        query = {}
+        if start is not None or end is not None:
+            query["t"] = {}
+            if start is not None:
+                query["t"]["$gte"] = start
+            if end is not None:
+                query["t"]["$lt"] = end
+        cursor = self.db.game_history.find(self._live(query), {"un": 0}).batch_size(batch_size)
+        while True:
+            batch = await cursor.to_list(batch_size)
+            if not batch:
+                return
+            yield batch
+
+    async def oldest_game_time(self) -> Optional[datetime]:
+        doc = await self.db.game_history.find_one(self._live({}), {"t": 1}, sort=[("t", 1)])
+        if not doc or "t" not in doc:
+            return None
+        # BSON datetimes come back naive but are always UTC
+        return doc["t"].replace(tzinfo=timezone.utc)
+
+    async def games_before(self, end: datetime, limit: int) -> List[dict]:
+        cursor = self.db.game_history.find(self._live({"t": {"$lt": end}})).sort("t", 1).limit(limit).batch_size(10000)
+        return await cursor.to_list(limit)
+
+    async def delete_games_before(self, end: datetime):
+        await self.db.game_history.delete_many({"t": {"$lt": end}})
+
+    # -- seed_sessions --------------------------------------------------------
+
+    async def upsert_seed_session(self, session: dict):
+        update = {"$setOnInsert": {k: v for k, v in session.items() if k not in ("_id", "ss")}}
+        if "ss" in session:
+            update["$set"] = {"ss": session["ss"]}
+        await self.db.seed_sessions.update_one({"_id": session["_id"]}, update, upsert=True)
+
+    async def get_seed_sessions(self, session_ids: Iterable[str]) -> List[dict]:
+        # Always the primary: the games that reference these may come from a
+        # secondary that is ahead of the one this read would pick
+        return await self.db.seed_sessions.find({"_id": {"$in": list(session_ids)}}).to_list(None)
+
+    async def find_seed_sessions_by_hash(self, server_seed_hash: str) -> List[dict]:
+        sessions = await self.db.seed_sessions.find({"h": bytes.fromhex(server_seed_hash)}).to_list(None)
+        if self.legacy_games:
+            # Sessions only played as v1 rows get the document migration would write
+            known = {session["c"] for session in sessions}
+            client_seeds = await self.db.game_history.distinct(
+                "client_seed", {**LEGACY_GAMES, "server_seed_hash": server_seed_hash}
+            )
+            for client_seed in client_seeds:
+                if client_seed not in known:
+                    session = build_session(None, server_seed_hash, client_seed)
+                    await self.upsert_seed_session(session)
+                    sessions.append(session)
+        return sessions
+
+    # -- user_seeds -----------------------------------------------------------
+
+    async def get_active_seed(self, user_id: str) -> Optional[dict]:
+        return await self.db.user_seeds.find_one({"user_id": user_id, "active": True}, {"_id": 0})
+
+    async def rotate_active_seed(
+        self,
+        user_id: str,
+        doc: dict,
+        reveal_id: Optional[str] = None,
+        reveal_fields: Optional[dict] = None
+    ) -> bool:
+        if reveal_id is None:
+            retire = UpdateMany({"user_id": user_id, "active": True}, {"$set": {"active": False}})
+        else:
+            retire = UpdateOne(
+                {"user_id": user_id, "active": True, "id": reveal_id},
+                {"$set": {"active": False, **(reveal_fields or {})}}
+            )
+        ops = [retire, InsertOne(dict(doc))]
+
+        async def in_transaction(session):
+            result = await self.db.user_seeds.bulk_write(ops, session=session)
+            if reveal_id is not None and result.matched_count == 0:
+                await session.abort_transaction()
+                return False
+            return True
+
+        try:
+            if self.transactions:
+                async with await self.client.start_session() as session:
+                    return await session.with_transaction(in_transaction)
+            # Standalone server: retire, then insert. The partial unique index
+            # still rules out two active seeds; a crash between the two writes
+            # can leave none, which creating seeds again repairs. A reveal of a
+            # seed that is no longer active writes nothing at all.
+            if reveal_id is None:
+                await self.db.user_seeds.bulk_write(ops)
+                return True
+            if (await self.db.user_seeds.bulk_write(ops[:1])).matched_count == 0:
+                return False
+            await self.db.user_seeds.bulk_write(ops[1:])
+            return True
+        except BulkWriteError as e:
+            # The insert hit the one-active-seed index: a concurrent rotation won
+            if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                raise
+            return False
+
+    async def _repair_active_seeds(self):
+        """Keep only the newest active seed of users that have several"""
+        pipeline = [
+            {"$match": {"active": True}},
+            {"$sort": {"created_at": -1}},
+            {"$group": {"_id": "$user_id", "ids": {"$push": "$id"}}},
+            {"$match": {"ids.1": {"$exists": True}}}
+        ]
+        stale = [seed_id async for doc in self.db.user_seeds.aggregate(pipeline) for seed_id in doc["ids"][1:]]
+        if stale:
+            logger.warning("Deactivating %d duplicate active seeds", len(stale))
+            await self.db.user_seeds.update_many({"id": {"$in": stale}}, {"$set": {"active": False}})
+
+    async def increment_nonce(self, user_id: str) -> Optional[dict]:
+        return await self.db.user_seeds.find_one_and_update(
+            {"user_id": user_id, "active": True},
+            {"$inc": {"nonce": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def advance_nonce(self, user_id: str, seed_id: str, expected: int, nonce: int) -> bool:
+        result = await self.db.user_seeds.update_one(
+            {"user_id": user_id, "active": True, "id": seed_id, "nonce": expected},
+            {"$set": {"nonce": nonce}}
+        )
+        return result.matched_count == 1
+
+    async def get_revealed_seed(self, server_seed_hash: str) -> Optional[dict]:
+        seed = await self.db.user_seeds.find_one(
+            {"server_seed_hash": server_seed_hash, "active": False},
+            {"_id": 0}
+        )
+        if seed is None:
+            doc = await self.db.revealed_seeds.find_one({"_id": server_seed_hash})
+            seed = decode_revealed_seed(doc) if doc else None
+        return seed
+
+    async def set_seed_audit(self, seed_id: str, server_seed_hash: str, audit: dict):
+        result = await self.db.user_seeds.update_one(
+            {"server_seed_hash": server_seed_hash, "id": seed_id},
+            {"$set": {"audit": audit}}
+        )
+        if result.matched_count == 0:
+            await self.db.revealed_seeds.update_one({"_id": server_seed_hash}, {"$set": {"a": audit}})
+
+    async def pending_audits(self, limit: int) -> List[dict]:
+        seeds = await self.db.user_seeds.find(
+            {"active": False, "audit.status": "pending"}, {"_id": 0}
+        ).limit(limit).to_list(limit)
+        if len(seeds) < limit:
+            cursor = self.db.revealed_seeds.find({"a.status": "pending"}).limit(limit - len(seeds))
+            seeds += [decode_revealed_seed(doc) async for doc in cursor]
+        return seeds
+
+    # -- revealed_seeds -------------------------------------------------------
+
+    async def inactive_seeds_before(self, cutoff: datetime, limit: int) -> List[dict]:
+        before = cutoff.isoformat()
+        cursor = self.db.user_seeds.find(
+            {"active": False, "created_at": {"$lt": before}, "revealed_at": {"$not": {"$gte": before}}},
+            {"_id": 0}
+        ).sort("created_at", 1).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def retire_seeds(self, seeds: List[dict]):
+        if not seeds:
+            return
+        await self.db.revealed_seeds.bulk_write([
+            ReplaceOne({"_id": seed["server_seed_hash"]}, encode_revealed_seed(seed), upsert=True)
+            for seed in seeds
+        ], ordered=False)
+        await self.db.user_seeds.delete_many({
+            "server_seed_hash": {"$in": [seed["server_seed_hash"] for seed in seeds]},
+            "active": False
+        })
+
+    # -- seed_pairs -----------------------------------------------------------
+
+    async def insert_seed_pair(self, doc: dict):
+        await self.db.seed_pairs.insert_one(dict(doc))
+
+    # -- seed_audits ----------------------------------------------------------
+
+    async def save_audit_chunks(self, server_seed_hash: str, chunks: List[dict]):
+        await self.db.seed_audits.delete_many({"server_seed_hash": server_seed_hash})
+        if chunks:
+            await self.db.seed_audits.insert_many([dict(chunk) for chunk in chunks])
+
+    async def load_audit_chunks(self, server_seed_hash: str) -> List[dict]:
+        cursor = self.db.seed_audits.find({"server_seed_hash": server_seed_hash}, {"_id": 0}).sort("chunk", 1)
+        return await cursor.to_list(None)
+
+    # -- rollups --------------------------------------------------------------
+
+    @staticmethod
+    def _rollup_key(row: dict) -> dict:
+        return {k: row[k] for k in ("granularity", "start", "game_type", "currency")}
+
+    @staticmethod
+    async def _bulk_upsert(collection, ops: List[UpdateOne]):
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Two writers upserting the same new document race on the unique index;
+            # the loser's update applies cleanly once the document exists
+            retry = [ops[err["index"]] for err in e.details["writeErrors"] if err["code"] == 11000]
+            if len(retry) < len(e.details["writeErrors"]):
+                raise
+            await collection.bulk_write(retry, ordered=False)
+
+    async def increment_rollups(self, rows: List[dict]):
+        if rows:
+            await self._bulk_upsert(self.db.rollups, [
+                UpdateOne(self._rollup_key(row), {"$inc": {k: row[k] for k in ROLLUP_FIELDS}}, upsert=True)
+                for row in rows
+            ])
+
+    async def set_rollup_backfill(self, rows: List[dict]):
+        if rows:
+            await self._bulk_upsert(self.db.rollups, [
+                UpdateOne(self._rollup_key(row), {"$set": {"bf": {k: row[k] for k in ROLLUP_FIELDS}}}, upsert=True)
+                for row in rows
+            ])
+
+    async def rollup_buckets(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        game_type: Optional[str] = None,
+        currency: Optional[str] = None
+    ) -> List[dict]:
+        query = {"granularity": granularity, "start": {"$gte": start, "$lt": end}}
+        if game_type:
+            query["game_type"] = game_type
+        if currency:
+            query["currency"] = currency
+        buckets = []
+        async for doc in self.db.rollups.find(query, {"_id": 0}).sort("start", 1):
+            backfill = doc.pop("bf", {})
+            for part in (doc, backfill):
+                # Buckets `migrate.py ledger-amounts` has not converted yet
+                for k, legacy in LEGACY_ROLLUP_AMOUNTS.items():
+                    if legacy in part:
+                        part[k] = part.get(k, 0) + to_minor(part.pop(legacy), doc["currency"])
+            for k in ROLLUP_FIELDS:
+                doc[k] = doc.get(k, 0) + backfill.get(k, 0)
+            doc["start"] = doc["start"].replace(tzinfo=timezone.utc)
+            buckets.append(doc)
+        return buckets
+
+    # -- leaderboard_totals ---------------------------------------------------
+
+    async def save_leaderboard_totals(self, rows: List[dict]):
+        if rows:
+            key_fields = ("window", "period", "game_type", "currency", "user_id")
+            await self._bulk_upsert(self.db.leaderboard_totals, [
+                UpdateOne(
+                    {k: row[k] for k in key_fields},
+                    {"$set": {k: row[k] for k in ("wagered", "profit", "games", "username")}},
+                    upsert=True
+                )
+                for row in rows
+            ])
+
+    async def load_leaderboard_totals(self, window: str, period: str) -> List[dict]:
+        cursor = self.db.leaderboard_totals.find({"window": window, "period": period}, {"_id": 0})
+        return await cursor.to_list(None)
+
+    async def delete_leaderboard_totals(self, window: str, keep_period: str):
+        await self.db.leaderboard_totals.delete_many({"window": window, "period": {"$ne": keep_period}})
+
+    # -- users ----------------------------------------------------------------
+
+    async def upsert_user(self, user_id: str, username: str):
+        name = username.lower()
+        for attempt in range(3):
+            await self.db.users.update_many(
+                {"username_lower": name, "_id": {"$ne": user_id}},
+                {"$unset": {"username_lower": ""}}
+            )
+            try:
+                await self.db.users.update_one(
+                    {"_id": user_id},
+                    {"$set": {"username": username, "username_lower": name}},
+                    upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                # Another worker recorded the same name (or user) in between
+                if attempt == 2:
+                    raise
+
+    async def add_users(self, users: List[dict]):
+        if not users:
+            return
+        ops = [
+            UpdateOne(
+                {"_id": user["user_id"]},
+                {"$setOnInsert": {"username": user["username"], "username_lower": user["username"].lower()}},
+                upsert=True
+            )
+            for user in users
+        ]
+        try:
+            await self.db.users.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            taken = [users[err["index"]] for err in e.details["writeErrors"] if err["code"] == 11000]
+            if len(taken) < len(e.details["writeErrors"]):
+                raise
+            # Their names already belong to other users; keep them reachable by id
+            try:
+                await self.db.users.bulk_write([
+                    UpdateOne({"_id": user["user_id"]}, {"$setOnInsert": {"username": user["username"]}}, upsert=True)
+                    for user in taken
+                ], ordered=False)
+            except BulkWriteError as retry_error:
+                if any(err["code"] != 11000 for err in retry_error.details["writeErrors"]):
+                    raise
+
+    async def find_user(self, identifier: str) -> Optional[str]:
+        docs = await self._reads().users.find(
+            {"$or": [{"_id": identifier}, {"username_lower": identifier.lower()}]},
+            {"_id": 1}
+        ).to_list(2)
+        ids = [doc["_id"] for doc in docs]
+        if identifier in ids:
+            return identifier
+        return ids[0] if ids else None
+
+    # -- leases ---------------------------------------------------------------
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches nothing while another owner's lease is live; the upsert then hits the _id
+            await self.db.leases.update_one(
+                {"_id": key, "$or": [{"o": owner}, {"e": {"$lt": now}}]},
+                {"$set": {"o": owner, "e": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def renew_leases(self, owner: str, ttl: float) -> List[str]:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        await self.db.leases.update_many({"o": owner}, {"$set": {"e": expires}})
+        return [doc["_id"] async for doc in self.db.leases.find({"o": owner}, {"_id": 1})]
+
+    async def release_leases(self, owner: str, keys: Optional[List[str]] = None):
+        query = {"o": owner}
+        if keys is not None:
+            query["_id"] = {"$in": keys}
+        await self.db.leases.delete_many(query)
+
+    # -- service_state --------------------------------------------------------
+
+    async def load_state(self, key: str) -> Optional[dict]:
+        doc = await self.db.service_state.find_one({"_id": key})
+        return doc["value"] if doc else None
+
+    async def save_state(self, key: str, value: dict):
+        await self.db.service_state.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    async def create_state(self, key: str, value: dict) -> dict:
+        try:
+            doc = await self.db.service_state.find_one_and_update(
+                {"_id": key},
+                {"$setOnInsert": {"value": value, "updated_at": datetime.now(timezone.utc)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker's upsert inserted it first
+            doc = await self.db.service_state.find_one({"_id": key})
+        return doc["value"]
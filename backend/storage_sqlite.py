@@ -0,0 +1,863 @@
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from ledger import to_minor
+from metrics import REGISTRY, record_db_command
+from storage import Storage, add_to_summary, empty_summary
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SQLITE STORAGE
+# =============================================================================
+# Embedded backend for single-node deployments and local load testing.
+#
+# - WAL journal: readers never block the writer or each other
+# - Reads run on a thread pool, one connection per thread
+# - Writes go through one writer thread that drains its queue into a single
+#   transaction (group commit), with a savepoint per operation so one failing
+#   write does not take the rest of the batch down with it
+# - SQL text is constant per operation, so every statement is prepared once
+#   per connection and then served from sqlite3's statement cache
+
+ROLLUPS_TABLE = """
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    game_type TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    wagered_minor INTEGER NOT NULL DEFAULT 0,
+    payout_minor INTEGER NOT NULL DEFAULT 0,
+    bf_games INTEGER NOT NULL DEFAULT 0,
+    bf_wins INTEGER NOT NULL DEFAULT 0,
+    bf_wagered_minor INTEGER NOT NULL DEFAULT 0,
+    bf_payout_minor INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, start, game_type, currency)
+)"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS game_history (
+    id TEXT PRIMARY KEY,
+    g INTEGER NOT NULL,
+    s TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    o INTEGER NOT NULL,
+    r REAL NOT NULL,
+    u TEXT NOT NULL,
+    un TEXT NOT NULL,
+    mu TEXT NOT NULL,
+    b REAL NOT NULL,
+    m REAL NOT NULL,
+    w INTEGER NOT NULL,
+    p REAL NOT NULL,
+    cu TEXT,
+    t INTEGER NOT NULL,
+    ba INTEGER NOT NULL,
+    pa INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS game_history_t ON game_history (t);
+CREATE INDEX IF NOT EXISTS game_history_g_t ON game_history (g, t);
+CREATE INDEX IF NOT EXISTS game_history_u_t ON game_history (u, t);
+CREATE INDEX IF NOT EXISTS game_history_s_n ON game_history (s, n);
+
+CREATE TABLE IF NOT EXISTS seed_sessions (
+    id TEXT PRIMARY KEY,
+    h BLOB NOT NULL,
+    ss TEXT,
+    c TEXT NOT NULL,
+    t INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seed_sessions_h ON seed_sessions (h);
+
+CREATE TABLE IF NOT EXISTS user_seeds (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    server_seed TEXT NOT NULL,
+    server_seed_hash TEXT NOT NULL,
+    client_seed TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    revealed_at TEXT,
+    audit TEXT
+);
+CREATE INDEX IF NOT EXISTS user_seeds_inactive ON user_seeds (created_at) WHERE active = 0;
+CREATE INDEX IF NOT EXISTS user_seeds_hash ON user_seeds (server_seed_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS user_seeds_one_active ON user_seeds (user_id) WHERE active = 1;
+
+CREATE TABLE IF NOT EXISTS revealed_seeds (
+    server_seed_hash TEXT PRIMARY KEY,
+    server_seed TEXT NOT NULL,
+    client_seed TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    seed_id TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    revealed_at TEXT,
+    audit TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS seed_pairs (
+    id TEXT PRIMARY KEY,
+    server_seed TEXT NOT NULL,
+    server_seed_hash TEXT NOT NULL,
+    client_seed TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS seed_audits (
+    server_seed_hash TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    game_ids TEXT NOT NULL,
+    leaves BLOB NOT NULL,
+    PRIMARY KEY (server_seed_hash, chunk)
+);
+
+{ROLLUPS_TABLE};
+
+CREATE TABLE IF NOT EXISTS leaderboard_totals (
+    window TEXT NOT NULL,
+    period TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    wagered INTEGER NOT NULL,
+    profit INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (window, period, game_type, currency, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    username_lower TEXT UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner);
+
+CREATE TABLE IF NOT EXISTS service_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+# Takes a free or expired lease, or extends one's own; changes no row otherwise
+ACQUIRE_LEASE = (
+    "INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?) "
+    "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+    "WHERE leases.owner = excluded.owner OR leases.expires < ?"
+)
+
+GAME_COLUMNS = "id, g, s, n, o, r, u, un, mu, b, m, w, p, cu, t, ba, pa"
+INSERT_GAME = f"INSERT INTO game_history ({GAME_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING"
+SELECT_GAMES = f"SELECT {GAME_COLUMNS} FROM game_history"
+
+UPSERT_SESSION = """
+INSERT INTO seed_sessions (id, h, ss, c, t) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET ss = COALESCE(excluded.ss, seed_sessions.ss)
+"""
+
+SEED_COLUMNS = "id, user_id, server_seed, server_seed_hash, client_seed, nonce, active, created_at, revealed_at, audit"
+INSERT_SEED = "INSERT INTO user_seeds (id, user_id, server_seed, server_seed_hash, client_seed, nonce, active, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+SELECT_ACTIVE_SEED = f"SELECT {SEED_COLUMNS} FROM user_seeds WHERE user_id = ? AND active = 1"
+
+# Same column order as SEED_COLUMNS, so rows decode with _seed_doc
+SELECT_REVEALED_SEED = """
+SELECT seed_id, user_id, server_seed, server_seed_hash, client_seed, nonce, 0, created_at, revealed_at, audit
+FROM revealed_seeds WHERE server_seed_hash = ?
+"""
+SELECT_PENDING_AUDITS = f"""
+SELECT {SEED_COLUMNS} FROM user_seeds WHERE active = 0 AND json_extract(audit, '$.status') = 'pending'
+UNION ALL
+SELECT seed_id, user_id, server_seed, server_seed_hash, client_seed, nonce, 0, created_at, revealed_at, audit
+FROM revealed_seeds WHERE json_extract(audit, '$.status') = 'pending'
+LIMIT ?
+"""
+RETIRE_SEED = """
+INSERT OR REPLACE INTO revealed_seeds (server_seed_hash, server_seed, client_seed, user_id, seed_id, nonce, created_at, revealed_at, audit)
+SELECT server_seed_hash, server_seed, client_seed, user_id, id, nonce, created_at, revealed_at, audit
+FROM user_seeds WHERE server_seed_hash = ? AND active = 0
+"""
+
+INCREMENT_ROLLUP = """
+INSERT INTO rollups (granularity, start, game_type, currency, games, wins, wagered_minor, payout_minor) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (granularity, start, game_type, currency) DO UPDATE SET
+    games = games + excluded.games, wins = wins + excluded.wins,
+    wagered_minor = wagered_minor + excluded.wagered_minor, payout_minor = payout_minor + excluded.payout_minor
+"""
+
+SET_ROLLUP_BACKFILL = """
+INSERT INTO rollups (granularity, start, game_type, currency, bf_games, bf_wins, bf_wagered_minor, bf_payout_minor) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (granularity, start, game_type, currency) DO UPDATE SET
+    bf_games = excluded.bf_games, bf_wins = excluded.bf_wins,
+    bf_wagered_minor = excluded.bf_wagered_minor, bf_payout_minor = excluded.bf_payout_minor
+"""
+
+SELECT_ROLLUPS = """
+SELECT granularity, start, game_type, currency,
+       games + bf_games, wins + bf_wins, wagered_minor + bf_wagered_minor, payout_minor + bf_payout_minor
+FROM rollups WHERE granularity = ? AND start >= ? AND start < ?
+"""
+
+LEADERBOARD_COLUMNS = ("window", "period", "game_type", "currency", "user_id", "wagered", "profit", "games", "username")
+UPSERT_LEADERBOARD_TOTAL = f"""
+INSERT OR REPLACE INTO leaderboard_totals ({", ".join(LEADERBOARD_COLUMNS)}) VALUES ({", ".join("?" * len(LEADERBOARD_COLUMNS))})
+"""
+
+UPSERT_USER = """
+INSERT INTO users (user_id, username, username_lower) VALUES (?, ?, ?)
+ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, username_lower = excluded.username_lower
+"""
+
+# A username someone else already holds is left out rather than taken over
+ADD_USER = """
+INSERT INTO users (user_id, username, username_lower)
+VALUES (?, ?, CASE WHEN EXISTS (SELECT 1 FROM users WHERE username_lower = ?) THEN NULL ELSE ? END)
+ON CONFLICT (user_id) DO NOTHING
+"""
+
+# Databases from before minor unit amounts: the game_history columns are
+# added and filled, and rollups is rebuilt with integer amounts
+UPGRADE_GAME_AMOUNTS = (
+    "ALTER TABLE game_history ADD COLUMN ba INTEGER",
+    "ALTER TABLE game_history ADD COLUMN pa INTEGER",
+    "UPDATE game_history SET ba = to_minor(b, cu), pa = to_minor(p, cu)",
+)
+UPGRADE_ROLLUP_AMOUNTS = (
+    "ALTER TABLE rollups RENAME TO rollups_legacy",
+    ROLLUPS_TABLE,
+    """INSERT INTO rollups SELECT granularity, start, game_type, currency,
+        games, wins, to_minor(wagered, currency), to_minor(payout, currency),
+        bf_games, bf_wins, to_minor(bf_wagered, currency), to_minor(bf_payout, currency)
+    FROM rollups_legacy""",
+    "DROP TABLE rollups_legacy",
+)
+
+# SQLite builds older than 3.32 cap bound parameters at 999
+MAX_IN_PARAMS = 500
+
+def _to_micros(timestamp: datetime) -> int:
+    return int(timestamp.timestamp() * 1_000_000)
+
+def _from_micros(micros: int) -> datetime:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc)
+
+def _game_row(doc: dict) -> tuple:
+    return (
+        doc["_id"], doc["g"], doc["s"], doc["n"], doc["o"], doc["r"], doc["u"], doc["un"], doc["mu"],
+        doc["b"], doc["m"], int(doc["w"]), doc["p"], doc.get("cu"), _to_micros(doc["t"]), doc["ba"], doc["pa"]
+    )
+
+def _game_doc(row: tuple) -> dict:
+    doc = {
+        "_id": row[0], "v": 2, "g": row[1], "s": row[2], "n": row[3], "o": row[4], "r": row[5],
+        "u": row[6], "un": row[7], "mu": row[8], "b": row[9], "m": row[10], "w": bool(row[11]),
+        "p": row[12], "t": _from_micros(row[14]), "ba": row[15], "pa": row[16]
+    }
+    if row[13] is not None:
+        doc["cu"] = row[13]
+    return doc
+
+def _session_doc(row: tuple) -> dict:
+    doc = {"_id": row[0], "h": bytes(row[1]), "c": row[3], "t": _from_micros(row[4])}
+    if row[2] is not None:
+        doc["ss"] = row[2]
+    return doc
+
+def _seed_doc(row: tuple) -> dict:
+    doc = {
+        "id": row[0], "user_id": row[1], "server_seed": row[2], "server_seed_hash": row[3],
+        "client_seed": row[4], "nonce": row[5], "active": bool(row[6]), "created_at": row[7]
+    }
+    if row[8] is not None:
+        doc["revealed_at"] = row[8]
+    if row[9] is not None:
+        doc["audit"] = json.loads(row[9])
+    return doc
+
+def _chunks(items: list, size: int = MAX_IN_PARAMS):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _placeholders(count: int) -> str:
+    return ", ".join("?" * count)
+
+WRITE_QUEUE_DEPTH = REGISTRY.gauge("sqlite_write_queue_depth", "Writes waiting for the SQLite writer thread")
+
+class SQLiteStorage(Storage):
+    """Storage backed by an embedded SQLite database in WAL mode"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, read_threads: int = 4, batch_size: int = 256):
+        self.path = path
+        self.batch_size = batch_size
+        self._readers = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="sqlite-read")
+        self._local = threading.local()
+        self._connections = []
+        self._writes = queue.SimpleQueue()
+        self._writer = None
+        WRITE_QUEUE_DEPTH.set_callback(lambda: {(): self._writes.qsize()})
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are managed explicitly by the writer
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _upgrade(conn: sqlite3.Connection):
+        def columns(table: str) -> List[str]:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+        conn.create_function("to_minor", 2, to_minor, deterministic=True)
+        # Every worker runs this at startup; the first one through converts
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            steps = []
+            game_columns = columns("game_history")
+            if game_columns and "ba" not in game_columns:
+                steps += UPGRADE_GAME_AMOUNTS
+            if "wagered" in columns("rollups"):
+                steps += UPGRADE_ROLLUP_AMOUNTS
+            for sql in steps:
+                conn.execute(sql)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if steps:
+            logger.info("Converted game_history and rollups amounts to minor units")
+
+    async def init(self):
+        conn = self._connect()
+        self._upgrade(conn)
+        conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, args=(conn,), name="sqlite-write", daemon=True)
+        self._writer.start()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            await asyncio.get_running_loop().run_in_executor(None, self._writer.join)
+            self._writer = None
+        self._readers.shutdown(wait=True)
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+
+    # -- execution ------------------------------------------------------------
+
+    def _write_loop(self, conn: sqlite3.Connection):
+        running = True
+        while running:
+            item = self._writes.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            try:
+                results = self._run_batch(conn, batch)
+            except Exception as e:
+                # The writer thread must survive anything: queued and later writes would wait forever
+                logger.exception("SQLite write batch of %d writes failed", len(batch))
+                self._quietly(conn, "ROLLBACK")
+                results = [(future, loop, None, e) for _, future, loop in batch]
+
+            for future, loop, value, error in results:
+                try:
+                    loop.call_soon_threadsafe(_resolve, future, value, error)
+                except RuntimeError:
+                    # The caller's event loop is closed
+                    pass
+
+    @staticmethod
+    def _quietly(conn: sqlite3.Connection, sql: str):
+        try:
+            conn.execute(sql)
+        except sqlite3.Error:
+            # SQLite may have rolled the transaction back on its own already
+            pass
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list) -> list:
+        """Run a batch of writes in one transaction; (future, loop, value, error) of each"""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            return [(future, loop, None, e) for _, future, loop in batch]
+        results = []
+        first = 0   # first result of the open transaction
+        for index, (fn, future, loop) in enumerate(batch):
+            try:
+                conn.execute("SAVEPOINT op")
+                value = fn(conn)
+                conn.execute("RELEASE op")
+                results.append((future, loop, value, None))
+                continue
+            except Exception as e:
+                error = e
+            results.append((future, loop, None, error))
+            if conn.in_transaction:
+                self._quietly(conn, "ROLLBACK TO op")
+                self._quietly(conn, "RELEASE op")
+            if not conn.in_transaction:
+                # SQLite rolled the whole transaction back (disk full, I/O error):
+                # the writes before this one are gone too. The rest get a new one.
+                results[first:] = [(f, l, None, error) for f, l, _, _ in results[first:]]
+                first = len(results)
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                except Exception as e:
+                    return results + [(f, l, None, e) for _, f, l in batch[index + 1:]]
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.exception("SQLite commit of %d writes failed", len(results) - first)
+            self._quietly(conn, "ROLLBACK")
+            results[first:] = [(future, loop, None, e) for future, loop, _, _ in results[first:]]
+        return results
+
+    async def _write(self, fn):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        start = time.perf_counter()
+        self._writes.put((fn, future, loop))
+        try:
+            return await future
+        finally:
+            # Includes the wait for the group commit, which is what the caller sees
+            record_db_command("sqlite_write", time.perf_counter() - start)
+
+    def _run_read(self, fn):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return fn(conn)
+
+    async def _read(self, fn):
+        start = time.perf_counter()
+        rows = await asyncio.get_running_loop().run_in_executor(self._readers, self._run_read, fn)
+        record_db_command("sqlite_read", time.perf_counter() - start, len(rows) if isinstance(rows, list) else int(rows is not None))
+        return rows
+
+    # -- game_history ---------------------------------------------------------
+
+    async def insert_game(self, doc: dict) -> bool:
+        row = _game_row(doc)
+        return await self._write(lambda conn: conn.execute(INSERT_GAME, row).rowcount) == 1
+
+    @property
+    def _live_since(self) -> int:
+        """Lower bound on t that hides rows the archive owns (0 without an archive)"""
+        return _to_micros(self.archived_before) if self.archived_before is not None else 0
+
+    async def recent_games(
+        self,
+        limit: int,
+        game_type: Optional[int] = None,
+        user_id: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[dict]:
+        # Rows are read whole: the columns live in the same page either way
+        clauses = ["t >= ?"]
+        params = [self._live_since]
+        if game_type is not None:
+            clauses.append("g = ?")
+            params.append(game_type)
+        if user_id:
+            clauses.append("u = ?")
+            params.append(user_id)
+        sql = f"{SELECT_GAMES} WHERE {' AND '.join(clauses)} ORDER BY t DESC LIMIT ?"
+        params.append(limit)
+        rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
+        return [_game_doc(row) for row in rows]
+
+    async def count_games_by_type(self) -> Dict[int, int]:
+        since = self._live_since
+        rows = await self._read(lambda conn: conn.execute("SELECT g, COUNT(*) FROM game_history WHERE t >= ? GROUP BY g", (since,)).fetchall())
+        return dict(rows)
+
+    async def user_summary(self, user_id: str) -> dict:
+        sql = "SELECT g, cu, COUNT(*), SUM(w), SUM(ba), SUM(pa) FROM game_history WHERE u = ? AND t >= ? GROUP BY g, cu"
+        params = (user_id, self._live_since)
+        rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
+        summary = empty_summary()
+        for row in rows:
+            add_to_summary(summary, *row)
+        return summary
+
+    async def recent_user_games(self, user_id: str, limit: int, fields: Optional[List[str]] = None) -> List[dict]:
+        sql = f"{SELECT_GAMES} WHERE u = ? AND t >= ? ORDER BY t DESC LIMIT ?"
+        params = (user_id, self._live_since, limit)
+        rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
+        return [_game_doc(row) for row in rows]
+
+    async def games_for_sessions(self, session_ids: List[str]) -> List[dict]:
+        since = self._live_since
+        def query(conn):
+            rows = []
+            for ids in _chunks(list(session_ids)):
+                sql = f"{SELECT_GAMES} WHERE s IN ({_placeholders(len(ids))}) AND t >= ?"
+                rows.extend(conn.execute(sql, (*ids, since)).fetchall())
+            return rows
+        games = [_game_doc(row) for row in await self._read(query)]
+        games.sort(key=lambda game: game["n"])
+        return games
+
+    async def scan_games(self, batch_size: int = 1000, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        # Keyset pagination on the primary key; each batch is a short read
+        clauses = ["id > ?", "t >= ?"]
+        bounds = [self._live_since]
+        if start is not None:
+            clauses.append("t >= ?")
+            bounds.append(_to_micros(start))
+        if end is not None:
+            clauses.append("t < ?")
+            bounds.append(_to_micros(end))
+        sql = f"{SELECT_GAMES} WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?"
+        last_id = ""
+        while True:
+            rows = await self._read(lambda conn: conn.execute(sql, (last_id, *bounds, batch_size)).fetchall())
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [_game_doc(row) for row in rows]
+
+    async def oldest_game_time(self) -> Optional[datetime]:
+        since = self._live_since
+        row = await self._read(lambda conn: conn.execute("SELECT MIN(t) FROM game_history WHERE t >= ?", (since,)).fetchone())
+        return _from_micros(row[0]) if row[0] is not None else None
+
+    async def games_before(self, end: datetime, limit: int) -> List[dict]:
+        params = (self._live_since, _to_micros(end), limit)
+        rows = await self._read(lambda conn: conn.execute(
+            f"{SELECT_GAMES} WHERE t >= ? AND t < ? ORDER BY t LIMIT ?", params
+        ).fetchall())
+        return [_game_doc(row) for row in rows]
+
+    async def delete_games_before(self, end: datetime):
+        bound = _to_micros(end)
+        await self._write(lambda conn: conn.execute("DELETE FROM game_history WHERE t < ?", (bound,)))
+
+    # -- seed_sessions --------------------------------------------------------
+
+    async def upsert_seed_session(self, session: dict):
+        row = (session["_id"], session["h"], session.get("ss"), session["c"], _to_micros(session["t"]))
+        await self._write(lambda conn: conn.execute(UPSERT_SESSION, row))
+
+    async def get_seed_sessions(self, session_ids: Iterable[str]) -> List[dict]:
+        def query(conn):
+            rows = []
+            for ids in _chunks(list(session_ids)):
+                sql = f"SELECT id, h, ss, c, t FROM seed_sessions WHERE id IN ({_placeholders(len(ids))})"
+                rows.extend(conn.execute(sql, ids).fetchall())
+            return rows
+        return [_session_doc(row) for row in await self._read(query)]
+
+    async def find_seed_sessions_by_hash(self, server_seed_hash: str) -> List[dict]:
+        h = bytes.fromhex(server_seed_hash)
+        rows = await self._read(lambda conn: conn.execute("SELECT id, h, ss, c, t FROM seed_sessions WHERE h = ?", (h,)).fetchall())
+        return [_session_doc(row) for row in rows]
+
+    # -- user_seeds -----------------------------------------------------------
+
+    async def get_active_seed(self, user_id: str) -> Optional[dict]:
+        row = await self._read(lambda conn: conn.execute(SELECT_ACTIVE_SEED, (user_id,)).fetchone())
+        return _seed_doc(row) if row else None
+
+    @staticmethod
+    def _insert_seed(conn: sqlite3.Connection, doc: dict):
+        conn.execute(INSERT_SEED, (
+            doc["id"], doc["user_id"], doc["server_seed"], doc["server_seed_hash"],
+            doc["client_seed"], doc["nonce"], int(doc["active"]), doc["created_at"]
+        ))
+
+    async def rotate_active_seed(
+        self,
+        user_id: str,
+        doc: dict,
+        reveal_id: Optional[str] = None,
+        reveal_fields: Optional[dict] = None
+    ) -> bool:
+        fields = reveal_fields or {}
+        audit = json.dumps(fields["audit"]) if "audit" in fields else None
+        def write(conn):
+            # One transaction on the single writer: there is never a moment with zero or two active seeds
+            if reveal_id is None:
+                conn.execute("UPDATE user_seeds SET active = 0 WHERE user_id = ? AND active = 1", (user_id,))
+            elif not conn.execute(
+                "UPDATE user_seeds SET active = 0, revealed_at = COALESCE(?, revealed_at), audit = COALESCE(?, audit) "
+                "WHERE user_id = ? AND active = 1 AND id = ?",
+                (fields.get("revealed_at"), audit, user_id, reveal_id)
+            ).rowcount:
+                return False
+            self._insert_seed(conn, doc)
+            return True
+        return await self._write(write)
+
+    async def increment_nonce(self, user_id: str) -> Optional[dict]:
+        def write(conn):
+            updated = conn.execute(
+                "UPDATE user_seeds SET nonce = nonce + 1 WHERE user_id = ? AND active = 1", (user_id,)
+            ).rowcount
+            # Same transaction on the single writer, so nothing can slip in between
+            return conn.execute(SELECT_ACTIVE_SEED, (user_id,)).fetchone() if updated else None
+        row = await self._write(write)
+        return _seed_doc(row) if row else None
+
+    async def advance_nonce(self, user_id: str, seed_id: str, expected: int, nonce: int) -> bool:
+        updated = await self._write(lambda conn: conn.execute(
+            "UPDATE user_seeds SET nonce = ? WHERE user_id = ? AND active = 1 AND id = ? AND nonce = ?",
+            (nonce, user_id, seed_id, expected)
+        ).rowcount)
+        return updated == 1
+
+    async def get_revealed_seed(self, server_seed_hash: str) -> Optional[dict]:
+        sql = f"SELECT {SEED_COLUMNS} FROM user_seeds WHERE server_seed_hash = ? AND active = 0"
+        def query(conn):
+            return (conn.execute(sql, (server_seed_hash,)).fetchone()
+                    or conn.execute(SELECT_REVEALED_SEED, (server_seed_hash,)).fetchone())
+        row = await self._read(query)
+        return _seed_doc(row) if row else None
+
+    async def set_seed_audit(self, seed_id: str, server_seed_hash: str, audit: dict):
+        payload = json.dumps(audit)
+        def write(conn):
+            if not conn.execute(
+                "UPDATE user_seeds SET audit = ? WHERE server_seed_hash = ? AND id = ?", (payload, server_seed_hash, seed_id)
+            ).rowcount:
+                conn.execute("UPDATE revealed_seeds SET audit = ? WHERE server_seed_hash = ?", (payload, server_seed_hash))
+        await self._write(write)
+
+    async def pending_audits(self, limit: int) -> List[dict]:
+        rows = await self._read(lambda conn: conn.execute(SELECT_PENDING_AUDITS, (limit,)).fetchall())
+        return [_seed_doc(row) for row in rows]
+
+    # -- revealed_seeds -------------------------------------------------------
+
+    async def inactive_seeds_before(self, cutoff: datetime, limit: int) -> List[dict]:
+        before = cutoff.isoformat()
+        sql = (
+            f"SELECT {SEED_COLUMNS} FROM user_seeds WHERE active = 0 AND created_at < ? "
+            "AND (revealed_at IS NULL OR revealed_at < ?) ORDER BY created_at LIMIT ?"
+        )
+        rows = await self._read(lambda conn: conn.execute(sql, (before, before, limit)).fetchall())
+        return [_seed_doc(row) for row in rows]
+
+    async def retire_seeds(self, seeds: List[dict]):
+        hashes = [(seed["server_seed_hash"],) for seed in seeds]
+        def write(conn):
+            # Copied and deleted in the same transaction
+            conn.executemany(RETIRE_SEED, hashes)
+            conn.executemany("DELETE FROM user_seeds WHERE server_seed_hash = ? AND active = 0", hashes)
+        if hashes:
+            await self._write(write)
+
+    # -- seed_pairs -----------------------------------------------------------
+
+    async def insert_seed_pair(self, doc: dict):
+        row = (
+            doc["id"], doc["server_seed"], doc["server_seed_hash"], doc["client_seed"],
+            doc["nonce"], int(doc["active"]), doc["created_at"]
+        )
+        await self._write(lambda conn: conn.execute(
+            "INSERT INTO seed_pairs (id, server_seed, server_seed_hash, client_seed, nonce, active, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            row
+        ))
+
+    # -- seed_audits ----------------------------------------------------------
+
+    async def save_audit_chunks(self, server_seed_hash: str, chunks: List[dict]):
+        rows = [
+            (server_seed_hash, chunk["chunk"], json.dumps(chunk["game_ids"]), chunk["leaves"])
+            for chunk in chunks
+        ]
+        def write(conn):
+            conn.execute("DELETE FROM seed_audits WHERE server_seed_hash = ?", (server_seed_hash,))
+            conn.executemany("INSERT INTO seed_audits (server_seed_hash, chunk, game_ids, leaves) VALUES (?, ?, ?, ?)", rows)
+        await self._write(write)
+
+    async def load_audit_chunks(self, server_seed_hash: str) -> List[dict]:
+        rows = await self._read(lambda conn: conn.execute(
+            "SELECT chunk, game_ids, leaves FROM seed_audits WHERE server_seed_hash = ? ORDER BY chunk",
+            (server_seed_hash,)
+        ).fetchall())
+        return [
+            {"server_seed_hash": server_seed_hash, "chunk": chunk, "game_ids": json.loads(game_ids), "leaves": bytes(leaves)}
+            for chunk, game_ids, leaves in rows
+        ]
+
+    # -- rollups --------------------------------------------------------------
+
+    @staticmethod
+    def _rollup_rows(rows: List[dict]) -> List[tuple]:
+        return [
+            (row["granularity"], _to_micros(row["start"]), row["game_type"], row["currency"],
+             row["games"], row["wins"], row["wagered_minor"], row["payout_minor"])
+            for row in rows
+        ]
+
+    async def increment_rollups(self, rows: List[dict]):
+        if rows:
+            params = self._rollup_rows(rows)
+            await self._write(lambda conn: conn.executemany(INCREMENT_ROLLUP, params))
+
+    async def set_rollup_backfill(self, rows: List[dict]):
+        if rows:
+            params = self._rollup_rows(rows)
+            await self._write(lambda conn: conn.executemany(SET_ROLLUP_BACKFILL, params))
+
+    async def rollup_buckets(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        game_type: Optional[str] = None,
+        currency: Optional[str] = None
+    ) -> List[dict]:
+        sql = SELECT_ROLLUPS
+        params = [granularity, _to_micros(start), _to_micros(end)]
+        if game_type:
+            sql += " AND game_type = ?"
+            params.append(game_type)
+        if currency:
+            sql += " AND currency = ?"
+            params.append(currency)
+        sql += " ORDER BY start"
+        rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
+        return [
+            {
+                "granularity": row[0], "start": _from_micros(row[1]), "game_type": row[2], "currency": row[3],
+                "games": row[4], "wins": row[5], "wagered_minor": row[6], "payout_minor": row[7]
+            }
+            for row in rows
+        ]
+
+    # -- leaderboard_totals ---------------------------------------------------
+
+    async def save_leaderboard_totals(self, rows: List[dict]):
+        if rows:
+            params = [tuple(row[column] for column in LEADERBOARD_COLUMNS) for row in rows]
+            await self._write(lambda conn: conn.executemany(UPSERT_LEADERBOARD_TOTAL, params))
+
+    async def load_leaderboard_totals(self, window: str, period: str) -> List[dict]:
+        sql = f"SELECT {', '.join(LEADERBOARD_COLUMNS)} FROM leaderboard_totals WHERE window = ? AND period = ?"
+        rows = await self._read(lambda conn: conn.execute(sql, (window, period)).fetchall())
+        return [dict(zip(LEADERBOARD_COLUMNS, row)) for row in rows]
+
+    async def delete_leaderboard_totals(self, window: str, keep_period: str):
+        await self._write(lambda conn: conn.execute(
+            "DELETE FROM leaderboard_totals WHERE window = ? AND period != ?", (window, keep_period)
+        ))
+
+    # -- users ----------------------------------------------------------------
+
+    async def upsert_user(self, user_id: str, username: str):
+        name = username.lower()
+        def write(conn):
+            conn.execute("UPDATE users SET username_lower = NULL WHERE username_lower = ? AND user_id != ?", (name, user_id))
+            conn.execute(UPSERT_USER, (user_id, username, name))
+        await self._write(write)
+
+    async def add_users(self, users: List[dict]):
+        rows = [
+            (user["user_id"], user["username"], user["username"].lower(), user["username"].lower())
+            for user in users
+        ]
+        if rows:
+            await self._write(lambda conn: conn.executemany(ADD_USER, rows))
+
+    async def find_user(self, identifier: str) -> Optional[str]:
+        params = (identifier, identifier.lower())
+        rows = await self._read(lambda conn: conn.execute(
+            "SELECT user_id FROM users WHERE user_id = ? OR username_lower = ? LIMIT 2", params
+        ).fetchall())
+        ids = [row[0] for row in rows]
+        if identifier in ids:
+            return identifier
+        return ids[0] if ids else None
+
+    # -- leases ---------------------------------------------------------------
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        row = (key, owner, now + ttl, now)
+        return await self._write(lambda conn: conn.execute(ACQUIRE_LEASE, row).rowcount) == 1
+
+    async def renew_leases(self, owner: str, ttl: float) -> List[str]:
+        expires = time.time() + ttl
+        rows = await self._write(lambda conn: conn.execute(
+            "UPDATE leases SET expires = ? WHERE owner = ? RETURNING key", (expires, owner)
+        ).fetchall())
+        return [key for key, in rows]
+
+    async def release_leases(self, owner: str, keys: Optional[List[str]] = None):
+        def release(conn):
+            if keys is None:
+                conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+            else:
+                conn.executemany("DELETE FROM leases WHERE key = ? AND owner = ?", [(key, owner) for key in keys])
+        await self._write(release)
+
+    # -- service_state --------------------------------------------------------
+
+    async def load_state(self, key: str) -> Optional[dict]:
+        row = await self._read(lambda conn: conn.execute("SELECT value FROM service_state WHERE key = ?", (key,)).fetchone())
+        return json.loads(row[0]) if row else None
+
+    async def save_state(self, key: str, value: dict):
+        row = (key, json.dumps(value), _to_micros(datetime.now(timezone.utc)))
+        await self._write(lambda conn: conn.execute(
+            "INSERT INTO service_state (key, value, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            row
+        ))
+
+    async def create_state(self, key: str, value: dict) -> dict:
+        row = (key, json.dumps(value), _to_micros(datetime.now(timezone.utc)))
+
+        def create(conn):
+            conn.execute("INSERT INTO service_state (key, value, updated_at) VALUES (?, ?, ?) ON CONFLICT (key) DO NOTHING", row)
+            return conn.execute("SELECT value FROM service_state WHERE key = ?", (key,)).fetchone()
+
+        return json.loads((await self._write(create))[0])
+
+def _resolve(future: asyncio.Future, value, error: Optional[BaseException]):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
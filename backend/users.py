@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from game_codec import decode_game
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# USER DIRECTORY
+# =============================================================================
+# The users collection maps every user_id that recorded a game to its latest
+# username, with a unique index on the lowercased username. Stats lookups by
+# id or username resolve to a user_id here, so every per-user game query runs
+# on the indexed user_id alone.
+#
+#   _id / user_id    username    username_lower (unique, absent when taken)
+#
+# record_game keeps the entry current; a process only writes when it sees a
+# user for the first time or under a different name. Deployments that already
+# have history fill the directory once from game_history in the background.
+# Renames are published on the cache bus, so other workers stop resolving the
+# old name to this user.
+
+STATE_KEY = "users"
+USER_EVENT = "user"
+
+class UserDirectory:
+    """In-process LRU of identifier -> user_id over the users collection"""
+
+    def __init__(self, maxsize: int = 10000, batch_size: int = 1000, bus=None):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.bus = bus
+        self.backfill_complete = False
+        # ("id", user_id) or ("name", lowercased username) -> user_id
+        self._resolved: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        # user_id -> username last written by this process
+        self._usernames: "OrderedDict[str, str]" = OrderedDict()
+        # user_id -> lowercased username it was looked up by
+        self._looked_up: "OrderedDict[str, str]" = OrderedDict()
+        self._backfill_task: Optional[asyncio.Task] = None
+        if bus is not None:
+            bus.subscribe(USER_EVENT, self._renamed)
+
+    def _put(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    async def ensure(self, storage, user_id: str, username: str):
+        """Keep the directory entry of a recording user current"""
+        previous = self._usernames.get(user_id)
+        if previous == username:
+            self._usernames.move_to_end(user_id)
+            return
+        await storage.upsert_user(user_id, username)
+        if previous is not None and self._resolved.get(("name", previous.lower())) == user_id:
+            del self._resolved[("name", previous.lower())]
+        self._put(self._usernames, user_id, username)
+        self._put(self._resolved, ("id", user_id), user_id)
+        self._put(self._resolved, ("name", username.lower()), user_id)
+        if self.bus is not None:
+            self.bus.publish(USER_EVENT, [user_id, username])
+
+    def _renamed(self, event):
+        # Another worker wrote `username` for `user_id`: the name moved to this
+        # user, and whatever name this process knew the user by no longer holds
+        user_id, username = event
+        key = ("name", username.lower())
+        holder = self._resolved.pop(key, None)
+        if holder is not None and holder != user_id:
+            self._usernames.pop(holder, None)
+        previous = self._usernames.get(user_id)
+        if previous is not None and previous != username:
+            self._resolved.pop(("name", previous.lower()), None)
+            self._usernames[user_id] = username
+        looked_up = self._looked_up.pop(user_id, None)
+        if looked_up is not None and looked_up != key[1] and self._resolved.get(("name", looked_up)) == user_id:
+            del self._resolved[("name", looked_up)]
+
+    async def resolve(self, storage, identifier: str) -> Optional[str]:
+        """user_id for a user id or (case-insensitive) username; None if unknown"""
+        for key in (("id", identifier), ("name", identifier.lower())):
+            user_id = self._resolved.get(key)
+            if user_id is not None:
+                self._resolved.move_to_end(key)
+                return user_id
+
+        user_id = await storage.find_user(identifier)
+        if user_id is None:
+            # Users of older history may not be in the directory yet
+            return None if self.backfill_complete else identifier
+        if user_id == identifier:
+            self._put(self._resolved, ("id", identifier), user_id)
+        else:
+            self._put(self._resolved, ("name", identifier.lower()), user_id)
+            self._put(self._looked_up, user_id, identifier.lower())
+        return user_id
+
+    # -- backfill -------------------------------------------------------------
+
+    async def backfill(self, storage):
+        """Add every user of game_history that the directory does not know yet"""
+        latest: Dict[str, tuple] = {}
+        async for docs in storage.scan_games(self.batch_size):
+            for doc in docs:
+                game = decode_game(doc)
+                user_id, username, timestamp = game.get("user_id"), game.get("username"), game.get("timestamp")
+                if not user_id or not username or timestamp is None:
+                    continue
+                seen = latest.get(user_id)
+                if seen is None or timestamp > seen[0]:
+                    latest[user_id] = (timestamp, username)
+
+        # Newest names first, so a name used by several users goes to its latest holder
+        users = [
+            {"user_id": user_id, "username": username}
+            for user_id, (_, username) in sorted(latest.items(), key=lambda item: item[1][0], reverse=True)
+        ]
+        for first in range(0, len(users), self.batch_size):
+            await storage.add_users(users[first:first + self.batch_size])
+
+        self.backfill_complete = True
+        await storage.save_state(STATE_KEY, {"backfill_complete": True})
+        logger.info("User directory backfilled with %d users", len(users))
+
+    async def _backfill_in_background(self, storage):
+        try:
+            await self.backfill(storage)
+        except Exception:
+            logger.exception("Backfilling the user directory failed; it runs again on the next start")
+
+    async def start(self, storage):
+        state = await storage.load_state(STATE_KEY)
+        self.backfill_complete = bool(state and state.get("backfill_complete"))
+        if not self.backfill_complete:
+            self._backfill_task = asyncio.create_task(self._backfill_in_background(storage))
+
+    async def stop(self, storage):
+        if self._backfill_task is not None:
+            # Safe to interrupt: it only inserts users the directory is missing
+            self._backfill_task.cancel()
+            self._backfill_task = None
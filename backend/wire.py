@@ -0,0 +1,169 @@
+import json
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.responses import JSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # optional: without it the bot routes speak JSON only
+    msgpack = None
+
+# =============================================================================
+# BOT WIRE FORMATS
+# =============================================================================
+# The bot routes accept and return MessagePack as well as JSON. A request
+# body is MessagePack when its Content-Type says so; a response is when the
+# Accept header asks for it. In MessagePack, seeds and hashes travel as raw
+# bytes (32 bytes instead of a 64 character hex string). Seeds may be sent in
+# either form, and the API still sees hex strings.
+#
+# Bodies are validated by a TypeAdapter over a TypedDict, built once per
+# schema. The handler gets a plain dict, so no model instance is built per
+# request. JSON is parsed and validated in a single pass by pydantic-core
+# instead of json.loads followed by model validation.
+
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+# Fields that are hex on the JSON wire and raw bytes on the MessagePack wire
+BINARY_FIELDS = frozenset({
+    "server_seed",
+    "server_seed_hash",
+    "revealed_server_seed",
+    "revealed_server_seed_hash",
+    "new_server_seed_hash"
+})
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";", 1)[0].strip().lower() in MSGPACK_TYPES
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """Whether an Accept header asks for MessagePack (and it can be produced)"""
+    return msgpack is not None and bool(accept) and any(kind in accept for kind in MSGPACK_TYPES)
+
+def _from_wire(doc):
+    if isinstance(doc, dict):
+        for field in BINARY_FIELDS.intersection(doc):
+            if isinstance(doc[field], bytes):
+                doc[field] = doc[field].hex()
+    elif isinstance(doc, list):
+        for item in doc:
+            _from_wire(item)
+    return doc
+
+def _to_wire(content):
+    if isinstance(content, dict):
+        content = dict(content)
+        for field in BINARY_FIELDS.intersection(content):
+            value = content[field]
+            if isinstance(value, str):
+                try:
+                    content[field] = bytes.fromhex(value)
+                except ValueError:
+                    pass
+    elif isinstance(content, list):
+        content = [_to_wire(item) for item in content]
+    return content
+
+def pack(content) -> bytes:
+    """MessagePack encoding of a response body, hex fields as raw bytes"""
+    if isinstance(content, BaseModel):
+        content = content.model_dump()
+    return msgpack.packb(_to_wire(content), use_bin_type=True)
+
+def unpack(body: bytes):
+    """Python value of a MessagePack request body, raw byte fields as hex"""
+    return _from_wire(msgpack.unpackb(body, raw=False))
+
+def _inline_refs(schema, defs: Dict):
+    # Local "#/$defs/..." refs would resolve against the whole OpenAPI document
+    if isinstance(schema, dict):
+        ref = schema.get("$ref", "")
+        if ref.startswith("#/$defs/"):
+            return _inline_refs(defs[ref[len("#/$defs/"):]], defs)
+        return {key: _inline_refs(value, defs) for key, value in schema.items() if key != "$defs"}
+    if isinstance(schema, list):
+        return [_inline_refs(item, defs) for item in schema]
+    return schema
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content) -> bytes:
+        return pack(content)
+
+def reply(accept: Optional[str], content):
+    """The response in the format the client accepts; JSON unless it asks for MessagePack"""
+    return MsgpackResponse(content) if wants_msgpack(accept) else content
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class PlainJSONResponse(JSONResponse):
+    """JSON of plain dicts, lists and datetimes, dumped in one pass
+
+    Returning a response skips FastAPI's jsonable_encoder, which walks and
+    copies every value first; on a page of 100 games that walk costs more
+    than the dump itself.
+    """
+
+    def render(self, content) -> bytes:
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default
+        ).encode("utf-8")
+
+def _body_error(error: dict) -> dict:
+    error = {**error, "loc": ("body",) + tuple(error["loc"])}
+    if error["type"] == "finite_number":
+        # NaN and infinity cannot be echoed back in a JSON response
+        error.pop("input", None)
+    return error
+
+class RequestBody:
+    """Dependency that validates a JSON or MessagePack body against a TypedDict
+
+    `defaults` fills optional keys the client left out, as a model's field
+    defaults would. Route decorators take `openapi_extra=body.openapi` so the
+    schema still shows up in the docs.
+    """
+
+    def __init__(self, schema, defaults: Optional[Dict] = None):
+        self.adapter = TypeAdapter(schema)
+        self.defaults = defaults or {}
+        body_schema = self.adapter.json_schema()
+        body_schema = _inline_refs(body_schema, body_schema.get("$defs", {}))
+        self.openapi = {
+            "requestBody": {
+                "required": True,
+                "content": {"application/json": {"schema": body_schema}, MSGPACK: {"schema": body_schema}}
+            }
+        }
+
+    def validate(self, body: bytes, content_type: Optional[str]):
+        try:
+            if is_msgpack(content_type):
+                if msgpack is None:
+                    raise HTTPException(status_code=415, detail="MessagePack is not available on this server")
+                try:
+                    value = unpack(body)
+                except (ValueError, msgpack.UnpackException) as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid MessagePack body: {e}")
+                value = self.adapter.validate_python(value)
+            else:
+                value = self.adapter.validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError([_body_error(error) for error in e.errors(include_url=False)])
+        if self.defaults:
+            for item in value if isinstance(value, list) else (value,):
+                for key, default in self.defaults.items():
+                    item.setdefault(key, default)
+        return value
+
+    async def __call__(self, request: Request):
+        return self.validate(await request.body(), request.headers.get("content-type"))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+RazerBet Bot Client Throughput Benchmark
+Bets per second of simulated Discord users, played two ways:
+
+    sequential  the flow of BOT_INTEGRATION_GUIDE.md: fetch seeds, record the
+                game, increment the nonce - three awaited calls per bet
+    client      razerbet_client.BotClient: cached seeds, local outcome,
+                pipelined nonce increments and batched game recording
+
+    python benchmarks/bench_client.py                              # in-process, embedded SQLite
+    python benchmarks/bench_client.py --users 1,16,64 --duration 5
+    python benchmarks/bench_client.py --url http://localhost:8001  # a running server
+    python benchmarks/bench_client.py --msgpack                    # client mode over MessagePack
+
+Both modes share one pooled keep-alive connection set. In-process mode drives
+backend/server.py through httpx's ASGI transport against a throwaway SQLite
+database; against --url each user plays with a local server seed, which
+record_game accepts the same way. Before timing, the client's copy of the
+provably fair code is checked against the server's.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / "backend"
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+
+import provably_fair as server_fairness  # noqa: E402
+from razerbet_client import BotClient, GAME_TYPES  # noqa: E402
+from razerbet_client import provably_fair as client_fairness  # noqa: E402
+
+def check_parity(samples: int = 10000):
+    """Fail loudly if the client computes any outcome differently from the server"""
+    rng = random.Random(42)
+    server_seed, client_seed = secrets.token_hex(32), secrets.token_hex(16)
+    assert client_fairness.GAME_TYPES == server_fairness.GAME_TYPES
+    for nonce in range(samples):
+        raw = rng.random()
+        for game_type in GAME_TYPES:
+            assert client_fairness.calculate_game_result(game_type, raw) == \
+                server_fairness.calculate_game_result(game_type, raw), (game_type, raw)
+        assert client_fairness.generate_hmac_result(server_seed, client_seed, nonce) == \
+            server_fairness.generate_hmac_result(server_seed, client_seed, nonce)
+    print(f"Client outcomes match the server for {samples:,} results x {len(GAME_TYPES)} games")
+
+def bet_fields(rng: random.Random, user_id: str) -> dict:
+    won = rng.random() < 0.49
+    bet_amount = round(rng.uniform(0.001, 0.1), 4)
+    return {
+        "username": f"Player{user_id[-4:]}",
+        "bet_amount": bet_amount,
+        "multiplier": 2.0 if won else 0.0,
+        "won": won,
+        "payout": bet_amount * 2 if won else 0.0,
+        "currency": "ETH"
+    }
+
+# =============================================================================
+# MODES
+# =============================================================================
+
+async def sequential_user(http: httpx.AsyncClient, user_id: str, server_seed: str, stop_at: float, rng) -> int:
+    bets = 0
+    while time.perf_counter() < stop_at:
+        seeds = (await http.get(f"/api/bot/seeds/{user_id}")).json()
+        game_type = rng.choice(GAME_TYPES)
+        raw = server_fairness.hex_to_float(server_fairness.generate_hmac_result(server_seed, seeds["client_seed"], seeds["nonce"]))
+        server_fairness.calculate_game_result(game_type, raw)
+        response = await http.post("/api/bot/game", json={
+            "game_type": game_type, "server_seed": server_seed, "client_seed": seeds["client_seed"],
+            "nonce": seeds["nonce"], "user_id": user_id, **bet_fields(rng, user_id)
+        })
+        assert response.status_code == 200, response.text
+        await http.post(f"/api/bot/seeds/{user_id}/increment-nonce")
+        bets += 1
+    return bets
+
+async def client_user(client: BotClient, user_id: str, server_seed: str, stop_at: float, rng) -> int:
+    bets = 0
+    while time.perf_counter() < stop_at:
+        play = await client.play(user_id, rng.choice(GAME_TYPES), server_seed)
+        result = await client.record(play, **bet_fields(rng, user_id))
+        assert result["success"], result
+        bets += 1
+    return bets
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+async def run_step(mode: str, users: int, args, base_url: str, api_key: str, transport, seed_lookup, offset: int) -> float:
+    user_ids = [f"bench-{mode}-{offset + index:06d}" for index in range(users)]
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    http = httpx.AsyncClient(base_url=base_url, headers={"X-API-KEY": api_key}, limits=limits,
+                             timeout=30, transport=transport)
+    client = BotClient(base_url, api_key, max_connections=args.connections, batch_size=args.batch_size,
+                       linger=args.linger, use_msgpack=args.msgpack, transport=transport)
+    try:
+        server_seeds = []
+        for user_id in user_ids:
+            await client.create_seeds(user_id)
+            server_seeds.append(await seed_lookup(user_id) if seed_lookup else secrets.token_hex(32))
+
+        start = time.perf_counter()
+        stop_at = start + args.duration
+        if mode == "sequential":
+            counts = await asyncio.gather(*(
+                sequential_user(http, user_id, seed, stop_at, random.Random(user_id))
+                for user_id, seed in zip(user_ids, server_seeds)
+            ))
+        else:
+            counts = await asyncio.gather(*(
+                client_user(client, user_id, seed, stop_at, random.Random(user_id))
+                for user_id, seed in zip(user_ids, server_seeds)
+            ))
+            await client.flush()
+        return sum(counts) / (time.perf_counter() - start)
+    finally:
+        await client.close()
+        await http.aclose()
+
+async def main_async(args):
+    if args.url:
+        base_url, transport, seed_lookup = args.url, None, None
+        api_key = args.api_key or os.environ.get("BOT_API_KEY", "razerbet_secret_key_change_in_production")
+    else:
+        data_dir = tempfile.mkdtemp(prefix="razerbet-client-")
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(data_dir, "client.db")
+        os.environ.pop("PROFILING_ENABLED", None)
+        os.chdir(BACKEND_DIR)
+        import logging
+        import server
+        logging.getLogger().setLevel(logging.WARNING)
+        await server.init_storage()
+        base_url, transport, api_key = "http://bench", httpx.ASGITransport(app=server.app), server.BOT_API_KEY
+
+        async def seed_lookup(user_id):
+            return (await server.storage.get_active_seed(user_id))["server_seed"]
+
+    print(f"\n{'users':>6} {'sequential bets/s':>18} {'client bets/s':>14} {'speedup':>8}")
+    offset = 0
+    try:
+        for users in args.users:
+            rates = {}
+            for mode in ("sequential", "client"):
+                rates[mode] = await run_step(mode, users, args, base_url, api_key, transport, seed_lookup, offset)
+            offset += users
+            print(f"{users:>6} {rates['sequential']:>18,.0f} {rates['client']:>14,.0f} "
+                  f"{rates['client'] / rates['sequential']:>7.1f}x")
+    finally:
+        if not args.url:
+            await server.shutdown_storage()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot client throughput against the sequential flow")
+    parser.add_argument("--users", default="1,8,32", help="Comma separated concurrent user counts")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per mode and step")
+    parser.add_argument("--connections", type=int, default=20, help="Keep-alive connections per mode")
+    parser.add_argument("--batch-size", type=int, default=100, help="Client batch size")
+    parser.add_argument("--linger", type=float, default=0.005, help="Client batch linger in seconds")
+    parser.add_argument("--msgpack", action="store_true", help="Client mode sends and accepts MessagePack")
+    parser.add_argument("--url", help="Base URL of a running server instead of the in-process app")
+    parser.add_argument("--api-key", help="Bot API key for --url (default: $BOT_API_KEY)")
+    args = parser.parse_args()
+    args.users = [int(value) for value in args.users.split(",")]
+
+    check_parity()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
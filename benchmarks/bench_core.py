@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+RazerBet Provably Fair Microbenchmarks
+Times the provably fair primitives, every game kernel and the batch paths
+
+    python benchmarks/bench_core.py                          # run and print
+    python benchmarks/bench_core.py --save baseline.json     # store a baseline
+    python benchmarks/bench_core.py --compare baseline.json  # flag regressions
+    python benchmarks/bench_core.py --filter mines           # only matching cases
+
+Batch cases report the cost per item (per game, per leaf). Each case is timed
+--repeat times and the fastest run is kept.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from provably_fair import (  # noqa: E402
+    GAME_TYPES,
+    hash_server_seed,
+    generate_hmac_result,
+    hex_to_float,
+    calculate_game_result
+)
+from audit import audit_games, build_merkle_levels, merkle_leaf  # noqa: E402
+from game_codec import pack_outcome, unpack_outcome, encode_game, decode_game  # noqa: E402
+
+SERVER_SEED = "7ac4ed1a3256b7960d55994bfee0eab993fd6f05d3d7b7db35fa527e486d0c0e"
+CLIENT_SEED = "c914b937b73b791006c29942b1948e5b"
+BATCH_SIZE = 1000
+
+def load_verify_game():
+    """server.verify_game, without letting the import touch a real database"""
+    os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+    os.environ.setdefault("SQLITE_PATH", os.devnull)
+    cwd = os.getcwd()
+    try:
+        os.chdir(BACKEND_DIR)
+        from server import verify_game
+    finally:
+        os.chdir(cwd)
+    return verify_game
+
+# =============================================================================
+# CASES
+# =============================================================================
+
+def build_cases():
+    """(name, items per call, callable) for every benchmark"""
+    rng = random.Random(1234)
+    raws = [rng.random() for _ in range(BATCH_SIZE)]
+    hmacs = [generate_hmac_result(SERVER_SEED, CLIENT_SEED, nonce) for nonce in range(BATCH_SIZE)]
+    verify_game = load_verify_game()
+
+    cases = [
+        ("hash_server_seed", 1, lambda: hash_server_seed(SERVER_SEED)),
+        ("generate_hmac_result", 1, lambda: generate_hmac_result(SERVER_SEED, CLIENT_SEED, 1234)),
+        ("hex_to_float", BATCH_SIZE, lambda: [hex_to_float(h) for h in hmacs]),
+    ]
+
+    for game_type in GAME_TYPES:
+        results = [calculate_game_result(game_type, raw) for raw in raws]
+        packed = [pack_outcome(game_type, result) for result in results]
+        cases += [
+            (f"calculate_game_result[{game_type}]", BATCH_SIZE,
+             lambda g=game_type: [calculate_game_result(g, raw) for raw in raws]),
+            (f"verify_game[{game_type}]", 1,
+             lambda g=game_type: verify_game(SERVER_SEED, CLIENT_SEED, 1234, g)),
+            (f"pack_outcome[{game_type}]", BATCH_SIZE,
+             lambda g=game_type, rs=results: [pack_outcome(g, r) for r in rs]),
+            (f"unpack_outcome[{game_type}]", BATCH_SIZE,
+             lambda g=game_type, ps=packed: [unpack_outcome(g, p, raw) for p, raw in zip(ps, raws)]),
+        ]
+
+    # Batch paths: one seed session re-verified and committed to a Merkle tree
+    games = []
+    for nonce in range(BATCH_SIZE):
+        game_type = GAME_TYPES[nonce % len(GAME_TYPES)]
+        raw = hex_to_float(generate_hmac_result(SERVER_SEED, CLIENT_SEED, nonce))
+        games.append({
+            "id": f"game-{nonce}", "game_type": game_type, "client_seed": CLIENT_SEED, "nonce": nonce,
+            "raw_result": raw, "result": calculate_game_result(game_type, raw)
+        })
+    leaves = [merkle_leaf(g["nonce"], g["game_type"], g["result"]) for g in games]
+    server_seed_hash = hash_server_seed(SERVER_SEED)
+
+    records = [dict(
+        g, server_seed_hash=server_seed_hash, user_id="123456789", username="PlayerOne",
+        bet_amount=0.01, multiplier=2.0, won=True, payout=0.02, currency="ETH",
+        timestamp=datetime.now(timezone.utc), verified=True
+    ) for g in games]
+    encoded = [encode_game(record) for record in records]
+    session = {"_id": encoded[0]["s"], "h": bytes.fromhex(server_seed_hash), "c": CLIENT_SEED}
+    sessions = {session["_id"]: session}
+
+    cases += [
+        ("verify_nonce_range[generate_hmac_result]", BATCH_SIZE,
+         lambda: [hex_to_float(generate_hmac_result(SERVER_SEED, CLIENT_SEED, n)) for n in range(BATCH_SIZE)]),
+        ("audit_games", BATCH_SIZE, lambda: audit_games(SERVER_SEED, server_seed_hash, games)),
+        ("merkle_leaf", BATCH_SIZE, lambda: [merkle_leaf(g["nonce"], g["game_type"], g["result"]) for g in games]),
+        ("build_merkle_levels", BATCH_SIZE, lambda: build_merkle_levels(leaves)),
+        ("encode_game", BATCH_SIZE, lambda: [encode_game(record) for record in records]),
+        ("decode_game", BATCH_SIZE, lambda: [decode_game(doc, sessions) for doc in encoded]),
+    ]
+    return cases
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def time_case(fn, min_time: float, repeat: int) -> float:
+    """Fastest seconds per call over `repeat` runs of at least `min_time` each"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+def run(pattern: str, min_time: float, repeat: int) -> dict:
+    results = {}
+    for name, items, fn in build_cases():
+        if pattern and not re.search(pattern, name):
+            continue
+        ns_per_op = time_case(fn, min_time, repeat) / items * 1e9
+        results[name] = {"ns_per_op": round(ns_per_op, 1), "ops_per_sec": round(1e9 / ns_per_op), "items": items}
+        print(f"{name:<45} {ns_per_op:>12,.1f} ns/op {1e9 / ns_per_op:>14,.0f} ops/s")
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """Print the change against a baseline; returns the number of regressions"""
+    print(f"\n{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    regressions = 0
+    for name, current in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<45} {'-':>12} {current['ns_per_op']:>12,.1f} {'new':>9}")
+            continue
+        change = (current["ns_per_op"] / before["ns_per_op"] - 1) * 100
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<45} {before['ns_per_op']:>12,.1f} {current['ns_per_op']:>12,.1f} {change:>+8.1f}%{flag}")
+
+    if regressions:
+        print(f"\n❌ {regressions} benchmark(s) slower than baseline by more than {threshold}%")
+    else:
+        print(f"\n✅ No regressions beyond {threshold}%")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the provably fair core")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name matches this regex")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per benchmark; the fastest is kept")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    print(f"Python {platform.python_version()} on {platform.machine()}\n")
+    results = run(args.filter, args.min_time, args.repeat)
+
+    if args.save:
+        baseline = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "results": results
+        }
+        Path(args.save).write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+RazerBet Bot Wire Format Benchmarks
+Compares JSON and MessagePack on the bot routes: bytes on the wire, the cost of
+decoding and validating a request body, of encoding a response, and the
+server CPU time of whole requests
+
+    python benchmarks/bench_wire.py
+    python benchmarks/bench_wire.py --requests 5000    # more requests per end-to-end case
+
+Body decoding is measured three ways: the pydantic model path the routes used
+before (json.loads + model validation), and the cached TypedDict validators
+of backend/wire.py for JSON and MessagePack. End-to-end cases drive
+backend/server.py through its ASGI interface against a throwaway SQLite
+database and report process CPU time per request (all threads, so the SQLite
+writer is included). Requires msgpack.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import msgpack  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from bench_core import CLIENT_SEED, SERVER_SEED, time_case  # noqa: E402
+from provably_fair import hash_server_seed  # noqa: E402
+from wire import pack  # noqa: E402
+
+SERVER_SEED_HASH = hash_server_seed(SERVER_SEED)
+NEW_SERVER_SEED_HASH = hash_server_seed(SERVER_SEED[::-1])
+
+GAME_BODY = {
+    "game_type": "coinflip",
+    "server_seed": SERVER_SEED,
+    "client_seed": CLIENT_SEED,
+    "nonce": 1234,
+    "user_id": "123456789012345678",
+    "username": "PlayerOne",
+    "bet_amount": 0.01,
+    "multiplier": 2.0,
+    "won": True,
+    "payout": 0.02,
+    "currency": "ETH"
+}
+
+# Response bodies of the bot routes, as the handlers return them
+RESPONSES = {
+    "bot/game": {"success": True, "game_id": "29d9c36d-7992-5ceb-b374-64798ff876f4",
+                 "server_seed_hash": SERVER_SEED_HASH, "duplicate": False},
+    "bot/seeds/{user_id}": {"server_seed_hash": SERVER_SEED_HASH, "client_seed": CLIENT_SEED, "nonce": 1234},
+    "bot/seeds/{user_id}/reveal": {"revealed_server_seed": SERVER_SEED, "revealed_server_seed_hash": SERVER_SEED_HASH,
+                                   "new_server_seed_hash": NEW_SERVER_SEED_HASH, "client_seed": CLIENT_SEED},
+    "bot/seeds/{user_id}/increment-nonce": {"nonce": 1235},
+}
+
+class GameRecordModel(BaseModel):
+    """The request model /bot/game validated into before the wire fast path"""
+    game_type: str
+    server_seed: str
+    client_seed: str
+    nonce: int
+    user_id: str
+    username: str
+    bet_amount: float
+    multiplier: float
+    won: bool
+    payout: float
+    currency: str = "ETH"
+
+def msgpack_game_body(body: dict) -> bytes:
+    return msgpack.packb(dict(body, server_seed=bytes.fromhex(body["server_seed"])), use_bin_type=True)
+
+# =============================================================================
+# WIRE SIZE
+# =============================================================================
+
+def print_sizes():
+    rows = [("POST bot/game request", json.dumps(GAME_BODY).encode(), msgpack_game_body(GAME_BODY))]
+    rows += [
+        (f"{route} response", JSONResponse(content).body, pack(content))
+        for route, content in RESPONSES.items()
+    ]
+    print(f"{'body':<52} {'json B':>8} {'msgpack B':>10} {'saved':>7}")
+    for name, as_json, as_msgpack in rows:
+        saved = (1 - len(as_msgpack) / len(as_json)) * 100
+        print(f"{name:<52} {len(as_json):>8} {len(as_msgpack):>10} {saved:>6.1f}%")
+
+# =============================================================================
+# CODEC CASES
+# =============================================================================
+
+def build_cases(game_record_body):
+    json_body = json.dumps(GAME_BODY).encode()
+    packed_body = msgpack_game_body(GAME_BODY)
+    cases = [
+        ("decode bot/game [json + model]", lambda: GameRecordModel.model_validate(json.loads(json_body))),
+        ("decode bot/game [json + adapter]", lambda: game_record_body.validate(json_body, "application/json")),
+        ("decode bot/game [msgpack + adapter]", lambda: game_record_body.validate(packed_body, "application/msgpack")),
+    ]
+    for route, content in RESPONSES.items():
+        cases += [
+            (f"encode {route} [json]", lambda c=content: JSONResponse(jsonable_encoder(c)).body),
+            (f"encode {route} [msgpack]", lambda c=content: pack(c)),
+        ]
+    return cases
+
+# =============================================================================
+# END TO END
+# =============================================================================
+
+async def call(app, method: str, path: str, body: bytes = b"", headers: dict = None):
+    """One in-process ASGI request; returns the status"""
+    raw_headers = [(b"host", b"bench")] + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    raw_headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": raw_headers, "client": ("127.0.0.1", 50000), "server": ("bench", 80)
+    }
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status["code"]
+
+async def run_end_to_end(server, requests: int):
+    key = {"X-API-Key": server.BOT_API_KEY}
+    formats = {
+        "json": ({**key, "Content-Type": "application/json"}, lambda body: json.dumps(body).encode()),
+        "msgpack": ({**key, "Content-Type": "application/msgpack", "Accept": "application/msgpack"}, msgpack_game_body),
+    }
+    verify_body = {"server_seed": SERVER_SEED, "client_seed": CLIENT_SEED, "nonce": 1, "game_type": "coinflip"}
+    results = {}
+    for name, (headers, encode) in formats.items():
+        cases = {
+            "POST /verify": lambda i: call(server.app, "POST", "/api/verify", encode(dict(verify_body, nonce=i)), headers),
+            # A fresh nonce per request, so every game is a real write
+            "POST /bot/game": lambda i: call(server.app, "POST", "/api/bot/game",
+                                             encode(dict(GAME_BODY, client_seed=f"{name}-bench", nonce=i)), headers),
+        }
+        for route, request in cases.items():
+            cpu, wall = time.process_time(), time.perf_counter()
+            for i in range(requests):
+                status = await request(i)
+                assert status == 200, f"{route} [{name}] returned {status}"
+            results[(route, name)] = ((time.process_time() - cpu) / requests, (time.perf_counter() - wall) / requests)
+    return results
+
+def end_to_end(requests: int):
+    data_dir = tempfile.mkdtemp(prefix="razerbet-wire-")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(data_dir, "wire.db")
+    os.environ.pop("PROFILING_ENABLED", None)
+    os.chdir(BACKEND_DIR)
+    import logging
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async def main():
+        await server.init_storage()
+        try:
+            return await run_end_to_end(server, requests)
+        finally:
+            await server.shutdown_storage()
+
+    results = asyncio.run(main())
+    print(f"\n{'request':<52} {'cpu us/req':>12} {'wall us/req':>12}")
+    for (route, name), (cpu, wall) in results.items():
+        print(f"{route + ' [' + name + ']':<52} {cpu * 1e6:>12,.1f} {wall * 1e6:>12,.1f}")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs MessagePack on the bot routes")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per codec case; the fastest is kept")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per end-to-end case")
+    args = parser.parse_args()
+
+    print(f"Python {platform.python_version()} on {platform.machine()}, msgpack {'.'.join(map(str, msgpack.version))}\n")
+    print_sizes()
+
+    server = end_to_end(args.requests)
+
+    print(f"\n{'codec case':<52} {'ns/op':>12}")
+    for name, fn in build_cases(server.game_record_body):
+        print(f"{name:<52} {time_case(fn, args.min_time, args.repeat) * 1e9:>12,.1f}")
+
+if __name__ == "__main__":
+    main()
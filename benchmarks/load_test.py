@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+RazerBet Load Test
+Replays Discord bot traffic against the API and reports throughput, per-route
+latency percentiles and a saturation curve as concurrency rises
+
+    python benchmarks/load_test.py                                  # in-process, embedded SQLite
+    python benchmarks/load_test.py --steps 1,8,32,128 --duration 10
+    python benchmarks/load_test.py --url http://localhost:8001      # a running server
+    python benchmarks/load_test.py --json results.json
+    python benchmarks/load_test.py --msgpack                        # bot routes over MessagePack
+
+Each concurrency step runs that many bots. Each bot owns a Discord user and
+loops over the bot's real flow:
+
+    seeds/create -> (fetch seeds -> play -> record game -> increment nonce) x N -> reveal
+
+interleaved with public reads (history, filtered history, stats, user stats).
+In-process mode drives backend/server.py through its ASGI interface against a
+throwaway SQLite database, so no Mongo is needed. Latency is taken when the
+last response byte is sent, like a real HTTP client; background work such as
+the reveal-time audit keeps running but is not counted. Against --url the bot
+cannot read back the server seed, so it plays with a local seed, which
+record_game accepts the same way.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlencode
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from provably_fair import GAME_TYPES, generate_hmac_result, hex_to_float, calculate_game_result  # noqa: E402
+
+# Weights of the public reads that are mixed in between bets
+READ_MIX = (
+    ("history", 0.5),
+    ("history_filtered", 0.2),
+    ("stats", 0.15),
+    ("user_stats", 0.15),
+)
+
+# =============================================================================
+# CLIENTS
+# =============================================================================
+
+def encode_body(body: dict, use_msgpack: bool):
+    if use_msgpack:
+        import msgpack
+        return msgpack.packb(body, use_bin_type=True), "application/msgpack"
+    return json.dumps(body).encode(), "application/json"
+
+def decode_body(body: bytes, content_type: str):
+    if content_type.startswith("application/msgpack"):
+        import msgpack
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body) if body.startswith((b"{", b"[")) else None
+
+class ASGIClient:
+    """Calls an ASGI app in-process; latency stops at the last response body chunk"""
+
+    def __init__(self, app, use_msgpack: bool = False):
+        self.app = app
+        self.use_msgpack = use_msgpack
+        self.pending = set()
+
+    async def request(self, method: str, path: str, params: dict = None, body: dict = None, headers: dict = None):
+        payload, content_type = encode_body(body, self.use_msgpack) if body is not None else (b"", "")
+        raw_headers = [(b"host", b"loadtest")]
+        raw_headers += [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+        if body is not None:
+            raw_headers += [(b"content-type", content_type.encode()), (b"content-length", str(len(payload)).encode())]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": urlencode(params or {}).encode(), "headers": raw_headers,
+            "client": ("127.0.0.1", 50000), "server": ("loadtest", 80)
+        }
+
+        response = {"status": 599, "body": [], "content_type": ""}
+        finished = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["content_type"] = dict(message.get("headers", [])).get(b"content-type", b"").decode()
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body"):
+                    response["elapsed"] = time.perf_counter() - start
+                    finished.set()
+
+        start = time.perf_counter()
+        task = asyncio.ensure_future(self.app(scope, receive, send))
+        self.pending.add(task)
+        task.add_done_callback(self._finished)
+        waiter = asyncio.ensure_future(finished.wait())
+        await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+
+        elapsed = response.get("elapsed", time.perf_counter() - start)
+        return response["status"], decode_body(b"".join(response["body"]), response["content_type"]), elapsed
+
+    def _finished(self, task):
+        self.pending.discard(task)
+        if not task.cancelled():
+            # Errors already surfaced as a 500 response
+            task.exception()
+
+    async def drain(self):
+        """Wait for background tasks (audits) that outlived their responses"""
+        while self.pending:
+            await asyncio.wait(set(self.pending))
+
+class HTTPClient:
+    """Calls a running server over HTTP keep-alive connections"""
+
+    def __init__(self, base_url: str, connections: int, use_msgpack: bool = False):
+        import httpx
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        self.client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30)
+        self.use_msgpack = use_msgpack
+
+    async def request(self, method: str, path: str, params: dict = None, body: dict = None, headers: dict = None):
+        content = None
+        if body is not None:
+            content, content_type = encode_body(body, self.use_msgpack)
+            headers = dict(headers or {}, **{"Content-Type": content_type})
+        start = time.perf_counter()
+        response = await self.client.request(method, path, params=params, content=content, headers=headers)
+        elapsed = time.perf_counter() - start
+        try:
+            data = decode_body(response.content, response.headers.get("content-type", ""))
+        except ValueError:
+            data = None
+        return response.status_code, data, elapsed
+
+    async def drain(self):
+        pass
+
+    async def close(self):
+        await self.client.aclose()
+
+# =============================================================================
+# WORKLOAD
+# =============================================================================
+
+class StepStats:
+    """Latencies and outcomes of one concurrency step"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bets = 0
+
+    def add(self, route: str, status: int, elapsed: float):
+        self.latencies[route].append(elapsed)
+        if status >= 400:
+            self.errors[route] += 1
+
+    @property
+    def requests(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Bot:
+    """One Discord user played by the bot"""
+
+    def __init__(self, client, user_id: str, api_key: str, stats: StepStats, rng: random.Random, args, seed_lookup):
+        self.client = client
+        self.user_id = user_id
+        self.headers = {"X-API-Key": api_key}
+        if args.msgpack:
+            self.headers["Accept"] = "application/msgpack"
+        self.stats = stats
+        self.rng = rng
+        self.args = args
+        self.seed_lookup = seed_lookup
+        self.server_seed = None
+        self.games_in_session = 0
+        self.total_bets = 0
+
+    async def call(self, route: str, method: str, path: str, **kwargs):
+        status, data, elapsed = await self.client.request(method, path, **kwargs)
+        self.stats.add(route, status, elapsed)
+        return status, data
+
+    async def load_server_seed(self):
+        # The real bot keeps the server seed it was handed; here it is read back
+        self.server_seed = await self.seed_lookup(self.user_id) if self.seed_lookup else secrets.token_hex(32)
+        self.games_in_session = 0
+
+    async def create_seeds(self):
+        await self.call("POST /bot/seeds/create", "POST", "/api/bot/seeds/create",
+                        params={"user_id": self.user_id}, headers=self.headers)
+        await self.load_server_seed()
+
+    async def bet(self):
+        status, seeds = await self.call("GET /bot/seeds/{user_id}", "GET", f"/api/bot/seeds/{self.user_id}", headers=self.headers)
+        if status != 200:
+            await self.create_seeds()
+            return
+
+        game_type = self.rng.choice(GAME_TYPES)
+        nonce = seeds["nonce"]
+        raw_result = hex_to_float(generate_hmac_result(self.server_seed, seeds["client_seed"], nonce))
+        # The bot shows the outcome to the player before recording it
+        calculate_game_result(game_type, raw_result)
+        won = self.rng.random() < 0.49
+        bet_amount = round(self.rng.uniform(0.001, 0.1), 4)
+
+        await self.call("POST /bot/game", "POST", "/api/bot/game", headers=self.headers, body={
+            "game_type": game_type,
+            "server_seed": self.server_seed,
+            "client_seed": seeds["client_seed"],
+            "nonce": nonce,
+            "user_id": self.user_id,
+            "username": f"Player{self.user_id[-4:]}",
+            "bet_amount": bet_amount,
+            "multiplier": 2.0 if won else 0.0,
+            "won": won,
+            "payout": bet_amount * 2 if won else 0.0,
+            "currency": "ETH"
+        })
+        await self.call("POST /bot/seeds/{user_id}/increment-nonce", "POST",
+                        f"/api/bot/seeds/{self.user_id}/increment-nonce", headers=self.headers)
+        self.stats.bets += 1
+        self.total_bets += 1
+        self.games_in_session += 1
+
+        if self.games_in_session >= self.args.reveal_every:
+            await self.call("POST /bot/seeds/{user_id}/reveal", "POST",
+                            f"/api/bot/seeds/{self.user_id}/reveal", headers=self.headers)
+            await self.load_server_seed()
+
+    async def read(self):
+        kind = self.rng.choices([name for name, _ in READ_MIX], weights=[weight for _, weight in READ_MIX])[0]
+        if kind == "user_stats" and not self.total_bets:
+            # A user without games is a 404, not a meaningful read
+            kind = "history"
+        if kind == "history":
+            await self.call("GET /history", "GET", "/api/history", params={"limit": 50})
+        elif kind == "history_filtered":
+            await self.call("GET /history?game_type", "GET", "/api/history",
+                            params={"limit": 20, "game_type": self.rng.choice(GAME_TYPES)})
+        elif kind == "stats":
+            await self.call("GET /stats", "GET", "/api/stats")
+        else:
+            await self.call("GET /user/{identifier}/stats", "GET", f"/api/user/{self.user_id}/stats")
+
+    async def run(self, stop_at: float):
+        await self.create_seeds()
+        while time.perf_counter() < stop_at:
+            if self.rng.random() < self.args.read_ratio:
+                await self.read()
+            else:
+                await self.bet()
+
+async def run_step(client, concurrency: int, args, api_key: str, seed_lookup, bot_offset: int) -> dict:
+    stats = StepStats()
+    rng = random.Random(concurrency)
+    bots = [
+        Bot(client, f"loadtest-{bot_offset + index:06d}", api_key, stats, random.Random(rng.random()), args, seed_lookup)
+        for index in range(concurrency)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(bot.run(start + args.duration) for bot in bots))
+    elapsed = time.perf_counter() - start
+    await client.drain()
+
+    routes = {}
+    all_latencies = []
+    for route, values in sorted(stats.latencies.items()):
+        values.sort()
+        all_latencies += values
+        routes[route] = {
+            "count": len(values),
+            "errors": stats.errors.get(route, 0),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p90_ms": percentile(values, 0.90) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000
+        }
+    all_latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "bets": stats.bets,
+        "bets_per_sec": stats.bets / elapsed,
+        "requests_per_sec": stats.requests / elapsed,
+        "errors": sum(stats.errors.values()),
+        "p50_ms": percentile(all_latencies, 0.50) * 1000,
+        "p99_ms": percentile(all_latencies, 0.99) * 1000,
+        "routes": routes
+    }
+
+def print_step(step: dict):
+    print(f"\n=== concurrency {step['concurrency']}: {step['bets_per_sec']:,.0f} bets/s, "
+          f"{step['requests_per_sec']:,.0f} req/s, {step['errors']} errors ===")
+    print(f"{'route':<42} {'count':>7} {'err':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for route, row in step["routes"].items():
+        print(f"{route:<42} {row['count']:>7} {row['errors']:>5} {row['p50_ms']:>8.2f} "
+              f"{row['p90_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['max_ms']:>8.2f}")
+
+def print_curve(steps: list, slo_ms: float):
+    print(f"\n=== saturation curve (p99 SLO {slo_ms:g} ms) ===")
+    print(f"{'bots':>6} {'bets/s':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'record p99':>11}")
+    best = None
+    for step in steps:
+        record_p99 = step["routes"].get("POST /bot/game", {}).get("p99_ms", 0.0)
+        within = step["p99_ms"] <= slo_ms and not step["errors"]
+        if within and (best is None or step["bets_per_sec"] > best["bets_per_sec"]):
+            best = step
+        print(f"{step['concurrency']:>6} {step['bets_per_sec']:>9,.0f} {step['requests_per_sec']:>9,.0f} "
+              f"{step['p50_ms']:>8.2f} {step['p99_ms']:>8.2f} {record_p99:>11.2f}{'' if within else '  over SLO'}")
+    if best:
+        print(f"\nPeak within SLO: {best['bets_per_sec']:,.0f} bets/s at {best['concurrency']} bots")
+    else:
+        print("\nNo step stayed within the SLO")
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+async def main_async(args):
+    if args.url:
+        client = HTTPClient(args.url, max(args.steps), args.msgpack)
+        api_key = args.api_key or os.environ.get("BOT_API_KEY", "razerbet_secret_key_change_in_production")
+        seed_lookup = None
+    else:
+        data_dir = tempfile.mkdtemp(prefix="razerbet-load-")
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(data_dir, "load.db")
+        os.environ.pop("PROFILING_ENABLED", None)
+        os.chdir(BACKEND_DIR)
+        import logging
+        import server
+        logging.getLogger().setLevel(logging.WARNING)
+        await server.init_storage()
+        client = ASGIClient(server.app, args.msgpack)
+        api_key = server.BOT_API_KEY
+
+        async def seed_lookup(user_id):
+            seeds = await server.storage.get_active_seed(user_id)
+            return seeds["server_seed"]
+
+    steps = []
+    bot_offset = 0
+    try:
+        for concurrency in args.steps:
+            step = await run_step(client, concurrency, args, api_key, seed_lookup, bot_offset)
+            bot_offset += concurrency
+            steps.append(step)
+            print_step(step)
+    finally:
+        if args.url:
+            await client.close()
+        else:
+            await server.shutdown_storage()
+
+    print_curve(steps, args.slo_ms)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"steps": steps}, indent=2) + "\n")
+        print(f"Saved results to {args.json}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with simulated Discord bot traffic")
+    parser.add_argument("--steps", default="1,4,16,64", help="Comma separated bot counts, one step each")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per step")
+    parser.add_argument("--read-ratio", type=float, default=0.3, help="Share of bot iterations that are public reads")
+    parser.add_argument("--reveal-every", type=int, default=50, help="Games per seed session before a reveal")
+    parser.add_argument("--slo-ms", type=float, default=100.0, help="p99 latency target for the saturation summary")
+    parser.add_argument("--url", help="Base URL of a running server instead of the in-process app")
+    parser.add_argument("--api-key", help="Bot API key for --url (default: $BOT_API_KEY)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--msgpack", action="store_true", help="Send and accept MessagePack on the bot routes")
+    args = parser.parse_args()
+    args.steps = [int(value) for value in args.steps.split(",")]
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -406,6 +406,9 @@ const VerificationTool = () => {
 };
 
 // Live Feed Section
+const POLL_INTERVAL_MS = 10000;
+const STREAM_MAX_FAILURES = 3;
+
 const LiveFeed = () => {
   const [games, setGames] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -429,9 +432,42 @@ const LiveFeed = () => {
 
   useEffect(() => {
     fetchGames();
-    const interval = setInterval(fetchGames, 10000); // Refresh every 10s
-    return () => clearInterval(interval);
-  }, [fetchGames]);
+
+    let source = null;
+    let interval = null;
+    let failures = 0;
+    const poll = () => {
+      if (source) source.close();
+      if (!interval) interval = setInterval(fetchGames, POLL_INTERVAL_MS);
+    };
+
+    if (typeof EventSource === "undefined") {
+      poll();
+    } else {
+      // New games are pushed over Server-Sent Events; EventSource reconnects and resumes on its own
+      const params = selectedGame !== "all" ? `?game_type=${selectedGame}` : "";
+      source = new EventSource(`${API}/history/stream${params}`);
+      source.addEventListener("game", (event) => {
+        const game = JSON.parse(event.data);
+        setGames((current) => [game, ...current.filter((g) => g.id !== game.id)].slice(0, 50));
+      });
+      // The server could not replay what was missed; reload the latest games
+      source.addEventListener("reset", fetchGames);
+      source.onopen = () => {
+        failures = 0;
+      };
+      // Deployments without the stream route (the Vercel function) answer 404, which
+      // EventSource gives up on; poll the history instead after repeated failures
+      source.onerror = () => {
+        failures += 1;
+        if (source.readyState === EventSource.CLOSED || failures >= STREAM_MAX_FAILURES) poll();
+      };
+    }
+    return () => {
+      if (source) source.close();
+      if (interval) clearInterval(interval);
+    };
+  }, [fetchGames, selectedGame]);
 
   const searchUser = async () => {
     if (!searchQuery.trim()) {
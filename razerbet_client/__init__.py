@@ -0,0 +1,16 @@
+"""Async client for the RazerBet bot API"""
+
+from .client import BotAPIError, BotClient, DuplicateGameError, Play
+from .provably_fair import GAME_TYPES, calculate_game_result, generate_hmac_result, hash_server_seed, hex_to_float
+
+__all__ = [
+    "BotAPIError",
+    "BotClient",
+    "DuplicateGameError",
+    "Play",
+    "GAME_TYPES",
+    "calculate_game_result",
+    "generate_hmac_result",
+    "hash_server_seed",
+    "hex_to_float",
+]
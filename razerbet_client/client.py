@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+import random
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .provably_fair import calculate_game_result, generate_hmac_result, hash_server_seed, hex_to_float
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed with use_msgpack=True
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# BOT CLIENT
+# =============================================================================
+# Async client for the bot API. A bet needs no round trip before the bot can
+# show its outcome:
+#
+# - seeds: a user's active seeds are fetched once and cached; the nonce is
+#   then advanced locally and the increment-nonce call is sent in the
+#   background (pipelined, nothing waits on it). Fetches are serialised per
+#   user, and a refetch never moves the local nonce back: the server's may
+#   still lag behind increments in flight
+# - outcome: computed locally with the same code the server verifies with
+# - recording: games are sent to /bot/games/batch. While no batch is in
+#   flight a game goes out at once; otherwise games queue until the batch is
+#   full or the oldest has waited `linger` seconds, so batches only form
+#   under load
+#
+# Every request reuses the keep-alive connections of one pooled httpx client.
+# Game recording is idempotent on the server (the game id is derived from the
+# seed pair and nonce), so batches are retried on errors and timeouts without
+# recording anything twice. Other writes are only retried when the request
+# never reached the server. A game the server already had on the first
+# attempt means its nonce was used twice, and fails with DuplicateGameError.
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class BotAPIError(Exception):
+    """An error response of the bot API"""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+class DuplicateGameError(BotAPIError):
+    """A new game whose seed pair and nonce the server had already recorded"""
+
+    def __init__(self, result: dict):
+        super().__init__(409, f"game {result['game_id']} was already recorded; its nonce was reused")
+        self.result = result
+
+class Play:
+    """A game whose outcome was computed locally, ready to be recorded"""
+
+    __slots__ = ("user_id", "game_type", "server_seed", "server_seed_hash", "client_seed", "nonce", "raw_result", "result")
+
+    def __init__(self, user_id: str, game_type: str, server_seed: str, client_seed: str, nonce: int):
+        self.user_id = user_id
+        self.game_type = game_type
+        self.server_seed = server_seed
+        self.server_seed_hash = hash_server_seed(server_seed)
+        self.client_seed = client_seed
+        self.nonce = nonce
+        self.raw_result = hex_to_float(generate_hmac_result(server_seed, client_seed, nonce))
+        self.result = calculate_game_result(game_type, self.raw_result)
+
+class BotClient:
+    """Pooled, batching client for the RazerBet bot API
+
+        async with BotClient("https://razerbet.xyz", api_key) as client:
+            play = await client.play(user_id, "coinflip", server_seed)
+            won = play.result["outcome"] == choice
+            await client.record(play, username=name, bet_amount=bet, multiplier=2.0,
+                                won=won, payout=bet * 2 if won else 0.0)
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        max_connections: int = 20,
+        http2: bool = False,
+        batch_size: int = 100,
+        linger: float = 0.005,
+        retries: int = 3,
+        backoff: float = 0.05,
+        timeout: float = 10.0,
+        use_msgpack: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        if use_msgpack and msgpack is None:
+            raise RuntimeError("use_msgpack needs the msgpack package")
+        self.batch_size = batch_size
+        self.linger = linger
+        self.retries = retries
+        self.backoff = backoff
+        self.use_msgpack = use_msgpack
+        headers = {"X-API-KEY": api_key}
+        if use_msgpack:
+            headers["Accept"] = "application/msgpack"
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/api",
+            headers=headers,
+            limits=limits,
+            timeout=timeout,
+            http2=http2,
+            transport=transport
+        )
+        self._seeds: Dict[str, dict] = {}
+        self._seed_locks: Dict[str, asyncio.Lock] = {}
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._linger_handle: Optional[asyncio.TimerHandle] = None
+        self._batches_in_flight = 0
+        self._tasks = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # -- transport ------------------------------------------------------------
+
+    def _encode(self, body) -> Tuple[bytes, str]:
+        if self.use_msgpack:
+            return msgpack.packb(body, use_bin_type=True), "application/msgpack"
+        return json.dumps(body).encode(), "application/json"
+
+    @staticmethod
+    def _hex(value):
+        # MessagePack responses carry seeds and hashes as raw bytes
+        if isinstance(value, bytes):
+            return value.hex()
+        if isinstance(value, dict):
+            return {key: BotClient._hex(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [BotClient._hex(item) for item in value]
+        return value
+
+    def _decode(self, response: httpx.Response):
+        if response.headers.get("content-type", "").startswith("application/msgpack"):
+            return self._hex(msgpack.unpackb(response.content, raw=False))
+        return response.json()
+
+    async def _request(self, method: str, path: str, params: Optional[dict] = None, body=None, idempotent: bool = False):
+        data, _ = await self._request_attempts(method, path, params, body, idempotent)
+        return data
+
+    async def _request_attempts(self, method: str, path: str, params: Optional[dict] = None, body=None, idempotent: bool = False):
+        """The decoded response and how many attempts it took"""
+        content, headers = None, None
+        if body is not None:
+            content, content_type = self._encode(body)
+            headers = {"Content-Type": content_type}
+
+        attempt = 0
+        while True:
+            try:
+                response = await self._http.request(method, path, params=params, content=content, headers=headers)
+            except httpx.TransportError as e:
+                # A request that never left is always safe to resend
+                if attempt >= self.retries or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                    raise
+            else:
+                if response.status_code < 400:
+                    return self._decode(response), attempt + 1
+                if attempt >= self.retries or not idempotent or response.status_code not in RETRY_STATUSES:
+                    try:
+                        detail = self._decode(response).get("detail")
+                    except ValueError:
+                        detail = response.text
+                    raise BotAPIError(response.status_code, detail)
+            attempt += 1
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # -- seeds ----------------------------------------------------------------
+
+    async def create_seeds(self, user_id: str, client_seed: Optional[str] = None) -> dict:
+        """Create (or replace) a user's active seeds"""
+        params = {"user_id": user_id}
+        if client_seed:
+            params["client_seed"] = client_seed
+        seeds = await self._request("POST", "/bot/seeds/create", params=params)
+        self._seeds[user_id] = {key: seeds[key] for key in ("server_seed_hash", "client_seed", "nonce")}
+        return seeds
+
+    def _seed_lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._seed_locks.get(user_id)
+        if lock is None:
+            lock = self._seed_locks[user_id] = asyncio.Lock()
+        return lock
+
+    def _needs_fetch(self, user_id: str) -> bool:
+        seeds = self._seeds.get(user_id)
+        return seeds is None or seeds.get("stale", False)
+
+    def _merge_seeds(self, user_id: str, fetched: dict):
+        seeds = {key: fetched[key] for key in ("server_seed_hash", "client_seed", "nonce")}
+        known = self._seeds.get(user_id)
+        if known is not None and (known["server_seed_hash"], known["client_seed"]) == (seeds["server_seed_hash"], seeds["client_seed"]):
+            # Same seeds: nonces handed out here may not have reached the server yet
+            seeds["nonce"] = max(seeds["nonce"], known["nonce"])
+        self._seeds[user_id] = seeds
+
+    async def get_seeds(self, user_id: str, refresh: bool = False) -> dict:
+        """A user's active seeds; served from the local cache unless `refresh`"""
+        if refresh or self._needs_fetch(user_id):
+            async with self._seed_lock(user_id):
+                # Concurrent callers wait for the first fetch instead of repeating it
+                if refresh or self._needs_fetch(user_id):
+                    fetched = await self._request("GET", f"/bot/seeds/{user_id}", idempotent=True)
+                    self._merge_seeds(user_id, fetched)
+        return {key: value for key, value in self._seeds[user_id].items() if key != "stale"}
+
+    async def increment_nonce(self, user_id: str) -> int:
+        """Advance the nonce on the server and wait for it; play() does this in the background"""
+        result = await self._request("POST", f"/bot/seeds/{user_id}/increment-nonce")
+        return result["nonce"]
+
+    async def reveal(self, user_id: str) -> dict:
+        """Reveal the server seed and rotate to new seeds"""
+        # Games queued for the old seeds go first, so none is recorded after the reveal
+        await self.flush()
+        seeds = self._seeds.get(user_id)
+        if seeds is not None:
+            # Refetched if the reveal fails, since it may have gone through
+            seeds["stale"] = True
+        revealed = await self._request("POST", f"/bot/seeds/{user_id}/reveal")
+        self._seeds[user_id] = {
+            "server_seed_hash": revealed["new_server_seed_hash"],
+            "client_seed": revealed["client_seed"],
+            "nonce": 0
+        }
+        return revealed
+
+    async def _advance_nonce(self, user_id: str):
+        try:
+            await self.increment_nonce(user_id)
+        except Exception:
+            # The local nonce may now be ahead of the server's; refetch next
+            # time, keeping the local nonce if it is the higher one
+            logger.exception("Incrementing the nonce of %s failed", user_id)
+            seeds = self._seeds.get(user_id)
+            if seeds is not None:
+                seeds["stale"] = True
+
+    # -- games ----------------------------------------------------------------
+
+    async def play(self, user_id: str, game_type: str, server_seed: str) -> Play:
+        """Take the user's next nonce and compute the outcome locally"""
+        await self.get_seeds(user_id)
+        seeds = self._seeds[user_id]
+        nonce = seeds["nonce"]
+        seeds["nonce"] = nonce + 1
+        self._spawn(self._advance_nonce(user_id))
+        return Play(user_id, game_type, server_seed, seeds["client_seed"], nonce)
+
+    async def record(
+        self,
+        play: Play,
+        username: str,
+        bet_amount: float,
+        multiplier: float,
+        won: bool,
+        payout: float,
+        currency: str = "ETH",
+        idempotency_key: Optional[str] = None
+    ) -> dict:
+        """Record a played game; resolves once its batch has been stored"""
+        game = {
+            "game_type": play.game_type,
+            "server_seed": bytes.fromhex(play.server_seed) if self.use_msgpack else play.server_seed,
+            "client_seed": play.client_seed,
+            "nonce": play.nonce,
+            "user_id": play.user_id,
+            "username": username,
+            "bet_amount": bet_amount,
+            "multiplier": multiplier,
+            "won": won,
+            "payout": payout,
+            "currency": currency
+        }
+        if idempotency_key:
+            game["idempotency_key"] = idempotency_key
+        return await self.record_game(game)
+
+    def record_game(self, game: dict) -> asyncio.Future:
+        """Queue a /bot/game body for the next batch; the future resolves to its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((game, future))
+        if len(self._pending) >= self.batch_size or not self._batches_in_flight:
+            self._send_pending()
+        elif self._linger_handle is None:
+            self._linger_handle = asyncio.get_running_loop().call_later(self.linger, self._send_pending)
+        return future
+
+    def _send_pending(self):
+        if self._linger_handle is not None:
+            self._linger_handle.cancel()
+            self._linger_handle = None
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._spawn(self._send_batch(batch))
+
+    async def _send_batch(self, batch: List[Tuple[dict, asyncio.Future]]):
+        self._batches_in_flight += 1
+        try:
+            data, attempts = await self._request_attempts(
+                "POST", "/bot/games/batch", body=[game for game, _ in batch], idempotent=True
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._batches_in_flight -= 1
+        for (game, future), result in zip(batch, data["results"]):
+            if future.done():
+                continue
+            if result["success"] and result.get("duplicate") and attempts == 1 and "idempotency_key" not in game:
+                # Not a retry of ours: another game already used this nonce
+                future.set_exception(DuplicateGameError(result))
+            elif result["success"]:
+                future.set_result(result)
+            else:
+                future.set_exception(BotAPIError(result["status_code"], result["detail"]))
+
+    async def flush(self):
+        """Send queued games now and wait for every request in flight"""
+        self._send_pending()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
+        await self._http.aclose()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+backend/server.py on a throwaway SQLite database for tests
+Requests go through httpx's ASGI transport, so no port is opened
+
+    async with serve(tmp_path) as (server, http):
+        await http.post("/api/bot/seeds/create", params={"user_id": "player"})
+
+The server module is imported once per test session; every `serve` gives it
+a fresh database and runs its startup and shutdown hooks.
+"""
+
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+def load_server():
+    """The backend/server.py module, imported for a single SQLite worker"""
+    if "server" not in sys.modules:
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        for name in ("MONGO_URL", "ARCHIVE_DIR", "WORKER_COORDINATION", "PROFILING_ENABLED"):
+            os.environ.pop(name, None)
+        if str(BACKEND_DIR) not in sys.path:
+            sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+@asynccontextmanager
+async def serve(data_dir: Path):
+    """(server module, httpx client with the bot API key) on a new database in `data_dir`"""
+    server = load_server()
+    from storage_sqlite import SQLiteStorage
+    server.storage = SQLiteStorage(str(Path(data_dir) / "razerbet.db"), read_threads=2)
+    await server.init_storage()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        headers = {"X-API-KEY": server.BOT_API_KEY}
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as http:
+            yield server, http
+    finally:
+        await server.shutdown_storage()
+
+def coinflip(seed: dict, nonce: int, user_id: str, **fields) -> dict:
+    """A /api/bot/game body for a coinflip on `seed` (a user_seeds document)"""
+    game = {
+        "game_type": "coinflip", "server_seed": seed["server_seed"], "client_seed": seed["client_seed"],
+        "nonce": nonce, "user_id": user_id, "username": user_id.title(), "bet_amount": 1.0,
+        "multiplier": 2.0, "won": True, "payout": 2.0
+    }
+    game.update(fields)
+    return game
+
+async def play(server, http: httpx.AsyncClient, user_id: str, **fields) -> httpx.Response:
+    """Record a coinflip for `user_id` on its active seed (created if needed) at its next nonce"""
+    if await server.storage.get_active_seed(user_id) is None:
+        assert (await http.post("/api/bot/seeds/create", params={"user_id": user_id})).status_code == 200
+    seed = await server.storage.get_active_seed(user_id)
+    nonce = (await http.post(f"/api/bot/seeds/{user_id}/increment-nonce")).json()["nonce"] - 1
+    return await http.post("/api/bot/game", json=coinflip(seed, nonce, user_id, **fields))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Local MongoDB replica set for tests
+Starts `members` mongod processes on free ports with throwaway data
+directories, initiates them as one replica set and waits for a primary
+
+    with ReplicaSet() as rs:
+        os.environ["MONGO_URL"] = rs.url
+
+    python tests/replica_set.py          # run one until Ctrl-C and print its URL
+
+Needs the mongod binary on PATH (or MONGOD); tests skip without it.
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from typing import List, Optional
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+
+def mongod_path() -> Optional[str]:
+    return os.environ.get("MONGOD") or shutil.which("mongod")
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ReplicaSet:
+    """A throwaway replica set of `members` local mongod processes"""
+
+    def __init__(self, members: int = 3, name: str = "rs0", timeout: float = 60):
+        self.members = members
+        self.name = name
+        self.timeout = timeout
+        self.ports: List[int] = []
+        self._processes: List[subprocess.Popen] = []
+        self._data_dir: Optional[str] = None
+
+    @property
+    def hosts(self) -> List[str]:
+        return [f"127.0.0.1:{port}" for port in self.ports]
+
+    @property
+    def url(self) -> str:
+        return f"mongodb://{','.join(self.hosts)}/?replicaSet={self.name}"
+
+    def _wait(self, condition, what: str):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if condition():
+                    return
+            except PyMongoError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Replica set {self.name}: timed out waiting for {what}")
+            time.sleep(0.2)
+
+    def start(self):
+        mongod = mongod_path()
+        if mongod is None:
+            raise RuntimeError("mongod not found; install MongoDB or set MONGOD")
+        self._data_dir = tempfile.mkdtemp(prefix="razerbet-rs-")
+        for index in range(self.members):
+            port = free_port()
+            path = os.path.join(self._data_dir, str(index))
+            os.makedirs(path)
+            self.ports.append(port)
+            self._processes.append(subprocess.Popen(
+                [mongod, "--replSet", self.name, "--port", str(port), "--bind_ip", "127.0.0.1",
+                 "--dbpath", path, "--oplogSize", "50", "--quiet"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ))
+
+        seed = MongoClient(self.hosts[0], directConnection=True, serverSelectionTimeoutMS=1000)
+        try:
+            self._wait(lambda: seed.admin.command("ping"), "mongod to start")
+            config = {
+                "_id": self.name,
+                # The first member is the only one that can be elected, so tests know the primary
+                "members": [
+                    {"_id": index, "host": host, "priority": 1 if index == 0 else 0}
+                    for index, host in enumerate(self.hosts)
+                ]
+            }
+            try:
+                seed.admin.command("replSetInitiate", config)
+            except OperationFailure as e:
+                if e.code != 23:  # AlreadyInitialized
+                    raise
+        finally:
+            seed.close()
+
+        client = MongoClient(self.url, serverSelectionTimeoutMS=1000)
+        try:
+            self._wait(lambda: self._healthy(client), "a primary and secondaries")
+        finally:
+            client.close()
+        return self
+
+    @staticmethod
+    def _healthy(client: MongoClient) -> bool:
+        states = [member["stateStr"] for member in client.admin.command("replSetGetStatus")["members"]]
+        return states.count("PRIMARY") == 1 and all(state in ("PRIMARY", "SECONDARY") for state in states)
+
+    def stop(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._processes = []
+        if self._data_dir is not None:
+            shutil.rmtree(self._data_dir, ignore_errors=True)
+            self._data_dir = None
+
+    def __enter__(self):
+        try:
+            return self.start()
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    with ReplicaSet() as rs:
+        print(rs.url)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Active seed cache tests
+Hits served from memory and misses loaded once, nonce increments written
+through with a compare-and-set that falls back to the atomic increment when
+another process moved the nonce, loads overlapping an invalidation left
+uncached, and an increment whose lease lapsed while it waited on the lock
+
+    python -m pytest tests/test_active_seeds.py
+"""
+
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR  # noqa: E402
+from test_metrics import sample  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from active_seeds import SEED_EVENT, ActiveSeedCache  # noqa: E402
+from coordination import CacheBus, Leases  # noqa: E402
+from metrics import REGISTRY  # noqa: E402
+from provably_fair import hash_server_seed  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+class LocalBus(CacheBus):
+    """A shared bus between objects of one process"""
+
+    shared = True
+
+    def __init__(self, worker: str, peers: list):
+        super().__init__(worker)
+        self.peers = peers
+        peers.append(self)
+
+    def _send(self, data: str):
+        for peer in self.peers:
+            peer._deliver(data)
+
+class CountingStorage(SQLiteStorage):
+    """Counts the seed reads and nonce writes; `load_gate` holds reads until set"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = {"get_active_seed": 0, "advance_nonce": 0, "increment_nonce": 0}
+        self.load_gate = None
+
+    async def get_active_seed(self, user_id):
+        self.calls["get_active_seed"] += 1
+        seed = await super().get_active_seed(user_id)
+        if self.load_gate is not None:
+            await self.load_gate.wait()
+        return seed
+
+    async def advance_nonce(self, user_id, seed_id, expected, nonce):
+        self.calls["advance_nonce"] += 1
+        return await super().advance_nonce(user_id, seed_id, expected, nonce)
+
+    async def increment_nonce(self, user_id):
+        self.calls["increment_nonce"] += 1
+        return await super().increment_nonce(user_id)
+
+def open_storage(tmp_path) -> CountingStorage:
+    return CountingStorage(str(tmp_path / "seeds.db"), read_threads=2)
+
+def seed_doc(user_id: str) -> dict:
+    server_seed = uuid.uuid4().hex * 2
+    return {
+        "id": str(uuid.uuid4()), "user_id": user_id, "server_seed": server_seed,
+        "server_seed_hash": hash_server_seed(server_seed), "client_seed": "client", "nonce": 0,
+        "active": True, "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+def lookups(result: str) -> float:
+    return sample(REGISTRY.render(), f'active_seed_cache_lookups_total{{result="{result}"}}')
+
+def test_hits_and_misses(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            seed = seed_doc("player")
+            await storage.rotate_active_seed("player", seed)
+            cache = ActiveSeedCache(maxsize=2)
+            hits, misses = lookups("hit"), lookups("miss")
+
+            assert (await cache.get(storage, "player"))["id"] == seed["id"]
+            assert (await cache.get(storage, "player"))["id"] == seed["id"]
+            assert storage.calls["get_active_seed"] == 1
+            assert (lookups("hit"), lookups("miss")) == (hits + 1, misses + 1)
+
+            # Copies: changing one never changes the cached seed
+            (await cache.get(storage, "player"))["nonce"] = 99
+            assert (await cache.increment(storage, "player"))["nonce"] == 1
+            assert storage.calls == {"get_active_seed": 1, "advance_nonce": 1, "increment_nonce": 0}
+            assert (await storage.get_active_seed("player"))["nonce"] == 1
+
+            # A user without a seed is not cached
+            assert await cache.get(storage, "nobody") is None
+            assert await cache.increment(storage, "nobody") is None
+            assert "nobody" not in cache._entries
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_conflict_falls_back_to_storage(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            await storage.rotate_active_seed("player", seed_doc("player"))
+            cache = ActiveSeedCache()
+            assert (await cache.increment(storage, "player"))["nonce"] == 1
+            conflicts = sample(REGISTRY.render(), "active_seed_cache_conflicts_total")
+
+            # Another process moves the nonce: the compare-and-set matches nothing
+            assert (await storage.increment_nonce("player"))["nonce"] == 2
+            assert (await cache.increment(storage, "player"))["nonce"] == 3
+            assert sample(REGISTRY.render(), "active_seed_cache_conflicts_total") == conflicts + 1
+            assert storage.calls["increment_nonce"] == 2
+
+            # The seed the fallback returned is cached again, and the next increment hits
+            assert (await cache.increment(storage, "player"))["nonce"] == 4
+            assert storage.calls["increment_nonce"] == 2 and storage.calls["get_active_seed"] == 1
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_load_overlapping_an_invalidation_is_not_cached(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            old = seed_doc("player")
+            await storage.rotate_active_seed("player", old)
+            cache = ActiveSeedCache()
+
+            storage.load_gate = asyncio.Event()
+            load = asyncio.ensure_future(cache.get(storage, "player"))
+            await asyncio.sleep(0.05)
+            # A reveal writes the new seed while the load is waiting on its old copy
+            new = seed_doc("player")
+            assert await storage.rotate_active_seed("player", new, reveal_id=old["id"])
+            cache.invalidate("player")
+            storage.load_gate.set()
+            storage.load_gate = None
+
+            assert (await load)["id"] == old["id"]
+            assert "player" not in cache._entries
+            assert (await cache.get(storage, "player"))["id"] == new["id"]
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_lease_lapsing_on_the_lock_goes_through_storage(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            await storage.rotate_active_seed("player", seed_doc("player"))
+            peers = []
+            leases = Leases("worker-1", ttl=30)
+            cache = ActiveSeedCache(bus=LocalBus("worker-1", peers), leases=leases)
+            events = []
+            LocalBus("worker-2", peers).subscribe(SEED_EVENT, events.append)
+
+            assert (await cache.increment(storage, "player"))["nonce"] == 1
+            assert leases.holds("player") and "player" in cache._entries
+
+            entry = cache._entries["player"]
+            async with entry.lock:
+                increment = asyncio.ensure_future(cache.increment(storage, "player"))
+                await asyncio.sleep(0.05)
+                # The lease lapses while the increment waits for the lock
+                leases.release("player")
+            seed = await increment
+
+            assert seed["nonce"] == 2
+            assert storage.calls["advance_nonce"] == 1 and storage.calls["increment_nonce"] == 1
+            assert "player" not in cache._entries
+            # The worker now holding the user drops its copy of the nonce
+            assert events == ["player"]
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
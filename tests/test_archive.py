@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Archive tests
+Segment files written and read back block by block, and games moved from an
+SQLite hot tier into segments: reads see every game exactly once and newest
+first, in one worker and across workers sharing the database and the archive
+directory
+
+    python -m pytest tests/test_archive.py
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import archive  # noqa: E402
+from archive import SEGMENT_SUFFIX, Archive, TieredStorage, write_segment  # noqa: E402
+from coordination import CacheBus  # noqa: E402
+from game_codec import GAME_TYPE_CODES, encode_game  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+COINFLIP = GAME_TYPE_CODES["coinflip"]
+
+class LocalBus(CacheBus):
+    """A shared bus between objects of one process"""
+
+    shared = True
+
+    def __init__(self, worker: str, peers: list):
+        super().__init__(worker)
+        self.peers = peers
+        peers.append(self)
+
+    def _send(self, data: str):
+        for peer in self.peers:
+            peer._deliver(data)
+
+def game(index: int, age: timedelta, user_id: str = "archived-user", client_seed: str = "client") -> dict:
+    return encode_game({
+        "id": f"game-{index}",
+        "game_type": "coinflip",
+        "server_seed_hash": "ab" * 32,
+        "client_seed": client_seed,
+        "nonce": index,
+        "result": {"outcome": "heads", "roll": 12.5},
+        "raw_result": 0.125,
+        "user_id": user_id,
+        "username": "ArchivedUser",
+        "bet_amount": 1.5,
+        "multiplier": 2.0,
+        "won": index % 2 == 0,
+        "payout": 3.0 if index % 2 == 0 else 0.0,
+        "timestamp": NOW - age
+    })
+
+def tiered(tmp_path: Path, bus=None, owner=None) -> TieredStorage:
+    hot = SQLiteStorage(str(tmp_path / "hot.db"), read_threads=2)
+    # A long interval: tests call archive_once themselves after the first round
+    return TieredStorage(hot, str(tmp_path / "archive"), archive_after_days=30,
+                         segment_rows=50, interval=3600, bus=bus, owner=owner)
+
+async def settle(storage: TieredStorage):
+    # Let the archive round init starts take the lock, then wait for it
+    await asyncio.sleep(0)
+    async with storage._moving:
+        pass
+
+def test_segment_round_trip(tmp_path, monkeypatch):
+    # Small blocks, so users and sessions span several of them
+    monkeypatch.setattr(archive, "BLOCK_ROWS", 16)
+    docs = [
+        game(index, timedelta(days=40, minutes=index), user_id=f"user-{index % 3}", client_seed=f"client-{index % 5}")
+        for index in range(100)
+    ]
+    path = write_segment(tmp_path / "archive", docs)
+    store = Archive(str(tmp_path / "archive"))
+    store.open([path.name])
+    try:
+        segment = store.segments[0]
+        assert segment.rows == 100 and len(segment.blocks) == 7
+        by_id = {doc["_id"]: doc for doc in docs}
+        scanned = [doc for block in store.scan(None, None) for doc in block]
+        assert sorted(doc["_id"] for doc in scanned) == sorted(by_id)
+        for doc in scanned:
+            original = by_id[doc["_id"]]
+            assert abs(doc.pop("t") - original["t"]) < timedelta(milliseconds=1)
+            assert doc == {key: value for key, value in original.items() if key != "t"}
+
+        games = store.user_games("user-1", limit=10)
+        expected = sorted((doc for doc in docs if doc["u"] == "user-1"), key=lambda doc: doc["t"], reverse=True)
+        assert [doc["_id"] for doc in games] == [doc["_id"] for doc in expected[:10]]
+        # A projection only inflates the columns asked for, plus t to order by
+        assert set(store.user_games("user-1", limit=1, fields=["_id", "pa"])[0]) == {"v", "_id", "pa", "t"}
+
+        newest = store.recent_games(5)
+        assert [doc["_id"] for doc in newest] == [f"game-{index}" for index in range(5)]
+        session = docs[0]["s"]
+        assert {doc["_id"] for doc in store.games_for_sessions([session])} == {
+            doc["_id"] for doc in docs if doc["s"] == session
+        }
+        summary = store.user_summary("user-0")
+        assert summary["total_games"] == 34
+        assert store.count_games_by_type() == {COINFLIP: 100}
+        cutoff = docs[50]["t"]
+        assert sum(len(block) for block in store.scan(None, cutoff)) == 49
+    finally:
+        store.close()
+
+def test_reads_merge_hot_and_archived_games(tmp_path):
+    async def run():
+        storage = tiered(tmp_path)
+        await storage.init()
+        await settle(storage)
+        try:
+            for index in range(60):
+                await storage.insert_game(game(index, timedelta(days=40, hours=index)))
+            for index in range(60, 70):
+                await storage.insert_game(game(index, timedelta(hours=70 - index)))
+            assert await storage.archive_once() == 60
+
+            # Hot games first, then the archive continues where they end
+            ids = [doc["_id"] for doc in await storage.recent_games(25)]
+            assert ids == [f"game-{index}" for index in range(69, 59, -1)] + [f"game-{index}" for index in range(15)]
+            ids = [doc["_id"] for doc in await storage.recent_user_games("archived-user", 12)]
+            assert ids[10:] == ["game-0", "game-1"]
+            assert len(await storage.games_for_sessions([game(0, timedelta())["s"]])) == 70
+            scanned = [doc["_id"] async for batch in storage.scan_games(16) for doc in batch]
+            assert sorted(scanned) == sorted(f"game-{index}" for index in range(70))
+            oldest = await storage.oldest_game_time()
+            assert oldest == min(doc["t"] for batch in storage.archive.scan(None, None) for doc in batch)
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_one_worker_archives_and_the_others_follow(tmp_path):
+    async def run():
+        peers = []
+        first = tiered(tmp_path, LocalBus("first", peers), "first")
+        second = tiered(tmp_path, LocalBus("second", peers), "second")
+        await first.init()
+        await settle(first)
+        await second.init()
+        await settle(second)
+        try:
+            for index in range(120):
+                await first.insert_game(game(index, timedelta(days=40 + index / 100)))
+            for index in range(120, 130):
+                await first.insert_game(game(index, timedelta(hours=1)))
+
+            # The first worker holds the lease, so the second never moves anything
+            assert await second.archive_once() == 0
+            assert await first.archive_once() == 120
+            assert len(first.archive.segments) == 3
+
+            # The second worker opened the segments from the bus event
+            assert [s.path.name for s in second.archive.segments] == [s.path.name for s in first.archive.segments]
+            assert second.hot.archived_before == first.hot.archived_before
+            for storage in (first, second):
+                assert await storage.count_games_by_type() == {COINFLIP: 130}
+                summary = await storage.user_summary("archived-user")
+                assert summary["total_games"] == 130
+                games = await storage.recent_games(200)
+                assert len({doc["_id"] for doc in games}) == 130
+        finally:
+            await second.close()
+            await first.close()
+
+    asyncio.run(run())
+
+def test_followers_reload_missed_moves(tmp_path):
+    async def run():
+        first = tiered(tmp_path, LocalBus("first", []), "first")
+        # Not connected to the first worker's bus: every event is lost
+        second = tiered(tmp_path, LocalBus("second", []), "second")
+        await first.init()
+        await settle(first)
+        await second.init()
+        await settle(second)
+        try:
+            for index in range(20):
+                await first.insert_game(game(index, timedelta(days=40)))
+            assert await first.archive_once() == 20
+            assert second.archive.segments == []
+            assert await second.archive_once() == 0
+            assert len(second.archive.segments) == 1
+            assert await second.count_games_by_type() == {COINFLIP: 20}
+        finally:
+            await second.close()
+            await first.close()
+
+    asyncio.run(run())
+
+def test_only_the_lease_holder_removes_uncommitted_segments(tmp_path):
+    async def run():
+        peers = []
+        first = tiered(tmp_path, LocalBus("first", peers), "first")
+        await first.init()
+        await settle(first)
+        # A segment the first worker is still writing, not yet in the saved state
+        pending = first.archive.directory / f"0-1-pending{SEGMENT_SUFFIX}"
+        pending.parent.mkdir(parents=True, exist_ok=True)
+        pending.write_bytes(b"partial")
+
+        second = tiered(tmp_path, LocalBus("second", peers), "second")
+        await second.init()
+        await settle(second)
+        try:
+            assert pending.exists()
+            await first.close()
+            # Once the first worker is gone and its lease released, the second cleans up
+            await second.hot.release_leases("first")
+            await second.archive_once()
+            assert not pending.exists()
+        finally:
+            await second.close()
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Seed audit tests
+Merkle inclusion proofs for every leaf of odd and even trees, the reveal-time
+audit over the API (run after the reveal has answered), and audits left
+"pending" by a restart being run again
+
+    python -m pytest tests/test_audit.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+import audit  # noqa: E402
+from audit import build_merkle_levels, merkle_leaf, merkle_proof, resume_pending_audits, verify_merkle_proof  # noqa: E402
+
+def test_every_leaf_has_a_valid_proof():
+    for count in (1, 2, 3, 7, 8, 33):
+        leaves = [merkle_leaf(nonce, "coinflip", {"outcome": nonce % 2}) for nonce in range(count)]
+        levels = build_merkle_levels(leaves)
+        root = levels[-1][0].hex()
+        for index, leaf in enumerate(leaves):
+            proof = merkle_proof(levels, index)
+            assert verify_merkle_proof(leaf.hex(), proof, root), (count, index)
+            # A proof only fits its own leaf
+            other = merkle_leaf(index, "coinflip", {"outcome": "tampered"})
+            assert not verify_merkle_proof(other.hex(), proof, root)
+
+def test_trees_of_different_leaves_differ():
+    a, b = merkle_leaf(0, "dice", {"roll": 1}), merkle_leaf(1, "dice", {"roll": 2})
+    # The odd leaf is promoted, not paired with itself
+    assert build_merkle_levels([a, b, b])[-1] != build_merkle_levels([a, b])[-1]
+    assert build_merkle_levels([a, b])[-1] != build_merkle_levels([b, a])[-1]
+
+async def reveal_with_games(server, http, user_id: str, games: int) -> dict:
+    for _ in range(games):
+        assert (await play(server, http, user_id)).status_code == 200
+    seed = await server.storage.get_active_seed(user_id)
+    response = await http.post(f"/api/bot/seeds/{user_id}/reveal")
+    assert response.status_code == 200
+    await asyncio.gather(*server.background_jobs)
+    return seed
+
+def test_reveal_audits_and_proves_games(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            seed = await reveal_with_games(server, http, "audited", 5)
+            audit_doc = (await http.get(f"/api/seeds/{seed['server_seed_hash']}/audit")).json()["audit"]
+            assert audit_doc["status"] == "complete"
+            assert audit_doc["verified"] == audit_doc["games_checked"] == 5
+            games = (await http.get("/api/history", params={"user_id": "audited"})).json()["games"]
+            assert len(games) == 5
+            for game in games:
+                proof = (await http.get(f"/api/seeds/{seed['server_seed_hash']}/proof/{game['id']}")).json()
+                assert proof["merkle_root"] == audit_doc["merkle_root"]
+                assert verify_merkle_proof(proof["leaf_hash"], proof["proof"], proof["merkle_root"])
+            # The same tree is rebuilt from the stored leaves
+            audit._tree_cache.clear()
+            proof = (await http.get(f"/api/seeds/{seed['server_seed_hash']}/proof/{games[0]['id']}")).json()
+            assert proof["merkle_root"] == audit_doc["merkle_root"]
+
+    asyncio.run(run())
+
+def test_reveal_does_not_wait_for_the_audit(tmp_path, monkeypatch):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            release = asyncio.Event()
+            audited = []
+
+            async def slow_audit(storage, seed_sessions, seeds):
+                await release.wait()
+                audited.append(seeds["server_seed_hash"])
+
+            monkeypatch.setattr(server, "run_seed_audit", slow_audit)
+            assert (await play(server, http, "impatient")).status_code == 200
+            seed = await server.storage.get_active_seed("impatient")
+            response = await http.post("/api/bot/seeds/impatient/reveal")
+            assert response.status_code == 200
+            assert audited == [] and len(server.background_jobs) == 1
+            release.set()
+            await asyncio.gather(*server.background_jobs)
+            assert audited == [seed["server_seed_hash"]]
+
+    asyncio.run(run())
+
+def test_pending_audits_are_resumed(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            seed = await reveal_with_games(server, http, "interrupted", 3)
+            # As if the worker died between the reveal and its audit
+            await server.storage.set_seed_audit(seed["id"], seed["server_seed_hash"], {"status": "pending"})
+            await server.storage.retire_seeds([await server.storage.get_revealed_seed(seed["server_seed_hash"])])
+            assert len(await server.storage.pending_audits(10)) == 1
+
+            assert await resume_pending_audits(server.storage, server.seed_sessions) == 1
+            revealed = await server.storage.get_revealed_seed(seed["server_seed_hash"])
+            assert revealed["audit"]["status"] == "complete"
+            assert revealed["audit"]["games_checked"] == 3
+            assert await server.storage.pending_audits(10) == []
+            assert await resume_pending_audits(server.storage, server.seed_sessions) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Bot client tests
+razerbet_client.BotClient against the app on a throwaway SQLite database:
+nonces are never handed out twice, and a reused nonce is reported instead of
+being taken for a stored game
+
+    python -m pytest tests/test_bot_client.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+sys.path.insert(0, str(TESTS_DIR.parent))
+
+from local_server import serve  # noqa: E402
+from razerbet_client import BotClient, DuplicateGameError  # noqa: E402
+
+def client_for(server) -> BotClient:
+    return BotClient("http://test", server.BOT_API_KEY, transport=httpx.ASGITransport(app=server.app))
+
+async def record(client: BotClient, play) -> dict:
+    return await client.record(play, username="Player", bet_amount=1.0, multiplier=2.0, won=True, payout=2.0)
+
+def test_concurrent_first_plays_take_distinct_nonces(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            await http.post("/api/bot/seeds/create", params={"user_id": "concurrent"})
+            server_seed = (await server.storage.get_active_seed("concurrent"))["server_seed"]
+            async with client_for(server) as client:
+                plays = await asyncio.gather(*(client.play("concurrent", "coinflip", server_seed) for _ in range(20)))
+                assert sorted(play.nonce for play in plays) == list(range(20))
+                results = await asyncio.gather(*(record(client, play) for play in plays))
+                assert not any(result["duplicate"] for result in results)
+            assert (await http.get("/api/bot/seeds/concurrent")).json()["nonce"] == 20
+
+    asyncio.run(run())
+
+def test_refetch_never_lowers_the_nonce(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            await http.post("/api/bot/seeds/create", params={"user_id": "refetch"})
+            server_seed = (await server.storage.get_active_seed("refetch"))["server_seed"]
+            async with client_for(server) as client:
+                increment = client.increment_nonce
+                failures = []
+
+                async def failing_increment(user_id):
+                    if not failures:
+                        failures.append(user_id)
+                        raise httpx.ReadTimeout("lost")
+                    return await increment(user_id)
+
+                client.increment_nonce = failing_increment
+                first = await client.play("refetch", "coinflip", server_seed)
+                await client.flush()
+                # The failed increment left the server one behind; the refetch must not reuse nonce 0
+                plays = await asyncio.gather(*(client.play("refetch", "coinflip", server_seed) for _ in range(5)))
+                nonces = [first.nonce] + [play.nonce for play in plays]
+                assert sorted(nonces) == list(range(6))
+                await asyncio.gather(*(record(client, play) for play in [first] + plays))
+
+    asyncio.run(run())
+
+def test_reused_nonce_raises(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            await http.post("/api/bot/seeds/create", params={"user_id": "reused"})
+            server_seed = (await server.storage.get_active_seed("reused"))["server_seed"]
+            async with client_for(server) as client:
+                play = await client.play("reused", "coinflip", server_seed)
+                assert (await record(client, play))["duplicate"] is False
+                with pytest.raises(DuplicateGameError):
+                    await record(client, play)
+                # A caller retrying with its own idempotency key gets the stored game back
+                keyed = await client.play("reused", "coinflip", server_seed)
+                for _ in range(2):
+                    result = await client.record(keyed, username="Player", bet_amount=1.0, multiplier=2.0,
+                                                 won=True, payout=2.0, idempotency_key="bet-1")
+                    assert result["success"]
+
+    asyncio.run(run())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Response compression and projection tests
+Accept-Encoding negotiation, the size threshold, bodies left alone, streamed
+responses flushed chunk by chunk so every chunk decodes on arrival, and the
+history routes' `fields` and `layout=columns` parameters
+
+    python -m pytest tests/test_compression.py
+"""
+
+import asyncio
+import json
+import sys
+import zlib
+from pathlib import Path
+
+import brotli
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from compression import CompressionMiddleware, negotiate  # noqa: E402
+
+def app_sending(chunks, content_type: bytes = b"application/json", extra_headers=()):
+    """ASGI app answering with `chunks` as the body, streamed if there are several"""
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type)] + list(extra_headers)
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+    return app
+
+def call(app, accept_encoding: str = "gzip, br", minimum_size: int = 100):
+    """(response headers, body messages) of one GET through the middleware"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+    headers = {name.decode(): value.decode() for name, value in messages[0]["headers"]}
+    return headers, messages[1:]
+
+def test_negotiate():
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("br;q=0, gzip;q=0.5") == "gzip"
+    assert negotiate("*") == "br"
+    assert negotiate("identity") is None
+    assert negotiate("gzip;q=0") is None
+    assert negotiate(None) is None
+
+def test_threshold_and_encodings():
+    small = json.dumps({"games": []}).encode()
+    headers, messages = call(app_sending([small]))
+    assert "content-encoding" not in headers
+    assert messages[0]["body"] == small
+
+    large = json.dumps({"games": [{"id": i, "game_type": "coinflip"} for i in range(200)]}).encode()
+    headers, messages = call(app_sending([large]))
+    assert headers["content-encoding"] == "br"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(messages[0]["body"]) < len(large)
+    assert brotli.decompress(messages[0]["body"]) == large
+
+    headers, messages = call(app_sending([large]), accept_encoding="gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert zlib.decompress(messages[0]["body"], 31) == large
+
+def test_bodies_left_alone():
+    large = b"\x89PNG" + bytes(5000)
+    headers, messages = call(app_sending([large], content_type=b"image/png"))
+    assert "content-encoding" not in headers and messages[0]["body"] == large
+    encoded = zlib.compress(bytes(5000))
+    headers, messages = call(app_sending([encoded], extra_headers=[(b"content-encoding", b"deflate")]))
+    assert headers["content-encoding"] == "deflate" and messages[0]["body"] == encoded
+    headers, messages = call(app_sending([large], content_type=b"application/json"), accept_encoding="identity")
+    assert "content-encoding" not in headers
+
+def test_stream_chunks_decode_on_arrival():
+    events = [f"data: {json.dumps({'id': i, 'game_type': 'dice'})}\n\n".encode() for i in range(5)]
+    for encoding in ("gzip", "br"):
+        headers, messages = call(app_sending(events, content_type=b"text/event-stream"), accept_encoding=encoding)
+        assert headers["content-encoding"] == encoding
+        assert "content-length" not in headers
+        decoder = zlib.decompressobj(31) if encoding == "gzip" else brotli.Decompressor()
+        decode = decoder.decompress if encoding == "gzip" else decoder.process
+        # Small events are compressed too: a stream's size is not known up front
+        for event, message in zip(events, messages):
+            assert decode(message["body"]) == event
+        assert [message["more_body"] for message in messages] == [True] * 4 + [False]
+
+def test_history_fields_and_columns(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            for _ in range(3):
+                assert (await play(server, http, "projected")).status_code == 200
+            games = (await http.get("/api/history", params={"fields": "id,won"})).json()["games"]
+            assert len(games) == 3 and all(set(game) == {"id", "won"} for game in games)
+
+            columns = (await http.get("/api/history", params={"fields": "id,nonce", "layout": "columns"})).json()
+            assert set(columns["games"]) == {"id", "nonce"}
+            assert sorted(columns["games"]["nonce"]) == [0, 1, 2]
+            assert columns["games"]["id"] == [game["id"] for game in games]
+
+            assert (await http.get("/api/history", params={"fields": "id,secret"})).status_code == 400
+            assert (await http.get("/api/history", params={"layout": "rows"})).status_code == 400
+
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Database time attribution tests
+Storage calls land on the route that made them (Server-Timing header and
+db_command_* series), calls outside requests are reported as background,
+and the Mongo command listener logs slow commands by query shape
+
+    python -m pytest tests/test_db_time.py
+"""
+
+import asyncio
+import logging
+import re
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+from test_metrics import sample  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from metrics import REGISTRY, record_db_command  # noqa: E402
+from storage_mongo import CommandTimingListener, _reply_documents, query_shape  # noqa: E402
+
+def test_request_db_time_is_attributed_to_its_route(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            assert (await play(server, http, "timed")).status_code == 200
+            before = REGISTRY.render()
+            response = await http.get("/api/user/timed/stats")
+            assert response.status_code == 200
+            timing = response.headers["server-timing"]
+            match = re.fullmatch(r'db;dur=([\d.]+);desc="(\d+) calls", app;dur=([\d.]+)', timing)
+            assert match, timing
+            assert int(match.group(2)) >= 2
+
+            after = REGISTRY.render()
+            series = 'db_command_duration_seconds_count{route="/api/user/{identifier}/stats",command="sqlite_read"}'
+            assert sample(after, series) - sample(before, series) == int(match.group(2))
+            series = 'http_request_db_seconds_count{route="/api/user/{identifier}/stats"}'
+            assert sample(after, series) - sample(before, series) == 1
+
+    asyncio.run(run())
+
+def test_calls_outside_requests_are_background():
+    before = REGISTRY.render()
+    record_db_command("find", 0.002, 3)
+    record_db_command("find", 0.004, 1)
+    after = REGISTRY.render()
+    series = 'db_command_duration_seconds_count{route="background",command="find"}'
+    assert sample(after, series) - sample(before, series) == 2
+    series = 'db_command_documents_total{route="background",command="find"}'
+    assert sample(after, series) - sample(before, series) == 4
+
+def event(request_id: int, micros: int, command_name: str = "find", reply=None, command=None):
+    return SimpleNamespace(
+        connection_id=("127.0.0.1", 27017), request_id=request_id, command_name=command_name,
+        duration_micros=micros, reply=reply or {}, command=command or {}
+    )
+
+def test_slow_commands_are_logged_by_shape(caplog):
+    listener = CommandTimingListener(slow_ms=50)
+    command = {"find": "game_history", "filter": {"u": "secret-user", "t": {"$gte": 5}}, "limit": 10}
+    reply = {"cursor": {"firstBatch": [{}, {}, {}]}}
+    with caplog.at_level(logging.WARNING, logger="storage_mongo"):
+        listener.started(event(1, 0, command=command))
+        listener.succeeded(event(1, 10_000, reply=reply))
+        assert not caplog.records
+        listener.started(event(2, 0, command=command))
+        listener.succeeded(event(2, 120_000, reply=reply))
+    [record] = caplog.records
+    message = record.getMessage()
+    assert "find on game_history: 120.0 ms, 3 docs" in message
+    assert '{"u": "?", "t": {"$gte": "?"}}' in message
+    # Literal values never reach the log
+    assert "secret-user" not in message
+
+def test_failed_commands_are_counted_separately():
+    listener = CommandTimingListener(slow_ms=1000)
+    before = REGISTRY.render()
+    listener.started(event(3, 0, "insert", command={"insert": "game_history"}))
+    listener.failed(event(3, 2_000, "insert"))
+    after = REGISTRY.render()
+    series = 'db_command_duration_seconds_count{route="background",command="insert_failed"}'
+    assert sample(after, series) - sample(before, series) == 1
+
+def test_query_shape_and_reply_documents():
+    assert query_shape({"$or": [{"u": "a"}, {"un": "b"}], "g": {"$in": [1, 2]}}) == {
+        "$or": [{"u": "?"}, {"un": "?"}], "g": {"$in": "[?]"}
+    }
+    assert _reply_documents("find", {"cursor": {"nextBatch": [{}, {}]}}) == 2
+    assert _reply_documents("findAndModify", {"value": {"nonce": 1}}) == 1
+    assert _reply_documents("findAndModify", {"value": None}) == 0
+    assert _reply_documents("insert", {"n": 5}) == 5
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Fairness monitor tests
+Feeds known raw_result streams into the accumulators and checks the test
+statistics, the alert status and that every report can be sent as JSON
+
+    python -m pytest tests/test_fairness.py
+"""
+
+import random
+import sys
+from pathlib import Path
+
+from starlette.responses import JSONResponse
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fairness import HISTOGRAM_BINS, FairnessAccumulator, FairnessMonitor  # noqa: E402
+
+def accumulate(values) -> FairnessAccumulator:
+    acc = FairnessAccumulator()
+    for value in values:
+        acc.add(value)
+    return acc
+
+def test_results_on_one_side_report_no_runs_z():
+    report = accumulate([0.7, 0.8]).report(alert_p_value=0.001, min_samples=1000)
+    assert report["runs"]["z"] is None
+    assert report["runs"]["p_value"] == 0.0
+    # Starlette refuses NaN and infinity; this is what GET /api/fairness returns
+    monitor = FairnessMonitor()
+    monitor.observe("coinflip", 0.7)
+    monitor.observe("coinflip", 0.8)
+    JSONResponse(monitor.report())
+
+def test_uniform_stream_passes():
+    rng = random.Random(7)
+    acc = accumulate(rng.random() for _ in range(20000))
+    report = acc.report(alert_p_value=0.001, min_samples=1000)
+    assert report["status"] == "ok"
+    assert report["failing_tests"] == []
+    assert sum(report["chi_square"]["bins"]) == 20000
+    assert abs(report["mean"]["value"] - 0.5) < 0.01
+    assert abs(report["variance"]["value"] - 1 / 12) < 0.005
+
+def test_biased_stream_alerts():
+    rng = random.Random(7)
+    acc = accumulate(rng.random() ** 2 for _ in range(5000))
+    report = acc.report(alert_p_value=0.001, min_samples=1000)
+    assert report["status"] == "alert"
+    assert {"chi_square", "mean"} <= set(report["failing_tests"])
+
+def test_alternating_stream_fails_the_runs_test():
+    acc = accumulate([0.25, 0.75] * 1000)
+    report = acc.report(alert_p_value=0.001, min_samples=1000)
+    assert report["runs"]["observed"] == 2000
+    assert "runs" in report["failing_tests"]
+    assert report["longest_streak"]["length"] == 1
+
+def test_too_few_samples_never_alert():
+    report = accumulate([0.99] * 50).report(alert_p_value=0.001, min_samples=1000)
+    assert report["status"] == "insufficient_data"
+    assert report["failing_tests"] == []
+    assert report["longest_streak"]["length"] == 50
+
+def test_state_round_trip():
+    rng = random.Random(3)
+    acc = accumulate(rng.random() for _ in range(500))
+    restored = FairnessAccumulator.from_state(acc.to_state())
+    assert restored.report(0.001, 100) == acc.report(0.001, 100)
+
+    state = acc.to_state()
+    state["bins"] = [1] * (HISTOGRAM_BINS + 1)
+    assert FairnessAccumulator.from_state(state).bins == [0] * HISTOGRAM_BINS
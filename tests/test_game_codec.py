@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Game codec tests
+Every game type encoded to the compact v2 row and decoded back to the same
+public shape, legacy (v1) rows decoded as they are, and projections
+
+    python -m pytest tests/test_game_codec.py
+"""
+
+import random
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from game_codec import (  # noqa: E402
+    GAME_TYPE_CODES, PUBLIC_FIELDS, SCHEMA_VERSION, decode_game, encode_game, public_game, select_fields, stored_fields
+)
+from provably_fair import GAME_TYPES, calculate_game_result, generate_hmac_result, hash_server_seed, hex_to_float  # noqa: E402
+from seed_sessions import build_session  # noqa: E402
+
+SERVER_SEED = "a" * 64
+
+def record(game_type: str, nonce: int, currency: str = "ETH") -> dict:
+    raw_result = hex_to_float(generate_hmac_result(SERVER_SEED, "client", nonce))
+    return {
+        "id": f"game-{game_type}-{nonce}",
+        "game_type": game_type,
+        "server_seed_hash": hash_server_seed(SERVER_SEED),
+        "client_seed": "client",
+        "nonce": nonce,
+        "result": calculate_game_result(game_type, raw_result),
+        "raw_result": raw_result,
+        "user_id": "user-1",
+        "username": "Player",
+        "bet_amount": 0.1,
+        "multiplier": 2.0,
+        "won": nonce % 2 == 0,
+        "payout": 0.2 if nonce % 2 == 0 else 0.0,
+        "currency": currency,
+        "timestamp": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "verified": True
+    }
+
+def sessions_for(game: dict) -> dict:
+    session = build_session(SERVER_SEED, game["server_seed_hash"], game["client_seed"])
+    return {session["_id"]: session}
+
+def test_every_game_type_round_trips():
+    rng = random.Random(11)
+    for game_type in GAME_TYPES:
+        for nonce in rng.sample(range(100000), 50):
+            game = record(game_type, nonce, rng.choice(["ETH", "BTC", "USDT"]))
+            doc = encode_game(game)
+            assert doc["v"] == SCHEMA_VERSION and doc["g"] == GAME_TYPE_CODES[game_type]
+            # The plaintext seed and the result dict are not stored
+            assert "server_seed" not in doc and "result" not in doc
+            decoded = decode_game(doc, sessions_for(game))
+            assert decoded.pop("masked_username") == "Pl**er"
+            assert decoded == game, (game_type, nonce)
+
+def test_minor_units_and_default_currency():
+    doc = encode_game(record("coinflip", 2))
+    assert (doc["ba"], doc["pa"]) == (100_000_000, 200_000_000)
+    assert "cu" not in doc
+    assert encode_game(record("coinflip", 2, "USDT"))["cu"] == "USDT"
+
+def test_legacy_rows_decode_as_stored():
+    legacy = dict(record("crash", 3), _id="object-id", server_seed=SERVER_SEED)
+    legacy["timestamp"] = legacy["timestamp"].isoformat()
+    game = decode_game(legacy)
+    assert "server_seed" not in game and "_id" not in game
+    assert game["timestamp"] == datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert public_game(game)["username"] == "Pl**er"
+
+def test_projection_keeps_what_fields_need():
+    game = record("mines", 7)
+    doc = encode_game(game)
+    for fields in (["result"], ["server_seed_hash", "nonce"], ["username"], list(PUBLIC_FIELDS)):
+        projected = {key: value for key, value in doc.items() if key in stored_fields(fields)}
+        decoded = public_game(decode_game(projected, sessions_for(game)))
+        expected = dict(game, username="Pl**er")
+        assert select_fields(decoded, fields) == select_fields(expected, fields), fields
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Idempotent game recording tests
+Game ids derived from the seed session and nonce or the Idempotency-Key, and
+retried submissions (in order, concurrent, after the in-memory LRU forgot
+them, or inside a batch) answered with the original game and stored once
+
+    python -m pytest tests/test_idempotency.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, coinflip, serve  # noqa: E402
+from test_metrics import sample  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from idempotency import RecentGames, game_id_for  # noqa: E402
+from metrics import REGISTRY  # noqa: E402
+
+def duplicates(source: str) -> float:
+    return sample(REGISTRY.render(), f'games_duplicate_total{{source="{source}"}}')
+
+def test_game_ids_are_derived():
+    assert game_id_for("session", 1) == game_id_for("session", 1)
+    assert game_id_for("session", 1) != game_id_for("session", 2)
+    assert game_id_for("session", 1) != game_id_for("other", 1)
+    # A key replaces the session and nonce
+    assert game_id_for("session", 1, "bet-1") == game_id_for("other", 9, "bet-1")
+    assert game_id_for("session", 1, "bet-1") != game_id_for("session", 1)
+
+def test_recent_games_forgets_the_oldest():
+    recent = RecentGames(maxsize=3)
+    for game_id in ("a", "b", "c"):
+        recent.add(game_id)
+    assert recent.seen("a")
+    recent.add("d")
+    # "a" was used last, so "b" went
+    assert not recent.seen("b")
+    assert all(recent.seen(game_id) for game_id in ("a", "c", "d"))
+
+async def new_seed(server, http, user_id: str) -> dict:
+    assert (await http.post("/api/bot/seeds/create", params={"user_id": user_id})).status_code == 200
+    return await server.storage.get_active_seed(user_id)
+
+async def total_games(http, user_id: str) -> int:
+    return (await http.get(f"/api/user/{user_id}/stats")).json()["total_games"]
+
+def test_retries_return_the_original_game(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            seed = await new_seed(server, http, "retrier")
+            body = coinflip(seed, 0, "retrier")
+            first = (await http.post("/api/bot/game", json=body)).json()
+            assert first["duplicate"] is False
+
+            memory = duplicates("memory")
+            retry = (await http.post("/api/bot/game", json=body)).json()
+            assert retry == dict(first, duplicate=True)
+            assert duplicates("memory") == memory + 1
+
+            # Another worker, or this one after the LRU forgot the id: the primary key answers
+            server.recent_games._ids.clear()
+            stored = duplicates("storage")
+            retry = (await http.post("/api/bot/game", json=body)).json()
+            assert retry == dict(first, duplicate=True)
+            assert duplicates("storage") == stored + 1
+            assert await total_games(http, "retrier") == 1
+
+    asyncio.run(run())
+
+def test_concurrent_submissions_are_stored_once(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            seed = await new_seed(server, http, "pipelined")
+            body = coinflip(seed, 0, "pipelined")
+            responses = await asyncio.gather(*(http.post("/api/bot/game", json=body) for _ in range(8)))
+            results = [response.json() for response in responses]
+            assert [result["duplicate"] for result in results].count(False) == 1
+            assert len({result["game_id"] for result in results}) == 1
+            assert await total_games(http, "pipelined") == 1
+
+    asyncio.run(run())
+
+def test_idempotency_keys(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            seed = await new_seed(server, http, "keyed")
+            first = (await http.post("/api/bot/game", json=coinflip(seed, 0, "keyed"),
+                                     headers={"Idempotency-Key": "bet-1"})).json()
+            # The key decides: a retry is a duplicate even at another nonce...
+            retry = (await http.post("/api/bot/game", json=coinflip(seed, 1, "keyed"),
+                                     headers={"Idempotency-Key": "bet-1"})).json()
+            assert retry["duplicate"] is True and retry["game_id"] == first["game_id"]
+            # ...and a new key records a new game at the same nonce
+            other = (await http.post("/api/bot/game", json=coinflip(seed, 0, "keyed"),
+                                     headers={"Idempotency-Key": "bet-2"})).json()
+            assert other["duplicate"] is False and other["game_id"] != first["game_id"]
+
+            batch = [dict(coinflip(seed, 2, "keyed"), idempotency_key="bet-3"), coinflip(seed, 3, "keyed")]
+            results = (await http.post("/api/bot/games/batch", json=batch)).json()["results"]
+            assert [result["duplicate"] for result in results] == [False, False]
+            again = (await http.post("/api/bot/games/batch", json=batch + batch)).json()["results"]
+            assert all(result["duplicate"] for result in again)
+            assert [result["game_id"] for result in again] == [result["game_id"] for result in results] * 2
+            assert await total_games(http, "keyed") == 4
+
+    asyncio.run(run())
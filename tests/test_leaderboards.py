@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Leaderboard tests
+Boards fed game by game against totals computed directly, profit rankings
+refilled when read rather than on the ingest path, the rebuild route, and
+persistence: user totals are saved as one row each, only changed rows are
+written again, and a restart restores the same boards
+
+    python -m pytest tests/test_leaderboards.py
+"""
+
+import asyncio
+import random
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from leaderboards import WINDOWS, BoardSet, Leaderboards, TopK, period_of  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+def game(index: int, user: int, bet: float, multiplier: float, won: bool, currency: str = "ETH") -> dict:
+    return {
+        "id": f"game-{index}",
+        "game_type": "coinflip" if index % 2 else "crash",
+        "user_id": f"user-{user}",
+        "username": f"User{user}",
+        "bet_amount": bet,
+        "multiplier": multiplier,
+        "won": won,
+        "payout": round(bet * multiplier, 6) if won else 0.0,
+        "currency": currency,
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+def random_games(count: int, users: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [
+        game(index, rng.randrange(users), rng.choice([0.01, 0.1, 0.5, 1.0]), rng.choice([1.5, 2.0, 10.0]), rng.random() < 0.45)
+        for index in range(count)
+    ]
+
+def test_topk_keeps_the_highest_scores():
+    top = TopK(3)
+    rng = random.Random(5)
+    scores = {}
+    for _ in range(2000):
+        key = f"k{rng.randrange(50)}"
+        scores[key] = scores.get(key, 0) + rng.randint(-5, 10)
+        top.offer(key, scores[key])
+        if top.stale:
+            top.refill(scores.items())
+    best = sorted(scores.values(), reverse=True)[:3]
+    assert [score for _, score in top.top(3)] == best
+
+def test_boards_match_direct_totals():
+    boards = Leaderboards(size=5)
+    games = random_games(3000, users=40)
+    for g in games:
+        boards.observe(g)
+
+    profit = {}
+    for g in games:
+        profit[g["user_id"]] = profit.get(g["user_id"], 0) + round((g["payout"] - g["bet_amount"]) * 10 ** 9)
+    expected = sorted(profit.values(), reverse=True)[:5]
+    entries = boards.top("profit", "all_time", limit=5)["entries"]
+    assert [round(entry["value"] * 10 ** 9) for entry in entries] == expected
+
+    best = sorted((g["multiplier"] for g in games if g["won"]), reverse=True)[:5]
+    assert [entry["value"] for entry in boards.top("multiplier", "daily", limit=5)["entries"]] == best
+
+def test_profit_is_refilled_on_read(monkeypatch):
+    refills = []
+    refill = TopK.refill
+
+    def counting_refill(self, scores):
+        refills.append(self)
+        refill(self, scores)
+
+    monkeypatch.setattr(TopK, "refill", counting_refill)
+    boards = Leaderboards(size=3)
+    # Everyone wins first, then the leaders lose it all: untracked users end up ahead
+    for user in range(20):
+        boards.observe(game(user, user, 1.0, 1 + user / 10, True))
+    for user in range(10, 20):
+        for index in range(3):
+            boards.observe(game(1000 + user * 10 + index, user, 5.0, 2.0, False))
+    assert refills == []
+
+    entries = boards.top("profit", "all_time", limit=3)["entries"]
+    assert [entry["user_id"] for entry in entries] == ["user-9", "user-8", "user-7"]
+    assert refills
+    # Nothing fell since: the next read is a plain slice
+    count = len(refills)
+    assert boards.top("profit", "all_time", limit=3)["entries"] == entries
+    assert len(refills) == count
+
+def test_rebuild_route(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            for _ in range(3):
+                assert (await play(server, http, "rebuilt")).status_code == 200
+            server.leaderboards.boards = BoardSet(server.leaderboards.size)
+            assert (await http.post("/api/bot/leaderboards/rebuild")).status_code == 200
+            # Started but not finished: a second rebuild is refused
+            assert (await http.post("/api/bot/leaderboards/rebuild")).status_code == 409
+            await server.leaderboards._rebuild_task
+            board = (await http.get("/api/leaderboard", params={"metric": "wagered", "window": "all_time"})).json()
+            assert [(entry["user_id"], entry["games"]) for entry in board["entries"]] == [("rebuilt", 3)]
+            assert (await http.post("/api/bot/leaderboards/rebuild")).status_code == 200
+
+    asyncio.run(run())
+
+class CountingStorage(SQLiteStorage):
+    """Counts the leaderboard total rows written"""
+
+    written = 0
+
+    async def save_leaderboard_totals(self, rows):
+        self.written += len(rows)
+        await super().save_leaderboard_totals(rows)
+
+def test_totals_persist_as_rows_and_restore(tmp_path):
+    async def run():
+        storage = CountingStorage(str(tmp_path / "boards.db"), read_threads=2)
+        await storage.init()
+        try:
+            boards = Leaderboards(size=5)
+            games = random_games(2000, users=300)
+            for g in games:
+                boards.observe(g)
+            await boards.persist(storage)
+            users = len({g["user_id"] for g in games})
+            # One row per user, game type (plus `all`) and window
+            first = storage.written
+            assert users * len(WINDOWS) < first <= users * 3 * len(WINDOWS)
+            state = await storage.load_state("leaderboards")
+            assert "users" not in state["windows"]["all_time"]
+
+            # Only what changed is written again
+            boards.observe(game(10_000, 7, 1.0, 2.0, True))
+            await boards.persist(storage)
+            assert storage.written - first == 2 * len(WINDOWS)
+
+            restored = Leaderboards(size=5)
+            assert await restored.load(storage)
+            for window in WINDOWS:
+                for metric in ("wagered", "profit", "multiplier"):
+                    for game_type in ("all", "coinflip", "crash"):
+                        got = restored.top(metric, window, game_type)["entries"]
+                        want = boards.top(metric, window, game_type)["entries"]
+                        assert got == want, (metric, window, game_type)
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_rows_of_finished_periods_are_dropped(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "boards.db"), read_threads=2)
+        await storage.init()
+        try:
+            await storage.save_leaderboard_totals([{
+                "window": "daily", "period": "2000-01-01", "game_type": "all", "currency": "ETH",
+                "user_id": "old", "wagered": 1, "profit": 1, "games": 1, "username": "Old"
+            }])
+            boards = Leaderboards(size=5)
+            boards.observe(game(1, 1, 1.0, 2.0, True))
+            await boards.persist(storage)
+            assert await storage.load_leaderboard_totals("daily", "2000-01-01") == []
+            today = period_of("daily", datetime.now(timezone.utc))
+            assert {row["user_id"] for row in await storage.load_leaderboard_totals("daily", today)} == {"user-1"}
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_failed_save_is_retried(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "boards.db"), read_threads=2)
+        await storage.init()
+        try:
+            boards = Leaderboards(size=5)
+            boards.observe(game(1, 1, 1.0, 2.0, True))
+            save = storage.save_state
+
+            async def failing_save(key, value):
+                raise OSError("disk full")
+
+            storage.save_state = failing_save
+            try:
+                await boards.persist(storage)
+            except OSError:
+                boards._dirty = True
+            storage.save_state = save
+            await storage.delete_leaderboard_totals("all_time", keep_period="none")
+            await boards.persist(storage)
+            rows = await storage.load_leaderboard_totals("all_time", "all")
+            assert {row["game_type"] for row in rows} == {"all", "coinflip"}
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Ledger amount tests
+Minor unit conversion, and the API refusing amounts that cannot be stored as
+int64 minor units on the single and the batch game route
+
+    python -m pytest tests/test_ledger.py
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, coinflip, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ledger import check_amount, from_minor, to_minor  # noqa: E402
+
+def test_minor_units_are_exact():
+    assert to_minor(1.5, "ETH") == 1_500_000_000
+    assert to_minor(0.1, None) == 100_000_000
+    assert to_minor(0.00000001, "BTC") == 1
+    assert to_minor(12.345678, "USDT") == 12_345_678
+    assert to_minor(0.1, "DOGE") == 10_000_000
+    assert sum(to_minor(0.1, "ETH") for _ in range(10)) == to_minor(1.0, "ETH")
+    assert from_minor(to_minor(2.25, "SOL"), "SOL") == 2.25
+
+def test_check_amount_limits():
+    assert check_amount(9_000_000_000.0, "ETH") == 9_000_000_000.0
+    assert check_amount(9e12, "USDT") == 9e12
+    for amount, currency in ((float("nan"), "ETH"), (float("inf"), "ETH"), (-float("inf"), "BTC"),
+                             (1e300, "ETH"), (1e12, "ETH"), (-1e12, "ETH"), (1e11, "BTC")):
+        with pytest.raises(ValueError):
+            check_amount(amount, currency)
+
+BAD_AMOUNTS = ["NaN", "Infinity", "-Infinity", "1e300", "1e12"]
+
+def test_bot_routes_refuse_unstorable_amounts(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            assert (await play(server, http, "ledger-user", bet_amount=0.25, payout=0.5)).status_code == 200
+            seed = await server.storage.get_active_seed("ledger-user")
+            for amount in BAD_AMOUNTS:
+                for field in ("bet_amount", "payout"):
+                    body = coinflip(seed, 1, "ledger-user")
+                    # NaN and Infinity are not JSON numbers; send them as Python's encoder writes them
+                    raw = json.dumps(dict(body, **{field: "AMOUNT"})).replace('"AMOUNT"', amount)
+                    headers = {"Content-Type": "application/json"}
+                    response = await http.post("/api/bot/game", content=raw, headers=headers)
+                    assert response.status_code == 422, (field, amount, response.text)
+                    response = await http.post("/api/bot/games/batch", content=f"[{raw}]", headers=headers)
+                    assert response.status_code == 422, (field, amount, response.text)
+
+            response = await http.get("/api/user/ledger-user/stats")
+            assert response.status_code == 200
+            assert response.json()["total_games"] == 1
+
+    asyncio.run(run())
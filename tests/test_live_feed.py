@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Live feed tests
+LiveFeedHub fan-out to filtered subscribers, Last-Event-ID replay from the
+ring, a `reset` event when the ring no longer covers the gap or the id is from
+another boot, dropping subscribers that fall behind, and /api/history/stream
+end to end
+
+    python -m pytest tests/test_live_feed.py
+"""
+
+import asyncio
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+from test_metrics import sample  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from live_feed import LiveFeedHub  # noqa: E402
+from metrics import REGISTRY  # noqa: E402
+
+def game(index: int, game_type: str = "coinflip", user_id: str = "user-1") -> dict:
+    return {"id": f"game-{index}", "game_type": game_type, "user_id": user_id, "timestamp": datetime.now(timezone.utc)}
+
+def parse(frame: bytes) -> dict:
+    """Fields of one SSE frame, with `data` decoded"""
+    fields = dict(line.split(": ", 1) for line in frame.decode().strip().split("\n") if not line.startswith(":"))
+    if "data" in fields:
+        fields["data"] = json.loads(fields["data"])
+    return fields
+
+async def opened(hub: LiveFeedHub, game_type=None, user_id=None, last_event_id=None):
+    """A subscribed stream, past its retry line"""
+    stream = hub.stream(game_type, user_id, last_event_id)
+    assert await stream.__anext__() == b"retry: 3000\n\n"
+    return stream
+
+async def take(stream, count: int) -> list:
+    """The next `count` frames"""
+    return [parse(await asyncio.wait_for(stream.__anext__(), 1)) for _ in range(count)]
+
+async def ids(stream, count: int) -> list:
+    return [frame["data"]["id"] for frame in await take(stream, count)]
+
+async def finished(stream) -> bool:
+    """Whether nothing else is queued for `stream`; closes it either way"""
+    try:
+        await asyncio.wait_for(stream.__anext__(), 0.05)
+    except asyncio.TimeoutError:
+        # Cancelling the wait ends the generator
+        return True
+    await stream.aclose()
+    return False
+
+def test_subscribers_get_matching_games():
+    async def run():
+        hub = LiveFeedHub()
+        everything = await opened(hub)
+        coinflips = await opened(hub, game_type="coinflip")
+        mine = await opened(hub, user_id="user-2")
+
+        hub.publish(game(1, "crash", "user-1"))
+        hub.publish(game(2, "coinflip", "user-2"))
+        hub.publish(game(3, "coinflip", "user-1"))
+
+        frames = await take(everything, 3)
+        assert [frame["data"]["id"] for frame in frames] == ["game-1", "game-2", "game-3"]
+        assert [frame["event"] for frame in frames] == ["game"] * 3
+        assert [frame["id"] for frame in frames] == [f"{hub._boot}-{seq}" for seq in (1, 2, 3)]
+        assert await ids(coinflips, 2) == ["game-2", "game-3"]
+        assert await ids(mine, 1) == ["game-2"]
+
+        for stream in (everything, coinflips, mine):
+            assert await finished(stream)
+        assert not hub._subscribers
+
+    asyncio.run(run())
+
+def test_last_event_id_replay_and_reset():
+    async def run():
+        hub = LiveFeedHub(replay_size=3)
+        for index in range(1, 6):
+            hub.publish(game(index, "coinflip" if index % 2 else "crash"))
+        # The ring holds games 3 to 5
+
+        stream = await opened(hub, last_event_id=f"{hub._boot}-3")
+        assert await ids(stream, 2) == ["game-4", "game-5"]
+        assert await finished(stream)
+        stream = await opened(hub, last_event_id=f"{hub._boot}-2")
+        assert await ids(stream, 3) == ["game-3", "game-4", "game-5"]
+        assert await finished(stream)
+        # Replay honours the filter too
+        stream = await opened(hub, game_type="crash", last_event_id=f"{hub._boot}-2")
+        assert await ids(stream, 1) == ["game-4"]
+        assert await finished(stream)
+
+        # Game 2 is gone from the ring, the id is from another boot, or not an id at all
+        for last_event_id in (f"{hub._boot}-1", "0-4", "garbage"):
+            stream = await opened(hub, last_event_id=last_event_id)
+            assert await take(stream, 1) == [{"id": f"{hub._boot}-5", "event": "reset", "data": {}}]
+            assert await finished(stream)
+
+        # Live games follow the replay
+        stream = await opened(hub, last_event_id=f"{hub._boot}-4")
+        hub.publish(game(6))
+        assert await ids(stream, 2) == ["game-5", "game-6"]
+        assert await finished(stream)
+
+    asyncio.run(run())
+
+def test_slow_subscribers_are_dropped():
+    async def run():
+        hub = LiveFeedHub(queue_size=2)
+        slow = await opened(hub)
+        fast = await opened(hub)
+        dropped = sample(REGISTRY.render(), "live_feed_dropped_total")
+
+        hub.publish(game(1))
+        hub.publish(game(2))
+        assert await ids(fast, 2) == ["game-1", "game-2"]
+        # The slow one read nothing: its third game does not fit
+        hub.publish(game(3))
+        assert sample(REGISTRY.render(), "live_feed_dropped_total") == dropped + 1
+        assert len(hub._subscribers) == 1
+
+        # Its stream ends; the browser reconnects and resumes from the ring
+        try:
+            await slow.__anext__()
+            assert False, "the dropped stream kept going"
+        except StopAsyncIteration:
+            pass
+        assert await ids(fast, 1) == ["game-3"]
+        resumed = await opened(hub, last_event_id=f"{hub._boot}-0")
+        assert await ids(resumed, 3) == ["game-1", "game-2", "game-3"]
+        assert await finished(fast) and await finished(resumed)
+
+    asyncio.run(run())
+
+class StreamClient:
+    """One GET /api/history/stream served by the ASGI app until `close`
+
+    httpx's ASGI transport waits for the whole body, which an event stream
+    never finishes, so the request is driven by hand.
+    """
+
+    def __init__(self, app, query: str = "", last_event_id: str = None):
+        headers = [(b"host", b"test")]
+        if last_event_id:
+            headers.append((b"last-event-id", last_event_id.encode()))
+        self.scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/api/history/stream", "raw_path": b"/api/history/stream",
+            "root_path": "", "query_string": query.encode(), "headers": headers,
+            "client": ("127.0.0.1", 50000), "server": ("test", 80)
+        }
+        self.status = None
+        self.chunks: asyncio.Queue = asyncio.Queue()
+        self._disconnected = asyncio.Event()
+        self._task = asyncio.ensure_future(app(self.scope, self._receive, self._send))
+
+    async def _receive(self):
+        await self._disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        elif message.get("body"):
+            await self.chunks.put(message["body"])
+
+    async def events(self, count: int) -> list:
+        """The next `count` events, skipping the retry line"""
+        events = []
+        while len(events) < count:
+            chunk = await asyncio.wait_for(self.chunks.get(), 5)
+            for frame in chunk.split(b"\n\n"):
+                if frame.strip() and not frame.startswith(b"retry:"):
+                    events.append(parse(frame))
+        return events
+
+    async def close(self):
+        self._disconnected.set()
+        await asyncio.wait_for(self._task, 5)
+
+def test_stream_route(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            assert (await http.get("/api/history/stream", params={"game_type": "roulette"})).status_code == 400
+
+            everyone = StreamClient(server.app)
+            mine = StreamClient(server.app, query="user_id=streamer")
+            await asyncio.sleep(0.05)
+            assert everyone.status == mine.status == 200
+
+            assert (await play(server, http, "other")).status_code == 200
+            assert (await play(server, http, "streamer")).status_code == 200
+            first, second = await everyone.events(2)
+            assert (first["event"], first["data"]["user_id"]) == ("game", "other")
+            assert second["data"]["user_id"] == "streamer"
+            [only] = await mine.events(1)
+            assert only["id"] == second["id"] and "server_seed" not in only["data"]
+
+            # A reconnect with Last-Event-ID is replayed what it missed
+            assert (await play(server, http, "streamer")).status_code == 200
+            resumed = StreamClient(server.app, last_event_id=first["id"])
+            replayed = await resumed.events(2)
+            assert [event["data"]["user_id"] for event in replayed] == ["streamer", "streamer"]
+            assert replayed[0]["id"] == second["id"]
+            restarted = StreamClient(server.app, last_event_id="0-1")
+            [reset] = await restarted.events(1)
+            assert reset["event"] == "reset"
+
+            for client in (everyone, mine, resumed, restarted):
+                await client.close()
+            assert not server.live_feed._subscribers
+
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Metrics tests
+Prometheus text rendering of counters, gauges and histograms, and the HTTP
+middleware labelling requests by route template on GET /metrics
+
+    python -m pytest tests/test_metrics.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from metrics import CONTENT_TYPE, Registry  # noqa: E402
+
+def sample(text: str, series: str) -> float:
+    """Value of one series line of a scrape; 0 when absent"""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_render_counter_and_gauge():
+    registry = Registry()
+    counter = registry.counter("jobs_total", "Jobs by state", ("state",))
+    gauge = registry.gauge("queue_depth", "Queued items")
+    counter.inc("done")
+    counter.inc("done", amount=2)
+    counter.inc('fa"il\\ed\n')
+    gauge.set(4)
+    gauge.dec(amount=1.5)
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP jobs_total Jobs by state", "# TYPE jobs_total counter"]
+    assert 'jobs_total{state="done"} 3' in lines
+    assert 'jobs_total{state="fa\\"il\\\\ed\\n"} 1' in lines
+    assert "# TYPE queue_depth gauge" in lines
+    assert "queue_depth 2.5" in lines
+
+def test_gauge_callback_is_read_at_scrape():
+    registry = Registry()
+    depth = {"value": 1}
+    registry.gauge("pool_size", "Pool size", ("pool",)).set_callback(lambda: {("main",): depth["value"]})
+    assert 'pool_size{pool="main"} 1' in registry.render()
+    depth["value"] = 7
+    assert 'pool_size{pool="main"} 7' in registry.render()
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/a")
+    text = registry.render()
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="0.1"}') == 2
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="1"}') == 3
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="+Inf"}') == 4
+    assert sample(text, 'latency_seconds_count{route="/a"}') == 4
+    assert sample(text, 'latency_seconds_sum{route="/a"}') == 3.65
+
+def test_duplicate_names_are_refused():
+    registry = Registry()
+    registry.counter("twice_total", "Once")
+    with pytest.raises(ValueError):
+        registry.gauge("twice_total", "Twice")
+
+def test_requests_are_labelled_by_route_template(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            before = (await http.get("/metrics")).text
+            for user in ("metrics-a", "metrics-b"):
+                assert (await play(server, http, user)).status_code == 200
+                assert (await http.get(f"/api/user/{user}/stats")).status_code == 200
+            assert (await http.get("/api/user/nobody-here/stats")).status_code == 404
+
+            response = await http.get("/metrics")
+            assert response.headers["content-type"] == CONTENT_TYPE
+            after = response.text
+            route = '"/api/user/{identifier}/stats"'
+
+            def delta(series):
+                return sample(after, series) - sample(before, series)
+
+            assert delta(f'http_requests_total{{method="GET",route={route},status="200"}}') == 2
+            assert delta(f'http_requests_total{{method="GET",route={route},status="404"}}') == 1
+            assert delta(f'http_request_duration_seconds_count{{method="GET",route={route}}}') == 3
+            assert delta('games_recorded_total{game_type="coinflip",currency="ETH"}') == 2
+            # Raw paths never become labels
+            assert "metrics-a" not in after
+            assert sample(after, "http_requests_in_flight") == 1
+
+    asyncio.run(run())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Multi-worker nonce test
+Starts several uvicorn workers on one SQLite database with the Unix socket
+cache bus, increments the nonces of a few users through all of them at once,
+and checks that no nonce is handed out twice and none is lost
+
+    python -m pytest tests/test_multiworker_nonces.py
+    python tests/test_multiworker_nonces.py --workers 6 --increments 300
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+API_KEY = "multiworker-test-key"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_workers(count: int, data_dir: str):
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND="sqlite",
+        SQLITE_PATH=os.path.join(data_dir, "multiworker.db"),
+        WORKER_COORDINATION="unix",
+        WORKER_SOCKET_DIR=os.path.join(data_dir, "sockets"),
+        # Short leases, so users change hands while the test runs
+        SEED_LEASE_SECONDS="1",
+        BOT_API_KEY=API_KEY
+    )
+    env.pop("MONGO_URL", None)
+    env.pop("ARCHIVE_DIR", None)
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        )
+        workers.append((process, f"http://127.0.0.1:{port}"))
+    return workers
+
+async def wait_ready(urls, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        for url in urls:
+            while True:
+                try:
+                    if (await http.get(f"{url}/api/")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Worker at {url} did not start")
+                await asyncio.sleep(0.1)
+
+async def hammer(urls, users: int, increments: int):
+    """Nonces returned per user, with increments spread round-robin over the workers"""
+    headers = {"X-API-KEY": API_KEY}
+    limits = httpx.Limits(max_connections=64)
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=30) as http:
+        user_ids = [f"multiworker-{index}" for index in range(users)]
+        for user_id in user_ids:
+            response = await http.post(f"{urls[0]}/api/bot/seeds/create", params={"user_id": user_id})
+            assert response.status_code == 200, response.text
+
+        async def increment(user_id: str, index: int) -> int:
+            url = urls[index % len(urls)]
+            response = await http.post(f"{url}/api/bot/seeds/{user_id}/increment-nonce")
+            assert response.status_code == 200, response.text
+            return response.json()["nonce"]
+
+        nonces = {}
+        for user_id in user_ids:
+            nonces[user_id] = asyncio.gather(*(increment(user_id, index) for index in range(increments)))
+        nonces = dict(zip(nonces, await asyncio.gather(*nonces.values())))
+
+        # Every worker must now see the final nonce, cached or not, once the
+        # cache bus has carried the last changes over (a few milliseconds)
+        final = {}
+        for user_id in user_ids:
+            deadline = time.monotonic() + 2
+            while True:
+                seen = {(await http.get(f"{url}/api/bot/seeds/{user_id}")).json()["nonce"] for url in urls}
+                if seen == {increments} or time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.01)
+            final[user_id] = seen
+    return nonces, final
+
+def run(workers: int = 4, users: int = 3, increments: int = 100):
+    with tempfile.TemporaryDirectory(prefix="razerbet-multiworker-") as data_dir:
+        processes = start_workers(workers, data_dir)
+        try:
+            urls = [url for _, url in processes]
+            asyncio.run(wait_ready(urls))
+            nonces, final = asyncio.run(hammer(urls, users, increments))
+        finally:
+            for process, _ in processes:
+                process.terminate()
+            for process, _ in processes:
+                process.wait(timeout=10)
+
+    for user_id, returned in nonces.items():
+        duplicated = [nonce for nonce, count in Counter(returned).items() if count > 1]
+        assert not duplicated, f"{user_id}: nonces handed out twice: {duplicated[:10]}"
+        assert sorted(returned) == list(range(1, increments + 1)), f"{user_id}: nonces lost"
+        assert final[user_id] == {increments}, f"{user_id}: workers disagree on the nonce: {final[user_id]}"
+    return nonces
+
+def test_no_duplicate_nonces_across_workers():
+    run()
+
+def main():
+    parser = argparse.ArgumentParser(description="Nonce uniqueness across several workers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--increments", type=int, default=100, help="Increments per user")
+    args = parser.parse_args()
+    run(args.workers, args.users, args.increments)
+    print(f"OK: {args.workers} workers, {args.users} users x {args.increments} increments, no duplicate nonces")
+
+if __name__ == "__main__":
+    main()
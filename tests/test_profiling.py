@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Request profiler tests
+Signed profile tokens, and ProfilingMiddleware around a small FastAPI app:
+profiled requests are written as collapsed stacks holding both CPU frames
+and awaited ones, the event loop never waits for the sampling thread, old
+profiles are pruned, and other requests are untouched
+
+    python -m pytest tests/test_profiling.py
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from starlette.responses import PlainTextResponse
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from profiling import PROFILE_HEADER, ProfilingMiddleware, RequestProfiler, _TaskSampler, sign_profile_token, verify_profile_token  # noqa: E402
+
+SECRET = "profile-secret"
+
+def spin(seconds: float) -> int:
+    end = time.perf_counter() + seconds
+    count = 0
+    while time.perf_counter() < end:
+        count += 1
+    return count
+
+def profiled_app(profiler: RequestProfiler):
+    app = FastAPI()
+
+    @app.get("/slow/{item}")
+    async def slow_route(item: str):
+        spin(0.05)
+        await asyncio.sleep(0.05)
+        return PlainTextResponse("done")
+
+    return ProfilingMiddleware(app, profiler)
+
+def test_tokens():
+    token = sign_profile_token(SECRET, 60)
+    assert verify_profile_token(SECRET, token)
+    assert not verify_profile_token("other-secret", token)
+    assert not verify_profile_token(SECRET, sign_profile_token(SECRET, -5))
+    expires, _, signature = token.partition(".")
+    assert not verify_profile_token(SECRET, f"{int(expires) + 3600}.{signature}")
+    assert not verify_profile_token(SECRET, "garbage")
+
+def test_profiled_request_is_saved(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), SECRET, interval_ms=1)
+    switch_interval = sys.getswitchinterval()
+
+    async def run():
+        transport = httpx.ASGITransport(app=profiled_app(profiler))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            assert (await http.get("/slow/1")).text == "done"
+            assert profiler.list_profiles() == []
+            headers = {PROFILE_HEADER: sign_profile_token(SECRET, 60)}
+            assert (await http.get("/slow/2", headers=headers)).text == "done"
+
+    asyncio.run(run())
+    assert sys.getswitchinterval() == switch_interval
+
+    [profile] = profiler.list_profiles()
+    assert "_GET_slow_item_" in profile["name"]
+    lines = profiler.profile_path(profile["name"]).read_text().splitlines()
+    assert all(line.startswith("GET /slow/{item} [200];") for line in lines)
+    stacks = "\n".join(lines)
+    assert "spin (test_profiling.py" in stacks
+    assert "slow_route (test_profiling.py" in stacks and "[await]" in stacks
+    # Frames above the middleware are not part of the request
+    assert "_run_once" not in stacks and "run_until_complete" not in stacks
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) > 20
+
+def test_event_loop_never_waits_for_the_sampler(tmp_path, monkeypatch):
+    profiler = RequestProfiler(str(tmp_path), SECRET, sample_rate=1.0, interval_ms=1)
+    sample = _TaskSampler._sample
+
+    def slow_sample(self):
+        # A sample caught mid-walk when the request ends
+        time.sleep(0.3)
+        return sample(self)
+
+    monkeypatch.setattr(_TaskSampler, "_sample", slow_sample)
+
+    async def run():
+        gaps = []
+
+        async def tick():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.create_task(tick())
+        transport = httpx.ASGITransport(app=profiled_app(profiler))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            assert (await http.get("/slow/1")).status_code == 200
+        ticker.cancel()
+        # The request itself spins for 50 ms; joining the sampler must not add to that
+        assert max(gaps) < 0.2
+
+    asyncio.run(run())
+    assert len(profiler.list_profiles()) == 1
+
+def test_old_profiles_are_pruned(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), SECRET, sample_rate=1.0, keep=2, interval_ms=5)
+
+    async def run():
+        transport = httpx.ASGITransport(app=profiled_app(profiler))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            for item in range(4):
+                assert (await http.get(f"/slow/{item}")).status_code == 200
+
+    asyncio.run(run())
+    assert len(profiler.list_profiles()) == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+def test_profile_names_are_checked(tmp_path):
+    profiler = RequestProfiler(str(tmp_path / "profiles"), SECRET)
+    (tmp_path / "secret.collapsed").write_text("x 1\n")
+    assert profiler.profile_path("../secret.collapsed") is None
+    assert profiler.profile_path("missing.collapsed") is None
+    assert profiler.profile_path("notes.txt") is None
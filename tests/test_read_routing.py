@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Read routing test
+Runs backend/server.py against a local three member replica set and checks
+which member served each command: the public read routes must be served by
+secondaries, the bot and seed routes by the primary
+
+    python -m pytest tests/test_read_routing.py
+
+Skipped when mongod is not installed (see tests/replica_set.py).
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient, monitoring
+
+TESTS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = TESTS_DIR.parent / "backend"
+sys.path.insert(0, str(TESTS_DIR))
+
+from replica_set import ReplicaSet, mongod_path  # noqa: E402
+
+pytestmark = pytest.mark.skipif(mongod_path() is None, reason="needs mongod for a local replica set")
+
+DB_NAME = "razerbet_read_routing"
+PUBLIC_ROUTES = ("/api/history", "/api/stats", "/api/user/{identifier}/stats")
+
+class CommandLog(monitoring.CommandListener):
+    """Route, command, collection and member of every command sent"""
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        from metrics import current_route
+        host, port = event.connection_id
+        collection = event.command.get(event.command_name)
+        self.commands.append((current_route(), event.command_name, collection, f"{host}:{port}"))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def members(self, routes, collections):
+        return {
+            member for route, _, collection, member in self.commands
+            if route in routes and collection in collections
+        }
+
+def wait_replicated(rs: ReplicaSet, games: int, timeout: float = 30):
+    """Until every secondary has `games` rows in game_history"""
+    deadline = time.monotonic() + timeout
+    for host in rs.hosts[1:]:
+        member = MongoClient(host, directConnection=True, readPreference="secondaryPreferred")
+        try:
+            while member[DB_NAME].game_history.count_documents({}) < games:
+                assert time.monotonic() < deadline, f"{host} did not catch up"
+                time.sleep(0.1)
+        finally:
+            member.close()
+
+async def exercise(server, rs: ReplicaSet, log: CommandLog):
+    import httpx
+    await server.init_storage()
+    transport = httpx.ASGITransport(app=server.app)
+    headers = {"X-API-KEY": server.BOT_API_KEY}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as http:
+            response = await http.post("/api/bot/seeds/create", params={"user_id": "reader"})
+            assert response.status_code == 200, response.text
+            seed = await server.storage.get_active_seed("reader")
+            response = await http.post("/api/bot/game", json={
+                "game_type": "coinflip", "server_seed": seed["server_seed"], "client_seed": seed["client_seed"],
+                "nonce": 0, "user_id": "reader", "username": "Reader", "bet_amount": 0.01,
+                "multiplier": 2.0, "won": True, "payout": 0.02
+            })
+            assert response.status_code == 200, response.text
+            await asyncio.get_running_loop().run_in_executor(None, wait_replicated, rs, 1)
+
+            log.commands.clear()
+            for path in ("/api/history", "/api/stats", "/api/user/reader/stats"):
+                response = await http.get(path)
+                assert response.status_code == 200, f"{path}: {response.text}"
+            for _ in range(3):
+                assert (await http.get("/api/bot/seeds/reader")).status_code == 200
+                assert (await http.post("/api/bot/seeds/reader/increment-nonce")).status_code == 200
+    finally:
+        await server.shutdown_storage()
+
+def test_public_reads_leave_the_primary(monkeypatch):
+    log = CommandLog()
+    monitoring.register(log)
+    with ReplicaSet(members=3) as rs:
+        primary = rs.hosts[0]
+        for name, value in dict(
+            STORAGE_BACKEND="mongo",
+            MONGO_URL=rs.url,
+            DB_NAME=DB_NAME,
+            MONGO_MAX_STALENESS_SECONDS="90"
+        ).items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.delenv("ARCHIVE_DIR", raising=False)
+        monkeypatch.delenv("WORKER_COORDINATION", raising=False)
+        monkeypatch.syspath_prepend(str(BACKEND_DIR))
+        monkeypatch.chdir(BACKEND_DIR)
+        import server
+        from storage import create_storage
+
+        # Other tests may have imported the server on SQLite; build the Mongo
+        # storage here, after the listener above, so every command is logged
+        monkeypatch.setattr(server, "storage", create_storage())
+        assert server.storage.name == "mongo"
+
+        asyncio.run(exercise(server, rs, log))
+
+        public = log.members(PUBLIC_ROUTES, {"game_history"})
+        assert public, "the public routes sent no game_history reads"
+        assert primary not in public, f"public reads hit the primary: {sorted(public)}"
+
+        bot_routes = {"/api/bot/seeds/{user_id}", "/api/bot/seeds/{user_id}/increment-nonce"}
+        pinned = log.members(bot_routes, {"user_seeds"})
+        assert pinned == {primary}, f"seed routes left the primary: {sorted(pinned)}"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
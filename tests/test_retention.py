@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Seed retention tests
+Inactive user seeds past the retention period move to revealed_seeds in
+batches, recent and active seeds stay, and lookups, audits and pending audit
+resumption find retired seeds like any other
+
+    python -m pytest tests/test_retention.py
+"""
+
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from provably_fair import hash_server_seed  # noqa: E402
+from retention import SeedCompactor, decode_revealed_seed, encode_revealed_seed  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+
+def seed_doc(user_id: str, age: timedelta, nonce: int = 0) -> dict:
+    server_seed = uuid.uuid4().hex * 2
+    return {
+        "id": str(uuid.uuid4()), "user_id": user_id, "server_seed": server_seed,
+        "server_seed_hash": hash_server_seed(server_seed), "client_seed": "client", "nonce": nonce,
+        "active": True, "created_at": (NOW - age).isoformat()
+    }
+
+async def rotate(storage, user_id: str, seeds: list, revealed_age: timedelta, audit: dict):
+    """Make the seeds active in turn, revealing each one as the next replaces it"""
+    await storage.rotate_active_seed(user_id, seeds[0])
+    for previous, seed in zip(seeds, seeds[1:]):
+        fields = {"revealed_at": (NOW - revealed_age).isoformat(), "audit": audit}
+        assert await storage.rotate_active_seed(user_id, seed, reveal_id=previous["id"], reveal_fields=fields)
+
+async def user_seed_count(storage) -> int:
+    row = await storage._read(lambda conn: conn.execute("SELECT COUNT(*) FROM user_seeds").fetchone())
+    return row[0]
+
+def test_revealed_seed_round_trip():
+    seed = dict(seed_doc("user-1", timedelta(days=10), nonce=42), active=False,
+                revealed_at=NOW.isoformat(), audit={"status": "verified"})
+    assert decode_revealed_seed(encode_revealed_seed(seed)) == seed
+    # Replaced without a reveal: no revealed_at or audit
+    seed = dict(seed_doc("user-1", timedelta(days=10)), active=False)
+    assert set(encode_revealed_seed(seed)) == {"_id", "ss", "c", "u", "i", "n", "ct"}
+    assert decode_revealed_seed(encode_revealed_seed(seed)) == seed
+
+def test_compaction_moves_only_old_inactive_seeds(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "retention.db"), read_threads=2)
+        await storage.init()
+        try:
+            old = [seed_doc("old-user", timedelta(days=30 - i), nonce=i) for i in range(6)]
+            await rotate(storage, "old-user", old, timedelta(days=20), {"status": "verified"})
+            # Created long ago but revealed yesterday: kept until the reveal is old too
+            recent = [seed_doc("recent-user", timedelta(days=30)), seed_doc("recent-user", timedelta(days=1))]
+            await rotate(storage, "recent-user", recent, timedelta(days=1), {"status": "pending"})
+            assert await user_seed_count(storage) == 8
+
+            compactor = SeedCompactor(retention_days=7, batch_size=2, pause=0)
+            assert await compactor.compact_once(storage) == 5
+            # user_seeds keeps the active seeds and the recent reveal
+            assert await user_seed_count(storage) == 3
+            assert (await storage.get_active_seed("old-user"))["id"] == old[-1]["id"]
+            assert await compactor.compact_once(storage) == 0
+
+            for seed in old[:-1]:
+                revealed = await storage.get_revealed_seed(seed["server_seed_hash"])
+                assert revealed["server_seed"] == seed["server_seed"]
+                assert revealed["nonce"] == seed["nonce"]
+                assert revealed["active"] is False
+                assert revealed["audit"] == {"status": "verified"}
+            assert (await storage.get_revealed_seed(recent[0]["server_seed_hash"]))["audit"] == {"status": "pending"}
+
+            # Retiring the same seeds again changes nothing
+            await storage.retire_seeds(old[:-1])
+            assert await user_seed_count(storage) == 3
+            assert (await storage.get_revealed_seed(old[0]["server_seed_hash"]))["nonce"] == 0
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_audits_reach_retired_seeds(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "retention.db"), read_threads=2)
+        await storage.init()
+        try:
+            seeds = [seed_doc("auditor", timedelta(days=30)), seed_doc("auditor", timedelta(days=29))]
+            await rotate(storage, "auditor", seeds, timedelta(days=20), {"status": "pending"})
+            assert await SeedCompactor(retention_days=7, pause=0).compact_once(storage) == 1
+
+            pending = await storage.pending_audits(10)
+            assert [seed["server_seed_hash"] for seed in pending] == [seeds[0]["server_seed_hash"]]
+            await storage.set_seed_audit(seeds[0]["id"], seeds[0]["server_seed_hash"], {"status": "verified"})
+            assert (await storage.get_revealed_seed(seeds[0]["server_seed_hash"]))["audit"] == {"status": "verified"}
+            assert await storage.pending_audits(10) == []
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_audit_route_serves_retired_seeds(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            assert (await play(server, http, "retiring")).status_code == 200
+            revealed = (await http.post("/api/bot/seeds/retiring/reveal")).json()
+            await asyncio.gather(*server.background_jobs)
+            # Retention of zero days: everything inactive is retired
+            assert await SeedCompactor(retention_days=0, pause=0).compact_once(server.storage) == 1
+            response = await http.get(f"/api/seeds/{revealed['revealed_server_seed_hash']}/audit")
+            assert response.status_code == 200
+            assert response.json()["server_seed"] == revealed["revealed_server_seed"]
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Analytics rollup tests
+Live counts buffered and flushed as increments, the backfill of games recorded
+before live counting started, backfilling the same days twice without
+counting them twice, and workers starting together agreeing on when live
+counting started
+
+    python -m pytest tests/test_rollups.py
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from game_codec import encode_game  # noqa: E402
+from rollups import Rollups, bucket_start  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+DAY = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+def game(index: int, timestamp: datetime, bet: float = 0.1, won: bool = True, game_type: str = "coinflip") -> dict:
+    return {
+        "id": f"game-{index}", "game_type": game_type, "server_seed_hash": "ab" * 32, "client_seed": "client",
+        "nonce": index, "result": {"outcome": "heads", "roll": 12.0}, "raw_result": 0.12, "user_id": "user-1",
+        "username": "Player", "bet_amount": bet, "multiplier": 2.0, "won": won, "payout": bet * 2 if won else 0.0,
+        "currency": "ETH", "timestamp": timestamp
+    }
+
+def totals(series):
+    return sum(b["games"] for b in series), sum(b["wins"] for b in series), round(sum(b["wagered"] for b in series), 9)
+
+def test_live_counts_flush_as_increments(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "rollups.db"), read_threads=2)
+        await storage.init()
+        try:
+            rollups = Rollups()
+            hour = DAY + timedelta(hours=5)
+            for index in range(10):
+                rollups.observe(game(index, hour + timedelta(minutes=index), won=index % 2 == 0))
+            # Unflushed counts are part of the series already
+            series = await rollups.series(storage, "hour", DAY, DAY + timedelta(days=1))
+            assert totals(series) == (10, 5, 1.0)
+
+            await rollups.flush(storage)
+            for index in range(10, 13):
+                rollups.observe(game(index, hour))
+            await rollups.flush(storage)
+            series = await rollups.series(storage, "hour", DAY, DAY + timedelta(days=1))
+            assert [b["start"] for b in series] == [hour.isoformat()]
+            assert totals(series) == (13, 8, 1.3)
+            assert series[0]["house_profit"] == round(1.3 - 8 * 0.2, 9)
+            daily = await rollups.series(storage, "day", DAY, DAY + timedelta(days=1), game_type="crash")
+            assert daily == []
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_backfill_twice_counts_once(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "rollups.db"), read_threads=2)
+        await storage.init()
+        try:
+            rollups = Rollups(batch_size=2)
+            rollups.live_since = DAY + timedelta(days=2, hours=12)
+            # Two games on each of the first two days, one before live_since on the third
+            for index, hours in enumerate((1, 13, 25, 37, 49)):
+                await storage.insert_game(encode_game(game(index, DAY + timedelta(hours=hours))))
+            # A game recorded after live_since is counted live, never by the backfill
+            live = game(100, DAY + timedelta(days=2, hours=14))
+            await storage.insert_game(encode_game(live))
+            rollups.observe(live)
+            await rollups.flush(storage)
+
+            await rollups.backfill(storage)
+            assert rollups.backfill_complete
+            assert rollups.backfilled_to >= rollups.live_since
+            end = DAY + timedelta(days=3)
+            first = await rollups.series(storage, "day", DAY, end)
+            assert [b["games"] for b in first] == [2, 2, 2]
+
+            # A restart that lost the mark aggregates every day again
+            rollups.backfilled_to = None
+            await rollups.backfill(storage)
+            assert await rollups.series(storage, "day", DAY, end) == first
+            hourly = await rollups.series(storage, "hour", DAY, end)
+            assert totals(hourly) == (6, 6, 0.6)
+            assert hourly[-1]["start"] == bucket_start("hour", live["timestamp"]).isoformat()
+
+            state = await storage.load_state("rollups")
+            assert state["backfill_complete"] is True
+            assert state["backfilled_to"] == rollups.backfilled_to.isoformat()
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_workers_starting_together_share_live_since(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "rollups.db"), read_threads=2)
+        await storage.init()
+        workers = [Rollups() for _ in range(4)]
+        try:
+            await asyncio.gather(*(rollups.start(storage) for rollups in workers))
+            state = await storage.load_state("rollups")
+            assert {rollups.live_since.isoformat() for rollups in workers} == {state["live_since"]}
+            # Once saved, another start keeps it
+            later = Rollups()
+            workers.append(later)
+            await later.start(storage)
+            assert later.live_since.isoformat() == state["live_since"]
+        finally:
+            for rollups in workers:
+                await rollups.stop(storage)
+            await storage.close()
+
+    asyncio.run(run())
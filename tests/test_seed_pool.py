@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Seed pool and rotation tests
+Pooled server seeds match their hashes and are handed out once, the pool
+refills in the background and generates inline when empty, and concurrent
+reveals through the API rotate a user's seeds exactly once
+
+    python -m pytest tests/test_seed_pool.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+from test_metrics import sample  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from metrics import REGISTRY  # noqa: E402
+from provably_fair import hash_server_seed  # noqa: E402
+from seed_pool import SeedPool  # noqa: E402
+
+def test_pool_hands_out_each_seed_once():
+    async def run():
+        pool = SeedPool(size=20, batch_size=8)
+        await pool.start()
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if len(pool._pairs) == 20:
+                    break
+            assert len(pool._pairs) == 20
+
+            pairs = [pool.take() for _ in range(15)]
+            assert all(hash_server_seed(seed) == seed_hash for seed, seed_hash in pairs)
+            # Dropping to half woke the refill
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if len(pool._pairs) == 20:
+                    break
+            assert len(pool._pairs) == 20
+            pairs += [pool.take() for _ in range(20)]
+            assert len({seed for seed, _ in pairs}) == 35
+        finally:
+            await pool.stop()
+        assert len(pool._pairs) == 0
+
+    asyncio.run(run())
+
+def test_empty_pool_generates_inline():
+    pool = SeedPool(size=10)
+    before = sample(REGISTRY.render(), "seed_pool_exhausted_total")
+    seed, seed_hash = pool.take()
+    assert hash_server_seed(seed) == seed_hash
+    assert sample(REGISTRY.render(), "seed_pool_exhausted_total") == before + 1
+
+def test_concurrent_reveals_rotate_once(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            for _ in range(3):
+                assert (await play(server, http, "revealer")).status_code == 200
+            first = await server.storage.get_active_seed("revealer")
+
+            responses = await asyncio.gather(*(http.post("/api/bot/seeds/revealer/reveal") for _ in range(6)))
+            statuses = sorted(response.status_code for response in responses)
+            assert statuses[0] == 200 and statuses[-1] == 409
+            revealed = [response.json() for response in responses if response.status_code == 200]
+            assert all(body["revealed_server_seed_hash"] == first["server_seed_hash"] for body in revealed)
+            # However many reveals got through, exactly one seed is active and it is the last one handed out
+            active = await server.storage.get_active_seed("revealer")
+            assert active["nonce"] == 0
+            assert active["server_seed_hash"] in {body["new_server_seed_hash"] for body in revealed}
+            assert hash_server_seed(active["server_seed"]) == active["server_seed_hash"]
+            rows = await server.storage._read(lambda conn: conn.execute(
+                "SELECT COUNT(*) FROM user_seeds WHERE user_id = ? AND active = 1", ("revealer",)
+            ).fetchone())
+            assert rows == (1,)
+
+            seeds = (await http.get("/api/bot/seeds/revealer")).json()
+            assert seeds["server_seed_hash"] == active["server_seed_hash"]
+            assert (await server.storage.get_revealed_seed(first["server_seed_hash"]))["server_seed"] == first["server_seed"]
+
+    asyncio.run(run())
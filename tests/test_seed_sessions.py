@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Seed session tests
+Session ids derived from the server seed hash and client seed, the session
+LRU writing each session once, a plaintext seed filled in after the session
+was first stored, and the seed-sessions migration moving inline h/c of game
+rows onto referenced sessions
+
+    python -m pytest tests/test_seed_sessions.py
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from game_codec import decode_game, encode_game  # noqa: E402
+from migrate import inline_seed_sessions  # noqa: E402
+from provably_fair import hash_server_seed  # noqa: E402
+from seed_sessions import SeedSessionCache, build_session, session_fields, session_id  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+SERVER_SEED = "5e" * 32
+SEED_HASH = hash_server_seed(SERVER_SEED)
+
+def game_record(nonce: int, client_seed: str = "client") -> dict:
+    return {
+        "id": f"game-{client_seed}-{nonce}", "game_type": "coinflip", "server_seed_hash": SEED_HASH,
+        "client_seed": client_seed, "nonce": nonce, "result": {"outcome": "heads", "roll": 42.0}, "raw_result": 0.42,
+        "user_id": "user-1", "username": "Player", "bet_amount": 1.0, "multiplier": 2.0, "won": True,
+        "payout": 2.0, "timestamp": datetime.now(timezone.utc)
+    }
+
+class CountingStorage(SQLiteStorage):
+    """Counts seed session writes and lookups"""
+
+    upserts = 0
+    lookups = 0
+
+    async def upsert_seed_session(self, session):
+        self.upserts += 1
+        await super().upsert_seed_session(session)
+
+    async def get_seed_sessions(self, session_ids):
+        self.lookups += 1
+        return await super().get_seed_sessions(session_ids)
+
+def test_session_round_trip():
+    session = build_session(SERVER_SEED, SEED_HASH, "client")
+    assert session["_id"] == session_id(SEED_HASH, "client")
+    assert len(session["_id"]) == 12
+    assert session["h"] == bytes.fromhex(SEED_HASH) and session["ss"] == SERVER_SEED
+    assert session_fields(session) == {"server_seed_hash": SEED_HASH, "client_seed": "client"}
+    # Another client seed is another session; no plaintext before the reveal
+    other = build_session(None, SEED_HASH, "other")
+    assert other["_id"] != session["_id"] and "ss" not in other
+
+    doc = encode_game(game_record(3))
+    assert doc["s"] == session["_id"]
+    game = decode_game(doc, {session["_id"]: session})
+    assert (game["server_seed_hash"], game["client_seed"], game["nonce"]) == (SEED_HASH, "client", 3)
+    # Without its session a row still decodes, minus the seed fields
+    assert "server_seed_hash" not in decode_game(doc)
+
+def test_plaintext_seed_is_filled_in_later(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "sessions.db"), read_threads=2)
+        await storage.init()
+        try:
+            hidden = build_session(None, SEED_HASH, "client")
+            await storage.upsert_seed_session(hidden)
+            [stored] = await storage.get_seed_sessions([hidden["_id"]])
+            assert "ss" not in stored
+
+            await storage.upsert_seed_session(build_session(SERVER_SEED, SEED_HASH, "client"))
+            [stored] = await storage.find_seed_sessions_by_hash(SEED_HASH)
+            assert stored["ss"] == SERVER_SEED
+            # Writing the session without a seed again never erases it
+            await storage.upsert_seed_session(hidden)
+            [stored] = await storage.get_seed_sessions([hidden["_id"]])
+            assert stored["ss"] == SERVER_SEED and stored["c"] == "client" and stored["h"] == hidden["h"]
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_cache_writes_and_fetches_once(tmp_path):
+    async def run():
+        storage = CountingStorage(str(tmp_path / "sessions.db"), read_threads=2)
+        await storage.init()
+        try:
+            cache = SeedSessionCache(maxsize=2)
+            sessions = [build_session(None, SEED_HASH, f"client-{i}") for i in range(3)]
+            for _ in range(3):
+                await cache.ensure(storage, sessions[0])
+            assert storage.upserts == 1
+            for session in sessions[1:]:
+                await cache.ensure(storage, session)
+            # The first session was evicted: ensuring it writes again
+            await cache.ensure(storage, sessions[0])
+            assert storage.upserts == 4
+
+            cache = SeedSessionCache()
+            ids = [session["_id"] for session in sessions]
+            found = await cache.get_many(storage, ids + ids)
+            assert set(found) == set(ids) and storage.lookups == 1
+            assert await cache.get_many(storage, ids) == found
+            assert storage.lookups == 1
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_migration_moves_inline_seeds_to_sessions():
+    # A v2 row as written before seed sessions: the hash and client seed inline
+    rows = []
+    for nonce, client_seed in ((0, "client"), (1, "client"), (2, "other")):
+        doc = encode_game(game_record(nonce, client_seed))
+        del doc["s"]
+        doc["h"], doc["c"] = bytes.fromhex(SEED_HASH), client_seed
+        rows.append(doc)
+    original = [decode_game(row) for row in rows]
+
+    sessions, updates = inline_seed_sessions(rows)
+    assert set(sessions) == {session_id(SEED_HASH, "client"), session_id(SEED_HASH, "other")}
+    assert [game_id for game_id, _ in updates] == [row["_id"] for row in rows]
+
+    for row, (_, update) in zip(rows, updates):
+        row.update(update["$set"])
+        for field in update["$unset"]:
+            del row[field]
+    assert all("h" not in row and "c" not in row for row in rows)
+    # The migrated rows decode to the same games through their sessions
+    assert [decode_game(row, sessions) for row in rows] == original
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+MongoDB storage tests
+Seed rotation against a local one member replica set, with and without
+multi-document transactions: a reveal of a seed that is no longer active is
+refused and writes nothing
+
+    python -m pytest tests/test_storage_mongo.py
+
+Skipped when mongod is not installed (see tests/replica_set.py).
+"""
+
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+TESTS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = TESTS_DIR.parent / "backend"
+sys.path.insert(0, str(TESTS_DIR))
+sys.path.insert(0, str(BACKEND_DIR))
+
+from provably_fair import hash_server_seed  # noqa: E402
+from replica_set import ReplicaSet, mongod_path  # noqa: E402
+from storage_mongo import MongoStorage  # noqa: E402
+
+pytestmark = pytest.mark.skipif(mongod_path() is None, reason="needs mongod for a local replica set")
+
+DB_NAME = "razerbet_storage_mongo"
+
+def seed_doc(user_id: str) -> dict:
+    server_seed = uuid.uuid4().hex * 2
+    return {
+        "id": str(uuid.uuid4()), "user_id": user_id, "server_seed": server_seed,
+        "server_seed_hash": hash_server_seed(server_seed), "client_seed": "client", "nonce": 0,
+        "active": True, "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+@pytest.mark.parametrize("transactions", [True, False])
+def test_lost_reveal_writes_nothing(transactions):
+    async def run(url: str):
+        storage = MongoStorage(url, DB_NAME)
+        await storage.init()
+        # Without transactions: the path taken on a standalone server
+        storage.transactions = transactions
+        try:
+            first, second, third = (seed_doc("rotating") for _ in range(3))
+            fields = {"revealed_at": datetime.now(timezone.utc).isoformat(), "audit": {"status": "pending"}}
+            assert await storage.rotate_active_seed("rotating", first)
+            assert await storage.rotate_active_seed("rotating", second, reveal_id=first["id"], reveal_fields=fields)
+
+            # The first seed was revealed already: the second reveal loses
+            assert not await storage.rotate_active_seed("rotating", third, reveal_id=first["id"], reveal_fields=fields)
+            assert await storage.db.user_seeds.count_documents({"id": third["id"]}) == 0
+            assert (await storage.get_active_seed("rotating"))["id"] == second["id"]
+
+            # Nothing active at all: the insert has no unique index to stop it
+            await storage.db.user_seeds.update_many({"user_id": "rotating"}, {"$set": {"active": False}})
+            assert not await storage.rotate_active_seed("rotating", third, reveal_id=second["id"], reveal_fields=fields)
+            assert await storage.db.user_seeds.count_documents({"id": third["id"]}) == 0
+            assert await storage.get_active_seed("rotating") is None
+        finally:
+            await storage.client.drop_database(DB_NAME)
+            await storage.close()
+
+    with ReplicaSet(members=1) as rs:
+        asyncio.run(run(rs.url))
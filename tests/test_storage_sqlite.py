@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+SQLite storage tests
+Game inserts and duplicates, the group commit writer surviving a transaction
+SQLite rolled back itself, nonce compare-and-set, atomic seed rotation, leases,
+and opening a database written before minor unit amounts
+
+    python -m pytest tests/test_storage_sqlite.py
+"""
+
+import asyncio
+import sqlite3
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from game_codec import GAME_TYPE_CODES, decode_game, encode_game  # noqa: E402
+from provably_fair import hash_server_seed  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+
+def open_storage(tmp_path) -> SQLiteStorage:
+    return SQLiteStorage(str(tmp_path / "razerbet.db"), read_threads=2)
+
+def game_doc(nonce: int, user_id: str = "user-1", bet: float = 0.1, payout: float = 0.2, currency: str = "ETH") -> dict:
+    return encode_game({
+        "id": f"game-{user_id}-{nonce}", "game_type": "coinflip", "server_seed_hash": "ab" * 32,
+        "client_seed": "client", "nonce": nonce, "result": {"outcome": "heads", "roll": 12.0}, "raw_result": 0.12,
+        "user_id": user_id, "username": "Player", "bet_amount": bet, "multiplier": 2.0, "won": payout > 0,
+        "payout": payout, "currency": currency, "timestamp": datetime.now(timezone.utc)
+    })
+
+def seed_doc(user_id: str, nonce: int = 0) -> dict:
+    server_seed = uuid.uuid4().hex * 2
+    return {
+        "id": str(uuid.uuid4()), "user_id": user_id, "server_seed": server_seed,
+        "server_seed_hash": hash_server_seed(server_seed), "client_seed": "client", "nonce": nonce,
+        "active": True, "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+def test_insert_and_duplicate(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            results = await asyncio.gather(*(storage.insert_game(game_doc(n)) for n in range(10)))
+            assert all(results)
+            # Same id: refused without failing the rest of the group commit
+            results = await asyncio.gather(storage.insert_game(game_doc(3)), storage.insert_game(game_doc(10)))
+            assert results == [False, True]
+
+            games = await storage.recent_games(50)
+            assert len(games) == 11
+            assert decode_game(games[0])["user_id"] == "user-1"
+            summary = await storage.user_summary("user-1")
+            assert summary["total_games"] == 11
+            assert summary["currencies"]["ETH"]["wagered"] == 11 * 100_000_000
+            assert await storage.count_games_by_type() == {GAME_TYPE_CODES["coinflip"]: 11}
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_writer_survives_a_lost_transaction(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            gate = threading.Event()
+
+            def held(conn):
+                gate.wait()
+
+            def lost(conn):
+                # What SQLite does itself on a full disk or an I/O error
+                conn.execute("ROLLBACK")
+                raise sqlite3.OperationalError("database or disk is full")
+
+            # Hold the writer so the rest queue up as one batch
+            first = asyncio.ensure_future(storage._write(held))
+            await asyncio.sleep(0.05)
+            before = asyncio.ensure_future(storage.insert_game(game_doc(0)))
+            failed = asyncio.ensure_future(storage._write(lost))
+            after = asyncio.ensure_future(storage.insert_game(game_doc(1)))
+            await asyncio.sleep(0.05)
+            gate.set()
+            results = await asyncio.gather(first, before, failed, after, return_exceptions=True)
+
+            # The write before the failure went down with the transaction; the one after did not
+            assert results[0] is None
+            assert isinstance(results[1], sqlite3.OperationalError)
+            assert isinstance(results[2], sqlite3.OperationalError)
+            assert results[3] is True
+            assert await storage.insert_game(game_doc(2))
+            assert [decode_game(game)["nonce"] for game in await storage.recent_games(10)] == [2, 1]
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_advance_nonce_compare_and_set(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            seed = seed_doc("cas")
+            assert await storage.rotate_active_seed("cas", seed)
+            assert await storage.advance_nonce("cas", seed["id"], 0, 5)
+            # Stale expectation, or a seed that is no longer active: nothing moves
+            assert not await storage.advance_nonce("cas", seed["id"], 0, 9)
+            assert not await storage.advance_nonce("cas", "other-seed", 5, 9)
+            assert (await storage.get_active_seed("cas"))["nonce"] == 5
+
+            # Racing writers with the same expectation: exactly one wins
+            results = await asyncio.gather(*(storage.advance_nonce("cas", seed["id"], 5, 6 + i) for i in range(8)))
+            assert results.count(True) == 1
+            assert (await storage.get_active_seed("cas"))["nonce"] == 6 + results.index(True)
+
+            increments = await asyncio.gather(*(storage.increment_nonce("cas") for _ in range(20)))
+            nonces = sorted(seed["nonce"] for seed in increments)
+            assert nonces == list(range(nonces[0], nonces[0] + 20))
+            assert await storage.increment_nonce("nobody") is None
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_rotate_active_seed(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            first = seed_doc("rotating")
+            assert await storage.rotate_active_seed("rotating", first)
+            # Concurrent reveals of the same seed: one rotation wins, never two active seeds
+            candidates = [seed_doc("rotating") for _ in range(5)]
+            fields = {"revealed_at": datetime.now(timezone.utc).isoformat(), "audit": {"status": "pending"}}
+            results = await asyncio.gather(*(
+                storage.rotate_active_seed("rotating", doc, reveal_id=first["id"], reveal_fields=fields)
+                for doc in candidates
+            ))
+            assert results.count(True) == 1
+            active = await storage.get_active_seed("rotating")
+            assert active["id"] == candidates[results.index(True)]["id"]
+
+            revealed = await storage.get_revealed_seed(first["server_seed_hash"])
+            assert revealed["active"] is False
+            assert revealed["audit"] == {"status": "pending"}
+            assert revealed["revealed_at"] == fields["revealed_at"]
+
+            # A reveal of a seed that is no longer active writes nothing
+            late = seed_doc("rotating")
+            assert not await storage.rotate_active_seed("rotating", late, reveal_id=first["id"], reveal_fields=fields)
+            rows = await storage._read(lambda conn: conn.execute(
+                "SELECT COUNT(*) FROM user_seeds WHERE id = ?", (late["id"],)
+            ).fetchone())
+            assert rows == (0,)
+
+            # Without reveal_id every active seed is replaced
+            replacement = seed_doc("rotating")
+            assert await storage.rotate_active_seed("rotating", replacement)
+            assert (await storage.get_active_seed("rotating"))["id"] == replacement["id"]
+            rows = await storage._read(lambda conn: conn.execute(
+                "SELECT COUNT(*) FROM user_seeds WHERE user_id = ? AND active = 1", ("rotating",)
+            ).fetchone())
+            assert rows == (1,)
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_leases(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            assert await storage.acquire_lease("user:1", "worker-a", ttl=30)
+            assert await storage.acquire_lease("user:2", "worker-a", ttl=30)
+            assert not await storage.acquire_lease("user:1", "worker-b", ttl=30)
+            # The holder extends its own lease
+            assert await storage.acquire_lease("user:1", "worker-a", ttl=30)
+            assert sorted(await storage.renew_leases("worker-a", ttl=30)) == ["user:1", "user:2"]
+            assert await storage.renew_leases("worker-b", ttl=30) == []
+
+            # An expired lease can be taken over, and the old owner no longer renews it
+            assert await storage.acquire_lease("user:3", "worker-a", ttl=-1)
+            assert await storage.acquire_lease("user:3", "worker-b", ttl=30)
+            assert sorted(await storage.renew_leases("worker-a", ttl=30)) == ["user:1", "user:2"]
+
+            await storage.release_leases("worker-a", ["user:1"])
+            assert await storage.acquire_lease("user:1", "worker-b", ttl=30)
+            await storage.release_leases("worker-a")
+            assert await storage.renew_leases("worker-a", ttl=30) == []
+            assert sorted(await storage.renew_leases("worker-b", ttl=30)) == ["user:1", "user:3"]
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+V1_GAME_HISTORY = """
+CREATE TABLE game_history (
+    id TEXT PRIMARY KEY, g INTEGER NOT NULL, s TEXT NOT NULL, n INTEGER NOT NULL, o INTEGER NOT NULL,
+    r REAL NOT NULL, u TEXT NOT NULL, un TEXT NOT NULL, mu TEXT NOT NULL, b REAL NOT NULL, m REAL NOT NULL,
+    w INTEGER NOT NULL, p REAL NOT NULL, cu TEXT, t INTEGER NOT NULL
+)"""
+V1_ROLLUPS = """
+CREATE TABLE rollups (
+    granularity TEXT NOT NULL, start INTEGER NOT NULL, game_type TEXT NOT NULL, currency TEXT NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0,
+    wagered REAL NOT NULL DEFAULT 0, payout REAL NOT NULL DEFAULT 0,
+    bf_games INTEGER NOT NULL DEFAULT 0, bf_wins INTEGER NOT NULL DEFAULT 0,
+    bf_wagered REAL NOT NULL DEFAULT 0, bf_payout REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, start, game_type, currency)
+)"""
+
+def test_upgrade_from_float_amounts(tmp_path):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    conn = sqlite3.connect(str(tmp_path / "razerbet.db"))
+    conn.execute(V1_GAME_HISTORY)
+    conn.execute(V1_ROLLUPS)
+    for nonce in range(10):
+        doc = game_doc(nonce, currency="USDT" if nonce % 2 else "ETH")
+        conn.execute(
+            "INSERT INTO game_history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (doc["_id"], doc["g"], doc["s"], doc["n"], doc["o"], doc["r"], doc["u"], doc["un"], doc["mu"],
+             doc["b"], doc["m"], int(doc["w"]), doc["p"], doc.get("cu"), int(doc["t"].timestamp() * 1_000_000))
+        )
+    conn.execute(
+        "INSERT INTO rollups VALUES ('hour', ?, 'coinflip', 'ETH', 3, 1, 0.3, 0.2, 2, 1, 0.2, 0.1)",
+        (int(start.timestamp() * 1_000_000),)
+    )
+    conn.commit()
+    conn.close()
+
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            summary = await storage.user_summary("user-1")
+            # 0.1 * 5 summed as floats is not 0.5; as minor units it is exact
+            assert summary["currencies"]["ETH"]["wagered"] == 500_000_000
+            assert summary["currencies"]["USDT"]["wagered"] == 500_000
+            assert summary["currencies"]["ETH"]["payout"] == 1_000_000_000
+            buckets = await storage.rollup_buckets("hour", start, datetime(2026, 1, 2, tzinfo=timezone.utc))
+            assert [(b["games"], b["wins"], b["wagered_minor"], b["payout_minor"]) for b in buckets] == [
+                (5, 2, 500_000_000, 300_000_000)
+            ]
+            # New rows are written with the minor unit columns
+            assert await storage.insert_game(game_doc(99))
+        finally:
+            await storage.close()
+
+        # Opening the upgraded file again changes nothing
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            assert (await storage.user_summary("user-1"))["total_games"] == 11
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
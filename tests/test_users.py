@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+User directory tests
+Usernames are unique in any case and move to whoever recorded them last,
+lookups resolve ids and names to a user_id, renames seen by another worker
+drop its cached names, and the backfill from older history
+
+    python -m pytest tests/test_users.py
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, play, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from coordination import CacheBus  # noqa: E402
+from game_codec import encode_game  # noqa: E402
+from storage_sqlite import SQLiteStorage  # noqa: E402
+from users import UserDirectory  # noqa: E402
+
+class LocalBus(CacheBus):
+    """A shared bus between objects of one process"""
+
+    shared = True
+
+    def __init__(self, worker: str, peers: list):
+        super().__init__(worker)
+        self.peers = peers
+        peers.append(self)
+
+    def _send(self, data: str):
+        for peer in self.peers:
+            peer._deliver(data)
+
+def open_storage(tmp_path) -> SQLiteStorage:
+    return SQLiteStorage(str(tmp_path / "users.db"), read_threads=2)
+
+def test_username_moves_to_its_latest_holder(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            await storage.upsert_user("user-1", "Alice")
+            assert await storage.find_user("alice") == "user-1"
+            assert await storage.find_user("ALICE") == "user-1"
+            # Another user records the same name in another case: it is theirs now
+            await storage.upsert_user("user-2", "ALICE")
+            assert await storage.find_user("Alice") == "user-2"
+            # An id wins over a username equal to it
+            await storage.upsert_user("bob", "Carol")
+            await storage.upsert_user("user-3", "bob")
+            assert await storage.find_user("bob") == "bob"
+            assert await storage.find_user("nobody") is None
+
+            # add_users never takes a name or changes a known user
+            await storage.add_users([{"user_id": "user-4", "username": "alice"}, {"user_id": "user-1", "username": "Dave"}])
+            assert await storage.find_user("alice") == "user-2"
+            assert await storage.find_user("user-4") == "user-4"
+            assert await storage.find_user("dave") is None
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_renames_reach_other_workers(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            peers = []
+            first = UserDirectory(bus=LocalBus("first", peers))
+            second = UserDirectory(bus=LocalBus("second", peers))
+            for directory in (first, second):
+                directory.backfill_complete = True
+
+            await first.ensure(storage, "user-1", "Alice")
+            assert await second.resolve(storage, "alice") == "user-1"
+            # The second worker cached the name; the first renames the user
+            await first.ensure(storage, "user-1", "Alicia")
+            assert await second.resolve(storage, "alice") is None
+            assert await second.resolve(storage, "ALICIA") == "user-1"
+
+            # The old name taken over by someone else on the second worker
+            await second.ensure(storage, "user-2", "Alicia")
+            assert await first.resolve(storage, "alicia") == "user-2"
+            assert await first.resolve(storage, "user-1") == "user-1"
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_backfill_gives_names_to_their_newest_holder(tmp_path):
+    async def run():
+        storage = open_storage(tmp_path)
+        await storage.init()
+        try:
+            now = datetime.now(timezone.utc)
+            for index, (user_id, username, age) in enumerate(
+                (("user-1", "Alice", 3), ("user-2", "alice", 1), ("user-1", "Al", 2), ("user-3", "Zed", 5))
+            ):
+                await storage.insert_game(encode_game({
+                    "id": f"game-{index}", "game_type": "coinflip", "server_seed_hash": "ab" * 32,
+                    "client_seed": "client", "nonce": index, "result": {"outcome": "heads", "roll": 12.0},
+                    "raw_result": 0.12, "user_id": user_id, "username": username, "bet_amount": 1.0,
+                    "multiplier": 2.0, "won": True, "payout": 2.0, "timestamp": now - timedelta(hours=age)
+                }))
+
+            directory = UserDirectory(batch_size=2)
+            # Before the backfill an unknown identifier is taken for a user_id
+            assert await directory.resolve(storage, "zed") == "zed"
+            await directory.backfill(storage)
+            assert await directory.resolve(storage, "ALICE") == "user-2"
+            assert await directory.resolve(storage, "al") == "user-1"
+            assert await directory.resolve(storage, "Zed") == "user-3"
+            assert await directory.resolve(storage, "nobody") is None
+            assert await storage.load_state("users") == {"backfill_complete": True}
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
+
+def test_stats_by_username(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            for _ in range(3):
+                assert (await play(server, http, "stats-user", username="StatsName")).status_code == 200
+            for identifier in ("stats-user", "statsname", "STATSNAME"):
+                response = await http.get(f"/api/user/{identifier}/stats")
+                assert response.status_code == 200
+                assert response.json()["total_games"] == 3
+            assert (await http.get("/api/user/unknown-name/stats")).status_code == 404
+
+    asyncio.run(run())
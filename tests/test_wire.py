@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Bot wire format tests
+Seeds and hashes as raw bytes in MessagePack and hex in JSON, content
+negotiation, and the bot routes taking and returning MessagePack with the
+same results and errors as JSON
+
+    python -m pytest tests/test_wire.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import msgpack
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR))
+
+from local_server import BACKEND_DIR, coinflip, serve  # noqa: E402
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from wire import MSGPACK, is_msgpack, pack, unpack, wants_msgpack  # noqa: E402
+
+SEED_HASH = "ab" * 32
+
+def test_binary_fields_round_trip():
+    body = {"server_seed_hash": SEED_HASH, "client_seed": "cd" * 4, "nonce": 3}
+    packed = msgpack.unpackb(pack(body), raw=False)
+    # Only the listed fields become bytes; a hex looking client seed stays a string
+    assert packed == {"server_seed_hash": bytes.fromhex(SEED_HASH), "client_seed": "cd" * 4, "nonce": 3}
+    assert unpack(pack(body)) == body
+    assert unpack(pack([body, body])) == [body, body]
+    # A value that is not hex is sent as it is
+    assert msgpack.unpackb(pack({"server_seed": "not hex"}), raw=False) == {"server_seed": "not hex"}
+    # Seeds sent as hex strings in MessagePack are accepted as well
+    assert unpack(msgpack.packb({"server_seed": SEED_HASH})) == {"server_seed": SEED_HASH}
+
+def test_content_negotiation():
+    assert is_msgpack("application/msgpack")
+    assert is_msgpack("Application/X-MsgPack; charset=binary")
+    assert not is_msgpack("application/json")
+    assert not is_msgpack(None)
+    assert wants_msgpack("application/vnd.msgpack, application/json;q=0.5")
+    assert not wants_msgpack("application/json")
+    assert not wants_msgpack(None)
+
+def post_msgpack(http, url: str, body, **kwargs):
+    headers = {"Content-Type": MSGPACK, "Accept": MSGPACK}
+    return http.post(url, content=msgpack.packb(body, use_bin_type=True), headers=headers, **kwargs)
+
+def test_bot_routes_speak_msgpack(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            response = await http.post("/api/bot/seeds/create", params={"user_id": "packed"}, headers={"Accept": MSGPACK})
+            assert response.headers["content-type"] == MSGPACK
+            created = msgpack.unpackb(response.content, raw=False)
+            seed = await server.storage.get_active_seed("packed")
+            assert created["server_seed_hash"] == bytes.fromhex(seed["server_seed_hash"])
+
+            game = coinflip(seed, 0, "packed")
+            game["server_seed"] = bytes.fromhex(game["server_seed"])
+            response = await post_msgpack(http, "/api/bot/game", game)
+            assert response.status_code == 200
+            recorded = msgpack.unpackb(response.content, raw=False)
+            assert recorded["duplicate"] is False
+            assert recorded["server_seed_hash"] == bytes.fromhex(seed["server_seed_hash"])
+
+            # The same game sent as JSON is the same game
+            response = await http.post("/api/bot/game", json=coinflip(seed, 0, "packed"))
+            assert response.json() == dict(recorded, server_seed_hash=seed["server_seed_hash"], duplicate=True)
+
+            batch = [dict(game, nonce=1), dict(game, nonce=2, game_type="roulette")]
+            response = await post_msgpack(http, "/api/bot/games/batch", batch)
+            results = msgpack.unpackb(response.content, raw=False)["results"]
+            assert results[0]["success"] and results[1]["status_code"] == 400
+
+            response = await http.post("/api/bot/seeds/packed/reveal", headers={"Accept": MSGPACK})
+            revealed = msgpack.unpackb(response.content, raw=False)
+            assert revealed["revealed_server_seed"] == bytes.fromhex(seed["server_seed"])
+            assert isinstance(revealed["new_server_seed_hash"], bytes)
+
+    asyncio.run(run())
+
+def test_bad_msgpack_bodies(tmp_path):
+    async def run():
+        async with serve(tmp_path) as (server, http):
+            response = await http.post("/api/bot/game", content=b"\xc1", headers={"Content-Type": MSGPACK})
+            assert response.status_code == 400
+            response = await post_msgpack(http, "/api/bot/game", {"game_type": "coinflip"})
+            assert response.status_code == 422
+            locations = [error["loc"] for error in response.json()["detail"]]
+            assert ["body", "server_seed"] in locations
+
+    asyncio.run(run())